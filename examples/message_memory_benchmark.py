@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+消息内存基准
+
+比较 ConversationMessage（数据类）和 CompactMessage（紧凑表示）每条消息占用的内存。
+消息内容在两种表示之间共享，不计入结果，只比较消息本身的开销。
+
+用法：python examples/message_memory_benchmark.py [消息数]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from interactive_mcp_popup.compact import CompactMessage
+from interactive_mcp_popup.conversation import ConversationMessage
+
+
+def measure(message_class, count: int, contents) -> float:
+    """创建 count 条消息（每个对话 50 条），返回每条消息的平均字节数"""
+    conversation_ids = [str(uuid.uuid4()) for _ in range(count // 50 + 1)]
+    tracemalloc.start()
+    messages = [
+        message_class(
+            id=str(uuid.uuid4()),
+            conversation_id=conversation_ids[i // 50],
+            timestamp=time.strftime("%Y-%m-%d %H:%M:%S"),
+            sender="user" if i % 2 else "assistant",
+            content=contents[i],
+            message_type="answer" if i % 2 else "question",
+            seq=i % 50 + 1,
+        )
+        for i in range(count)
+    ]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del messages
+    return current / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    contents = [f"回答 {i}" for i in range(count)]
+
+    before = measure(ConversationMessage, count, contents)
+    after = measure(CompactMessage, count, contents)
+
+    print(f"消息数: {count}")
+    print(f"ConversationMessage: {before:.0f} 字节/条")
+    print(f"CompactMessage:      {after:.0f} 字节/条")
+    print(f"节省: {(1 - after / before) * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
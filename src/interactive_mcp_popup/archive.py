@@ -0,0 +1,150 @@
+"""
+对话归档流式读取模块
+
+save_to_file 导出的文件形如 {"conversations": {"<id>": {...}, ...}}。
+ArchiveReader 按块读取文件，用 json.JSONDecoder.raw_decode 每次只解析一个对话，
+内存占用与最大的单个对话成正比，而不是与整个文件成正比。
+"""
+
+import codecs
+import json
+import os
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
+
+_WHITESPACE = " \t\n\r"
+
+
+class ArchiveReader:
+    """逐个读取归档文件中的对话"""
+
+    def __init__(self, filepath: str, chunk_size: int = 1024 * 1024):
+        """
+        Args:
+            filepath: 归档文件路径
+            chunk_size: 每次读取的字节数
+        """
+        self.filepath = filepath
+        self.chunk_size = chunk_size
+        self.total_bytes = os.path.getsize(filepath)
+        self.bytes_read = 0
+        self.extra: Dict[str, Any] = (
+            {}
+        )  # conversations 之外的顶层字段，例如快照的 last_op
+
+        self._file: Optional[BinaryIO] = None
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def __iter__(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """依次产生 (对话ID, 对话字典)
+
+        Raises:
+            ValueError: 文件格式错误
+        """
+        with open(self.filepath, "rb") as f:
+            self._file = f
+            self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+            try:
+                self._expect("{")
+                if self._peek() == "}":
+                    return
+                while True:
+                    key = self._value()
+                    self._expect(":")
+                    if key == "conversations":
+                        yield from self._conversations()
+                    else:
+                        self.extra[key] = self._value()
+                    if self._separator("}"):
+                        return
+            finally:
+                self._file = None
+
+    def _conversations(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            conv_id = self._value()
+            self._expect(":")
+            yield conv_id, self._value()
+            if self._separator("}"):
+                return
+
+    def _fill(self, size: int) -> bool:
+        """再读入至少 size 字节，丢弃已解析的部分
+
+        Returns:
+            是否读到了新数据
+        """
+        if self._eof or self._file is None:
+            return False
+        if self._pos:
+            self._buffer = self._buffer[self._pos :]
+            self._pos = 0
+        data = self._file.read(max(size, self.chunk_size))
+        self.bytes_read += len(data)
+        self._eof = not data
+        self._buffer += self._text_decoder.decode(data, final=self._eof)
+        return bool(data)
+
+    def _peek(self) -> str:
+        """跳过空白，返回下一个字符（文件结束时返回空字符串）"""
+        while True:
+            while (
+                self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE
+            ):
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill(self.chunk_size):
+                return ""
+
+    def _expect(self, char: str) -> None:
+        found = self._peek()
+        if found != char:
+            raise ValueError(
+                f"归档格式错误: 位置 {self.bytes_read} 附近应为 {char!r}，实际为 {found!r}"
+            )
+        self._pos += 1
+
+    def _separator(self, closing: str) -> bool:
+        """读取逗号或结束符
+
+        Returns:
+            是否遇到结束符
+        """
+        found = self._peek()
+        self._pos += 1
+        if found == closing:
+            return True
+        if found != ",":
+            raise ValueError(
+                f"归档格式错误: 位置 {self.bytes_read} 附近应为 ',' 或 {closing!r}，实际为 {found!r}"
+            )
+        return False
+
+    def _value(self) -> Any:
+        """解析下一个 JSON 值，缓冲区中不完整时加倍读入后重试"""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                # 值还没有完整读入；每次至少读入与已有缓冲区同样多的数据，总的重复解析量是线性的
+                if not self._fill(len(self._buffer) - self._pos):
+                    raise
+                continue
+            if (
+                end == len(self._buffer)
+                and not self._eof
+                and not isinstance(value, (dict, list, str))
+            ):
+                # 数字可能被块边界截断
+                if self._fill(self.chunk_size):
+                    continue
+            self._pos = end
+            return value
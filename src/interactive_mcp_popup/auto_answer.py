@@ -0,0 +1,298 @@
+"""
+自动回答规则模块
+
+在弹出对话框之前，按配置中的关键词/正则规则匹配问题。
+命中规则的常规确认类问题（"继续吗？"、"使用默认设置？"）直接返回预设回答，不打扰用户。
+"""
+
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .utils import get_config_path, load_json
+
+# 开头的全局内联标志，例如 "(?i)"；嵌入组合正则时改写为局部标志
+_GLOBAL_FLAGS = re.compile(r"\(\?([aiLmsux]+)\)")
+# 按编号引用分组（\1、(?(1)...)）：嵌入组合正则后分组编号会变化
+_NUMBERED_REFERENCE = re.compile(r"(?<!\\)(?:\\\\)*(?:\\[1-9]|\(\?\(\d)")
+# 关键词分支的分组名：忽略大小写的关键词统一为小写，区分大小写的关键词原样匹配
+_KEYWORD_GROUPS = {"kw": True, "kc": False}
+
+
+@dataclass
+class AutoAnswerRule:
+    """自动回答规则"""
+
+    name: str
+    answer: str
+    keywords: List[str] = field(default_factory=list)
+    regex: str = ""
+    ignore_case: bool = True
+    match_context: bool = False
+
+
+def _build_keyword_pattern(keywords: List[str]) -> str:
+    """把关键词构造成前缀树形状的正则
+
+    共享前缀只出现一次，匹配开销取决于关键词长度而不是关键词数量。
+
+    Args:
+        keywords: 关键词列表
+
+    Returns:
+        正则表达式字符串
+    """
+    trie: Dict[str, Any] = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}  # 词尾标记
+
+    def to_pattern(node: Dict[str, Any]) -> str:
+        alternatives = []
+        optional = False
+        # 长分支优先，保证最长匹配
+        for char in sorted(node, key=lambda c: (c == "", c)):
+            if char == "":
+                optional = True
+                continue
+            alternatives.append(re.escape(char) + to_pattern(node[char]))
+
+        if not alternatives:
+            return ""
+        if len(alternatives) == 1 and not optional:
+            return alternatives[0]
+
+        pattern = "(?:" + "|".join(alternatives) + ")"
+        return pattern + "?" if optional else pattern
+
+    return to_pattern(trie)
+
+
+class AutoAnswerEngine:
+    """自动回答引擎
+
+    所有规则编译成一个组合正则：关键词规则合并成一棵前缀树分支，
+    正则规则各占一个命名分组。配置文件未变化时不会重新编译。
+    """
+
+    def __init__(self, config_path: Optional[str] = None):
+        self.config_path = Path(config_path) if config_path else get_config_path()
+        self.enabled = False
+        self.rules: List[AutoAnswerRule] = []
+        self.auto_answered_count = 0
+        self.rule_hits: Dict[str, int] = {}
+
+        self._matcher: Optional[re.Pattern[str]] = None
+        self._context_matcher: Optional[re.Pattern[str]] = None
+        self._keyword_rules: Dict[str, Dict[str, int]] = {}
+        self._context_keyword_rules: Dict[str, Dict[str, int]] = {}
+        self._config_stamp: Optional[Tuple[int, int]] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load_rules(self, auto_answer_config: Dict[str, Any]) -> None:
+        """根据配置编译规则
+
+        Args:
+            auto_answer_config: 配置中的 auto_answer 部分
+        """
+        rules: List[AutoAnswerRule] = []
+        for index, rule_data in enumerate(auto_answer_config.get("rules", [])):
+            keywords = rule_data.get("keywords", [])
+            if isinstance(keywords, str):
+                keywords = [keywords]
+
+            rule = AutoAnswerRule(
+                name=rule_data.get("name", f"rule_{index}"),
+                answer=rule_data.get("answer", ""),
+                keywords=[kw for kw in keywords if kw],
+                regex=rule_data.get("regex", ""),
+                ignore_case=rule_data.get("ignore_case", True),
+                match_context=rule_data.get("match_context", False),
+            )
+
+            if not rule.answer or not (rule.keywords or rule.regex):
+                continue
+            if rule.regex:
+                if "(?P" in rule.regex:
+                    print(f"忽略自动回答规则 {rule.name}: 不支持命名分组")
+                    continue
+                if _NUMBERED_REFERENCE.search(rule.regex):
+                    print(f"忽略自动回答规则 {rule.name}: 不支持按编号引用分组")
+                    continue
+                try:
+                    # 按嵌入组合正则时的形式校验，一条规则不会导致整个组合正则编译失败
+                    re.compile(self._embed(rule, len(rules)))
+                except re.error as e:
+                    print(f"忽略无效的自动回答规则 {rule.name}: {e}")
+                    continue
+            rules.append(rule)
+
+        self.rules = rules
+        self.enabled = bool(auto_answer_config.get("enabled", True)) and bool(rules)
+        self._matcher, self._keyword_rules = self._compile(
+            [i for i, r in enumerate(rules) if not r.match_context]
+        )
+        self._context_matcher, self._context_keyword_rules = self._compile(
+            [i for i, r in enumerate(rules) if r.match_context]
+        )
+
+    @staticmethod
+    def _embed(rule: AutoAnswerRule, rule_index: int) -> str:
+        """正则规则在组合正则中的分支"""
+        regex = rule.regex
+        flags = _GLOBAL_FLAGS.match(regex)
+        if flags:
+            regex = f"(?{flags.group(1)}:{regex[flags.end():]})"
+        scope = "(?i:" if rule.ignore_case else "(?-i:"
+        return f"(?P<r{rule_index}>{scope}{regex}))"
+
+    def _compile(
+        self, rule_indexes: List[int]
+    ) -> Tuple[Optional[re.Pattern[str]], Dict[str, Dict[str, int]]]:
+        """把一组规则编译成单个组合正则
+
+        ignore_case 为 true 的规则的关键词合并成忽略大小写的分支，
+        其余规则的关键词合并成区分大小写的分支。
+
+        Args:
+            rule_indexes: 参与编译的规则下标
+
+        Returns:
+            (组合正则, {关键词分组名: 关键词到规则下标的映射})
+        """
+        keyword_rules: Dict[str, Dict[str, int]] = {
+            group: {} for group in _KEYWORD_GROUPS
+        }
+        branches = []
+        for rule_index in rule_indexes:
+            rule = self.rules[rule_index]
+            for keyword in rule.keywords:
+                if rule.ignore_case:
+                    keyword_rules["kw"].setdefault(keyword.lower(), rule_index)
+                else:
+                    keyword_rules["kc"].setdefault(keyword, rule_index)
+            if rule.regex:
+                branches.append(self._embed(rule, rule_index))
+
+        keyword_branches = [
+            f"(?P<{group}>({'?i' if ignore_case else '?-i'}:"
+            f"{_build_keyword_pattern(list(keyword_rules[group]))}))"
+            for group, ignore_case in _KEYWORD_GROUPS.items()
+            if keyword_rules[group]
+        ]
+        branches[:0] = keyword_branches
+        if not branches:
+            return None, keyword_rules
+
+        try:
+            return re.compile("|".join(branches)), keyword_rules
+        except re.error as e:
+            print(f"编译自动回答规则失败: {e}")
+            return None, {}
+
+    def reload_if_changed(self) -> bool:
+        """配置文件变化时重新加载规则
+
+        Returns:
+            是否重新加载
+        """
+        try:
+            stat = os.stat(self.config_path)
+            stamp: Optional[Tuple[int, int]] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            stamp = None
+
+        with self._lock:
+            if self._loaded and stamp == self._config_stamp:
+                return False
+
+            config = (load_json(str(self.config_path)) or {}) if stamp else {}
+            self.load_rules(config.get("auto_answer", {}))
+            self._config_stamp = stamp
+            self._loaded = True
+            return True
+
+    def _search(
+        self,
+        matcher: Optional[re.Pattern[str]],
+        keyword_rules: Dict[str, Dict[str, int]],
+        text: str,
+    ) -> Optional[AutoAnswerRule]:
+        """用组合正则搜索文本，返回命中的规则"""
+        if matcher is None or not text:
+            return None
+        match = matcher.search(text)
+        if match is None:
+            return None
+        group = match.lastgroup or ""
+        if group in _KEYWORD_GROUPS:
+            keyword = match.group(group)
+            if _KEYWORD_GROUPS[group]:
+                keyword = keyword.lower()
+            return self.rules[keyword_rules[group][keyword]]
+        return self.rules[int(group[1:])]
+
+    def match(self, question: str, context: str = "") -> Optional[Dict[str, Any]]:
+        """匹配问题，命中时返回预设回答并计数
+
+        Args:
+            question: 问题文本
+            context: 上下文信息
+
+        Returns:
+            命中规则的回答信息，未命中返回 None
+        """
+        self.reload_if_changed()
+        if not self.enabled:
+            return None
+
+        rule = self._search(self._matcher, self._keyword_rules, question)
+        if rule is None:
+            rule = self._search(
+                self._context_matcher,
+                self._context_keyword_rules,
+                f"{question}\n{context}",
+            )
+        if rule is None:
+            return None
+
+        with self._lock:
+            self.auto_answered_count += 1
+            self.rule_hits[rule.name] = self.rule_hits.get(rule.name, 0) + 1
+
+        return {
+            "question": question,
+            "context": context,
+            "answer": rule.answer,
+            "rule": rule.name,
+            "status": "auto_answered",
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取自动回答统计
+
+        Returns:
+            统计信息
+        """
+        self.reload_if_changed()
+        return {
+            "enabled": self.enabled,
+            "rule_count": len(self.rules),
+            "auto_answered_count": self.auto_answered_count,
+            "rule_hits": dict(self.rule_hits),
+        }
+
+
+# 全局自动回答引擎实例
+auto_answer_engine = AutoAnswerEngine()
+
+
+def get_auto_answer_engine() -> AutoAnswerEngine:
+    """获取全局自动回答引擎实例"""
+    return auto_answer_engine
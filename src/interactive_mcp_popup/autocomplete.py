@@ -0,0 +1,245 @@
+"""
+回答自动补全模块
+
+用压缩前缀树（radix tree）记录用户历史回答及其出现次数。
+每个节点缓存子树中频率最高的若干回答，按键查询只需沿前缀走一遍，适合在 GUI 线程逐键调用。
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .metrics import phase
+
+
+class _TrieNode:
+    """前缀树节点"""
+
+    __slots__ = ("label", "children", "count", "top")
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.count = 0
+        # 子树中频率最高的回答 [(次数, 回答)]，按次数降序
+        self.top: List[Tuple[int, str]] = []
+
+
+class AnswerTrie:
+    """带频率排序的回答前缀树"""
+
+    def __init__(self, top_k: int = 8, max_answer_length: int = 200):
+        self.top_k = top_k
+        self.max_answer_length = max_answer_length
+        self.persist_path: Optional[str] = None
+        self.flush_interval = 30.0
+
+        self._root = _TrieNode()
+        self._counts: Dict[str, int] = {}
+        self._dirty = False
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def _update_top(self, node: _TrieNode, answer: str, count: int) -> None:
+        """更新节点的高频回答缓存（次数只增不减）"""
+        top = node.top
+        for index, (_, existing) in enumerate(top):
+            if existing == answer:
+                del top[index]
+                break
+        else:
+            if len(top) >= self.top_k and count <= top[-1][0]:
+                return
+
+        position = len(top)
+        while position > 0 and top[position - 1][0] < count:
+            position -= 1
+        top.insert(position, (count, answer))
+        del top[self.top_k :]
+
+    def add(self, answer: str, count: int = 1) -> bool:
+        """记录一次回答
+
+        Args:
+            answer: 回答文本
+            count: 增加的次数
+
+        Returns:
+            是否被记录（空回答或过长回答会被忽略）
+        """
+        answer = answer.strip()
+        if not answer or len(answer) > self.max_answer_length or count <= 0:
+            return False
+
+        with self._lock:
+            total = self._counts.get(answer, 0) + count
+            self._counts[answer] = total
+
+            node = self._root
+            self._update_top(node, answer, total)
+            rest = answer
+            while rest:
+                child = node.children.get(rest[0])
+                if child is None:
+                    child = _TrieNode(rest)
+                    node.children[rest[0]] = child
+                    common = len(rest)
+                else:
+                    label = child.label
+                    common = 0
+                    limit = min(len(label), len(rest))
+                    while common < limit and label[common] == rest[common]:
+                        common += 1
+
+                    if common < len(label):
+                        # 拆分边：中间节点的子树与原子节点相同
+                        middle = _TrieNode(label[:common])
+                        middle.top = list(child.top)
+                        child.label = label[common:]
+                        middle.children[child.label[0]] = child
+                        node.children[rest[0]] = middle
+                        child = middle
+
+                node = child
+                rest = rest[common:]
+                self._update_top(node, answer, total)
+
+            node.count = total
+            self._dirty = True
+        return True
+
+    def add_all(self, answers: Iterable[str]) -> int:
+        """批量记录回答
+
+        Args:
+            answers: 回答序列
+
+        Returns:
+            记录的回答数量
+        """
+        return sum(1 for answer in answers if self.add(answer))
+
+    def complete(self, prefix: str, limit: int = 5) -> List[str]:
+        """查找以给定前缀开头的高频回答
+
+        Args:
+            prefix: 已输入的前缀
+            limit: 最多返回数量
+
+        Returns:
+            按频率降序排列的回答列表
+        """
+        if not prefix or len(prefix) > self.max_answer_length:
+            return []
+
+        node = self._root
+        rest = prefix
+        while rest:
+            child = node.children.get(rest[0])
+            if child is None:
+                return []
+            label = child.label
+            if len(rest) <= len(label):
+                if not label.startswith(rest):
+                    return []
+                node = child
+                break
+            if not rest.startswith(label):
+                return []
+            node = child
+            rest = rest[len(label) :]
+
+        return [answer for _, answer in node.top[:limit]]
+
+    def get_count(self, answer: str) -> int:
+        """获取回答出现的次数"""
+        return self._counts.get(answer.strip(), 0)
+
+    def save(self, filepath: str) -> bool:
+        """保存到文件
+
+        只保存回答和次数，加载时按次数重建前缀树，不需要重新扫描对话历史。
+
+        Args:
+            filepath: 文件路径
+
+        Returns:
+            是否成功
+        """
+        try:
+            with self._lock:
+                data = {"version": 1, "counts": dict(self._counts)}
+                self._dirty = False
+            temp_path = f"{filepath}.tmp"
+            with phase("persistence"):
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(temp_path, filepath)
+            self._last_flush = time.monotonic()
+            return True
+        except Exception as e:
+            self._dirty = True
+            print(f"保存自动补全数据失败: {e}")
+            return False
+
+    def load(self, filepath: str) -> bool:
+        """从文件加载
+
+        Args:
+            filepath: 文件路径
+
+        Returns:
+            是否成功
+        """
+        try:
+            with open(filepath, encoding="utf-8") as f:
+                data = json.load(f)
+            for answer, count in data.get("counts", {}).items():
+                self.add(answer, count)
+            self._dirty = False
+            return True
+        except Exception as e:
+            print(f"加载自动补全数据失败: {e}")
+            return False
+
+    def open(self, filepath: str, history: Optional[Iterable[str]] = None) -> bool:
+        """绑定持久化文件
+
+        文件存在时直接加载；不存在时用 history 中的历史回答构建一次。
+        之后通过 flush 定期写回，进程退出时自动写回。
+
+        Args:
+            filepath: 持久化文件路径
+            history: 历史回答（仅在文件不存在时使用）
+
+        Returns:
+            是否从文件加载
+        """
+        self.persist_path = filepath
+        atexit.register(self.flush, True)
+        if os.path.exists(filepath):
+            return self.load(filepath)
+        if history is not None:
+            self.add_all(history)
+        return False
+
+    def flush(self, force: bool = False) -> bool:
+        """有改动时写回持久化文件
+
+        Args:
+            force: 是否忽略写回间隔
+
+        Returns:
+            是否写入
+        """
+        if not self.persist_path or not self._dirty:
+            return False
+        if not force and time.monotonic() - self._last_flush < self.flush_interval:
+            return False
+        return self.save(self.persist_path)
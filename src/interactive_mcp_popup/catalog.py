@@ -0,0 +1,187 @@
+"""
+对话目录模块
+
+为对话列表查询维护二级索引和计数：
+- 按状态分组、按 (updated_at, id) 排序的列表，用于按更新时间排序和 updated_since 过滤；
+- 按状态分组、按 (topic, id) 排序的列表，用于主题前缀过滤；
+- 每种状态的对话数。
+
+索引用 bisect 维护有序列表，查询从起点二分定位后顺序取出一页，
+代价与页大小成正比，与对话总数无关。
+"""
+
+import json
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, Optional, Tuple
+
+SORT_ORDERS = ("updated_desc", "updated_asc", "topic")
+
+_ALL = ""  # 不区分状态的索引
+
+
+def _remove_sorted(items: List[Tuple[str, str]], item: Tuple[str, str]) -> None:
+    """从有序列表中删除一项"""
+    index = bisect_left(items, item)
+    if index < len(items) and items[index] == item:
+        del items[index]
+
+
+def encode_cursor(key: Tuple[str, str]) -> str:
+    """把排序键编码为游标"""
+    return json.dumps(list(key), ensure_ascii=False)
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """解析游标
+
+    Raises:
+        ValueError: 游标无效
+    """
+    try:
+        first, second = json.loads(cursor)
+    except (TypeError, ValueError):
+        raise ValueError(f"无效的游标: {cursor}") from None
+    return str(first), str(second)
+
+
+class ConversationCatalog:
+    """对话二级索引"""
+
+    def __init__(self) -> None:
+        self.clear()
+
+    def clear(self) -> None:
+        """清空索引"""
+        self._entries: Dict[str, Tuple[str, str, str]] = (
+            {}
+        )  # 对话ID -> (状态, 更新时间, 主题)
+        self._by_updated: Dict[str, List[Tuple[str, str]]] = {_ALL: []}
+        self._by_topic: Dict[str, List[Tuple[str, str]]] = {_ALL: []}
+        self.status_counts: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return conversation_id in self._entries
+
+    def count(self, status: Optional[str] = None) -> int:
+        """对话数
+
+        Args:
+            status: 只统计该状态，None 表示全部
+        """
+        if status is None:
+            return len(self._entries)
+        return self.status_counts.get(status, 0)
+
+    def update(
+        self, conversation_id: str, status: str, updated_at: str, topic: str
+    ) -> None:
+        """添加或更新一个对话的索引项"""
+        old = self._entries.get(conversation_id)
+        new = (status, updated_at, topic)
+        if old == new:
+            return
+
+        if old is not None:
+            self.remove(conversation_id)
+        self._entries[conversation_id] = new
+        for group in (_ALL, status):
+            insort(
+                self._by_updated.setdefault(group, []), (updated_at, conversation_id)
+            )
+            insort(self._by_topic.setdefault(group, []), (topic, conversation_id))
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    def remove(self, conversation_id: str) -> None:
+        """删除一个对话的索引项"""
+        entry = self._entries.pop(conversation_id, None)
+        if entry is None:
+            return
+        status, updated_at, topic = entry
+        for group in (_ALL, status):
+            _remove_sorted(self._by_updated[group], (updated_at, conversation_id))
+            _remove_sorted(self._by_topic[group], (topic, conversation_id))
+        self.status_counts[status] -= 1
+
+    def query(
+        self,
+        status: Optional[str] = None,
+        topic_prefix: str = "",
+        updated_since: Optional[str] = None,
+        sort: str = "updated_desc",
+        limit: int = 50,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[str], Optional[str]]:
+        """查询一页对话ID
+
+        sort 为 updated_* 时按更新时间索引定位，主题前缀在扫描时过滤；
+        sort 为 topic 时按主题索引定位前缀范围，更新时间在扫描时过滤。
+
+        Args:
+            status: 只返回该状态的对话
+            topic_prefix: 主题前缀
+            updated_since: 只返回更新时间不早于该值的对话（"YYYY-MM-DD HH:MM:SS" 或其前缀）
+            sort: "updated_desc"、"updated_asc" 或 "topic"
+            limit: 每页数量
+            cursor: 上一页返回的 next_cursor
+
+        Returns:
+            (对话ID列表, 下一页游标)，没有更多时游标为 None
+
+        Raises:
+            ValueError: 排序方式或游标无效
+        """
+        if sort not in SORT_ORDERS:
+            raise ValueError(f"不支持的排序: {sort}")
+        after = decode_cursor(cursor) if cursor else None
+        group = _ALL if status is None else status
+        entries = self._entries
+
+        if sort == "topic":
+            items = self._by_topic.get(group, [])
+            start = (
+                bisect_right(items, after)
+                if after
+                else bisect_left(items, (topic_prefix,))
+            )
+            positions = range(start, len(items))
+
+            def accept(item: Tuple[str, str]) -> bool:
+                return updated_since is None or entries[item[1]][1] >= updated_since
+
+            def stop(item: Tuple[str, str]) -> bool:
+                return not item[0].startswith(topic_prefix)
+
+        else:
+            items = self._by_updated.get(group, [])
+            low = bisect_left(items, (updated_since,)) if updated_since else 0
+            if sort == "updated_asc":
+                start = max(low, bisect_right(items, after)) if after else low
+                positions = range(start, len(items))
+            else:
+                end = bisect_left(items, after) if after else len(items)
+                positions = range(end - 1, low - 1, -1)
+
+            def accept(item: Tuple[str, str]) -> bool:
+                return entries[item[1]][2].startswith(topic_prefix)
+
+            def stop(item: Tuple[str, str]) -> bool:
+                return False
+
+        page: List[Tuple[str, str]] = []
+        has_more = False
+        for position in positions:
+            item = items[position]
+            if stop(item):
+                break
+            if not accept(item):
+                continue
+            if len(page) == limit:
+                has_more = True
+                break
+            page.append(item)
+
+        next_cursor = encode_cursor(page[-1]) if has_more else None
+        return [item[1] for item in page], next_cursor
@@ -0,0 +1,311 @@
+"""
+列式消息存储模块
+
+消息很多的对话可以把 conversation.messages 换成 MessageColumns：按列保存，而不是每条消息一个对象。
+
+- timestamps: array('q')，整数秒（compact.encode_timestamp）；
+- codes: bytearray，每条消息一个字节的发送者/类型编码（compact.encode_codes）；
+- ids: bytearray，每条消息 16 字节的二进制 UUID；
+- offsets: array('Q')，第 i 条消息的内容为 content[offsets[i]:offsets[i + 1]]；
+- content: bytearray，所有消息内容的 UTF-8 拼接在一起。
+
+MessageColumns 支持 conversation.messages 上用到的列表操作（len、下标、切片、遍历、append），
+下标访问返回 ColumnarMessage 行视图，属性在访问时才从列中解码。
+select / iter_contents / content_bytes 直接在列上扫描，不为每条消息创建对象。
+无法编码的值（非 UUID 的ID、其他格式的时间、未知的发送者或类型、不连续的序号）记录在例外表中。
+"""
+
+import sys
+from array import array
+from bisect import bisect_right
+from itertools import compress
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+from .compact import (
+    MESSAGE_TYPES,
+    SENDERS,
+    decode_codes,
+    decode_id,
+    decode_timestamp,
+    encode_codes,
+    encode_id,
+    encode_timestamp,
+)
+
+UNKNOWN_CODE = 255  # 发送者或类型无法编码，实际值在例外表中
+_NO_ID = bytes(16)
+
+
+class MessageColumns:
+    """一个对话的列式消息存储"""
+
+    def __init__(self, conversation_id: str, messages: Iterable[Any] = ()):
+        """
+        Args:
+            conversation_id: 对话ID
+            messages: 初始消息（ConversationMessage、CompactMessage 或任何带相同属性的对象）
+        """
+        self.conversation_id = sys.intern(conversation_id)
+        self.timestamps = array("q")
+        self.codes = bytearray()
+        self.ids = bytearray()
+        self.offsets = array("Q", [0])
+        self.content = bytearray()
+        # 无法编码的字段：消息下标 -> {字段名: 原值}
+        self._exceptions: Dict[int, Dict[str, Any]] = {}
+        # 时间戳单调不减时，按时间过滤可以二分查找
+        self._sorted = True
+        for message in messages:
+            self.append(message)
+
+    def append(self, message: Any) -> None:
+        """追加一条消息（序号应为当前消息数 + 1）"""
+        index = len(self.codes)
+        exceptions = {}
+
+        message_id = encode_id(message.id)
+        if isinstance(message_id, bytes):
+            self.ids += message_id
+        else:
+            self.ids += _NO_ID
+            exceptions["id"] = message_id
+
+        timestamp = encode_timestamp(message.timestamp)
+        if isinstance(timestamp, int):
+            if index and self._sorted and timestamp < self.timestamps[-1]:
+                self._sorted = False
+            self.timestamps.append(timestamp)
+        else:
+            self.timestamps.append(self.timestamps[-1] if index else 0)
+            self._sorted = False
+            exceptions["timestamp"] = timestamp
+
+        code = encode_codes(message.sender, message.message_type)
+        if code is None:
+            self.codes.append(UNKNOWN_CODE)
+            exceptions["sender"] = message.sender
+            exceptions["message_type"] = message.message_type
+        else:
+            self.codes.append(code)
+
+        if message.seq != index + 1:
+            exceptions["seq"] = message.seq
+        if message.conversation_id != self.conversation_id:
+            exceptions["conversation_id"] = message.conversation_id
+        if exceptions:
+            self._exceptions[index] = exceptions
+
+        data = message.content.encode("utf-8")
+        try:
+            self.content += data
+        except BufferError:
+            # 仍有 content_view 返回的视图引用缓冲区，不能原地扩容；复制一份，旧视图继续有效
+            self.content = self.content + data
+        self.offsets.append(len(self.content))
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return [ColumnarMessage(self, i) for i in range(*index.indices(len(self)))]
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError("消息下标超出范围")
+        return ColumnarMessage(self, index)
+
+    def __iter__(self) -> Iterator["ColumnarMessage"]:
+        for index in range(len(self)):
+            yield ColumnarMessage(self, index)
+
+    def __repr__(self) -> str:
+        return f"MessageColumns(conversation_id={self.conversation_id!r}, messages={len(self)}, content_bytes={self.content_bytes()})"
+
+    def _field(self, index: int, name: str) -> Any:
+        """例外表中的原值，没有时返回 None"""
+        exceptions = self._exceptions.get(index)
+        return exceptions.get(name) if exceptions else None
+
+    def text(self, index: int) -> str:
+        """第 index 条消息的内容"""
+        return self.content[self.offsets[index] : self.offsets[index + 1]].decode(
+            "utf-8"
+        )
+
+    def content_view(self, index: int) -> memoryview:
+        """第 index 条消息内容的 UTF-8 字节视图（不复制）"""
+        return memoryview(self.content)[self.offsets[index] : self.offsets[index + 1]]
+
+    def content_bytes(self) -> int:
+        """所有消息内容的 UTF-8 总字节数"""
+        return self.offsets[-1]
+
+    def nbytes(self) -> int:
+        """列占用的字节数（不含例外表）"""
+        return (
+            self.timestamps.itemsize * len(self.timestamps)
+            + len(self.codes)
+            + len(self.ids)
+            + self.offsets.itemsize * len(self.offsets)
+            + len(self.content)
+        )
+
+    def select(
+        self,
+        sender: Optional[str] = None,
+        message_type: Optional[str] = None,
+        after: Optional[str] = None,
+    ) -> List[int]:
+        """按发送者、类型和时间筛选消息
+
+        发送者/类型用 bytes.translate 把编码列映射为 0/1 掩码，再用 itertools.compress 取出下标，
+        都在 C 中完成；时间戳单调时用二分查找跳过更早的消息。
+
+        Args:
+            sender: 发送者，None 表示不限
+            message_type: 消息类型，None 表示不限
+            after: 只返回时间晚于该值的消息（"YYYY-MM-DD HH:MM:SS"）
+
+        Returns:
+            按顺序排列的消息下标
+        """
+        start = 0
+        epoch = None
+        if after is not None:
+            epoch = encode_timestamp(after)
+            if not isinstance(epoch, int):
+                raise ValueError(f"无效的时间: {after}")
+            if self._sorted:
+                start = bisect_right(self.timestamps, epoch)
+
+        if sender is None and message_type is None:
+            indexes = list(range(start, len(self)))
+        else:
+            wanted = [
+                encode_codes(s, t)
+                for s in ((sender,) if sender is not None else SENDERS)
+                for t in (
+                    (message_type,) if message_type is not None else MESSAGE_TYPES
+                )
+            ]
+            table = bytearray(256)
+            for code in wanted:
+                if code is not None:
+                    table[code] = 1
+            indexes = list(
+                compress(range(start, len(self)), self.codes[start:].translate(table))
+            )
+            # 无法编码的发送者/类型很少见，逐条比较例外表中的原值
+            position = self.codes.find(UNKNOWN_CODE, start)
+            if position != -1:
+                while position != -1:
+                    if (
+                        sender is None or self._field(position, "sender") == sender
+                    ) and (
+                        message_type is None
+                        or self._field(position, "message_type") == message_type
+                    ):
+                        indexes.append(position)
+                    position = self.codes.find(UNKNOWN_CODE, position + 1)
+                indexes.sort()
+
+        if after is not None and not self._sorted:
+            timestamps = self.timestamps
+            indexes = [
+                i
+                for i in indexes
+                if (self._field(i, "timestamp") or decode_timestamp(timestamps[i]))
+                > after
+            ]
+        return indexes
+
+    def iter_contents(
+        self,
+        sender: Optional[str] = None,
+        message_type: Optional[str] = None,
+        after: Optional[str] = None,
+    ) -> Iterator[str]:
+        """按 select 的条件遍历消息内容"""
+        for index in self.select(sender, message_type, after):
+            yield self.text(index)
+
+
+class ColumnarMessage:
+    """MessageColumns 中一条消息的只读视图，属性与 ConversationMessage 相同"""
+
+    __slots__ = ("_columns", "_index")
+
+    def __init__(self, columns: MessageColumns, index: int):
+        self._columns = columns
+        self._index = index
+
+    @property
+    def id(self) -> str:
+        columns, index = self._columns, self._index
+        value = columns._field(index, "id")
+        return (
+            value
+            if value is not None
+            else decode_id(bytes(columns.ids[index * 16 : index * 16 + 16]))
+        )
+
+    @property
+    def conversation_id(self) -> str:
+        value = self._columns._field(self._index, "conversation_id")
+        return value if value is not None else self._columns.conversation_id
+
+    @property
+    def timestamp(self) -> str:
+        value = self._columns._field(self._index, "timestamp")
+        return (
+            value
+            if value is not None
+            else decode_timestamp(self._columns.timestamps[self._index])
+        )
+
+    @property
+    def sender(self) -> str:
+        code = self._columns.codes[self._index]
+        if code == UNKNOWN_CODE:
+            sender: str = self._columns._field(self._index, "sender")
+            return sender
+        return decode_codes(code)[0]
+
+    @property
+    def message_type(self) -> str:
+        code = self._columns.codes[self._index]
+        if code == UNKNOWN_CODE:
+            message_type: str = self._columns._field(self._index, "message_type")
+            return message_type
+        return decode_codes(code)[1]
+
+    @property
+    def content(self) -> str:
+        return self._columns.text(self._index)
+
+    @property
+    def seq(self) -> int:
+        value = self._columns._field(self._index, "seq")
+        return value if value is not None else self._index + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        """与 dataclasses.asdict(ConversationMessage) 相同的字典"""
+        return {
+            "id": self.id,
+            "conversation_id": self.conversation_id,
+            "timestamp": self.timestamp,
+            "sender": self.sender,
+            "content": self.content,
+            "message_type": self.message_type,
+            "seq": self.seq,
+        }
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, ColumnarMessage):
+            return self.to_dict() == other.to_dict()
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"ColumnarMessage(id={self.id!r}, seq={self.seq}, sender={self.sender!r}, message_type={self.message_type!r})"
@@ -0,0 +1,176 @@
+"""
+紧凑消息表示模块
+
+常驻内存的消息很多时，ConversationMessage（普通数据类，每个实例一个 __dict__，
+两个 36 字符的 UUID 字符串、格式化的时间字符串、重复的 sender / message_type 字符串）
+占用的内存远大于消息内容本身。CompactMessage 提供相同的只读属性，但内部：
+
+- 使用 __slots__，没有实例字典；
+- sender 和 message_type 编码为一个小整数（CPython 缓存 0~256 的整数，不额外分配）；
+- 时间戳保存为整数秒（按不带时区的日历时间换算，格式化后与原字符串完全一致）；
+- 消息ID保存为 16 字节的二进制 UUID，只在访问 id 属性时格式化为字符串；
+- 同一对话的消息共享同一个对话ID字符串。
+
+无法编码的值（非 UUID 的ID、其他格式的时间、未知的发送者或类型）原样保存。
+"""
+
+import calendar
+import sys
+import time
+import uuid
+from typing import Any, Dict, Optional, Tuple, Union
+
+SENDERS: Tuple[str, ...] = ("user", "assistant", "system")
+MESSAGE_TYPES: Tuple[str, ...] = ("question", "answer", "system")
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_SENDER_CODES = {name: code for code, name in enumerate(SENDERS)}
+_TYPE_CODES = {name: code for code, name in enumerate(MESSAGE_TYPES)}
+
+
+def encode_timestamp(timestamp: str) -> Any:
+    """把 "YYYY-MM-DD HH:MM:SS" 编码为整数秒，其他格式原样返回"""
+    # 按固定位置解析，比 time.strptime 快一个数量级
+    try:
+        if len(timestamp) != 19:
+            return timestamp
+        seconds = calendar.timegm(
+            (
+                int(timestamp[0:4]),
+                int(timestamp[5:7]),
+                int(timestamp[8:10]),
+                int(timestamp[11:13]),
+                int(timestamp[14:16]),
+                int(timestamp[17:19]),
+                0,
+                0,
+                0,
+            )
+        )
+    except (TypeError, ValueError, OverflowError):
+        return timestamp
+    # 只有能还原为同一字符串时才编码（例如不接受省略前导零的写法）
+    return seconds if decode_timestamp(seconds) == timestamp else timestamp
+
+
+def decode_timestamp(value: Union[int, str]) -> str:
+    """把 encode_timestamp 的结果还原为字符串"""
+    if isinstance(value, int):
+        return time.strftime(TIME_FORMAT, time.gmtime(value))
+    return value
+
+
+def encode_codes(sender: str, message_type: str) -> Optional[int]:
+    """把发送者和消息类型编码为一个小整数，未知的值返回 None"""
+    sender_code = _SENDER_CODES.get(sender)
+    type_code = _TYPE_CODES.get(message_type)
+    if sender_code is None or type_code is None:
+        return None
+    return sender_code * len(MESSAGE_TYPES) + type_code
+
+
+def decode_codes(code: int) -> Tuple[str, str]:
+    """把 encode_codes 的结果还原为 (发送者, 消息类型)"""
+    return SENDERS[code // len(MESSAGE_TYPES)], MESSAGE_TYPES[code % len(MESSAGE_TYPES)]
+
+
+def encode_id(message_id: str) -> Any:
+    """把 UUID 字符串编码为 16 字节，其他ID原样返回"""
+    try:
+        value = uuid.UUID(message_id)
+    except (TypeError, ValueError, AttributeError):
+        return message_id
+    return value.bytes if str(value) == message_id else message_id
+
+
+def decode_id(value: Union[bytes, str]) -> str:
+    """把 encode_id 的结果还原为字符串"""
+    if isinstance(value, bytes):
+        return str(uuid.UUID(bytes=value))
+    return value
+
+
+class CompactMessage:
+    """紧凑的对话消息，只读属性与 ConversationMessage 相同"""
+
+    __slots__ = ("_id", "conversation_id", "_timestamp", "_codes", "content", "seq")
+
+    def __init__(
+        self,
+        id: str,
+        conversation_id: str,
+        timestamp: str,
+        sender: str,
+        content: str,
+        message_type: str,
+        seq: int = 0,
+    ):
+        self._id = encode_id(id)
+        self.conversation_id = sys.intern(conversation_id)
+        self._timestamp = encode_timestamp(timestamp)
+        codes = encode_codes(sender, message_type)
+        self._codes = (
+            (sys.intern(sender), sys.intern(message_type)) if codes is None else codes
+        )
+        self.content = content
+        self.seq = seq
+
+    @classmethod
+    def from_message(cls, message: Any) -> "CompactMessage":
+        """从 ConversationMessage（或任何带相同属性的对象）转换"""
+        if isinstance(message, cls):
+            return message
+        return cls(
+            message.id,
+            message.conversation_id,
+            message.timestamp,
+            message.sender,
+            message.content,
+            message.message_type,
+            message.seq,
+        )
+
+    @property
+    def id(self) -> str:
+        return decode_id(self._id)
+
+    @property
+    def timestamp(self) -> str:
+        return decode_timestamp(self._timestamp)
+
+    @property
+    def epoch(self) -> Any:
+        """时间戳的整数秒（无法编码时为原字符串）"""
+        return self._timestamp
+
+    @property
+    def sender(self) -> str:
+        if isinstance(self._codes, tuple):
+            return self._codes[0]
+        return decode_codes(self._codes)[0]
+
+    @property
+    def message_type(self) -> str:
+        if isinstance(self._codes, tuple):
+            return self._codes[1]
+        return decode_codes(self._codes)[1]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """与 dataclasses.asdict(ConversationMessage) 相同的字典"""
+        return {
+            "id": self.id,
+            "conversation_id": self.conversation_id,
+            "timestamp": self.timestamp,
+            "sender": self.sender,
+            "content": self.content,
+            "message_type": self.message_type,
+            "seq": self.seq,
+        }
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, CompactMessage):
+            return self.to_dict() == other.to_dict()
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"CompactMessage(id={self.id!r}, seq={self.seq}, sender={self.sender!r}, message_type={self.message_type!r})"
@@ -0,0 +1,205 @@
+"""
+对话上下文窗口模块
+
+在调用方给定的 token 或字符预算内组装对话视图：
+最近的消息原样保留，更早的消息按固定大小分段，每段用一行摘要代替。
+
+- 每条消息的 token 估算只计算一次并缓存；
+- 完整分段的摘要生成后保存，之后只为新出现的分段生成摘要；
+- 组装视图时从最新消息向前取，代价与视图大小成正比，不会每次扫描整个消息列表。
+"""
+
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from .utils import truncate_text
+
+SEGMENT_SIZE = 10  # 每段摘要覆盖的消息数
+SUMMARY_LINE_CHARS = 60  # 摘要中每条消息保留的字符数
+SUMMARY_MAX_CHARS = 400  # 每段摘要的最大字符数
+RECENT_SHARE = 0.7  # 放不下全部原文时，原文最多占用的预算比例，其余留给摘要
+
+_CJK_CHAR = re.compile(
+    r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]"
+)
+_SENDER_LABELS = {"assistant": "问", "user": "答", "system": "系统"}
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的 token 数
+
+    中日韩文字按每字一个 token，其他文字按每 4 个字符一个 token。
+
+    Args:
+        text: 文本
+
+    Returns:
+        估算的 token 数（至少为 1）
+    """
+    cjk = len(_CJK_CHAR.findall(text))
+    return max(1, cjk + (len(text) - cjk + 3) // 4)
+
+
+def summarize_messages(messages: List[Any]) -> str:
+    """把一段消息压缩成一行摘要"""
+    parts = []
+    for message in messages:
+        label = _SENDER_LABELS.get(message.sender, message.sender)
+        line = " ".join(message.content.split())
+        parts.append(f"{label}: {truncate_text(line, SUMMARY_LINE_CHARS)}")
+    return truncate_text(" / ".join(parts), SUMMARY_MAX_CHARS)
+
+
+@dataclass
+class _Digest:
+    """一个对话的缓存：每条消息的 token 数和已完成分段的摘要"""
+
+    conversation: Any
+    tokens: List[int] = field(default_factory=list)
+    total_tokens: int = 0
+    total_chars: int = 0
+    summaries: List[str] = field(default_factory=list)
+    summary_tokens: List[int] = field(default_factory=list)
+
+
+class ContextWindow:
+    """按预算组装对话上下文"""
+
+    def __init__(self, segment_size: int = SEGMENT_SIZE):
+        self.segment_size = segment_size
+        self._digests: Dict[str, _Digest] = {}
+        self._lock = threading.Lock()
+
+    def forget(self, conversation_id: str) -> None:
+        """丢弃对话的缓存（对话删除或重新加载时调用）"""
+        with self._lock:
+            self._digests.pop(conversation_id, None)
+
+    def _digest(self, conversation: Any) -> _Digest:
+        """取得对话的缓存，并补齐新消息的 token 数和新完成分段的摘要"""
+        digest = self._digests.get(conversation.id)
+        messages = conversation.messages
+        if (
+            digest is None
+            or digest.conversation is not conversation
+            or len(digest.tokens) > len(messages)
+        ):
+            digest = _Digest(conversation)
+            self._digests[conversation.id] = digest
+
+        for message in messages[len(digest.tokens) :]:
+            tokens = estimate_tokens(message.content)
+            digest.tokens.append(tokens)
+            digest.total_tokens += tokens
+            digest.total_chars += len(message.content)
+
+        complete = len(messages) // self.segment_size
+        for segment in range(len(digest.summaries), complete):
+            start = segment * self.segment_size
+            summary = summarize_messages(messages[start : start + self.segment_size])
+            digest.summaries.append(summary)
+            digest.summary_tokens.append(estimate_tokens(summary))
+        return digest
+
+    def build(
+        self,
+        conversation: Any,
+        max_tokens: Optional[int] = None,
+        max_chars: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """组装预算内的对话视图
+
+        Args:
+            conversation: 对话
+            max_tokens: token 预算
+            max_chars: 字符预算（同时给出时两者都要满足）
+
+        Returns:
+            {"summaries", "messages", "omitted", "used_tokens", "used_chars", "total_messages"}，
+            summaries 和 messages 都按从旧到新排列
+        """
+        with self._lock:
+            digest = self._digest(conversation)
+        messages = conversation.messages
+        budget_tokens = max_tokens if max_tokens else float("inf")
+        budget_chars = max_chars if max_chars else float("inf")
+        used_tokens = used_chars = 0
+
+        def fits(tokens: int, chars: int, share: float = 1.0) -> bool:
+            return (
+                used_tokens + tokens <= budget_tokens * share
+                and used_chars + chars <= budget_chars * share
+            )
+
+        # 全部原文放得下时不生成摘要；否则原文最多占 RECENT_SHARE，其余留给更早消息的摘要
+        share = 1.0 if fits(digest.total_tokens, digest.total_chars) else RECENT_SHARE
+
+        # 最近的消息原样保留
+        recent: List[Dict[str, Any]] = []
+        cutoff = len(messages)
+        while cutoff > 0:
+            message = messages[cutoff - 1]
+            tokens, chars = digest.tokens[cutoff - 1], len(message.content)
+            if not fits(tokens, chars, share):
+                break
+            recent.append(self._message_item(message, message.content))
+            used_tokens += tokens
+            used_chars += chars
+            cutoff -= 1
+
+        if not recent and messages:
+            # 最新一条消息本身就超出预算：按预算截断
+            message = messages[-1]
+            limit = min(budget_chars, budget_tokens, len(message.content))
+            content = truncate_text(message.content, max(int(limit), 4))
+            item = self._message_item(message, content)
+            item["content_truncated"] = True
+            recent.append(item)
+            used_tokens += estimate_tokens(content)
+            used_chars += len(content)
+            cutoff -= 1
+
+        # 更早的消息用分段摘要代替，从最近的分段开始取
+        summaries: List[Dict[str, Any]] = []
+        end = cutoff
+        while end > 0:
+            start = (end - 1) // self.segment_size * self.segment_size
+            if end - start == self.segment_size:
+                segment = start // self.segment_size
+                summary, tokens = (
+                    digest.summaries[segment],
+                    digest.summary_tokens[segment],
+                )
+            else:
+                # 被原样保留的消息截断的分段，临时生成摘要
+                summary = summarize_messages(messages[start:end])
+                tokens = estimate_tokens(summary)
+            if not fits(tokens, len(summary)):
+                break
+            summaries.append({"from_seq": start + 1, "to_seq": end, "summary": summary})
+            used_tokens += tokens
+            used_chars += len(summary)
+            end = start
+
+        summaries.reverse()
+        recent.reverse()
+        return {
+            "summaries": summaries,
+            "messages": recent,
+            "omitted": {"from_seq": 1, "to_seq": end} if end else None,
+            "used_tokens": used_tokens,
+            "used_chars": used_chars,
+            "total_messages": len(messages),
+        }
+
+    @staticmethod
+    def _message_item(message: Any, content: str) -> Dict[str, Any]:
+        return {
+            "seq": message.seq,
+            "sender": message.sender,
+            "message_type": message.message_type,
+            "timestamp": message.timestamp,
+            "content": content,
+        }
@@ -4,11 +4,28 @@
 支持多轮对话，保持对话上下文和历史记录。
 """
 
+import atexit
 import json
+import os
+import threading
 import time
 import uuid
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass, asdict
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Any, Set, Tuple, Union
+from dataclasses import dataclass, asdict, fields
+
+from .autocomplete import AnswerTrie
+from .catalog import ConversationCatalog
+from .columnar import ColumnarMessage, MessageColumns
+from .compact import CompactMessage
+from .context_window import ContextWindow
+from .metrics import phase
+from .search import SearchIndex, TOPIC_TYPE, make_snippet
+from .similarity import SimilarityIndex
+from .store import ConversationStore, create_conversation_store
+from .tracing import traced
+from .utils import config_manager, get_data_dir, truncate_text
 
 
 @dataclass
@@ -20,6 +37,7 @@ class ConversationMessage:
     sender: str  # "user" or "assistant"
     content: str
     message_type: str  # "question", "answer", "system"
+    seq: int = 0  # 对话内从 1 开始递增的序号
 
 
 @dataclass
@@ -31,14 +49,156 @@ class Conversation:
     created_at: str
     updated_at: str
     status: str  # "active", "ended"
-    messages: List[ConversationMessage]
+    messages: Union[List[Any], MessageColumns]  # ConversationMessage / CompactMessage 列表，或列式存储
+
+
+MESSAGE_FIELDS = tuple(field.name for field in fields(ConversationMessage))
+MAX_PAGE_SIZE = 500
+CONVERSATION_FIELDS = ("id", "topic", "context", "status", "created_at", "updated_at", "message_count")
+MAX_CONTENT_CHUNK = 100000
+MESSAGE_OVERHEAD_BYTES = 400  # 每条消息除内容外的估算内存（数据类、ID、时间戳等）
+COMPACT_MESSAGE_OVERHEAD_BYTES = 250  # CompactMessage 除内容外的估算内存
+COLUMNAR_MESSAGE_OVERHEAD_BYTES = 40  # MessageColumns 中每条消息除内容外的内存（时间戳、编码、ID、偏移）
+
+
+def estimate_message_bytes(message: ConversationMessage) -> int:
+    """估算一条消息占用的内存
+    
+    不使用 sys.getsizeof：字符串被编码过一次后会缓存 UTF-8 副本，同一条消息在写入存储前后大小不同。
+    """
+    content = message.content
+    if isinstance(message, ColumnarMessage):
+        overhead = COLUMNAR_MESSAGE_OVERHEAD_BYTES
+    elif isinstance(message, CompactMessage):
+        overhead = COMPACT_MESSAGE_OVERHEAD_BYTES
+    else:
+        overhead = MESSAGE_OVERHEAD_BYTES
+    return overhead + len(content) * (1 if content.isascii() else 2)
+
+
+def message_to_dict(message: Any) -> Dict[str, Any]:
+    """把消息（ConversationMessage、CompactMessage 或 ColumnarMessage）转换为字典，与 asdict 的结果相同"""
+    if isinstance(message, ConversationMessage):
+        return asdict(message)
+    result: Dict[str, Any] = message.to_dict()
+    return result
+
+
+def conversation_to_dict(conversation: Conversation) -> Dict[str, Any]:
+    """把对话转换为字典，与 asdict 的结果相同（消息可以是紧凑表示）"""
+    return {
+        "id": conversation.id,
+        "topic": conversation.topic,
+        "context": conversation.context,
+        "created_at": conversation.created_at,
+        "updated_at": conversation.updated_at,
+        "status": conversation.status,
+        "messages": [message_to_dict(message) for message in conversation.messages]
+    }
+
+
+def put_text(item: Dict[str, Any], name: str, text: str, max_chars: Optional[int] = None) -> None:
+    """把长文本字段放入结果，超过 max_chars 时只放预览
+    
+    同时写入 "<name>_length"；截断时写入 "<name>_truncated": True，
+    完整内容用 read_message_content 分段读取。
+    
+    Args:
+        item: 结果字典
+        name: 字段名
+        text: 完整文本
+        max_chars: 预览长度上限，None 或 0 表示不截断
+    """
+    item[f"{name}_length"] = len(text)
+    if max_chars and len(text) > max_chars:
+        item[name] = truncate_text(text, max_chars)
+        item[f"{name}_truncated"] = True
+    else:
+        item[name] = text
 
 
 class ConversationManager:
     """对话管理器"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        store: Optional[ConversationStore] = None,
+        background_load: bool = True,
+        memory_budget: Optional[int] = None,
+        compact_messages: bool = False,
+        columnar_threshold: Optional[int] = None
+    ):
+        """
+        Args:
+            store: 存储后端，默认不持久化
+            background_load: 存储延迟读入消息时，是否在后台线程中读入剩余对话的消息
+            memory_budget: 内存中消息的估算总字节数上限，超过时释放最久未访问的对话的消息
+                （只在存储后端能读回消息时生效），None 表示不限制
+            compact_messages: 是否以 CompactMessage 保存内存中的消息（属性相同，占用内存更少）
+            columnar_threshold: 对话的消息数达到该值时改用列式存储（MessageColumns），None 或 0 表示不使用
+        """
         self.conversations: Dict[str, Conversation] = {}
+        self.similarity_index = SimilarityIndex(resolve=self._message_at)
+        self.answer_trie = AnswerTrie()
+        self.catalog = ConversationCatalog()
+        self.context_window = ContextWindow()
+        self.search_index = SearchIndex()
+        # 全文检索索引尚未补齐的对话，新消息留给 sync_search_index 处理
+        self._search_pending: Set[str] = set()
+        self._search_lock = threading.Lock()
+        self._listeners: List[Callable[[str], None]] = []
+        self.store = store or ConversationStore()
+        # 消息尚未从存储读入的对话：对话ID -> 消息数
+        self._deferred: Dict[str, int] = {}
+        self._body_lock = threading.Lock()
+        # 尚未加入相似问题索引的对话（启动时延迟读入的对话）
+        self._unindexed: Set[str] = set()
+        # 消息在内存中的对话，按最近访问排序：对话ID -> 估算字节数
+        self.memory_budget = memory_budget
+        self._hot: "OrderedDict[str, int]" = OrderedDict()
+        self._hot_bytes = 0
+        self._can_evict = type(self.store).evict_body is not ConversationStore.evict_body
+        # 上次保存分片后变化过的对话，以及分片目录
+        self._dirty: Set[str] = set()
+        self._dirty_lock = threading.Lock()
+        self._shard_dir: Optional[str] = None
+        self._autosave: Optional[Tuple[threading.Event, threading.Thread, str]] = None
+        self.compact_messages = compact_messages
+        self._message_class = CompactMessage if compact_messages else ConversationMessage
+        self.columnar_threshold = columnar_threshold
+        
+        try:
+            conversations = list(self.store.load())
+            self._deferred = self.store.deferred()
+            self._unindexed = set(self._deferred)
+            for conversation in conversations:
+                self._adopt(conversation)
+        except Exception as e:
+            print(f"从存储加载对话失败: {e}")
+        self._search_pending = set(self.conversations)
+        
+        if self._deferred and background_load:
+            # 元数据已可查询，消息在首次访问时读入，其余的在后台读入
+            threading.Thread(target=self.load_deferred, name="conversation-loader", daemon=True).start()
+    
+    def add_listener(self, listener: Callable[[str], None]) -> None:
+        """注册对话变化时调用的回调，参数为对话ID"""
+        self._listeners.append(listener)
+    
+    def remove_listener(self, listener: Callable[[str], None]) -> None:
+        """移除回调"""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+    
+    def _notify(self, conversation_id: str) -> None:
+        # 所有修改都会通知，在这里记录变化过的对话
+        with self._dirty_lock:
+            self._dirty.add(conversation_id)
+        for listener in list(self._listeners):
+            try:
+                listener(conversation_id)
+            except Exception as e:
+                print(f"对话变化回调失败: {e}")
         
     def create_conversation(self, topic: str, context: str = "") -> str:
         """创建新对话
@@ -64,19 +224,211 @@ class ConversationManager:
         )
         
         # 添加系统消息
-        system_message = ConversationMessage(
+        system_message = self._message_class(
             id=str(uuid.uuid4()),
             conversation_id=conversation_id,
             timestamp=current_time,
             sender="system",
             content=f"对话开始: {topic}",
-            message_type="system"
+            message_type="system",
+            seq=1
         )
         conversation.messages.append(system_message)
         
         self.conversations[conversation_id] = conversation
+        self._index(conversation)
+        with self._search_lock:
+            self.search_index.add_topic(conversation_id, topic, current_time)
+            self.search_index.add_message(system_message)
+        self._persist(self.store.create_conversation, conversation)
+        with self._body_lock:
+            self._track(conversation)
+        self._notify(conversation_id)
         return conversation_id
     
+    def _index(self, conversation: Conversation) -> None:
+        """更新对话在目录索引中的状态、更新时间和主题"""
+        self.catalog.update(conversation.id, conversation.status, conversation.updated_at, conversation.topic)
+    
+    def _adopt(self, conversation: Conversation) -> None:
+        """把从存储或文件读入的对话放入内存并建立索引（已存在时替换）"""
+        if conversation.id in self.conversations:
+            self.similarity_index.remove_conversation(conversation.id)
+            self.context_window.forget(conversation.id)
+        self.conversations[conversation.id] = conversation
+        self._index(conversation)
+        if conversation.id in self._deferred:
+            return
+        self._convert_messages(conversation)
+        self._unindexed.discard(conversation.id)
+        for message in conversation.messages:
+            self.similarity_index.add_message(message)
+        with self._body_lock:
+            self._untrack(conversation.id)
+            self._track(conversation, promote=False)
+            self._shrink()
+    
+    def _columnize(self, conversation: Conversation) -> bool:
+        """消息数达到 columnar_threshold 时把消息转换为列式存储
+        
+        Returns:
+            是否进行了转换
+        """
+        messages = conversation.messages
+        if not self.columnar_threshold or isinstance(messages, MessageColumns) or len(messages) < self.columnar_threshold:
+            return False
+        conversation.messages = MessageColumns(conversation.id, messages)
+        return True
+    
+    def _convert_messages(self, conversation: Conversation) -> None:
+        """按配置转换从存储或文件读入的消息（列式存储或 CompactMessage）"""
+        if not self._columnize(conversation) and self.compact_messages:
+            conversation.messages = [CompactMessage.from_message(message) for message in conversation.messages]
+    
+    def _track(self, conversation: Conversation, promote: bool = True) -> None:
+        """把消息在内存中的对话加入热集合（调用时已持有 _body_lock）"""
+        if not self._can_evict:
+            return
+        messages = conversation.messages
+        if isinstance(messages, MessageColumns):
+            size = messages.nbytes() + COLUMNAR_MESSAGE_OVERHEAD_BYTES * len(messages)
+        else:
+            size = sum(estimate_message_bytes(message) for message in messages)
+        self._hot[conversation.id] = size
+        self._hot_bytes += size
+        if not promote:
+            # 批量读入的对话放在最久未访问的一端，优先释放
+            self._hot.move_to_end(conversation.id, last=False)
+    
+    def _untrack(self, conversation_id: str) -> None:
+        """从热集合中移除（调用时已持有 _body_lock）"""
+        self._hot_bytes -= self._hot.pop(conversation_id, 0)
+    
+    def _shrink(self, keep: Optional[str] = None) -> None:
+        """超出内存预算时，从最久未访问的对话开始释放消息（调用时已持有 _body_lock）"""
+        if self.memory_budget is None or self._hot_bytes <= self.memory_budget:
+            return
+        for conversation_id in list(self._hot):
+            if self._hot_bytes <= self.memory_budget:
+                break
+            if conversation_id == keep:
+                continue
+            conversation = self.conversations.get(conversation_id)
+            if conversation is None:
+                self._untrack(conversation_id)
+                continue
+            count = len(conversation.messages)
+            if self.store.evict_body(conversation):
+                self._deferred[conversation_id] = count
+                self._untrack(conversation_id)
+                self.context_window.forget(conversation_id)
+    
+    def _ensure_loaded(self, conversation: Conversation, promote: bool = True, shrink: bool = True) -> None:
+        """对话的消息尚未读入（或已被释放）时从存储读入，并更新热集合
+        
+        Args:
+            conversation: 对话
+            promote: 是否标记为最近访问（批量遍历时为 False）
+            shrink: 读入后是否按内存预算释放其他对话
+        """
+        with self._body_lock:
+            index = self._load_body(conversation, promote)
+            if shrink:
+                self._shrink(keep=conversation.id)
+        if index and self.conversations.get(conversation.id) is conversation:
+            for message in conversation.messages:
+                self.similarity_index.add_message(message)
+    
+    def _load_body(self, conversation: Conversation, promote: bool = True) -> bool:
+        """_ensure_loaded 的读入部分（调用时已持有 _body_lock）
+        
+        Returns:
+            读入的消息是否还需要加入相似问题索引
+        """
+        if conversation.id in self._deferred:
+            self.store.load_body(conversation)
+            self._convert_messages(conversation)
+            # 读入完成后才移除标记，其他线程在此之前会等待锁
+            self._deferred.pop(conversation.id, None)
+            index = conversation.id in self._unindexed
+            self._unindexed.discard(conversation.id)
+            self._track(conversation, promote)
+            return index
+        if promote and conversation.id in self._hot:
+            self._hot.move_to_end(conversation.id)
+        return False
+    
+    def load_deferred(self, shrink: bool = True) -> int:
+        """读入所有尚未读入的对话消息
+        
+        Args:
+            shrink: 是否按内存预算边读入边释放（为 False 时全部留在内存中，直到下一次访问对话）
+        
+        Returns:
+            读入的对话数
+        """
+        loaded = 0
+        for conversation_id in list(self._deferred):
+            conversation = self.conversations.get(conversation_id)
+            if conversation is None:
+                continue
+            try:
+                self._ensure_loaded(conversation, promote=False, shrink=shrink)
+                loaded += 1
+            except Exception as e:
+                print(f"读入对话消息失败: {e}")
+        return loaded
+    
+    def get_memory_stats(self) -> Dict[str, Any]:
+        """消息内存使用情况
+        
+        Returns:
+            {"conversations", "resident", "hot", "hot_bytes", "memory_budget", "columnar"}：
+            resident 为消息在内存中的对话数，hot / hot_bytes 为其中可释放的对话数和估算字节数，
+            columnar 为使用列式存储的对话数
+        """
+        with self._body_lock:
+            return {
+                "conversations": len(self.conversations),
+                "resident": len(self.conversations) - len(self._deferred),
+                "hot": len(self._hot),
+                "hot_bytes": self._hot_bytes,
+                "memory_budget": self.memory_budget,
+                "columnar": sum(
+                    isinstance(conversation.messages, MessageColumns) for conversation in self.conversations.values()
+                )
+            }
+    
+    def _message_count(self, conversation: Conversation) -> int:
+        """对话的消息数（消息未读入时使用存储记录的数量）"""
+        count = self._deferred.get(conversation.id)
+        return len(conversation.messages) if count is None else count
+    
+    def _message_at(self, conversation_id: str, seq: int) -> Optional[Any]:
+        """按序号取一条消息；消息不在内存中时尽量只从存储读取这一条
+        
+        Returns:
+            消息，对话或消息不存在时返回 None
+        """
+        conversation = self.conversations.get(conversation_id)
+        if conversation is None or seq < 1:
+            return None
+        if conversation_id in self._deferred:
+            rows = self.store.read_messages(conversation, seq - 1, seq)
+            if rows:
+                return rows[0]
+            self._ensure_loaded(conversation, promote=False)
+        messages = conversation.messages
+        return messages[seq - 1] if seq <= len(messages) else None
+    
+    def _persist(self, operation: Callable[..., None], *args: Any) -> None:
+        """调用存储后端；写入失败只记录，不影响内存中的对话"""
+        try:
+            operation(*args)
+        except Exception as e:
+            print(f"写入对话存储失败: {e}")
+    
+    @traced("add_message")
     def add_message(self, conversation_id: str, sender: str, content: str, message_type: str = "question") -> str:
         """添加消息到对话
         
@@ -96,17 +448,43 @@ class ConversationManager:
         message_id = str(uuid.uuid4())
         current_time = time.strftime("%Y-%m-%d %H:%M:%S")
         
-        message = ConversationMessage(
-            id=message_id,
-            conversation_id=conversation_id,
-            timestamp=current_time,
-            sender=sender,
-            content=content,
-            message_type=message_type
-        )
-        
-        conversation.messages.append(message)
-        conversation.updated_at = current_time
+        # 从读入消息到写入存储一直持有锁：期间其他线程不能释放这个对话的消息，
+        # 否则序号会从 1 重新开始，存储中也会缺少这条消息
+        with self._body_lock:
+            loaded = list(conversation.messages) if self._load_body(conversation) else []
+            message = self._message_class(
+                id=message_id,
+                conversation_id=conversation_id,
+                timestamp=current_time,
+                sender=sender,
+                content=content,
+                message_type=message_type,
+                seq=len(conversation.messages) + 1
+            )
+            
+            conversation.messages.append(message)
+            columnized = self._columnize(conversation)
+            conversation.updated_at = current_time
+            self._index(conversation)
+            self._persist(self.store.add_message, conversation, message)
+            if conversation_id in self._hot:
+                if columnized:
+                    self._untrack(conversation_id)
+                    self._track(conversation)
+                else:
+                    size = estimate_message_bytes(conversation.messages[-1])
+                    self._hot[conversation_id] += size
+                    self._hot_bytes += size
+                self._shrink(keep=conversation_id)
+        for loaded_message in loaded:
+            self.similarity_index.add_message(loaded_message)
+        self.similarity_index.add_message(message)
+        with self._search_lock:
+            if conversation_id not in self._search_pending:
+                self.search_index.add_message(message)
+        if sender == "user" and message_type == "answer":
+            self.answer_trie.add(content)
+        self._notify(conversation_id)
         
         return message_id
     
@@ -119,16 +497,77 @@ class ConversationManager:
         Returns:
             对话对象，如果不存在则返回 None
         """
-        return self.conversations.get(conversation_id)
+        conversation = self.conversations.get(conversation_id)
+        if conversation is not None:
+            self._ensure_loaded(conversation)
+        return conversation
     
     def get_all_conversations(self) -> List[Conversation]:
         """获取所有对话
         
+        会读入所有对话的消息；有内存预算时，超出的部分在下一次访问对话时释放。
+        
         Returns:
             对话列表
         """
+        self.load_deferred(shrink=False)
         return list(self.conversations.values())
     
+    def query_conversations(
+        self,
+        status: Optional[str] = None,
+        topic_prefix: str = "",
+        updated_since: Optional[str] = None,
+        sort: str = "updated_desc",
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+        max_context_chars: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """按条件分页查询对话列表
+        
+        Args:
+            status: 只返回该状态的对话（"active" 或 "ended"）
+            topic_prefix: 主题前缀
+            updated_since: 只返回更新时间不早于该值的对话
+            sort: "updated_desc"、"updated_asc" 或 "topic"
+            limit: 每页最多返回的对话数
+            cursor: 上一页返回的 next_cursor
+            fields: 只返回这些字段（默认全部）
+            max_context_chars: 上下文超过该长度时只返回预览
+            
+        Returns:
+            {"conversations", "total_count", "active_count", "has_more", "next_cursor"}
+        """
+        selected = tuple(fields) if fields else CONVERSATION_FIELDS
+        unknown = [name for name in selected if name not in CONVERSATION_FIELDS]
+        if unknown:
+            raise ValueError(f"不支持的字段: {', '.join(unknown)}")
+        
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        ids, next_cursor = self.catalog.query(status, topic_prefix, updated_since, sort, limit, cursor)
+        
+        page = []
+        for conversation_id in ids:
+            conversation = self.conversations[conversation_id]
+            item = {}
+            for name in selected:
+                if name == "message_count":
+                    item[name] = self._message_count(conversation)
+                elif name == "context":
+                    put_text(item, name, conversation.context, max_context_chars)
+                else:
+                    item[name] = getattr(conversation, name)
+            page.append(item)
+        
+        return {
+            "conversations": page,
+            "total_count": self.catalog.count(),
+            "active_count": self.catalog.count("active"),
+            "has_more": next_cursor is not None,
+            "next_cursor": next_cursor
+        }
+    
     def end_conversation(self, conversation_id: str, summary: str = "") -> bool:
         """结束对话
         
@@ -145,17 +584,22 @@ class ConversationManager:
         conversation = self.conversations[conversation_id]
         conversation.status = "ended"
         conversation.updated_at = time.strftime("%Y-%m-%d %H:%M:%S")
+        self._index(conversation)
+        self._persist(self.store.update_conversation, conversation)
         
         if summary:
             self.add_message(conversation_id, "system", f"对话结束: {summary}", "system")
+        else:
+            self._notify(conversation_id)
         
         return True
     
-    def get_conversation_history(self, conversation_id: str) -> List[Dict[str, Any]]:
+    def get_conversation_history(self, conversation_id: str, max_content_chars: Optional[int] = None) -> List[Dict[str, Any]]:
         """获取对话历史
         
         Args:
             conversation_id: 对话ID
+            max_content_chars: 消息内容超过该长度时只返回预览（默认返回完整内容）
             
         Returns:
             消息历史列表
@@ -164,7 +608,348 @@ class ConversationManager:
         if not conversation:
             return []
         
-        return [asdict(message) for message in conversation.messages]
+        if not max_content_chars:
+            return [message_to_dict(message) for message in conversation.messages]
+        
+        history = []
+        for message in conversation.messages:
+            item = message_to_dict(message)
+            put_text(item, "content", message.content, max_content_chars)
+            history.append(item)
+        return history
+    
+    def get_history_page(
+        self,
+        conversation_id: str,
+        limit: int = 50,
+        before: Optional[int] = None,
+        after: Optional[int] = None,
+        order: str = "asc",
+        fields: Optional[List[str]] = None,
+        since_seq: Optional[int] = None,
+        max_content_chars: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """分页获取对话历史
+        
+        游标是消息在对话中的位置（从 0 开始，消息只追加，位置不变，等于 seq - 1）。
+        只复制本页消息的所选字段，不会生成整个历史的副本；对话的消息不在内存中且存储支持按范围读取时，
+        只从存储读取本页的消息，不读入整个对话。
+        
+        Args:
+            conversation_id: 对话ID
+            limit: 每页最多返回的消息数
+            before: 只返回序号小于该值的消息
+            after: 只返回序号大于该值的消息
+            order: "asc" 从旧到新，"desc" 从新到旧
+            fields: 只返回这些字段（默认全部），每条消息总会带上 "index"
+            since_seq: 增量同步，只返回 seq 大于该值的消息（从旧到新），已是最新时直接返回空列表
+            max_content_chars: 消息内容超过该长度时只返回预览
+            
+        Returns:
+            {"messages", "total_messages", "latest_seq", "has_more", "next_cursor", "topic", "status", "context"}，
+            对话不存在时返回 None
+        """
+        if since_seq is not None:
+            order, after = "asc", max(after if after is not None else -1, since_seq - 1)
+        if order not in ("asc", "desc"):
+            raise ValueError(f"不支持的排序: {order}")
+        selected = tuple(fields) if fields else MESSAGE_FIELDS
+        unknown = [name for name in selected if name not in MESSAGE_FIELDS]
+        if unknown:
+            raise ValueError(f"不支持的字段: {', '.join(unknown)}")
+        
+        conversation = self.conversations.get(conversation_id)
+        if conversation is None:
+            return None
+        
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        start = max(0, after + 1) if after is not None else 0
+        
+        def bounds(total: int) -> Tuple[range, bool]:
+            """本页消息的位置（按返回顺序）和后面是否还有"""
+            stop = min(total, before) if before is not None else total
+            if order == "asc":
+                return range(start, min(stop, start + limit)), start + limit < stop
+            return range(stop - 1, max(start, stop - limit) - 1, -1), stop - limit > start
+        
+        messages: Any = None
+        total = self._deferred.get(conversation_id)
+        if total is not None:
+            indexes, has_more = bounds(total)
+            rows = self.store.read_messages(conversation, min(indexes), max(indexes) + 1) if indexes else []
+            if rows is not None and len(rows) == len(indexes):
+                # 本页消息按位置放进字典，下面与内存中的消息同样处理
+                messages = dict(zip(sorted(indexes), rows, strict=True))
+        if messages is None:
+            self._ensure_loaded(conversation)
+            messages = conversation.messages
+            total = len(messages)
+            indexes, has_more = bounds(total)
+        
+        page = []
+        for index in indexes:
+            message = messages[index]
+            item = {"index": index}
+            for name in selected:
+                if name == "content":
+                    put_text(item, name, message.content, max_content_chars)
+                else:
+                    item[name] = getattr(message, name)
+            page.append(item)
+        
+        next_cursor = None
+        if has_more and page:
+            # asc 时作为下一次的 after，desc 时作为下一次的 before
+            next_cursor = page[-1]["index"]
+        
+        return {
+            "messages": page,
+            "total_messages": total,
+            "latest_seq": total,
+            "has_more": has_more,
+            "next_cursor": next_cursor,
+            "topic": conversation.topic,
+            "status": conversation.status,
+            "context": conversation.context
+        }
+    
+    def read_message_content(
+        self,
+        conversation_id: str,
+        seq: int,
+        offset: int = 0,
+        length: int = 8000
+    ) -> Optional[Dict[str, Any]]:
+        """按字符范围读取一条消息的内容
+        
+        Args:
+            conversation_id: 对话ID
+            seq: 消息序号
+            offset: 起始字符位置
+            length: 最多读取的字符数
+            
+        Returns:
+            {"content", "offset", "total_length", "next_offset"}，对话或消息不存在时返回 None；
+            读到末尾时 next_offset 为 None
+        """
+        conversation = self.get_conversation(conversation_id)
+        if not conversation or not 1 <= seq <= len(conversation.messages):
+            return None
+        
+        content = conversation.messages[seq - 1].content
+        offset = max(0, offset)
+        end = offset + max(1, min(length, MAX_CONTENT_CHUNK))
+        return {
+            "content": content[offset:end],
+            "offset": offset,
+            "total_length": len(content),
+            "next_offset": end if end < len(content) else None
+        }
+    
+    def get_context_view(
+        self,
+        conversation_id: str,
+        max_tokens: Optional[int] = None,
+        max_chars: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """在预算内获取对话视图：最近的消息原样返回，更早的消息用分段摘要代替
+        
+        Args:
+            conversation_id: 对话ID
+            max_tokens: token 预算（估算值）
+            max_chars: 字符预算
+            
+        Returns:
+            对话视图，对话不存在时返回 None
+        """
+        conversation = self.get_conversation(conversation_id)
+        if not conversation:
+            return None
+        return self.context_window.build(conversation, max_tokens, max_chars)
+    
+    def get_conversation_version(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """获取对话的最新序号和更新时间，用于判断是否需要增量同步
+        
+        Args:
+            conversation_id: 对话ID
+            
+        Returns:
+            {"latest_seq", "updated_at", "status"}，对话不存在时返回 None
+        """
+        conversation = self.conversations.get(conversation_id)
+        if not conversation:
+            return None
+        return {
+            "latest_seq": self._message_count(conversation),
+            "updated_at": conversation.updated_at,
+            "status": conversation.status
+        }
+    
+    def iter_user_answers(self, after: Optional[str] = None) -> Iterator[str]:
+        """遍历所有对话中的用户回答
+        
+        Args:
+            after: 只返回时间晚于该值的回答（"YYYY-MM-DD HH:MM:SS"）
+        
+        Returns:
+            用户回答文本迭代器
+        """
+        for conversation in list(self.conversations.values()):
+            self._ensure_loaded(conversation, promote=False)
+            # 遍历期间对话的消息可能被释放，持有读入时的列表
+            messages = conversation.messages
+            if isinstance(messages, MessageColumns):
+                # 在编码列和时间戳列上筛选，只解码命中的内容
+                yield from messages.iter_contents("user", "answer", after)
+                continue
+            for message in messages:
+                if message.sender == "user" and message.message_type == "answer" and (
+                    after is None or message.timestamp > after
+                ):
+                    yield message.content
+    
+    def find_similar_questions(self, question: str, limit: int = 5, min_score: float = 0.3) -> List[Dict[str, Any]]:
+        """查找历史上相似的问题及其回答
+        
+        Args:
+            question: 新问题
+            limit: 最多返回数量
+            min_score: 最低相似度
+            
+        Returns:
+            相似问答列表，按相似度降序排列
+        """
+        return self.similarity_index.query(question, limit=limit, min_score=min_score)
+    
+    def _reindex_search(self, conversation: Conversation, after_seq: Optional[int] = None) -> None:
+        """把对话加入全文检索索引（调用时已持有 _search_lock）
+        
+        Args:
+            conversation: 对话
+            after_seq: 只索引序号大于该值的消息；None 表示先移除对话再全部重新索引
+        """
+        if after_seq is None:
+            self.search_index.remove_conversation(conversation.id)
+            self.search_index.add_topic(conversation.id, conversation.topic, conversation.created_at)
+            after_seq = 0
+        self._ensure_loaded(conversation, promote=False)
+        messages = conversation.messages
+        for message in messages[after_seq:]:
+            self.search_index.add_message(message)
+    
+    def _replace_search(self, conversation: Conversation) -> None:
+        """用导入的对话替换全文检索索引中的同ID对话"""
+        with self._search_lock:
+            self._search_pending.discard(conversation.id)
+            self._reindex_search(conversation)
+    
+    def sync_search_index(self) -> int:
+        """补齐全文检索索引
+        
+        索引中已删除的对话被移除；尚待补齐的对话中，索引落后的只补齐新增的消息，
+        已是最新的对话（按记录的消息数判断）不需要读入消息。每次只锁定一个对话，
+        补齐期间其他对话照常追加消息。
+        
+        Returns:
+            补齐或重建的对话数
+        """
+        with self._search_lock:
+            for conversation_id in self.search_index.conversation_ids() - set(self.conversations):
+                self.search_index.remove_conversation(conversation_id)
+        
+        updated = 0
+        for conversation_id in list(self._search_pending):
+            with self._search_lock:
+                conversation = self.conversations.get(conversation_id)
+                if conversation_id not in self._search_pending or conversation is None:
+                    self._search_pending.discard(conversation_id)
+                    continue
+                try:
+                    indexed = self.search_index.indexed_seq(conversation_id)
+                    count = self._message_count(conversation)
+                    if indexed != count:
+                        self._reindex_search(conversation, indexed if indexed is not None and indexed < count else None)
+                        updated += 1
+                except Exception as e:
+                    print(f"更新检索索引失败: {e}")
+                self._search_pending.discard(conversation_id)
+        return updated
+    
+    def open_search_index(self, filepath: str, background: bool = True) -> None:
+        """绑定全文检索索引文件：加载已保存的索引，之后变化的对话稍后补齐
+        
+        补齐需要读入索引落后的对话的消息，默认在后台线程中进行，不影响启动时间；
+        补齐完成之前的检索会先同步补齐。
+        
+        Args:
+            filepath: 索引文件路径
+            background: 是否在后台线程中补齐（为 False 时留给 sync_search_index 或首次检索）
+        """
+        self.search_index.open(filepath)
+        with self._search_lock:
+            self._search_pending = set(self.conversations)
+        if background:
+            threading.Thread(target=self.sync_search_index, name="search-index-sync", daemon=True).start()
+    
+    @traced("search_messages")
+    def search_messages(
+        self,
+        query: str,
+        sender: Optional[str] = None,
+        message_type: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: int = 20,
+        cursor: Optional[int] = None,
+        max_snippet_chars: int = 200
+    ) -> Dict[str, Any]:
+        """在所有对话的消息内容和主题中全文检索
+        
+        Args:
+            query: 查询文本
+            sender: 只返回该发送者的消息（"user"、"assistant"）
+            message_type: 只返回该类型的消息（"question"、"answer"，"topic" 表示对话主题）
+            since: 只返回时间不早于该值的结果
+            until: 只返回时间不晚于该值的结果（只给日期时包含当天）
+            limit: 每页最多返回的结果数
+            cursor: 上一页返回的 next_cursor
+            max_snippet_chars: 结果片段的最大长度
+            
+        Returns:
+            {"results", "total", "has_more", "next_cursor"}，结果按相关度降序，
+            每项包含对话ID、主题、消息序号、发送者、类型、时间、分数和命中片段
+        """
+        if self._search_pending:
+            self.sync_search_index()
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        offset = max(0, cursor or 0)
+        hits, total = self.search_index.search(query, sender, message_type, since, until, limit, offset)
+        
+        results = []
+        for hit in hits:
+            # 片段只需要命中的那条消息，不读入整个对话的消息
+            conversation = self.conversations.get(hit["conversation_id"])
+            if conversation is None:
+                continue
+            if hit["message_type"] == TOPIC_TYPE:
+                text = conversation.topic
+            else:
+                message = self._message_at(conversation.id, hit["seq"])
+                if message is None:
+                    continue
+                text = message.content
+            hit["topic"] = conversation.topic
+            hit["snippet"] = make_snippet(text, query, max_snippet_chars)
+            results.append(hit)
+        
+        next_offset = offset + len(hits)
+        has_more = next_offset < total
+        return {
+            "results": results,
+            "total": total,
+            "has_more": has_more,
+            "next_cursor": next_offset if has_more else None
+        }
     
     def delete_conversation(self, conversation_id: str) -> bool:
         """删除对话
@@ -177,9 +962,149 @@ class ConversationManager:
         """
         if conversation_id in self.conversations:
             del self.conversations[conversation_id]
+            with self._body_lock:
+                self._deferred.pop(conversation_id, None)
+                self._unindexed.discard(conversation_id)
+                self._untrack(conversation_id)
+            self.catalog.remove(conversation_id)
+            self.context_window.forget(conversation_id)
+            self.similarity_index.remove_conversation(conversation_id)
+            with self._search_lock:
+                self._search_pending.discard(conversation_id)
+                self.search_index.remove_conversation(conversation_id)
+            self._persist(self.store.delete_conversation, conversation_id)
+            self._notify(conversation_id)
             return True
         return False
     
+    @traced("save_shards")
+    def save_shards(self, directory: str, max_workers: Optional[int] = None) -> Dict[str, int]:
+        """把变化过的对话写入各自的分片文件
+        
+        第一次保存到某个目录（或换了目录）时写入全部对话，之后只写入上次保存后
+        创建、修改过的对话，并删除已删除对话的分片。分片在线程池中并行、原子地写入，
+        写入失败的对话下次保存时重试。
+        
+        Args:
+            directory: 分片目录
+            max_workers: 线程池大小，默认由 ThreadPoolExecutor 决定
+            
+        Returns:
+            {"written", "removed", "failed"}
+        """
+        from .shards import remove_shard, write_shard
+        
+        directory = os.path.abspath(directory)
+        os.makedirs(directory, exist_ok=True)
+        with self._dirty_lock:
+            if self._shard_dir != directory:
+                changed = set(self.conversations)
+                self._shard_dir = directory
+            else:
+                changed = self._dirty
+            self._dirty = set()
+        
+        def save(conversation_id: str) -> str:
+            conversation = self.conversations.get(conversation_id)
+            if conversation is None:
+                return "removed" if remove_shard(directory, conversation_id) else ""
+            self._ensure_loaded(conversation, promote=False)
+            write_shard(directory, conversation)
+            return "written"
+        
+        result = {"written": 0, "removed": 0, "failed": 0}
+        with phase("persistence"), ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {conversation_id: pool.submit(save, conversation_id) for conversation_id in changed}
+            for conversation_id, future in futures.items():
+                try:
+                    outcome = future.result()
+                    if outcome:
+                        result[outcome] += 1
+                except Exception as e:
+                    print(f"写入对话分片失败: {e}")
+                    result["failed"] += 1
+                    with self._dirty_lock:
+                        self._dirty.add(conversation_id)
+        return result
+    
+    def load_shards(self, directory: str, max_workers: Optional[int] = None) -> int:
+        """从分片目录加载对话，分片在线程池中并行读取
+        
+        加载的对话视为已保存，之后 save_shards 到同一目录时只写入变化的对话。
+        
+        Args:
+            directory: 分片目录
+            max_workers: 线程池大小
+            
+        Returns:
+            加载的对话数
+        """
+        from .shards import list_shards, read_shard
+        
+        def load(path: str) -> Optional[Conversation]:
+            try:
+                return read_shard(path)
+            except Exception as e:
+                print(f"读取对话分片失败: {e}")
+                return None
+        
+        directory = os.path.abspath(directory)
+        with phase("persistence"), ThreadPoolExecutor(max_workers=max_workers) as pool:
+            conversations = [c for c in pool.map(load, list_shards(directory)) if c is not None]
+        
+        for conversation in conversations:
+            self._deferred.pop(conversation.id, None)
+            self._adopt(conversation)
+            self._replace_search(conversation)
+            self._persist(self.store.save_conversation, conversation)
+            self._notify(conversation.id)
+        
+        with self._dirty_lock:
+            if self._shard_dir != directory:
+                # 内存中原有的对话不在这个目录中，下次保存时写入全部
+                self._dirty = set(self.conversations)
+                self._shard_dir = directory
+            self._dirty.difference_update(conversation.id for conversation in conversations)
+        return len(conversations)
+    
+    def start_shard_autosave(self, directory: str, interval: float = 30.0) -> int:
+        """以分片目录持久化对话：加载目录中的对话，之后在后台线程中定期保存变化过的对话
+        
+        进程退出时再保存一次。storage.backend 为 "shards" 时全局管理器启动时调用。
+        
+        Args:
+            directory: 分片目录
+            interval: 保存间隔（秒）
+            
+        Returns:
+            加载的对话数
+        """
+        self.stop_shard_autosave()
+        os.makedirs(directory, exist_ok=True)
+        loaded = self.load_shards(directory)
+        stop = threading.Event()
+        
+        def run() -> None:
+            while not stop.wait(interval):
+                self.save_shards(directory)
+        
+        thread = threading.Thread(target=run, name="shard-autosave", daemon=True)
+        self._autosave = (stop, thread, directory)
+        thread.start()
+        atexit.register(self.stop_shard_autosave)
+        return loaded
+    
+    def stop_shard_autosave(self) -> None:
+        """停止定期保存，并保存最后一次变化"""
+        autosave, self._autosave = self._autosave, None
+        if autosave is None:
+            return
+        stop, thread, directory = autosave
+        stop.set()
+        thread.join()
+        self.save_shards(directory)
+    
+    @traced("save_to_file")
     def save_to_file(self, filepath: str) -> bool:
         """保存对话到文件
         
@@ -190,51 +1115,101 @@ class ConversationManager:
             是否成功
         """
         try:
-            data = {
-                "conversations": {
-                    conv_id: asdict(conv) for conv_id, conv in self.conversations.items()
-                }
-            }
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            # 逐个对话写出（格式与 json.dump(..., indent=2) 相同），
+            # 有内存预算时不需要同时读入所有对话的消息
+            with phase("persistence"):
+                with open(filepath, 'w', encoding='utf-8') as f:
+                    f.write('{\n  "conversations": {')
+                    for index, conversation in enumerate(list(self.conversations.values())):
+                        self._ensure_loaded(conversation, promote=False)
+                        item = json.dumps(conversation_to_dict(conversation), ensure_ascii=False, indent=2)
+                        f.write(("," if index else "") + "\n    " + json.dumps(conversation.id, ensure_ascii=False) + ": ")
+                        f.write(item.replace("\n", "\n    "))
+                    f.write("\n  }\n}" if self.conversations else "}\n}")
             return True
         except Exception as e:
             print(f"保存对话失败: {e}")
             return False
     
-    def load_from_file(self, filepath: str) -> bool:
+    def load_from_file(
+        self,
+        filepath: str,
+        status: Optional[str] = None,
+        updated_after: Optional[str] = None,
+        progress: Optional[Callable[[Dict[str, int]], None]] = None,
+        progress_every: int = 1000
+    ) -> bool:
         """从文件加载对话
         
+        文件按块流式解析，每次只解析并转换一个对话，内存占用与最大的单个对话成正比。
+        
         Args:
             filepath: 文件路径
+            status: 只加载该状态的对话（例如 "active"）
+            updated_after: 只加载更新时间晚于该值的对话（"YYYY-MM-DD HH:MM:SS"）
+            progress: 进度回调，参数为 {"loaded", "skipped", "bytes_read", "total_bytes"}，
+                每处理 progress_every 个对话和结束时调用
+            progress_every: 进度回调间隔（对话数）
             
         Returns:
             是否成功
         """
+        from .archive import ArchiveReader
+        
+        counts = {"loaded": 0, "skipped": 0}
+        
+        def report(reader: ArchiveReader) -> None:
+            if progress is not None:
+                progress(dict(counts, bytes_read=reader.bytes_read, total_bytes=reader.total_bytes))
+        
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            conversations_data = data.get("conversations", {})
-            
-            for conv_id, conv_data in conversations_data.items():
-                messages_data = conv_data.pop("messages", [])
-                messages = [ConversationMessage(**msg_data) for msg_data in messages_data]
-                
-                conversation = Conversation(**conv_data)
-                conversation.messages = messages
-                
-                self.conversations[conv_id] = conversation
+            reader = ArchiveReader(filepath)
+            for conv_id, conv_data in reader:
+                # 先按原始字典过滤，不需要的对话不构造消息对象
+                if (status is not None and conv_data.get("status") != status) or \
+                        (updated_after is not None and conv_data.get("updated_at", "") <= updated_after):
+                    counts["skipped"] += 1
+                else:
+                    self._load_conversation(conv_id, conv_data)
+                    counts["loaded"] += 1
+                if (counts["loaded"] + counts["skipped"]) % progress_every == 0:
+                    report(reader)
             
+            report(reader)
             return True
         except Exception as e:
             print(f"加载对话失败: {e}")
             return False
+    
+    def _load_conversation(self, conv_id: str, conv_data: Dict[str, Any]) -> None:
+        """把归档中的一个对话加入管理器（已存在时替换）"""
+        messages_data = conv_data.pop("messages", [])
+        messages = [ConversationMessage(**msg_data) for msg_data in messages_data]
+        # 旧文件中的消息没有序号；序号总是等于位置 + 1
+        for position, message in enumerate(messages, 1):
+            message.seq = position
+        
+        conversation = Conversation(**conv_data, messages=messages)
+        self._deferred.pop(conv_id, None)
+        
+        self._adopt(conversation)
+        self._replace_search(conversation)
+        self._persist(self.store.save_conversation, conversation)
+        self._notify(conv_id)
 
 
 # 全局对话管理器实例
-conversation_manager = ConversationManager()
+conversation_manager = ConversationManager(
+    store=create_conversation_store(),
+    memory_budget=int(config_manager.get_storage_config().get("hot_set_mb", 256) * 1024 * 1024) or None,
+    compact_messages=bool(config_manager.get_storage_config().get("compact_messages", False)),
+    columnar_threshold=config_manager.get_storage_config().get("columnar_threshold", 0) or None
+)
+if config_manager.get_storage_config().get("backend") == "shards":
+    conversation_manager.start_shard_autosave(
+        config_manager.get_storage_config().get("shard_dir") or str(get_data_dir() / "shards"),
+        float(config_manager.get_storage_config().get("autosave_seconds", 30))
+    )
 
 
 def get_conversation_manager() -> ConversationManager:
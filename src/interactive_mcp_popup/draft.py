@@ -0,0 +1,135 @@
+"""
+回答草稿模块
+
+记录用户在弹窗中正在输入的内容，每次变化只保存增量：
+从 offset 处删除 delete 个字符后插入 insert。调用方记住已收到的版本号，
+之后只需要取比它新的增量，长草稿不会在每次按键时重复传输。
+"""
+
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+
+def compute_draft_diff(old: str, new: str) -> Dict[str, Any]:
+    """计算两段文本之间的单段增量
+
+    Args:
+        old: 旧文本
+        new: 新文本
+
+    Returns:
+        {"offset": 起始位置, "delete": 删除字符数, "insert": 插入文本}
+    """
+    limit = min(len(old), len(new))
+    prefix = 0
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+
+    suffix = 0
+    limit -= prefix
+    while suffix < limit and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+
+    return {
+        "offset": prefix,
+        "delete": len(old) - prefix - suffix,
+        "insert": new[prefix : len(new) - suffix],
+    }
+
+
+def apply_draft_diff(text: str, diff: Dict[str, Any]) -> str:
+    """把增量应用到文本上
+
+    Args:
+        text: 原文本
+        diff: compute_draft_diff 返回的增量
+
+    Returns:
+        新文本
+    """
+    offset: int = diff["offset"]
+    insert: str = diff["insert"]
+    return text[:offset] + insert + text[offset + diff["delete"] :]
+
+
+class DraftBuffer:
+    """带版本号的草稿缓冲"""
+
+    def __init__(self, max_history: int = 256):
+        self.text = ""
+        self.version = 0
+        self.done = False
+        self._diffs: Deque[Dict[str, Any]] = deque(maxlen=max_history)
+        self._listeners: List[Callable[[], None]] = []
+
+    def add_listener(self, listener: Callable[[], None]) -> None:
+        """注册草稿变化时调用的回调"""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[], None]) -> None:
+        """移除回调"""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self) -> None:
+        for listener in list(self._listeners):
+            try:
+                listener()
+            except Exception as e:
+                print(f"草稿回调失败: {e}")
+
+    def update(self, text: str) -> Optional[Dict[str, Any]]:
+        """记录新的草稿内容
+
+        Args:
+            text: 输入框当前的完整内容
+
+        Returns:
+            本次增量，内容没有变化或已完成时返回 None
+        """
+        if self.done or text == self.text:
+            return None
+
+        diff = compute_draft_diff(self.text, text)
+        self.version += 1
+        diff["version"] = self.version
+        self._diffs.append(diff)
+        self.text = text
+        self._notify()
+        return diff
+
+    def finish(self, text: Optional[str] = None) -> None:
+        """标记草稿完成（用户已提交或弹窗已关闭）
+
+        Args:
+            text: 最终提交的内容（可选）
+        """
+        if self.done:
+            return
+        if text is not None and text != self.text:
+            diff = compute_draft_diff(self.text, text)
+            self.version += 1
+            diff["version"] = self.version
+            self._diffs.append(diff)
+            self.text = text
+        self.done = True
+        self._notify()
+
+    def since(self, version: int = 0) -> Dict[str, Any]:
+        """获取某个版本之后的变化
+
+        Args:
+            version: 调用方已收到的版本号
+
+        Returns:
+            包含 version、done 和 diffs 的字典；所需增量已被淘汰时改为返回完整的 text
+        """
+        data: Dict[str, Any] = {"version": self.version, "done": self.done}
+        if version >= self.version:
+            data["diffs"] = []
+        elif version == 0 or not self._diffs or self._diffs[0]["version"] > version + 1:
+            # 首次获取或增量不完整时直接给全文，比从头回放更短
+            data["text"] = self.text
+        else:
+            data["diffs"] = [diff for diff in self._diffs if diff["version"] > version]
+        return data
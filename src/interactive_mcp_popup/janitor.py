@@ -0,0 +1,244 @@
+"""
+存储清理模块
+
+后台线程定期清理服务器产生的文件：
+- 超过 cleanup_days（对话配置）的文件直接删除；
+- 剩余文件总大小超过上限时，从最旧的开始删除。
+
+用 os.scandir 逐个遍历目录，每处理一批文件就暂停片刻，
+即使目录里有几十万个文件，一次清理也不会长时间占用 CPU 和磁盘、拖慢工具调用。
+"""
+
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .journal import AnswerJournal
+from .utils import config_manager, get_data_dir, get_temp_dir
+
+
+@dataclass
+class JanitorTarget:
+    """需要清理的目录"""
+
+    directory: str
+    suffixes: Tuple[str, ...] = (".json",)
+    prefix: str = ""
+    protect: Optional[Callable[[], Iterable[str]]] = (
+        None  # 返回不能删除的文件（例如正在写入的日志）
+    )
+    remove: Optional[Callable[[str], bool]] = (
+        None  # 代替 os.remove 删除文件，返回 False 表示保留
+    )
+
+    def matches(self, name: str) -> bool:
+        """文件名是否需要清理"""
+        return name.startswith(self.prefix) and name.endswith(self.suffixes)
+
+
+class StorageJanitor:
+    """按时间和总大小清理文件"""
+
+    def __init__(
+        self,
+        targets: List[JanitorTarget],
+        max_age_days: float = 7,
+        max_total_bytes: int = 512 * 1024 * 1024,
+        batch_size: int = 500,
+        batch_pause: float = 0.01,
+        interval: float = 6 * 3600,
+        initial_delay: float = 60.0,
+    ):
+        self.targets = targets
+        self.max_age_days = max_age_days
+        self.max_total_bytes = max_total_bytes
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.interval = interval
+        self.initial_delay = initial_delay
+        self.last_sweep: Dict[str, int] = {}
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _pause(self, processed: int) -> bool:
+        """每处理一批文件暂停一次，返回是否应当停止"""
+        if processed % self.batch_size == 0:
+            if self._stop.is_set():
+                return True
+            time.sleep(self.batch_pause)
+        return False
+
+    def _remove(
+        self,
+        path: str,
+        size: int,
+        stats: Dict[str, int],
+        remove: Optional[Callable[[str], bool]] = None,
+    ) -> bool:
+        try:
+            if remove is None:
+                os.remove(path)
+            elif not remove(path):
+                return False
+        except FileNotFoundError:
+            return True
+        except OSError as e:
+            print(f"清理文件失败: {path}: {e}")
+            return False
+        stats["deleted"] += 1
+        stats["freed_bytes"] += size
+        return True
+
+    def sweep(self) -> Dict[str, int]:
+        """执行一次完整清理
+
+        Returns:
+            {"scanned", "deleted", "freed_bytes", "kept_bytes"}
+        """
+        stats = {"scanned": 0, "deleted": 0, "freed_bytes": 0, "kept_bytes": 0}
+        cutoff = (
+            time.time() - self.max_age_days * 86400 if self.max_age_days > 0 else None
+        )
+        kept: List[Tuple[float, int, str, Optional[Callable[[str], bool]]]] = []
+        total = 0
+
+        for target in self.targets:
+            protected = (
+                {os.path.abspath(path) for path in target.protect()}
+                if target.protect
+                else set()
+            )
+            try:
+                entries = os.scandir(target.directory)
+            except FileNotFoundError:
+                continue
+
+            with entries:
+                for entry in entries:
+                    if not target.matches(entry.name):
+                        continue
+                    try:
+                        if (
+                            not entry.is_file(follow_symlinks=False)
+                            or os.path.abspath(entry.path) in protected
+                        ):
+                            continue
+                        stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+
+                    stats["scanned"] += 1
+                    if cutoff is not None and stat.st_mtime < cutoff:
+                        if not self._remove(
+                            entry.path, stat.st_size, stats, target.remove
+                        ):
+                            kept.append(
+                                (stat.st_mtime, stat.st_size, entry.path, target.remove)
+                            )
+                            total += stat.st_size
+                    else:
+                        kept.append(
+                            (stat.st_mtime, stat.st_size, entry.path, target.remove)
+                        )
+                        total += stat.st_size
+
+                    if self._pause(stats["scanned"]):
+                        return stats
+
+        if self.max_total_bytes > 0 and total > self.max_total_bytes:
+            # 超出总大小上限：从最旧的文件开始删除
+            kept.sort(key=lambda item: item[:3])
+            for processed, (_, size, path, remove) in enumerate(kept, 1):
+                if total <= self.max_total_bytes:
+                    break
+                if self._remove(path, size, stats, remove):
+                    total -= size
+                if self._pause(processed):
+                    break
+
+        stats["kept_bytes"] = total
+        self.last_sweep = stats
+        return stats
+
+    def _run(self) -> None:
+        if self._stop.wait(self.initial_delay):
+            return
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"存储清理失败: {e}")
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self) -> None:
+        """启动后台清理线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="interactive-mcp-popup-janitor", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """停止后台清理线程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+def get_exports_dir() -> str:
+    """获取保存对话导出文件的目录"""
+    exports_dir = get_data_dir() / "exports"
+    exports_dir.mkdir(exist_ok=True)
+    return str(exports_dir)
+
+
+def make_export_path() -> str:
+    """生成新的对话导出文件路径（文件名带时间，可被清理器识别）"""
+    filename = (
+        f"conversations-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.json"
+    )
+    return os.path.join(get_exports_dir(), filename)
+
+
+def create_storage_janitor(journal: Optional[AnswerJournal] = None) -> StorageJanitor:
+    """按配置创建覆盖服务器所有产物的清理器
+
+    Args:
+        journal: 回答日志（段文件通过日志删除，正在写入的段和索引不会被清理）
+
+    Returns:
+        存储清理器
+    """
+    janitor_config = config_manager.get_janitor_config()
+    targets = [
+        JanitorTarget(str(get_temp_dir()), (".json",)),
+        JanitorTarget(get_exports_dir(), (".json",), prefix="conversations-"),
+        # 只清理已轮转的调用链文件，正在写入的 traces.jsonl 由追踪模块自己轮转
+        JanitorTarget(str(get_data_dir()), ("",), prefix="traces.jsonl."),
+    ]
+    if journal is not None:
+        targets.append(
+            JanitorTarget(
+                journal.directory,
+                (".jsonl",),
+                prefix="answers-",
+                protect=journal.active_files,
+                remove=journal.remove_segment,
+            )
+        )
+
+    return StorageJanitor(
+        targets,
+        max_age_days=config_manager.get_conversation_config().get("cleanup_days", 7),
+        max_total_bytes=int(janitor_config.get("max_total_mb", 512) * 1024 * 1024),
+        batch_size=janitor_config.get("batch_size", 500),
+        interval=janitor_config.get("interval_hours", 6) * 3600,
+    )
@@ -0,0 +1,269 @@
+"""
+回答日志模块
+
+所有弹窗回答追加写入同一组 JSONL 文件（按大小轮转为多个段），
+代替每个回答一个临时文件。
+
+- 记录ID从 1 开始连续递增，创建后不变；
+- 索引文件 answers.idx 中第 N 条记录固定占 16 字节（段号、偏移、长度），
+  按ID查找只需一次定位读取索引、一次定位读取日志；
+- 先写日志再写索引，启动时扫描索引之后多出的日志行补齐索引，崩溃后不会丢记录；
+- 多个服务器进程可以共用同一目录：追加时持有 answers.lock 的进程间排他锁，
+  下一个ID和当前段都按索引文件重新确定，不依赖进程内的计数；
+- 写满的段由清理器通过 remove_segment 在同一把锁内删除，索引保持不变，
+  被删除的段中的记录ID不会被重用，get 对它们返回过期标记。
+"""
+
+import json
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .metrics import phase
+from .utils import config_manager, get_data_dir, lock_file, unlock_file
+
+_INDEX_ENTRY = struct.Struct("<IQI")  # 段号, 段内偏移, 记录长度
+
+
+class AnswerJournal:
+    """追加写入的回答日志"""
+
+    def __init__(
+        self,
+        directory: str,
+        max_segment_bytes: int = 16 * 1024 * 1024,
+        fsync: bool = False,
+    ):
+        """
+        Args:
+            directory: 日志目录
+            max_segment_bytes: 单个段文件的大小上限，超过后写入新段
+            fsync: 每条记录写入后是否 fsync（默认只 flush）
+        """
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.fsync = fsync
+
+        self._lock = threading.Lock()
+        self._segment = 1
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, "answers.lock"), "a+b")
+        self._index_file = open(self.index_path, "a+b")
+        with self._locked():
+            self._recover()
+        self._segment_file = open(self.segment_path(self._segment), "ab")
+
+    def __len__(self) -> int:
+        return os.path.getsize(self.index_path) // _INDEX_ENTRY.size
+
+    @property
+    def index_path(self) -> str:
+        """索引文件路径"""
+        return os.path.join(self.directory, "answers.idx")
+
+    def segment_path(self, segment: int) -> str:
+        """段文件路径"""
+        return os.path.join(self.directory, f"answers-{segment:06d}.jsonl")
+
+    def active_files(self) -> List[str]:
+        """正在写入的段文件和索引文件（清理时不能删除）"""
+        return [self.segment_path(self._segment), self.index_path]
+
+    def remove_segment(self, path: str) -> bool:
+        """删除一个写满的段文件（供清理器调用）
+
+        正在写入的段（按索引文件确定，包括其他进程已轮转到的段）不会被删除。
+
+        Args:
+            path: 段文件路径
+
+        Returns:
+            是否已删除，正在写入的段返回 False
+        """
+        name = os.path.basename(path)
+        if not (name.startswith("answers-") and name.endswith(".jsonl")):
+            return False
+        try:
+            segment = int(name[len("answers-") : -len(".jsonl")])
+        except ValueError:
+            return False
+
+        with self._locked():
+            self._sync()
+            if segment >= self._segment:
+                return False
+            os.remove(self.segment_path(segment))
+        return True
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """持有线程锁和进程间文件锁"""
+        with self._lock:
+            lock_file(self._lock_file)
+            try:
+                yield
+            finally:
+                unlock_file(self._lock_file)
+
+    def _recover(self) -> None:
+        """确定当前段，把索引之后多出的完整日志行补进索引（调用时已持有锁）"""
+        index_size = self._index_file.seek(0, os.SEEK_END)
+        if index_size % _INDEX_ENTRY.size:
+            # 索引最后一条只写了一半，丢弃后从日志补齐
+            self._index_file.truncate(index_size - index_size % _INDEX_ENTRY.size)
+        count = self._index_file.seek(0, os.SEEK_END) // _INDEX_ENTRY.size
+
+        if count:
+            segment, offset, length = self._read_index(count)
+            self._segment, end = segment, offset + length
+        else:
+            self._segment, end = 1, 0
+
+        while True:
+            path = self.segment_path(self._segment)
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    f.seek(end)
+                    tail = f.read()
+
+                complete = tail[: tail.rfind(b"\n") + 1]
+                for line in complete.splitlines(keepends=True):
+                    self._index_file.write(
+                        _INDEX_ENTRY.pack(self._segment, end, len(line))
+                    )
+                    end += len(line)
+                self._index_file.flush()
+
+                if len(complete) < len(tail):
+                    # 写了一半的行：截掉，之后从这里继续追加
+                    with open(path, "r+b") as f:
+                        f.truncate(end)
+
+            if not os.path.exists(self.segment_path(self._segment + 1)):
+                return
+            self._segment += 1
+            end = 0
+
+    def _sync(self) -> int:
+        """按索引文件切换到其他进程可能已轮转到的段（调用时已持有锁）
+
+        Returns:
+            当前记录数
+        """
+        count = self._index_file.seek(0, os.SEEK_END) // _INDEX_ENTRY.size
+        if count:
+            segment = self._read_index(count)[0]
+            if segment != self._segment:
+                self._segment_file.close()
+                self._segment = segment
+                self._segment_file = open(self.segment_path(segment), "ab")
+        return count
+
+    def _read_index(self, record_id: int) -> Tuple[int, int, int]:
+        self._index_file.seek((record_id - 1) * _INDEX_ENTRY.size)
+        return _INDEX_ENTRY.unpack(self._index_file.read(_INDEX_ENTRY.size))
+
+    def append(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """追加一条记录
+
+        Args:
+            record: 要记录的内容（例如弹窗结果）
+
+        Returns:
+            {"record_id", "segment", "offset", "journal_file"}
+        """
+        with self._locked():
+            record_id = self._sync() + 1
+            data = {
+                "record_id": record_id,
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                **record,
+            }
+            line = (
+                json.dumps(data, ensure_ascii=False, separators=(",", ":")) + "\n"
+            ).encode("utf-8")
+
+            with phase("persistence"):
+                # 以段文件的实际大小为准，其他进程也在追加
+                offset = self._segment_file.seek(0, os.SEEK_END)
+                if offset and offset + len(line) > self.max_segment_bytes:
+                    self._segment_file.close()
+                    self._segment += 1
+                    self._segment_file = open(self.segment_path(self._segment), "ab")
+                    offset = self._segment_file.seek(0, os.SEEK_END)
+
+                self._segment_file.write(line)
+                self._segment_file.flush()
+                if self.fsync:
+                    os.fsync(self._segment_file.fileno())
+
+                self._index_file.seek(0, os.SEEK_END)
+                self._index_file.write(
+                    _INDEX_ENTRY.pack(self._segment, offset, len(line))
+                )
+                self._index_file.flush()
+
+            return {
+                "record_id": record_id,
+                "segment": self._segment,
+                "offset": offset,
+                "journal_file": self.segment_path(self._segment),
+            }
+
+    def get(self, record_id: int) -> Optional[Dict[str, Any]]:
+        """按ID读取记录
+
+        Args:
+            record_id: 记录ID
+
+        Returns:
+            记录内容，不存在时返回 None；所在的段已被清理时返回 {"record_id", "expired": True}
+        """
+        with self._lock:
+            # 索引项在日志行写入之后才追加，能读到的索引项对应的日志行都已完整写入
+            if (
+                not 1
+                <= record_id
+                <= self._index_file.seek(0, os.SEEK_END) // _INDEX_ENTRY.size
+            ):
+                return None
+            segment, offset, length = self._read_index(record_id)
+
+        try:
+            with open(self.segment_path(segment), "rb") as f:
+                f.seek(offset)
+                record: Dict[str, Any] = json.loads(f.read(length))
+                return record
+        except FileNotFoundError:
+            # 段文件已被清理，ID仍然有效，但内容已过期
+            return {"record_id": record_id, "expired": True}
+
+    def close(self) -> None:
+        """关闭文件"""
+        with self._lock:
+            self._segment_file.close()
+            self._index_file.close()
+            self._lock_file.close()
+
+
+# 全局回答日志（首次使用时打开）
+answer_journal: Optional[AnswerJournal] = None
+
+
+def get_answer_journal() -> AnswerJournal:
+    """获取全局回答日志，位于数据目录下的 journal 目录"""
+    global answer_journal
+    if answer_journal is None:
+        journal_config = config_manager.get_journal_config()
+        answer_journal = AnswerJournal(
+            str(get_data_dir() / "journal"),
+            max_segment_bytes=int(
+                journal_config.get("max_segment_mb", 16) * 1024 * 1024
+            ),
+            fsync=journal_config.get("fsync", False),
+        )
+    return answer_journal
@@ -0,0 +1,359 @@
+"""
+服务器指标模块
+
+按 (工具, 阶段) 统计调用次数和耗时直方图，用于回答"工具调用的时间花在哪里"。
+
+阶段：
+- total: 整个工具调用（由 MetricsMiddleware 记录）
+- dialog_construction: 创建弹窗窗口
+- window_visible: 从打开弹窗到窗口显示
+- think_time: 用户思考和输入的时间
+- persistence: 写文件
+- serialization: 把响应编码为 JSON
+- overhead: total 减去以上各阶段，即服务器自身的开销
+
+记录一次耗时只需一次 perf_counter、一次二分查找和几次整数加法，可以在生产环境常开。
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .utils import config_manager
+
+# 直方图桶上界（秒），覆盖毫秒级的服务器开销到小时级的用户思考时间
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+    600.0,
+    1800.0,
+    3600.0,
+)
+
+# 当前工具调用: [工具名, 已记录的阶段耗时之和]
+_current_call: contextvars.ContextVar[Optional[List[Any]]] = contextvars.ContextVar(
+    "interactive_mcp_popup_current_call", default=None
+)
+
+
+class LatencyHistogram:
+    """固定桶耗时直方图"""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        """记录一次耗时"""
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """估算分位数（返回所在桶的上界，最后一个桶返回最大值）"""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target and bucket_count:
+                if index < len(LATENCY_BUCKETS):
+                    return min(LATENCY_BUCKETS[index], self.max)
+                break
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可序列化的字典"""
+        return {
+            "count": self.count,
+            "sum_seconds": round(self.total, 6),
+            "avg_seconds": round(self.total / self.count, 6) if self.count else 0.0,
+            "max_seconds": round(self.max, 6),
+            "p50_seconds": round(self.quantile(0.5), 6),
+            "p95_seconds": round(self.quantile(0.95), 6),
+            "p99_seconds": round(self.quantile(0.99), 6),
+        }
+
+
+class ServerMetrics:
+    """工具调用指标"""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        prometheus_file: str = "",
+        prometheus_interval: float = 15.0,
+    ):
+        self.enabled = enabled
+        self.prometheus_file = prometheus_file
+        self.prometheus_interval = prometheus_interval
+        self.started_at = time.time()
+
+        self._histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self._calls: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._last_export = 0.0
+
+    def observe(self, tool: str, phase: str, seconds: float) -> None:
+        """记录某个工具某个阶段的一次耗时
+
+        Args:
+            tool: 工具名
+            phase: 阶段名
+            seconds: 耗时（秒）
+        """
+        key = (tool, phase)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def record_call(
+        self, tool: str, seconds: float, phase_seconds: float, error: bool = False
+    ) -> None:
+        """记录一次完整的工具调用
+
+        Args:
+            tool: 工具名
+            seconds: 总耗时
+            phase_seconds: 已单独记录的各阶段耗时之和
+            error: 是否抛出异常
+        """
+        with self._lock:
+            self._calls[tool] = self._calls.get(tool, 0) + 1
+            if error:
+                self._errors[tool] = self._errors.get(tool, 0) + 1
+        self.observe(tool, "total", seconds)
+        self.observe(tool, "overhead", max(seconds - phase_seconds, 0.0))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取所有指标
+
+        Returns:
+            {"uptime_seconds", "tools": {工具名: {"calls", "errors", "calls_per_minute", "phases": {...}}}}
+        """
+        uptime = time.time() - self.started_at
+        tools: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for (tool, phase), histogram in sorted(self._histograms.items()):
+                entry = tools.setdefault(
+                    tool,
+                    {
+                        "calls": self._calls.get(tool, 0),
+                        "errors": self._errors.get(tool, 0),
+                        "calls_per_minute": round(
+                            self._calls.get(tool, 0) / max(uptime / 60, 1e-9), 3
+                        ),
+                        "phases": {},
+                    },
+                )
+                entry["phases"][phase] = histogram.to_dict()
+        return {"uptime_seconds": round(uptime, 1), "tools": tools}
+
+    def to_prometheus(self) -> str:
+        """导出为 Prometheus 文本格式"""
+        lines = [
+            "# HELP interactive_mcp_popup_tool_calls_total Tool calls",
+            "# TYPE interactive_mcp_popup_tool_calls_total counter",
+        ]
+        with self._lock:
+            for tool, count in sorted(self._calls.items()):
+                lines.append(
+                    f'interactive_mcp_popup_tool_calls_total{{tool="{tool}"}} {count}'
+                )
+            lines.append(
+                "# HELP interactive_mcp_popup_tool_errors_total Tool calls that raised"
+            )
+            lines.append("# TYPE interactive_mcp_popup_tool_errors_total counter")
+            for tool, count in sorted(self._errors.items()):
+                lines.append(
+                    f'interactive_mcp_popup_tool_errors_total{{tool="{tool}"}} {count}'
+                )
+
+            lines.append(
+                "# HELP interactive_mcp_popup_phase_seconds Tool call latency by phase"
+            )
+            lines.append("# TYPE interactive_mcp_popup_phase_seconds histogram")
+            for (tool, phase), histogram in sorted(self._histograms.items()):
+                labels = f'tool="{tool}",phase="{phase}"'
+                cumulative = 0
+                for bound, bucket_count in zip(
+                    LATENCY_BUCKETS, histogram.counts, strict=False
+                ):
+                    cumulative += bucket_count
+                    lines.append(
+                        f'interactive_mcp_popup_phase_seconds_bucket{{{labels},le="{bound}"}} {cumulative}'
+                    )
+                lines.append(
+                    f'interactive_mcp_popup_phase_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}'
+                )
+                lines.append(
+                    f"interactive_mcp_popup_phase_seconds_sum{{{labels}}} {histogram.total}"
+                )
+                lines.append(
+                    f"interactive_mcp_popup_phase_seconds_count{{{labels}}} {histogram.count}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, filepath: Optional[str] = None) -> bool:
+        """把 Prometheus 文本写入文件（原子替换，可供 node_exporter textfile 采集）
+
+        Args:
+            filepath: 文件路径，默认使用配置中的 prometheus_file
+
+        Returns:
+            是否成功
+        """
+        filepath = filepath or self.prometheus_file
+        if not filepath:
+            return False
+        try:
+            temp_path = f"{filepath}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
+            os.replace(temp_path, filepath)
+            self._last_export = time.monotonic()
+            return True
+        except Exception as e:
+            print(f"写入 Prometheus 指标失败: {e}")
+            return False
+
+    def maybe_write_prometheus(self) -> bool:
+        """距上次写入超过间隔时写入 Prometheus 文件"""
+        if (
+            not self.prometheus_file
+            or time.monotonic() - self._last_export < self.prometheus_interval
+        ):
+            return False
+        return self.write_prometheus()
+
+    def reset(self) -> None:
+        """清空所有指标"""
+        with self._lock:
+            self._histograms.clear()
+            self._calls.clear()
+            self._errors.clear()
+        self.started_at = time.time()
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """记录当前工具调用中某个阶段的耗时
+
+    不在工具调用中（例如单独测试弹窗）时不记录。
+
+    Args:
+        name: 阶段名
+    """
+    call = _current_call.get()
+    if call is None or not server_metrics.enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - start)
+
+
+def record_phase(name: str, seconds: float) -> None:
+    """把一段已经测得的耗时记到当前工具调用的某个阶段
+
+    Args:
+        name: 阶段名
+        seconds: 耗时（秒）
+    """
+    call = _current_call.get()
+    if call is None or not server_metrics.enabled:
+        return
+    call[1] += seconds
+    server_metrics.observe(call[0], name, seconds)
+
+
+def timed_dumps(data: Any, **kwargs: Any) -> str:
+    """json.dumps，并把耗时记为 serialization 阶段"""
+    with phase("serialization"):
+        return json.dumps(data, **kwargs)
+
+
+try:
+    from fastmcp.server.middleware import Middleware
+except ImportError:
+
+    class Middleware:  # type: ignore[no-redef]
+        """没有 fastmcp 时的基类，中间件仍可创建和直接调用，只是没有服务器可以注册"""
+
+
+class MetricsMiddleware(Middleware):
+    """统计每次工具调用总耗时和服务器开销的 FastMCP 中间件"""
+
+    def __init__(self, metrics: "ServerMetrics"):
+        self.metrics = metrics
+
+    async def on_call_tool(
+        self, context: Any, call_next: Callable[[Any], Awaitable[Any]]
+    ) -> Any:
+        if not self.metrics.enabled:
+            return await call_next(context)
+
+        tool = context.message.name
+        call = [tool, 0.0]
+        token = _current_call.set(call)
+        start = time.perf_counter()
+        error = False
+        try:
+            return await call_next(context)
+        except BaseException:
+            error = True
+            raise
+        finally:
+            _current_call.reset(token)
+            self.metrics.record_call(tool, time.perf_counter() - start, call[1], error)
+            self.metrics.maybe_write_prometheus()
+
+
+def _create_server_metrics() -> ServerMetrics:
+    metrics_config = config_manager.get_metrics_config()
+    return ServerMetrics(
+        enabled=metrics_config.get("enabled", True),
+        prometheus_file=os.path.expanduser(metrics_config.get("prometheus_file", "")),
+        prometheus_interval=metrics_config.get("prometheus_interval", 15),
+    )
+
+
+# 全局指标实例
+server_metrics = _create_server_metrics()
+
+
+def get_server_metrics() -> ServerMetrics:
+    """获取全局指标实例"""
+    return server_metrics
@@ -0,0 +1,716 @@
+"""
+对话操作日志存储
+
+不使用数据库时的文件存储：每次修改对话只向 ops.jsonl 追加一行操作记录，
+定期把全部对话写成快照 snapshot.json（与 save_to_file 相同的格式）。
+写快照与 search 模块相同：持有锁时只换下当前日志（ops.jsonl.old）并打开新日志，
+在后台线程中写快照，期间的操作写入新日志，快照替换完成后才删除换下的日志。
+
+- 每条操作带连续递增的编号 n，快照记录其包含的最后一个编号 last_op，
+  写完快照、删除换下的日志之间崩溃时，重放会跳过快照已包含的操作；
+- 快照先写临时文件再原子替换；
+- 每条操作写入后 flush，崩溃最多丢失最后一条未写完的操作，启动时截掉不完整的行。
+
+快速启动：写快照时同时写一个小的元数据文件 snapshot.meta.json，记录每个对话的元数据、
+消息数，以及消息数组在快照中的字节位置。启动时只读元数据文件并重放日志尾部，
+消息在首次访问对话时按位置从快照中读入，启动时间与消息总量无关。
+元数据文件与快照不一致（旧格式快照或替换之间崩溃）时退回到完整解析快照。
+
+快照中有位置的对话，其之后追加的消息另外记在尾部列表中，
+因此这些对话的消息可以随时释放，之后从快照和尾部读回。
+
+多个服务器进程可以打开同一目录：追加操作、读入消息和写快照时持有 ops.lock 的进程间排他锁，
+先跳过其他进程追加的操作（编号接着最大的编号）；发现其他进程写了新快照时按新的元数据更新位置，
+发现其他进程换下了日志时改为追加到新日志。
+同一时间只有一个线程或进程写快照（持有 compact.lock），
+快照按磁盘上的状态（当前快照加上换下的日志中所有进程追加的操作）生成，不会丢掉其他进程的对话。
+每个进程内存中的对话只包含自己的修改，其他进程的修改在重启后可见。
+"""
+
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from dataclasses import fields
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from .archive import ArchiveReader
+from .conversation import (
+    Conversation,
+    ConversationMessage,
+    conversation_to_dict,
+    message_to_dict,
+)
+from .metrics import phase
+from .store import ConversationStore
+from .utils import lock_file, unlock_file
+
+_SNAPSHOT_HEAD = re.compile(rb'^\{"last_op": (\d+),')
+_HEADER_FIELDS = tuple(
+    field.name for field in fields(Conversation) if field.name != "messages"
+)
+
+
+class JsonlConversationStore(ConversationStore):
+    """操作日志 + 快照存储后端"""
+
+    def __init__(self, directory: str, snapshot_every: int = 1000, fsync: bool = False):
+        """
+        Args:
+            directory: 存储目录
+            snapshot_every: 操作日志累计多少条后写一次快照
+            fsync: 每条操作写入后是否 fsync（默认只 flush）
+        """
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+
+        self._lock = threading.Lock()
+        self._conversations: Dict[str, Conversation] = {}
+        # 消息在快照中的位置：对话ID -> (偏移, 长度, 消息数)
+        self._positions: Dict[str, Tuple[int, int, int]] = {}
+        # 快照之后追加的消息及其操作编号
+        self._tail: Dict[str, List[Tuple[int, ConversationMessage]]] = {}
+        # 快照之后创建（或替换）的对话及其操作编号
+        self._created: Dict[str, int] = {}
+        # 消息未读入内存的对话
+        self._lazy: Set[str] = set()
+        self._last_op = 0  # 最后一条操作的编号
+        self._log_ops = 0  # 操作日志中的操作数
+        self._log_offset = 0  # 已读到（或写到）的日志字节数
+        self._snapshot_stamp: Optional[Tuple[int, int, int]] = None
+        self._log_file: Optional[IO[bytes]] = None
+        self._lock_file: Optional[IO[bytes]] = None
+        # 写快照的锁：线程锁和 compact.lock 的进程间锁
+        self._compact_lock = threading.Lock()
+        self._compact_file: Optional[IO[bytes]] = None
+
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def snapshot_path(self) -> str:
+        """快照文件路径"""
+        return os.path.join(self.directory, "snapshot.json")
+
+    @property
+    def meta_path(self) -> str:
+        """快照元数据文件路径"""
+        return os.path.join(self.directory, "snapshot.meta.json")
+
+    @property
+    def log_path(self) -> str:
+        """操作日志路径"""
+        return os.path.join(self.directory, "ops.jsonl")
+
+    @property
+    def old_log_path(self) -> str:
+        """写快照时换下的操作日志路径"""
+        return self.log_path + ".old"
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """持有线程锁和进程间文件锁"""
+        with self._lock:
+            if self._lock_file is None:
+                self._lock_file = open(os.path.join(self.directory, "ops.lock"), "a+b")
+            lock_file(self._lock_file)
+            try:
+                yield
+            finally:
+                unlock_file(self._lock_file)
+
+    def _acquire_compaction(self, blocking: bool) -> bool:
+        """获得写快照的锁
+
+        Args:
+            blocking: 是否等待其他线程或进程写完快照
+
+        Returns:
+            是否获得锁
+        """
+        if not self._compact_lock.acquire(blocking):
+            return False
+        if self._compact_file is None:
+            self._compact_file = open(
+                os.path.join(self.directory, "compact.lock"), "a+b"
+            )
+        if lock_file(self._compact_file, blocking):
+            return True
+        self._compact_lock.release()
+        return False
+
+    def _release_compaction(self) -> None:
+        """释放写快照的锁"""
+        if self._compact_file is not None:
+            unlock_file(self._compact_file)
+        self._compact_lock.release()
+
+    def _stamp(self) -> Optional[Tuple[int, int, int]]:
+        """快照文件的标识，其他进程替换快照后会变化"""
+        try:
+            stat = os.stat(self.snapshot_path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def load(self) -> Iterator[Conversation]:
+        """读取快照（优先只读元数据），重放快照之后的操作"""
+        with self._locked(), phase("persistence"):
+            self._read()
+            self._log_file = open(self.log_path, "a+b")
+            self._log_file.truncate(self._log_offset)
+            return iter(list(self._conversations.values()))
+
+    def _read(self) -> None:
+        """从快照和操作日志（先读换下的日志）读出全部状态（调用时已持有锁）"""
+        self._read_snapshot()
+        self._log_ops = 0
+        self._replay(self.old_log_path)
+        self._log_offset = self._replay(self.log_path)
+
+    def _read_snapshot(self) -> None:
+        """读取快照，优先只读元数据（调用时已持有锁或写快照的锁）"""
+        self._conversations = {}
+        self._positions = {}
+        self._tail = {}
+        self._lazy = set()
+        self._last_op = 0
+        self._snapshot_stamp = self._stamp()
+        if not self._load_meta() and os.path.exists(self.snapshot_path):
+            reader = ArchiveReader(self.snapshot_path)
+            for conv_id, conv_data in reader:
+                self._conversations[conv_id] = self._decode_conversation(conv_data)
+            self._last_op = reader.extra.get("last_op", 0)
+
+    def _replay(self, path: str) -> int:
+        """重放日志中快照之后的操作
+
+        Args:
+            path: 日志路径
+
+        Returns:
+            完整的行的字节数
+        """
+        valid_size = 0
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except ValueError:
+                        # 崩溃时写了一半的最后一行
+                        break
+                    valid_size += len(line)
+                    self._log_ops += 1
+                    if op["n"] > self._last_op:
+                        self._apply(op)
+                        self._last_op = op["n"]
+        return valid_size
+
+    def _read_meta(self) -> Optional[Tuple[int, List[Dict[str, Any]]]]:
+        """读取与快照一致的元数据文件
+
+        Returns:
+            (快照包含的最后一条操作编号, 每个对话的元数据)，文件不存在或不一致时返回 None
+        """
+        try:
+            with open(self.meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(self.snapshot_path, "rb") as f:
+                head = _SNAPSHOT_HEAD.match(f.read(64))
+                snapshot_bytes = f.seek(0, os.SEEK_END)
+        except (OSError, ValueError):
+            return None
+        if (
+            head is None
+            or int(head.group(1)) != meta.get("last_op")
+            or snapshot_bytes != meta.get("snapshot_bytes")
+        ):
+            return None
+        return meta["last_op"], meta["conversations"]
+
+    def _load_meta(self) -> bool:
+        """从元数据文件加载对话（消息延迟读入）
+
+        Returns:
+            元数据文件存在且与快照一致时返回 True
+        """
+        meta = self._read_meta()
+        if meta is None:
+            return False
+
+        self._last_op = meta[0]
+        for entry in meta[1]:
+            entry = dict(entry)
+            position = (
+                entry.pop("offset"),
+                entry.pop("length"),
+                entry.pop("message_count"),
+            )
+            conversation = Conversation(**entry, messages=[])
+            self._conversations[conversation.id] = conversation
+            self._positions[conversation.id] = position
+            if position[2]:
+                self._lazy.add(conversation.id)
+        return True
+
+    def _sync(self) -> None:
+        """跟上其他进程的写入（调用时已持有锁）
+
+        其他进程写了新快照时，新快照已包含换下的日志中的操作：按新的元数据更新消息位置；
+        其他进程换下了日志时，从仍打开的旧日志读完剩余的操作，改为追加到新日志；
+        然后跳过日志中其他进程追加的操作，记下最大的编号。
+        """
+        stamp = self._stamp()
+        if stamp != self._snapshot_stamp:
+            self._snapshot_stamp = stamp
+            meta = self._read_meta()
+            if meta is None:
+                # 元数据不一致（其他进程在替换快照和元数据之间崩溃）：
+                # 按对话ID从完整快照中读入
+                self._rebase(self._snapshot_last_op(), {})
+            else:
+                self._rebase(
+                    meta[0],
+                    {
+                        entry["id"]: (
+                            entry["offset"],
+                            entry["length"],
+                            entry["message_count"],
+                        )
+                        for entry in meta[1]
+                    },
+                )
+
+        if self._log_file is not None and not self._is_current_log():
+            self._skip(self._log_file)
+            self._log_file.close()
+            self._log_file = open(self.log_path, "a+b")
+            self._log_offset = 0
+            self._log_ops = 0
+
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, "rb") as f:
+            if not self._skip(f):
+                # 其他进程写到一半时崩溃：截掉，否则之后追加的操作会接在这半行后面
+                with open(self.log_path, "r+b") as out:
+                    out.truncate(self._log_offset)
+
+    def _skip(self, f: IO[bytes]) -> bool:
+        """跳过日志中已读位置之后其他进程追加的操作，记下最大的编号（调用时已持有锁）
+
+        Returns:
+            没有遇到写了一半的行时返回 True
+        """
+        f.seek(self._log_offset)
+        for line in f:
+            try:
+                op = json.loads(line) if line.endswith(b"\n") else None
+            except ValueError:
+                op = None
+            if op is None:
+                return False
+            self._log_offset += len(line)
+            self._log_ops += 1
+            self._last_op = max(self._last_op, op["n"])
+        return True
+
+    def _is_current_log(self) -> bool:
+        """打开的日志是否仍是 ops.jsonl（其他进程写快照时会换下日志）"""
+        assert self._log_file is not None
+        try:
+            current = os.stat(self.log_path)
+        except OSError:
+            return False
+        opened = os.fstat(self._log_file.fileno())
+        return (current.st_dev, current.st_ino) == (opened.st_dev, opened.st_ino)
+
+    def _snapshot_last_op(self) -> int:
+        """从快照开头读出其包含的最后一条操作编号"""
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                head = _SNAPSHOT_HEAD.match(f.read(64))
+        except OSError:
+            return 0
+        return int(head.group(1)) if head is not None else 0
+
+    def _rebase(self, last_op: int, positions: Dict[str, Tuple[int, int, int]]) -> None:
+        """换用新快照中的消息位置（调用时已持有锁）
+
+        新快照包含编号不超过 last_op 的操作：尾部只保留之后追加的消息，
+        之后重新创建的对话仍不能从快照读回。
+
+        Args:
+            last_op: 新快照包含的最后一条操作编号
+            positions: 每个对话的消息在新快照中的位置
+        """
+        self._created = {
+            conv_id: n for conv_id, n in self._created.items() if n > last_op
+        }
+        self._positions = {
+            conv_id: position
+            for conv_id, position in positions.items()
+            if conv_id not in self._created
+        }
+        self._last_op = max(self._last_op, last_op)
+        tail: Dict[str, List[Tuple[int, ConversationMessage]]] = {}
+        for conv_id, entries in self._tail.items():
+            kept = [entry for entry in entries if entry[0] > last_op]
+            if kept:
+                tail[conv_id] = kept
+        self._tail = tail
+
+    @staticmethod
+    def _decode_conversation(conv_data: Dict[str, Any]) -> Conversation:
+        conv_data = dict(conv_data)
+        messages = [
+            ConversationMessage(**msg_data)
+            for msg_data in conv_data.pop("messages", [])
+        ]
+        for position, message in enumerate(messages, 1):
+            message.seq = position
+        return Conversation(**conv_data, messages=messages)
+
+    def _apply(self, op: Dict[str, Any]) -> None:
+        """重放一条操作"""
+        kind = op["op"]
+        if kind == "create":
+            created = self._decode_conversation(op["conversation"])
+            self._forget(created.id)
+            self._conversations[created.id] = created
+        elif kind == "message":
+            conversation = self._conversations.get(op["message"]["conversation_id"])
+            if conversation is not None:
+                message = ConversationMessage(**op["message"])
+                if conversation.id in self._positions:
+                    self._tail.setdefault(conversation.id, []).append(
+                        (op["n"], message)
+                    )
+                if conversation.id not in self._lazy:
+                    conversation.messages.append(message)
+                conversation.updated_at = op["updated_at"]
+        elif kind == "update":
+            updated = self._conversations.get(op["id"])
+            if updated is not None:
+                updated.status = op["status"]
+                updated.updated_at = op["updated_at"]
+        elif kind == "delete":
+            self._forget(op["id"])
+
+    def _forget(self, conversation_id: str) -> None:
+        self._conversations.pop(conversation_id, None)
+        self._positions.pop(conversation_id, None)
+        self._tail.pop(conversation_id, None)
+        self._lazy.discard(conversation_id)
+
+    def deferred(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                conv_id: self._positions[conv_id][2] + len(self._tail.get(conv_id, ()))
+                for conv_id in self._lazy
+            }
+
+    def _read_raw_messages(self, conversation_id: str) -> bytes:
+        """从快照读出对话消息数组的 JSON（调用时已持有锁）"""
+        offset, length, _ = self._positions[conversation_id]
+        with open(self.snapshot_path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def _read_messages(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """从快照读出对话的消息（调用时已持有锁）"""
+        if conversation_id in self._positions:
+            messages: List[Dict[str, Any]] = json.loads(
+                self._read_raw_messages(conversation_id)
+            )
+            return messages
+        # 其他进程写的快照没有可用的元数据，或对话已被其他进程删除
+        if os.path.exists(self.snapshot_path):
+            for conv_id, conv_data in ArchiveReader(self.snapshot_path):
+                if conv_id == conversation_id:
+                    found: List[Dict[str, Any]] = conv_data.get("messages", [])
+                    return found
+        return []
+
+    def load_body(self, conversation: Conversation) -> None:
+        with self._locked(), phase("persistence"):
+            if conversation.id not in self._lazy:
+                return
+            self._sync()
+            messages: List[Any] = [
+                ConversationMessage(**msg_data)
+                for msg_data in self._read_messages(conversation.id)
+            ]
+            for position, message in enumerate(messages, 1):
+                message.seq = position
+            messages.extend(
+                message for _, message in self._tail.get(conversation.id, ())
+            )
+            messages.extend(conversation.messages)
+            self._lazy.discard(conversation.id)
+            conversation.messages = messages
+
+    def evict_body(self, conversation: Conversation) -> bool:
+        with self._lock:
+            # 快照之后才创建的对话要等下次写快照后才能释放
+            if (
+                conversation.id not in self._positions
+                or self._conversations.get(conversation.id) is not conversation
+            ):
+                return False
+            self._lazy.add(conversation.id)
+            conversation.messages = []
+            return True
+
+    def _append(
+        self, op: Dict[str, Any], record: Optional[Callable[[], None]] = None
+    ) -> None:
+        """追加一条操作，累计到 snapshot_every 条时换下日志并在后台写快照
+
+        Args:
+            op: 操作
+            record: 跟上其他进程、分配编号之后，写入之前更新内存状态的回调
+        """
+        with self._locked(), phase("persistence"):
+            self._sync()
+            if self._log_file is None:
+                self._log_file = open(self.log_path, "a+b")
+            self._last_op += 1
+            op["n"] = self._last_op
+            if record is not None:
+                record()
+            line = json.dumps(op, ensure_ascii=False).encode("utf-8") + b"\n"
+            self._log_file.write(line)
+            self._log_file.flush()
+            if self.fsync:
+                os.fsync(self._log_file.fileno())
+            self._log_offset += len(line)
+            self._log_ops += 1
+            # 其他线程或进程正在写快照时不等待，之后的追加再尝试
+            if (
+                self.snapshot_every
+                and self._log_ops >= self.snapshot_every
+                and self._acquire_compaction(blocking=False)
+            ):
+                try:
+                    self._swap_log()
+                except OSError as e:
+                    self._release_compaction()
+                    print(f"写入对话快照失败: {e}")
+                else:
+                    threading.Thread(
+                        target=self._compact_in_background,
+                        name="oplog-compact",
+                        daemon=True,
+                    ).start()
+
+    def _swap_log(self) -> None:
+        """换下当前日志并打开新日志（调用时已持有锁、写快照的锁并已跟上其他进程）"""
+        if os.path.exists(self.log_path):
+            if os.path.exists(self.old_log_path):
+                # 上次写快照失败，换下的日志仍需保留
+                with (
+                    open(self.old_log_path, "ab") as old,
+                    open(self.log_path, "rb") as current,
+                ):
+                    old.write(current.read())
+                os.remove(self.log_path)
+            else:
+                os.replace(self.log_path, self.old_log_path)
+        if self._log_file is not None:
+            self._log_file.close()
+        self._log_file = open(self.log_path, "a+b")
+        self._log_offset = 0
+        self._log_ops = 0
+
+    def _compact(self) -> None:
+        """写快照和元数据文件，替换后删除换下的日志（调用时已持有写快照的锁，不持有锁）
+
+        快照按磁盘上的状态生成：读取当前快照的元数据和换下的日志（包括其他进程追加的操作），
+        而不是只写本进程内存中的对话。两者只有持有写快照的锁时才会改变，
+        写临时文件期间其他线程和进程照常向新日志追加操作；持有锁时只替换文件、更新消息位置。
+        """
+        disk = JsonlConversationStore(
+            self.directory, snapshot_every=0, fsync=self.fsync
+        )
+        disk._read_snapshot()
+        disk._replay(disk.old_log_path)
+        positions = disk._write_snapshot()
+
+        with self._locked():
+            os.replace(self.snapshot_path + ".tmp", self.snapshot_path)
+            os.replace(self.meta_path + ".tmp", self.meta_path)
+            os.remove(self.old_log_path)
+            self._snapshot_stamp = self._stamp()
+            self._rebase(disk._last_op, positions)
+
+    def _compact_in_background(self) -> None:
+        """后台线程：写快照后释放写快照的锁"""
+        try:
+            self._compact()
+        except Exception as e:
+            print(f"写入对话快照失败: {e}")
+        finally:
+            self._release_compaction()
+
+    def _write_snapshot(self) -> Dict[str, Tuple[int, int, int]]:
+        """写快照和元数据文件的临时文件（调用时已持有锁或写快照的锁）
+
+        快照逐个对话写出并记录消息数组的位置；消息尚未读入的对话直接复制快照中的原始字节，
+        不解析也不读入内存。
+
+        Returns:
+            每个对话的消息在新快照中的位置
+        """
+        snapshot_temp = self.snapshot_path + ".tmp"
+        entries = []
+        positions = {}
+        with open(snapshot_temp, "wb") as out:
+            out.write(b'{"last_op": %d, "conversations": {' % self._last_op)
+            for index, (conv_id, conversation) in enumerate(
+                self._conversations.items()
+            ):
+                header = {name: getattr(conversation, name) for name in _HEADER_FIELDS}
+                if conv_id in self._lazy:
+                    raw = self._read_raw_messages(conv_id)
+                    tail = self._tail.get(conv_id, [])
+                    if tail:
+                        items = b", ".join(
+                            json.dumps(message_to_dict(m), ensure_ascii=False).encode(
+                                "utf-8"
+                            )
+                            for _, m in tail
+                        )
+                        raw = raw[:-1] + (b", " if raw != b"[]" else b"") + items + b"]"
+                    count = self._positions[conv_id][2] + len(tail)
+                else:
+                    raw = json.dumps(
+                        [message_to_dict(m) for m in conversation.messages],
+                        ensure_ascii=False,
+                    ).encode("utf-8")
+                    count = len(conversation.messages)
+
+                prefix = (
+                    json.dumps(conv_id, ensure_ascii=False)
+                    + ": "
+                    + json.dumps(header, ensure_ascii=False)[:-1]
+                )
+                out.write(
+                    (", " if index else "").encode("utf-8")
+                    + prefix.encode("utf-8")
+                    + b', "messages": '
+                )
+                offset = out.tell()
+                out.write(raw + b"}")
+
+                entries.append(
+                    dict(header, message_count=count, offset=offset, length=len(raw))
+                )
+                positions[conv_id] = (offset, len(raw), count)
+            out.write(b"}}")
+            out.flush()
+            os.fsync(out.fileno())
+            snapshot_bytes = out.tell()
+
+        meta_temp = self.meta_path + ".tmp"
+        with open(meta_temp, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "last_op": self._last_op,
+                    "snapshot_bytes": snapshot_bytes,
+                    "conversations": entries,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        return positions
+
+    def snapshot(self) -> None:
+        """立即写快照（先等待正在写的快照完成）"""
+        with phase("persistence"):
+            self._acquire_compaction(blocking=True)
+            try:
+                with self._locked():
+                    self._sync()
+                    self._swap_log()
+                self._compact()
+            finally:
+                self._release_compaction()
+
+    def create_conversation(self, conversation: Conversation) -> None:
+        def record() -> None:
+            self._forget(conversation.id)
+            self._conversations[conversation.id] = conversation
+            self._created[conversation.id] = self._last_op
+
+        self._append(
+            {"op": "create", "conversation": conversation_to_dict(conversation)}, record
+        )
+
+    def add_message(self, conversation: Conversation, message: Any) -> None:
+        # ConversationManager 追加消息前总会先读入对话的消息。
+        # 所有对话都记尾部：正在写的快照完成后，快照之前创建的对话也会有位置
+        def record() -> None:
+            self._tail.setdefault(conversation.id, []).append((self._last_op, message))
+
+        self._append(
+            {
+                "op": "message",
+                "message": message_to_dict(message),
+                "updated_at": conversation.updated_at,
+            },
+            record,
+        )
+
+    def update_conversation(self, conversation: Conversation) -> None:
+        self._append(
+            {
+                "op": "update",
+                "id": conversation.id,
+                "status": conversation.status,
+                "updated_at": conversation.updated_at,
+            }
+        )
+
+    def delete_conversation(self, conversation_id: str) -> None:
+        with self._lock:
+            existed = conversation_id in self._conversations
+            self._forget(conversation_id)
+        if existed:
+            self._append({"op": "delete", "id": conversation_id})
+
+    def save_conversation(self, conversation: Conversation) -> None:
+        # create 操作会替换同ID的对话
+        self.create_conversation(conversation)
+
+    def close(self) -> None:
+        """等待正在写的快照完成，写最后一次快照并关闭操作日志"""
+        self._acquire_compaction(blocking=True)
+        try:
+            with self._locked():
+                if self._log_file is None:
+                    return
+                self._sync()
+                pending = self._log_ops > 0 or os.path.exists(self.old_log_path)
+                if pending:
+                    self._swap_log()
+            if pending:
+                self._compact()
+            with self._lock:
+                if self._log_file is not None:
+                    self._log_file.close()
+                    self._log_file = None
+        finally:
+            self._release_compaction()
+
+    def get_stats(self) -> Dict[str, int]:
+        """存储状态：对话数、消息尚未读入的对话数、日志中的操作数和最后一条操作的编号"""
+        with self._lock:
+            return {
+                "conversations": len(self._conversations),
+                "deferred": len(self._lazy),
+                "log_ops": self._log_ops,
+                "last_op": self._last_op,
+            }
@@ -0,0 +1,334 @@
+"""
+等待中弹窗管理模块
+
+弹窗在 asyncio 事件循环中由独立任务驱动，调用方只是等待结果：
+- 等待期间定期发送进度心跳，避免客户端超时；
+- 客户端超时后重试同一个问题时，重新挂到已打开的弹窗上，而不是再弹一个；
+- 调用方放弃后用户才回答的结果会保留一段时间，供重试的调用直接取回；
+- 可选推送用户正在输入的草稿（增量），调用方可以提前开始准备。
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from .draft import DraftBuffer
+from .metrics import record_phase
+
+PopupFactory = Callable[..., Awaitable[Optional[Dict[str, Any]]]]
+Heartbeat = Callable[["PendingPopup"], Awaitable[None]]
+DraftListener = Callable[["PendingPopup", Dict[str, Any]], Awaitable[None]]
+
+
+@dataclass
+class PendingPopup:
+    """等待用户回答的弹窗"""
+
+    popup_id: str
+    key: str
+    question: str
+    context: str
+    started_at: float
+    future: "asyncio.Future[Optional[Dict[str, Any]]]"
+    attach_count: int = 0
+    session_id: str = ""
+    finished_at: Optional[float] = None
+    on_result: Optional[Callable[[Dict[str, Any]], Any]] = field(
+        default=None, repr=False
+    )
+    draft: Optional[DraftBuffer] = field(default=None, repr=False)
+
+    def elapsed(self) -> float:
+        """已等待的秒数"""
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可序列化的字典"""
+        data = {
+            "popup_id": self.popup_id,
+            "question": self.question,
+            "context": self.context,
+            "waited_seconds": round(self.elapsed(), 1),
+            "attach_count": self.attach_count,
+            "done": self.future.done(),
+        }
+        if self.draft is not None:
+            data["draft_version"] = self.draft.version
+        return data
+
+
+def make_popup_key(question: str, context: str = "", scope: str = "") -> str:
+    """生成弹窗的去重键
+
+    Args:
+        question: 问题
+        context: 上下文
+        scope: 作用域（例如对话ID）
+
+    Returns:
+        去重键
+    """
+    digest = hashlib.sha1()
+    for part in (scope, question, context):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def progress_heartbeat(ctx: Any) -> Heartbeat:
+    """生成通过 MCP 进度通知发送心跳的回调
+
+    Args:
+        ctx: FastMCP 的 Context
+
+    Returns:
+        心跳回调
+    """
+
+    async def heartbeat(pending: PendingPopup) -> None:
+        elapsed = pending.elapsed()
+        await ctx.report_progress(
+            progress=round(elapsed, 1),
+            message=f"等待用户回答，已等待 {int(elapsed)} 秒 (popup_id: {pending.popup_id})",
+        )
+
+    return heartbeat
+
+
+def progress_draft(ctx: Any) -> DraftListener:
+    """生成通过 MCP 进度通知推送草稿增量的回调
+
+    通知的 message 是 JSON：{"popup_id", "version", "done", "diffs"}，
+    首次推送或增量不完整时用 "text" 代替 "diffs"。
+
+    Args:
+        ctx: FastMCP 的 Context
+
+    Returns:
+        草稿回调
+    """
+
+    async def report(pending: PendingPopup, update: Dict[str, Any]) -> None:
+        await ctx.report_progress(
+            progress=round(pending.elapsed(), 1),
+            message=json.dumps(
+                {"popup_id": pending.popup_id, **update}, ensure_ascii=False
+            ),
+        )
+
+    return report
+
+
+class PendingPopupRegistry:
+    """等待中弹窗注册表"""
+
+    def __init__(
+        self,
+        popup_factory: Optional[PopupFactory] = None,
+        heartbeat_interval: float = 10.0,
+        result_ttl: float = 900.0,
+    ):
+        self.popup_factory = popup_factory
+        self.heartbeat_interval = heartbeat_interval
+        self.result_ttl = result_ttl
+        self._pending: Dict[str, PendingPopup] = {}
+        self._completed: Dict[str, PendingPopup] = {}
+        self._tasks: Set["asyncio.Task[Any]"] = set()
+
+    def _factory(self) -> PopupFactory:
+        if self.popup_factory is None:
+            from .popup import show_popup_dialog_async
+
+            self.popup_factory = show_popup_dialog_async
+        return self.popup_factory
+
+    def _expire_completed(self) -> None:
+        now = time.monotonic()
+        expired = [
+            key
+            for key, popup in self._completed.items()
+            if popup.finished_at is not None
+            and now - popup.finished_at > self.result_ttl
+        ]
+        for key in expired:
+            del self._completed[key]
+
+    def has(self, key: str) -> bool:
+        """是否有该键的弹窗正在等待，或有尚未取回的回答
+
+        Args:
+            key: 去重键
+
+        Returns:
+            是否存在
+        """
+        self._expire_completed()
+        return key in self._pending or key in self._completed
+
+    def list_pending(self, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """列出正在等待的弹窗
+
+        Args:
+            session_id: 只列出该会话发起的弹窗（默认列出全部）
+
+        Returns:
+            弹窗信息列表
+        """
+        return [
+            popup.to_dict()
+            for popup in self._pending.values()
+            if session_id is None or popup.session_id == session_id
+        ]
+
+    def get_draft(
+        self, popup_id: str, since_version: int = 0
+    ) -> Optional[Dict[str, Any]]:
+        """获取弹窗中正在输入的草稿
+
+        Args:
+            popup_id: 弹窗ID
+            since_version: 调用方已收到的版本号
+
+        Returns:
+            草稿变化，弹窗不存在或未开启草稿推送时返回 None
+        """
+        self._expire_completed()
+        for popup in list(self._pending.values()) + list(self._completed.values()):
+            if popup.popup_id == popup_id and popup.draft is not None:
+                return {"popup_id": popup_id, **popup.draft.since(since_version)}
+        return None
+
+    async def _drive(self, popup: PendingPopup, factory_kwargs: Dict[str, Any]) -> None:
+        """驱动弹窗直到用户回答或取消"""
+        try:
+            result = await self._factory()(
+                popup.question, popup.context, **factory_kwargs
+            )
+            if popup.draft is not None:
+                popup.draft.finish(result["answer"] if result else None)
+            if result and popup.on_result is not None:
+                popup.on_result(result)
+        except asyncio.CancelledError:
+            if popup.draft is not None:
+                popup.draft.finish()
+            popup.future.cancel()
+            raise
+        except Exception as e:
+            popup.future.set_exception(e)
+        else:
+            popup.future.set_result(result)
+            # 只保留已回答的结果；用户取消的问题重试时应该重新询问
+            if result:
+                self._completed[popup.key] = popup
+        finally:
+            popup.finished_at = time.monotonic()
+            self._pending.pop(popup.key, None)
+
+    async def ask(
+        self,
+        key: str,
+        question: str,
+        context: str = "",
+        on_heartbeat: Optional[Heartbeat] = None,
+        on_result: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        stream_draft: bool = False,
+        on_draft: Optional[DraftListener] = None,
+        session_id: str = "",
+        **factory_kwargs: Any,
+    ) -> Tuple[Optional[Dict[str, Any]], PendingPopup, bool]:
+        """显示弹窗或重新挂到已存在的弹窗上，并等待回答
+
+        Args:
+            key: 去重键，相同键的调用共享同一个弹窗
+            question: 问题
+            context: 上下文
+            on_heartbeat: 等待期间定期调用的心跳回调
+            on_result: 用户回答后调用一次（即使原调用方已放弃）
+            stream_draft: 新建弹窗时是否记录用户正在输入的草稿
+            on_draft: 草稿变化时调用，参数为自上次推送以来的变化
+            session_id: 发起弹窗的会话ID
+            **factory_kwargs: 传给弹窗工厂的其他参数
+
+        Returns:
+            (用户回答或 None, 弹窗信息, 是否重新挂到已有弹窗)
+        """
+        self._expire_completed()
+
+        popup = self._pending.get(key)
+        resumed = popup is not None
+        if popup is None:
+            popup = self._completed.pop(key, None)
+            resumed = popup is not None
+
+        if popup is None:
+            loop = asyncio.get_running_loop()
+            popup = PendingPopup(
+                popup_id=str(uuid.uuid4()),
+                key=key,
+                question=question,
+                context=context,
+                started_at=time.monotonic(),
+                future=loop.create_future(),
+                session_id=session_id,
+                on_result=on_result,
+                draft=DraftBuffer() if stream_draft else None,
+            )
+            if popup.draft is not None:
+                factory_kwargs["draft_callback"] = popup.draft.update
+            self._pending[key] = popup
+            # 弹窗由独立任务驱动，调用方被取消时弹窗保持打开
+            task = loop.create_task(self._drive(popup, factory_kwargs))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        popup.attach_count += 1
+        wait_started = time.perf_counter()
+        draft = popup.draft if on_draft is not None else None
+        changed = asyncio.Event()
+        sent_version = 0
+        if draft is not None:
+            draft.add_listener(changed.set)
+        try:
+            while not popup.future.done():
+                waiters: Set["asyncio.Future[Any]"] = {popup.future}
+                if draft is not None:
+                    waiters.add(asyncio.ensure_future(changed.wait()))
+                try:
+                    await asyncio.wait(
+                        waiters,
+                        timeout=self.heartbeat_interval,
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                finally:
+                    for waiter in waiters - {popup.future}:
+                        waiter.cancel()
+                if popup.future.done():
+                    break
+
+                try:
+                    if draft is not None and on_draft is not None and changed.is_set():
+                        # 草稿推送本身也是进度通知，同时起到心跳作用
+                        changed.clear()
+                        update = draft.since(sent_version)
+                        sent_version = update["version"]
+                        await on_draft(popup, update)
+                    elif on_heartbeat is not None:
+                        await on_heartbeat(popup)
+                except Exception as e:
+                    print(f"发送进度心跳失败: {e}")
+        finally:
+            if draft is not None:
+                draft.remove_listener(changed.set)
+            if resumed:
+                # 重新挂上的调用没有驱动弹窗，等待时间都算作用户思考时间
+                record_phase("think_time", time.perf_counter() - wait_started)
+
+        if key in self._completed and self._completed[key] is popup:
+            # 回答已交给调用方，不再保留
+            del self._completed[key]
+        return popup.future.result(), popup, resumed
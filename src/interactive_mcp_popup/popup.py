@@ -6,28 +6,38 @@
 
 import sys
 import json
+import asyncio
 import tempfile
 import os
-from typing import Dict, Optional, Any
+import time
+from typing import Callable, Dict, List, Optional, Any
 
 try:
     from PySide6.QtWidgets import (
         QApplication, QDialog, QVBoxLayout, QLabel, 
-        QTextEdit, QPushButton, QWidget, QFrame
+        QTextEdit, QPushButton, QWidget, QFrame, QListWidget, QListWidgetItem
     )
-    from PySide6.QtCore import Qt, QTimer, QPoint, QSize, QRect
-    from PySide6.QtGui import QFont, QPalette, QColor, QCursor, QMouseEvent
+    from PySide6.QtCore import Qt, QTimer, QPoint, QSize, QRect, QEvent, QObject
+    from PySide6.QtGui import QFont, QPalette, QColor, QCursor, QKeyEvent, QMouseEvent
 except ImportError as e:
     raise ImportError(f"PySide6 is required: {e}")
 
+from .metrics import phase, record_phase
+from .tracing import span, traced
+
 
 class ModernPopupDialog(QDialog):
     """现代化的弹窗对话框 - 支持移动和调整大小"""
     
-    def __init__(self, question: str, context: str = "", parent=None):
+    @traced()
+    def __init__(self, question: str, context: str = "", parent: Optional[QWidget] = None, suggestions: Optional[List[Dict[str, Any]]] = None, completer: Optional[Any] = None, draft_callback: Optional[Callable[[str], None]] = None, draft_debounce_ms: int = 300):
         super().__init__(parent)
         self.question = question
         self.context = context
+        self.suggestions = suggestions or []
+        self.completer = completer  # 提供 complete(prefix, limit) 的自动补全源
+        self.draft_callback = draft_callback  # 输入停顿后收到当前草稿
+        self.draft_debounce_ms = draft_debounce_ms
         self.result = None
         
         # 拖拽相关变量
@@ -48,6 +58,7 @@ class ModernPopupDialog(QDialog):
         self.setup_style()
         self.load_window_settings()
         
+    @traced()
     def load_window_settings(self):
         """加载窗口设置"""
         try:
@@ -109,12 +120,45 @@ class ModernPopupDialog(QDialog):
             context_text.setFont(QFont("Arial", 9))
             layout.addWidget(context_text)
         
+        # 如果有相似问题的历史回答，显示为建议
+        if self.suggestions:
+            suggestion_label = QLabel("相似问题的历史回答（点击填入）:")
+            suggestion_label.setFont(QFont("Arial", 10, QFont.Weight.Bold))
+            layout.addWidget(suggestion_label)
+            
+            self.suggestion_list = QListWidget()
+            self.suggestion_list.setMaximumHeight(90)
+            for suggestion in self.suggestions:
+                item = QListWidgetItem(suggestion["answer"])
+                item.setToolTip(f"问题: {suggestion['question']}")
+                self.suggestion_list.addItem(item)
+            self.suggestion_list.itemClicked.connect(self.use_suggestion)
+            layout.addWidget(self.suggestion_list)
+        
         # 输入框
         self.input_field = QTextEdit()
         self.input_field.setPlaceholderText("请输入你的回答...")
         self.input_field.setMinimumHeight(100)
         layout.addWidget(self.input_field)
         
+        # 自动补全列表，有候选时显示在输入框下方
+        self.completion_list = QListWidget()
+        self.completion_list.setMaximumHeight(100)
+        self.completion_list.hide()
+        self.completion_list.itemClicked.connect(self.accept_completion)
+        layout.addWidget(self.completion_list)
+        if self.completer is not None:
+            self.input_field.textChanged.connect(self.update_completions)
+            self.input_field.installEventFilter(self)
+        
+        # 草稿推送：输入停顿 draft_debounce_ms 毫秒后才回调，避免逐键推送
+        self.draft_timer = QTimer(self)
+        self.draft_timer.setSingleShot(True)
+        self.draft_timer.setInterval(self.draft_debounce_ms)
+        self.draft_timer.timeout.connect(self.emit_draft)
+        if self.draft_callback is not None:
+            self.input_field.textChanged.connect(self.draft_timer.start)
+        
         # 提交按钮
         self.submit_button = QPushButton("提交回答")
         self.submit_button.setMinimumHeight(40)
@@ -217,6 +261,7 @@ class ModernPopupDialog(QDialog):
             if new_rect.width() <= max_size.width() and new_rect.height() <= max_size.height():
                 self.setGeometry(new_rect)
         
+    @traced()
     def setup_style(self):
         """设置现代化样式"""
         self.setStyleSheet("""
@@ -238,6 +283,15 @@ class ModernPopupDialog(QDialog):
             QTextEdit:focus {
                 border-color: #3498db;
             }
+            QListWidget {
+                background-color: white;
+                border: 1px solid #e1e8ed;
+                border-radius: 8px;
+                font-size: 12px;
+            }
+            QListWidget::item:hover {
+                background-color: #eaf4fc;
+            }
             QPushButton {
                 background-color: #3498db;
                 color: white;
@@ -254,10 +308,63 @@ class ModernPopupDialog(QDialog):
             }
         """)
         
+    def update_completions(self) -> None:
+        """根据当前输入更新自动补全候选"""
+        prefix = self.input_field.toPlainText()
+        completions = [c for c in self.completer.complete(prefix, 5) if c != prefix] if prefix and self.completer is not None else []
+        
+        self.completion_list.clear()
+        if completions:
+            self.completion_list.addItems(completions)
+            self.completion_list.setCurrentRow(0)
+            self.completion_list.show()
+        else:
+            self.completion_list.hide()
+    
+    def accept_completion(self, item: Optional[QListWidgetItem] = None) -> None:
+        """用选中的候选替换输入内容"""
+        current: Optional[QListWidgetItem] = item or self.completion_list.currentItem()
+        if current is None:
+            return
+        self.input_field.setPlainText(current.text())
+        self.input_field.moveCursor(self.input_field.textCursor().MoveOperation.End)
+        self.completion_list.hide()
+        self.input_field.setFocus()
+    
+    def eventFilter(self, obj: QObject, event: QEvent) -> bool:
+        """输入框按键：Tab 接受候选，上下键切换候选，Esc 关闭候选"""
+        if (obj is self.input_field and isinstance(event, QKeyEvent)
+                and event.type() == QEvent.Type.KeyPress and self.completion_list.isVisible()):
+            key = event.key()
+            if key == Qt.Key.Key_Tab:
+                self.accept_completion()
+                return True
+            if key in (Qt.Key.Key_Down, Qt.Key.Key_Up):
+                step = 1 if key == Qt.Key.Key_Down else -1
+                row = (self.completion_list.currentRow() + step) % self.completion_list.count()
+                self.completion_list.setCurrentRow(row)
+                return True
+            if key == Qt.Key.Key_Escape:
+                self.completion_list.hide()
+                return True
+        return super().eventFilter(obj, event)
+    
+    def use_suggestion(self, item: QListWidgetItem) -> None:
+        """把选中的历史回答填入输入框"""
+        self.input_field.setPlainText(item.text())
+        self.input_field.setFocus()
+    
+    def emit_draft(self) -> None:
+        """把当前输入内容作为草稿回调"""
+        if self.draft_callback is not None:
+            self.draft_callback(self.input_field.toPlainText())
+    
+    @traced()
     def submit_answer(self):
         """提交回答"""
         answer = self.input_field.toPlainText().strip()
         if answer:
+            self.draft_timer.stop()
             self.result = {
                 "question": self.question,
                 "context": self.context,
@@ -274,21 +381,24 @@ class ModernPopupDialog(QDialog):
         return self.result
 
 
-def show_popup_dialog(question: str, context: str = "") -> Optional[Dict[str, Any]]:
-    """显示弹窗对话框
+def create_popup_dialog(question: str, context: str = "", suggestions: Optional[List[Dict[str, Any]]] = None, completer: Optional[Any] = None, draft_callback: Optional[Callable[[str], None]] = None) -> ModernPopupDialog:
+    """创建并居中弹窗对话框，不显示
     
     Args:
         question: 要问用户的问题
         context: 上下文信息（可选）
+        suggestions: 相似问题的历史回答（可选）
+        completer: 输入框自动补全源，需提供 complete(prefix, limit)（可选）
+        draft_callback: 输入停顿后接收当前草稿的回调（可选）
         
     Returns:
-        包含用户回答的字典，如果用户取消则返回 None
+        弹窗对话框
     """
     app = QApplication.instance()
     if app is None:
         app = QApplication(sys.argv)
     
-    dialog = ModernPopupDialog(question, context)
+    dialog = ModernPopupDialog(question, context, suggestions=suggestions, completer=completer, draft_callback=draft_callback)
     
     # 居中显示
     if dialog.parent():
@@ -301,7 +411,27 @@ def show_popup_dialog(question: str, context: str = "") -> Optional[Dict[str, An
             y = (geometry.height() - dialog.height()) // 2
             dialog.move(x, y)
     
-    result = dialog.exec()
+    return dialog
+
+
+@traced("show_popup_dialog")
+def show_popup_dialog(question: str, context: str = "", suggestions: Optional[List[Dict[str, Any]]] = None, completer: Optional[Any] = None) -> Optional[Dict[str, Any]]:
+    """显示弹窗对话框
+    
+    Args:
+        question: 要问用户的问题
+        context: 上下文信息（可选）
+        suggestions: 相似问题的历史回答（可选）
+        completer: 输入框自动补全源，需提供 complete(prefix, limit)（可选）
+        
+    Returns:
+        包含用户回答的字典，如果用户取消则返回 None
+    """
+    with phase("dialog_construction"):
+        dialog = create_popup_dialog(question, context, suggestions, completer)
+    
+    with phase("think_time"), span("exec"):
+        result = dialog.exec()
     
     if result == QDialog.Accepted:
         return dialog.get_result()
@@ -309,6 +439,52 @@ def show_popup_dialog(question: str, context: str = "") -> Optional[Dict[str, An
         return None
 
 
+@traced("show_popup_dialog")
+async def show_popup_dialog_async(question: str, context: str = "", suggestions: Optional[List[Dict[str, Any]]] = None, completer: Optional[Any] = None, draft_callback: Optional[Callable[[str], None]] = None, poll_interval: float = 0.02) -> Optional[Dict[str, Any]]:
+    """在 asyncio 事件循环中显示弹窗对话框
+    
+    不调用阻塞的 exec()，而是在当前（主）线程中定期处理 Qt 事件，
+    等待期间事件循环可以继续处理其他请求和发送通知。
+    
+    Args:
+        question: 要问用户的问题
+        context: 上下文信息（可选）
+        suggestions: 相似问题的历史回答（可选）
+        completer: 输入框自动补全源（可选）
+        draft_callback: 输入停顿后接收当前草稿的回调（可选）
+        poll_interval: 处理 Qt 事件的间隔（秒）
+        
+    Returns:
+        包含用户回答的字典，如果用户取消则返回 None
+    """
+    with phase("dialog_construction"):
+        dialog = create_popup_dialog(question, context, suggestions, completer, draft_callback)
+    
+    finished: List[int] = []
+    dialog.finished.connect(finished.append)
+    dialog.open()
+    opened_at = time.perf_counter()
+    visible_at = None
+    
+    try:
+        with span("exec"):
+            while not finished:
+                QApplication.processEvents()
+                if visible_at is None and dialog.isVisible():
+                    visible_at = time.perf_counter()
+                    record_phase("window_visible", visible_at - opened_at)
+                await asyncio.sleep(poll_interval)
+    except asyncio.CancelledError:
+        dialog.reject()
+        raise
+    finally:
+        record_phase("think_time", time.perf_counter() - (visible_at or opened_at))
+    
+    if finished[0] == QDialog.DialogCode.Accepted:
+        return dialog.get_result()
+    return None
+
+
 def save_result_to_file(result: Dict[str, Any], output_file: str) -> bool:
     """保存结果到文件
     
@@ -320,8 +496,9 @@ def save_result_to_file(result: Dict[str, Any], output_file: str) -> bool:
         保存是否成功
     """
     try:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
+        with phase("persistence"):
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
         return True
     except Exception as e:
         print(f"保存结果失败: {e}")
@@ -0,0 +1,228 @@
+"""
+对话资源模块
+
+把对话列表和每个对话暴露为 MCP 资源：
+- conversation://list：对话列表（最近更新在前，不含上下文）；
+- conversation://{conversation_id}：对话内容和全部消息（超过 preview_chars 的内容只含预览）。
+
+客户端订阅后，add_message、end_conversation、delete_conversation 等修改对话时
+服务器发送 notifications/resources/updated。一小段时间内的多次修改合并为一次通知，
+客户端收到后重新读取资源即可，不必轮询工具。会话结束时丢弃它的所有订阅。
+
+FastMCP 没有公开订阅处理和能力声明的接口，这里使用底层服务器 mcp._mcp_server
+和会话的 _exit_stack，依赖的 fastmcp 版本范围固定在 pyproject.toml 中，
+tests/test_resources.py 在这些属性不存在时失败。
+"""
+
+import asyncio
+import json
+import threading
+import weakref
+from typing import Any, Dict, Optional, Set
+
+from fastmcp import FastMCP
+from pydantic import AnyUrl
+
+from .conversation import MAX_PAGE_SIZE, ConversationManager, put_text
+from .utils import config_manager
+
+LIST_URI = "conversation://list"
+LIST_FIELDS = ["id", "topic", "status", "created_at", "updated_at", "message_count"]
+
+
+def conversation_uri(conversation_id: str) -> str:
+    """对话资源的 URI"""
+    return f"conversation://{conversation_id}"
+
+
+class ConversationSubscriptions:
+    """记录各会话订阅的资源，合并对话修改并发送更新通知"""
+
+    def __init__(self, manager: ConversationManager, debounce: float = 0.2):
+        """
+        Args:
+            manager: 对话管理器
+            debounce: 合并通知的等待时间（秒），这段时间内的修改只发送一次通知
+        """
+        self.manager = manager
+        self.debounce = debounce
+        self.notifications_sent = 0
+
+        self._subscribers: Dict[str, Set[Any]] = {}
+        self._sessions: "weakref.WeakSet[Any]" = weakref.WeakSet()
+        self._dirty: Set[str] = set()
+        self._lock = threading.Lock()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        manager.add_listener(self._on_change)
+
+    def subscribe(self, uri: str, session: Any) -> bool:
+        """会话订阅资源（需在事件循环中调用）
+
+        Returns:
+            是否为该会话的第一个订阅（调用方应在会话结束时调用 drop_session）
+        """
+        self._loop = asyncio.get_running_loop()
+        self._subscribers.setdefault(uri, set()).add(session)
+        if session in self._sessions:
+            return False
+        self._sessions.add(session)
+        return True
+
+    def unsubscribe(self, uri: str, session: Any) -> None:
+        """取消订阅"""
+        sessions = self._subscribers.get(uri)
+        if sessions is not None:
+            sessions.discard(session)
+            if not sessions:
+                del self._subscribers[uri]
+
+    def drop_session(self, session: Any) -> None:
+        """会话结束时取消它的所有订阅"""
+        self._sessions.discard(session)
+        for uri in list(self._subscribers):
+            self.unsubscribe(uri, session)
+
+    def subscriber_count(self, uri: str) -> int:
+        """订阅该资源的会话数"""
+        return len(self._subscribers.get(uri, ()))
+
+    def _on_change(self, conversation_id: str) -> None:
+        """对话修改回调：记录需要通知的资源，安排一次合并的发送"""
+        with self._lock:
+            for uri in (conversation_uri(conversation_id), LIST_URI):
+                if uri in self._subscribers:
+                    self._dirty.add(uri)
+            if not self._dirty or self._loop is None or self._loop.is_closed():
+                return
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._schedule()
+        else:
+            # 修改来自其他线程
+            self._loop.call_soon_threadsafe(self._schedule)
+
+    def _schedule(self) -> None:
+        if self._flush_handle is None and self._loop is not None:
+            self._flush_handle = self._loop.call_later(self.debounce, self._flush)
+
+    def _flush(self) -> None:
+        self._flush_handle = None
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if self._loop is None:
+            return
+        for uri in dirty:
+            for session in list(self._subscribers.get(uri, ())):
+                self._loop.create_task(self._send(uri, session))
+
+    async def _send(self, uri: str, session: Any) -> None:
+        try:
+            await session.send_resource_updated(uri)
+            self.notifications_sent += 1
+        except Exception as e:
+            # 会话已断开
+            print(f"发送资源更新通知失败: {e}")
+            self.unsubscribe(uri, session)
+
+
+def get_preview_chars() -> int:
+    """历史和列表中长文本的预览长度"""
+    preview_chars: int = config_manager.get_conversation_config().get(
+        "preview_chars", 2000
+    )
+    return preview_chars
+
+
+def read_conversation_list(manager: ConversationManager) -> str:
+    """对话列表资源内容"""
+    page = manager.query_conversations(limit=MAX_PAGE_SIZE, fields=LIST_FIELDS)
+    return json.dumps(page, ensure_ascii=False)
+
+
+def read_conversation(manager: ConversationManager, conversation_id: str) -> str:
+    """对话资源内容
+
+    Raises:
+        ValueError: 对话不存在
+    """
+    conversation = manager.get_conversation(conversation_id)
+    if conversation is None:
+        raise ValueError(f"对话 {conversation_id} 不存在")
+    preview_chars = get_preview_chars()
+    data: Dict[str, Any] = {"id": conversation.id, "topic": conversation.topic}
+    put_text(data, "context", conversation.context, preview_chars)
+    data.update(
+        {
+            "status": conversation.status,
+            "created_at": conversation.created_at,
+            "updated_at": conversation.updated_at,
+            "latest_seq": len(conversation.messages),
+            "messages": manager.get_conversation_history(
+                conversation_id, preview_chars
+            ),
+        }
+    )
+    return json.dumps(data, ensure_ascii=False)
+
+
+def register_conversation_resources(
+    mcp: FastMCP, manager: ConversationManager
+) -> ConversationSubscriptions:
+    """在 FastMCP 服务器上注册对话资源和订阅处理
+
+    Args:
+        mcp: FastMCP 实例
+        manager: 对话管理器
+
+    Returns:
+        订阅管理器
+    """
+    debounce_ms = config_manager.get_conversation_config().get(
+        "notify_debounce_ms", 200
+    )
+    subscriptions = ConversationSubscriptions(manager, debounce=debounce_ms / 1000)
+    server = mcp._mcp_server
+
+    @mcp.resource(LIST_URI, name="conversations", mime_type="application/json")
+    def conversation_list() -> str:
+        """对话列表，最近更新在前"""
+        return read_conversation_list(manager)
+
+    @mcp.resource(
+        "conversation://{conversation_id}",
+        name="conversation",
+        mime_type="application/json",
+    )
+    def conversation(conversation_id: str) -> str:
+        """对话内容和全部消息"""
+        return read_conversation(manager, conversation_id)
+
+    # 底层服务器的订阅装饰器没有类型注解
+    @server.subscribe_resource()  # type: ignore[untyped-decorator]
+    async def subscribe(uri: AnyUrl) -> None:
+        session = server.request_context.session
+        if subscriptions.subscribe(str(uri), session):
+            # 客户端断开、会话退出时丢弃订阅，不必等到发送通知失败
+            session._exit_stack.callback(subscriptions.drop_session, session)
+
+    @server.unsubscribe_resource()  # type: ignore[untyped-decorator]
+    async def unsubscribe(uri: AnyUrl) -> None:
+        subscriptions.unsubscribe(str(uri), server.request_context.session)
+
+    # 底层服务器默认声明不支持订阅
+    get_capabilities = server.get_capabilities
+
+    def get_capabilities_with_subscribe(*args: Any, **kwargs: Any) -> Any:
+        capabilities = get_capabilities(*args, **kwargs)
+        if capabilities.resources is not None:
+            capabilities.resources.subscribe = True
+        return capabilities
+
+    server.get_capabilities = get_capabilities_with_subscribe  # type: ignore[method-assign]
+    return subscriptions
@@ -0,0 +1,584 @@
+"""
+全文检索模块
+
+对所有对话的消息内容和主题建立倒排索引，按 BM25 排序。
+分词使用 similarity.tokenize：中文按相邻两字切分，英文和数字按单词切分。
+查询单个中文字时合并所有包含该字的两字词元的倒排表，不需要另外索引单字。
+
+- 每条消息（系统消息除外）是一个文档，对话主题是一个 message_type 为 "topic"、序号为 0 的文档；
+- 添加消息时增量更新倒排表；删除对话只把文档标记为已删除，写快照时再压缩；
+- 持久化与 oplog 相同：每次变化只向 <索引文件>.log 追加一行操作（带词频，重放时不需要重新分词），
+  累计 compact_every 条后在后台线程中写快照（JSON 文件）并开始新的日志；
+  启动时加载快照并重放日志，不需要重建。
+"""
+
+import atexit
+import json
+import math
+import os
+import tempfile
+import threading
+from typing import IO, Any, Dict, List, Optional, Set, Tuple
+
+from .metrics import phase
+from .similarity import is_cjk, tokenize
+
+TOPIC_TYPE = "topic"
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 文档元数据：(对话ID, 序号, 发送者, 消息类型, 时间, 词元数)
+DocInfo = Tuple[str, int, str, str, str, int]
+
+
+def make_snippet(text: str, query: str, max_chars: int = 120) -> str:
+    """截取文本中第一个命中查询词元附近的片段
+
+    Args:
+        text: 原文
+        query: 查询文本
+        max_chars: 片段最大长度
+
+    Returns:
+        片段，截断处用 "..." 表示
+    """
+    if len(text) <= max_chars:
+        return text
+    lowered = text.lower()
+    positions = [lowered.find(token) for token in tokenize(query)]
+    hit = min((position for position in positions if position >= 0), default=0)
+    start = max(0, min(hit - max_chars // 4, len(text) - max_chars))
+    snippet = text[start : start + max_chars]
+    return (
+        ("..." if start else "")
+        + snippet
+        + ("..." if start + max_chars < len(text) else "")
+    )
+
+
+class SearchIndex:
+    """带 BM25 排序的倒排索引"""
+
+    def __init__(self) -> None:
+        self.persist_path: Optional[str] = None
+        self.compact_every = 5000
+
+        self._docs: List[Optional[DocInfo]] = []  # 文档ID -> 元数据，已删除为 None
+        self._postings: Dict[str, Dict[int, int]] = {}  # 词元 -> {文档ID: 词频}
+        self._conversation_docs: Dict[str, List[int]] = {}
+        self._char_tokens: Dict[str, Set[str]] = {}  # 中文字 -> 包含它的两字词元
+        self._last_seq: Dict[str, int] = {}  # 每个对话已索引到的消息序号
+        self._live = 0
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+        self._log_file: Optional[IO[bytes]] = None
+        self._last_op = 0  # 最后一条操作的编号
+        self._log_ops = 0  # 当前日志中的操作数
+        self._compacting = False
+
+    def __len__(self) -> int:
+        return self._live
+
+    @property
+    def log_path(self) -> str:
+        """增量日志路径"""
+        return f"{self.persist_path}.log"
+
+    @property
+    def old_log_path(self) -> str:
+        """写快照期间被替换下来的日志，快照写完后删除"""
+        return f"{self.persist_path}.log.old"
+
+    @staticmethod
+    def _count(text: str) -> Dict[str, int]:
+        """分词并统计词频"""
+        counts: Dict[str, int] = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+        return counts
+
+    def _add_doc(
+        self,
+        conversation_id: str,
+        seq: int,
+        sender: str,
+        message_type: str,
+        timestamp: str,
+        counts: Dict[str, int],
+    ) -> None:
+        """添加一个文档（调用时已持有锁）"""
+        length = sum(counts.values())
+        if not length:
+            return
+        doc_id = len(self._docs)
+        self._docs.append(
+            (conversation_id, seq, sender, message_type, timestamp, length)
+        )
+        self._conversation_docs.setdefault(conversation_id, []).append(doc_id)
+        for token, count in counts.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                self._register_token(token)
+            postings[doc_id] = count
+        self._live += 1
+        self._total_length += length
+
+    def _register_token(self, token: str) -> None:
+        """记录两字中文词元包含的字（调用时已持有锁）"""
+        if len(token) == 2 and is_cjk(token):
+            for char in token:
+                self._char_tokens.setdefault(char, set()).add(token)
+
+    def _term_postings(self, term: str) -> Dict[int, int]:
+        """查询词元的倒排表（调用时已持有锁）
+
+        单个中文字合并包含它的两字词元：字在文档中的出现次数按它作为两字词元首字和尾字的次数中较大者估算，
+        再加上单独成词的次数。
+        """
+        postings = self._postings.get(term, {})
+        bigrams = self._char_tokens.get(term) if len(term) == 1 else None
+        if not bigrams:
+            return postings
+        leading: Dict[int, int] = {}
+        trailing: Dict[int, int] = {}
+        for token in bigrams:
+            target = leading if token[0] == term else trailing
+            for doc_id, count in self._postings.get(token, {}).items():
+                target[doc_id] = target.get(doc_id, 0) + count
+        return {
+            doc_id: postings.get(doc_id, 0)
+            + max(leading.get(doc_id, 0), trailing.get(doc_id, 0))
+            for doc_id in leading.keys() | trailing.keys() | postings.keys()
+        }
+
+    def _apply(self, op: Dict[str, Any]) -> None:
+        """执行一条操作（调用时已持有锁）；重放日志时已执行过的操作会被忽略"""
+        kind = op["op"]
+        conversation_id = op["id"]
+        if kind == "topic":
+            self._last_seq.setdefault(conversation_id, 0)
+            self._add_doc(conversation_id, 0, "", TOPIC_TYPE, op["timestamp"], op["tf"])
+        elif kind == "message":
+            if op["seq"] <= self._last_seq.get(conversation_id, 0):
+                return
+            self._last_seq[conversation_id] = op["seq"]
+            self._add_doc(
+                conversation_id,
+                op["seq"],
+                op["sender"],
+                op["type"],
+                op["timestamp"],
+                op["tf"],
+            )
+        elif kind == "remove":
+            self._last_seq.pop(conversation_id, None)
+            doc_ids = self._conversation_docs.pop(conversation_id, [])
+            for doc_id in doc_ids:
+                doc = self._docs[doc_id]
+                if doc is not None:
+                    self._total_length -= doc[5]
+                self._docs[doc_id] = None
+            self._live -= len(doc_ids)
+
+    def _record(self, op: Dict[str, Any]) -> None:
+        """执行一条操作并追加到日志，累计到 compact_every 条时在后台写快照（调用时已持有锁）"""
+        self._apply(op)
+        if self._log_file is None:
+            return
+        self._last_op += 1
+        op["n"] = self._last_op
+        with phase("persistence"):
+            self._log_file.write(
+                json.dumps(op, ensure_ascii=False, separators=(",", ":")).encode(
+                    "utf-8"
+                )
+                + b"\n"
+            )
+            self._log_file.flush()
+        self._log_ops += 1
+        if (
+            self.compact_every
+            and self._log_ops >= self.compact_every
+            and not self._compacting
+        ):
+            self._compacting = True
+            threading.Thread(
+                target=self.compact, name="search-index-compact", daemon=True
+            ).start()
+
+    def add_topic(self, conversation_id: str, topic: str, timestamp: str) -> None:
+        """索引对话主题（对话首次加入索引时调用）
+
+        Args:
+            conversation_id: 对话ID
+            topic: 主题
+            timestamp: 对话创建时间
+        """
+        counts = self._count(topic)
+        with self._lock:
+            self._record(
+                {
+                    "op": "topic",
+                    "id": conversation_id,
+                    "timestamp": timestamp,
+                    "tf": counts,
+                }
+            )
+
+    def add_message(self, message: Any) -> None:
+        """索引一条消息（已索引过的序号会被忽略）"""
+        with self._lock:
+            last_seq = self._last_seq.get(message.conversation_id, 0)
+            if message.seq and message.seq <= last_seq:
+                return
+            # 系统消息不建文档，只推进已索引的序号
+            counts = (
+                self._count(message.content) if message.message_type != "system" else {}
+            )
+            self._record(
+                {
+                    "op": "message",
+                    "id": message.conversation_id,
+                    "seq": message.seq or last_seq + 1,
+                    "sender": message.sender,
+                    "type": message.message_type,
+                    "timestamp": message.timestamp,
+                    "tf": counts,
+                }
+            )
+
+    def remove_conversation(self, conversation_id: str) -> int:
+        """移除对话的所有文档
+
+        Returns:
+            移除的文档数
+        """
+        with self._lock:
+            if (
+                conversation_id not in self._last_seq
+                and conversation_id not in self._conversation_docs
+            ):
+                return 0
+            removed = len(self._conversation_docs.get(conversation_id, []))
+            self._record({"op": "remove", "id": conversation_id})
+            return removed
+
+    def indexed_seq(self, conversation_id: str) -> Optional[int]:
+        """对话已索引到的消息序号，对话不在索引中时返回 None"""
+        return self._last_seq.get(conversation_id)
+
+    def conversation_ids(self) -> Set[str]:
+        """索引中的对话ID"""
+        with self._lock:
+            return set(self._last_seq)
+
+    def search(
+        self,
+        query: str,
+        sender: Optional[str] = None,
+        message_type: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """检索
+
+        Args:
+            query: 查询文本
+            sender: 只返回该发送者的消息
+            message_type: 只返回该类型的消息（"topic" 表示对话主题）
+            since: 只返回时间不早于该值的文档（"YYYY-MM-DD" 或 "YYYY-MM-DD HH:MM:SS"）
+            until: 只返回时间不晚于该值的文档（只给日期时包含当天）
+            limit: 最多返回的结果数
+            offset: 跳过的结果数
+
+        Returns:
+            (结果列表, 匹配总数)；结果按分数降序，分数相同时新的在前，
+            每项为 {"conversation_id", "seq", "sender", "message_type", "timestamp", "score"}
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        scores: Dict[int, float] = {}
+        with self._lock:
+            if not terms or not self._live:
+                return [], 0
+            average_length = self._total_length / self._live
+            for term in terms:
+                postings = self._term_postings(term)
+                if not postings:
+                    continue
+                live = [
+                    (doc_id, doc, count)
+                    for doc_id, count in postings.items()
+                    if (doc := self._docs[doc_id]) is not None
+                ]
+                if not live:
+                    continue
+                idf = math.log(1 + (self._live - len(live) + 0.5) / (len(live) + 0.5))
+                for doc_id, doc, count in live:
+                    if not self._matches(doc, sender, message_type, since, until):
+                        continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * doc[5] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * count * (
+                        BM25_K1 + 1
+                    ) / (count + norm)
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+            page = [
+                (doc, score)
+                for doc_id, score in ranked[
+                    max(0, offset) : max(0, offset) + max(1, limit)
+                ]
+                if (doc := self._docs[doc_id]) is not None
+            ]
+
+        return [
+            {
+                "conversation_id": doc[0],
+                "seq": doc[1],
+                "sender": doc[2],
+                "message_type": doc[3],
+                "timestamp": doc[4],
+                "score": round(score, 4),
+            }
+            for doc, score in page
+        ], len(ranked)
+
+    @staticmethod
+    def _matches(
+        doc: DocInfo,
+        sender: Optional[str],
+        message_type: Optional[str],
+        since: Optional[str],
+        until: Optional[str],
+    ) -> bool:
+        """文档是否满足过滤条件"""
+        if sender is not None and doc[2] != sender:
+            return False
+        if message_type is not None and doc[3] != message_type:
+            return False
+        if since is not None and doc[4] < since:
+            return False
+        # 按 until 的长度比较前缀，只给日期时包含当天
+        if until is not None and doc[4][: len(until)] > until:
+            return False
+        return True
+
+    def _compact(self) -> None:
+        """丢弃已删除的文档并重新编号（调用时已持有锁）"""
+        if self._live == len(self._docs):
+            return
+        mapping: Dict[int, int] = {}
+        docs: List[Optional[DocInfo]] = []
+        for doc_id, doc in enumerate(self._docs):
+            if doc is not None:
+                mapping[doc_id] = len(docs)
+                docs.append(doc)
+        postings: Dict[str, Dict[int, int]] = {}
+        for token, entries in self._postings.items():
+            kept = {
+                mapping[doc_id]: count
+                for doc_id, count in entries.items()
+                if doc_id in mapping
+            }
+            if kept:
+                postings[token] = kept
+        self._docs = docs
+        self._postings = postings
+        self._conversation_docs = {
+            conversation_id: [mapping[doc_id] for doc_id in doc_ids]
+            for conversation_id, doc_ids in self._conversation_docs.items()
+        }
+        self._char_tokens = {}
+        for token in postings:
+            self._register_token(token)
+
+    def _snapshot(self) -> Dict[str, Any]:
+        """压缩后复制出快照数据（调用时已持有锁），序列化不需要持有锁"""
+        self._compact()
+        return {
+            "version": 1,
+            "last_op": self._last_op,
+            "docs": list(self._docs),
+            "last_seq": dict(self._last_seq),
+            # 每个词元的倒排表展开为 [文档ID, 词频, 文档ID, 词频, ...]
+            "postings": {
+                token: [value for entry in entries.items() for value in entry]
+                for token, entries in self._postings.items()
+            },
+        }
+
+    @staticmethod
+    def _write(data: Dict[str, Any], filepath: str) -> None:
+        """先写同目录下的临时文件再原子替换"""
+        with phase("persistence"):
+            fd, temp_path = tempfile.mkstemp(
+                prefix=os.path.basename(filepath) + ".",
+                dir=os.path.dirname(filepath) or ".",
+            )
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+                os.replace(temp_path, filepath)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+
+    def save(self, filepath: str) -> bool:
+        """把当前索引保存为快照文件（先丢弃已删除的文档）
+
+        Args:
+            filepath: 文件路径
+
+        Returns:
+            是否成功
+        """
+        try:
+            with self._lock:
+                data = self._snapshot()
+            self._write(data, filepath)
+            return True
+        except Exception as e:
+            print(f"保存检索索引失败: {e}")
+            return False
+
+    def compact(self) -> bool:
+        """写快照并开始新的日志
+
+        持有锁时只复制数据并换下当前日志，序列化和写文件期间其他线程照常更新索引，
+        新的操作写入新日志；快照替换完成后才删除换下的日志。
+
+        Returns:
+            是否写入
+        """
+        try:
+            with self._lock:
+                self._compacting = True
+                if self.persist_path is None or self._log_file is None:
+                    return False
+                data = self._snapshot()
+                self._log_file.close()
+                if os.path.exists(self.old_log_path):
+                    # 上次写快照失败，换下的日志仍需保留
+                    with (
+                        open(self.old_log_path, "ab") as old,
+                        open(self.log_path, "rb") as current,
+                    ):
+                        old.write(current.read())
+                    os.remove(self.log_path)
+                else:
+                    os.replace(self.log_path, self.old_log_path)
+                self._log_file = open(self.log_path, "ab")
+                self._log_ops = 0
+                persist_path = self.persist_path
+            self._write(data, persist_path)
+            os.remove(self.old_log_path)
+            return True
+        except Exception as e:
+            print(f"保存检索索引失败: {e}")
+            return False
+        finally:
+            self._compacting = False
+
+    def _replay(self, path: str, truncate: bool = False) -> int:
+        """重放日志中快照之后的操作（调用时已持有锁）
+
+        Args:
+            path: 日志路径
+            truncate: 是否截掉末尾写了一半的行
+
+        Returns:
+            日志中完整的操作数
+        """
+        if not os.path.exists(path):
+            return 0
+        ops = 0
+        valid_size = 0
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    # 崩溃时写了一半的最后一行
+                    break
+                valid_size += len(line)
+                ops += 1
+                if op["n"] > self._last_op:
+                    self._apply(op)
+                    self._last_op = op["n"]
+        if truncate and valid_size < os.path.getsize(path):
+            with open(path, "r+b") as f:
+                f.truncate(valid_size)
+        return ops
+
+    def load(self, filepath: str) -> bool:
+        """从快照文件加载（替换当前内容）
+
+        Args:
+            filepath: 文件路径
+
+        Returns:
+            是否成功
+        """
+        try:
+            with open(filepath, encoding="utf-8") as f:
+                data = json.load(f)
+            docs: List[Optional[DocInfo]] = [
+                (doc[0], doc[1], doc[2], doc[3], doc[4], doc[5]) for doc in data["docs"]
+            ]
+            postings = {
+                token: dict(zip(flat[::2], flat[1::2], strict=True))
+                for token, flat in data["postings"].items()
+            }
+            conversation_docs: Dict[str, List[int]] = {}
+            total_length = 0
+            for doc_id, doc in enumerate(docs):
+                if doc is not None:
+                    conversation_docs.setdefault(doc[0], []).append(doc_id)
+                    total_length += doc[5]
+            with self._lock:
+                self._docs = docs
+                self._postings = postings
+                self._conversation_docs = conversation_docs
+                self._char_tokens = {}
+                for token in postings:
+                    self._register_token(token)
+                self._last_seq = dict(data["last_seq"])
+                self._live = len(docs)
+                self._total_length = total_length
+                self._last_op = data.get("last_op", 0)
+            return True
+        except Exception as e:
+            print(f"加载检索索引失败: {e}")
+            return False
+
+    def open(self, filepath: str) -> bool:
+        """绑定持久化文件
+
+        加载快照并重放之后的日志，此后的每次变化都追加到日志，进程退出时关闭日志。
+
+        Args:
+            filepath: 快照文件路径
+
+        Returns:
+            是否加载了已保存的索引
+        """
+        self.persist_path = filepath
+        loaded = os.path.exists(filepath) and self.load(filepath)
+        with self._lock:
+            if not loaded:
+                self._last_op = 0
+            self._log_ops = self._replay(self.old_log_path) + self._replay(
+                self.log_path, truncate=True
+            )
+            self._log_file = open(self.log_path, "ab")
+        atexit.register(self.close)
+        return loaded or self._log_ops > 0
+
+    def close(self) -> None:
+        """关闭日志（之后的变化只保留在内存中）"""
+        with self._lock:
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
@@ -4,14 +4,12 @@ Interactive MCP Popup 主服务器
 整合 Qt 弹窗和持续对话功能的 MCP 服务器。
 """
 
-import json
-import tempfile
 import os
 import sys
-from typing import Annotated, Dict, Optional
+from typing import Annotated, Any, Dict, List, Optional
 
 from pydantic import Field
-from fastmcp import FastMCP
+from fastmcp import FastMCP, Context
 
 # 添加当前目录到 Python 路径，支持相对导入
 if __name__ == "__main__":
@@ -19,46 +17,131 @@ if __name__ == "__main__":
     parent_dir = os.path.dirname(current_dir)
     sys.path.insert(0, parent_dir)
 
-from interactive_mcp_popup.popup import show_popup_dialog, save_result_to_file
-from interactive_mcp_popup.conversation import get_conversation_manager, ConversationManager
+from interactive_mcp_popup.popup import show_popup_dialog
+from interactive_mcp_popup.conversation import get_conversation_manager, ConversationManager, put_text
+from interactive_mcp_popup.auto_answer import get_auto_answer_engine
+from interactive_mcp_popup.journal import get_answer_journal
+from interactive_mcp_popup.janitor import create_storage_janitor, make_export_path
+from interactive_mcp_popup.resources import register_conversation_resources
+from interactive_mcp_popup.pending import PendingPopupRegistry, make_popup_key, progress_heartbeat, progress_draft
+from interactive_mcp_popup.transport import run_server, get_session_id
+from interactive_mcp_popup.metrics import MetricsMiddleware, server_metrics, timed_dumps
+from interactive_mcp_popup.tracing import TracingMiddleware, tracer
+from interactive_mcp_popup.utils import get_data_dir, config_manager
 
 # 创建 FastMCP 实例
 mcp = FastMCP("Interactive MCP Popup", log_level="ERROR")
 
+# 统计每个工具调用的次数和分阶段耗时
+mcp.add_middleware(MetricsMiddleware(server_metrics))
+
+# 按采样率记录调用链，导出到数据目录下的 traces.jsonl
+mcp.add_middleware(TracingMiddleware(tracer))
+
 # 获取对话管理器
 conversation_manager = get_conversation_manager()
 
+# 对话资源：客户端可订阅 conversation://list 和 conversation://{id}，对话变化时收到合并后的更新通知
+conversation_subscriptions = register_conversation_resources(mcp, conversation_manager)
+
+# 获取自动回答引擎
+auto_answer_engine = get_auto_answer_engine()
+
+# 加载回答自动补全前缀树，首次使用时从对话历史构建
+answer_trie = conversation_manager.answer_trie
+answer_trie.open(str(get_data_dir() / "answer_trie.json"), conversation_manager.iter_user_answers())
+
+# 全文检索索引：从文件加载，只补齐之后变化的对话
+conversation_manager.open_search_index(str(get_data_dir() / "search_index.json"))
+
+# 回答日志：所有弹窗回答追加写入同一组 JSONL 文件
+answer_journal = get_answer_journal()
+
+# 后台清理：按 cleanup_days 和总大小上限分批删除旧文件，不阻塞工具调用
+storage_janitor = create_storage_janitor(answer_journal)
+if config_manager.get_janitor_config().get("enabled", True):
+    storage_janitor.start()
+
+# 等待中的弹窗：等待期间发送进度心跳，客户端重试相同问题时挂到已打开的弹窗上
+# 历史和列表中超过该长度的消息内容、上下文只返回预览，完整内容用 read_message_content 读取
+preview_chars = config_manager.get_conversation_config().get("preview_chars", 2000)
+
+popup_registry = PendingPopupRegistry(
+    heartbeat_interval=config_manager.get_popup_config().get("heartbeat_seconds", 10)
+)
+
+
+def record_answer(result: Dict[str, Any]) -> None:
+    """记录弹窗回答：更新自动补全并追加到回答日志（调用方放弃后用户才回答时也会执行）"""
+    answer_trie.add(result["answer"])
+    try:
+        result["journal"] = answer_journal.append(result)
+    except Exception as e:
+        print(f"写入回答日志失败: {e}")
+
 
 @mcp.tool()
-def ask_user_popup(
+async def ask_user_popup(
     question: Annotated[str, Field(description="要问用户的问题")],
-    context: Annotated[str, Field(description="上下文信息，可选")] = ""
+    context: Annotated[str, Field(description="上下文信息，可选")] = "",
+    stream_draft: Annotated[bool, Field(description="是否通过进度通知推送用户正在输入的草稿")] = False,
+    ctx: Optional[Context] = None
 ) -> str:
     """使用 Qt 弹窗向用户提问并等待回答
     
     Args:
         question: 要问用户的问题
         context: 上下文信息（可选）
+        stream_draft: 是否推送用户正在输入的草稿（增量），也可用 get_answer_draft 轮询
         
     Returns:
         包含用户回答的 JSON 字符串
     """
     try:
-        # 显示弹窗并等待用户回答
-        result = show_popup_dialog(question, context)
+        # 命中自动回答规则时不打扰用户
+        auto_answer = auto_answer_engine.match(question, context)
+        if auto_answer:
+            return timed_dumps({
+                "status": "auto_answered",
+                "question": question,
+                "context": context,
+                "answer": auto_answer["answer"],
+                "rule": auto_answer["rule"],
+                "message": "已根据自动回答规则回答，未打扰用户"
+            }, ensure_ascii=False)
+        
+        # 显示弹窗并等待用户回答，附带相似问题的历史回答
+        suggestions = conversation_manager.find_similar_questions(question, limit=3)
+        # HTTP 传输下多个客户端共享服务器，相同问题只在同一会话内合并
+        session_id = get_session_id(ctx)
+        result, popup, resumed = await popup_registry.ask(
+            make_popup_key(question, context, scope=session_id),
+            question,
+            context,
+            session_id=session_id,
+            on_heartbeat=progress_heartbeat(ctx) if ctx else None,
+            stream_draft=stream_draft,
+            on_draft=progress_draft(ctx) if ctx and stream_draft else None,
+            on_result=record_answer,
+            suggestions=suggestions,
+            completer=answer_trie
+        )
         
         if result:
-            # 保存结果到临时文件
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False, encoding='utf-8') as f:
-                output_file = f.name
+            answer_trie.flush()
             
-            if save_result_to_file(result, output_file):
+            record = result.get("journal")
+            if record:
                 response_data = {
                     "status": "answered",
                     "question": question,
                     "context": context,
                     "answer": result["answer"],
-                    "output_file": output_file,
+                    "record_id": record["record_id"],
+                    "journal_file": record["journal_file"],
+                    "offset": record["offset"],
+                    "popup_id": popup.popup_id,
+                    "resumed": resumed,
                     "message": "用户已通过弹窗回答问题"
                 }
             else:
@@ -67,7 +150,9 @@ def ask_user_popup(
                     "question": question,
                     "context": context,
                     "answer": result["answer"],
-                    "message": "用户已通过弹窗回答问题（保存文件失败）"
+                    "popup_id": popup.popup_id,
+                    "resumed": resumed,
+                    "message": "用户已通过弹窗回答问题（写入回答日志失败）"
                 }
         else:
             response_data = {
@@ -77,7 +162,7 @@ def ask_user_popup(
                 "message": "用户取消了回答"
             }
         
-        return json.dumps(response_data, ensure_ascii=False)
+        return timed_dumps(response_data, ensure_ascii=False)
     
     except Exception as e:
         error_data = {
@@ -86,7 +171,7 @@ def ask_user_popup(
             "context": context,
             "message": f"弹窗操作失败: {str(e)}"
         }
-        return json.dumps(error_data, ensure_ascii=False)
+        return timed_dumps(error_data, ensure_ascii=False)
 
 
 @mcp.tool()
@@ -106,7 +191,7 @@ def start_conversation(
     try:
         conversation_id = conversation_manager.create_conversation(topic, context)
         
-        return json.dumps({
+        return timed_dumps({
             "status": "conversation_started",
             "conversation_id": conversation_id,
             "topic": topic,
@@ -116,44 +201,77 @@ def start_conversation(
         }, ensure_ascii=False)
     
     except Exception as e:
-        return json.dumps({
+        return timed_dumps({
             "status": "error",
             "message": f"开始对话失败: {str(e)}"
         }, ensure_ascii=False)
 
 
 @mcp.tool()
-def continue_conversation(
+async def continue_conversation(
     conversation_id: Annotated[str, Field(description="对话ID")],
-    message: Annotated[str, Field(description="你的消息")]
-) -> Dict[str, str]:
+    message: Annotated[str, Field(description="你的消息")],
+    stream_draft: Annotated[bool, Field(description="是否通过进度通知推送用户正在输入的草稿")] = False,
+    ctx: Optional[Context] = None
+) -> Dict[str, Any]:
     """继续对话，发送消息并等待用户回复
     
     Args:
         conversation_id: 对话ID
         message: 你的消息
+        stream_draft: 是否推送用户正在输入的草稿（增量），也可用 get_answer_draft 轮询
         
     Returns:
         包含用户回复的字典
     """
     try:
-        # 添加助手消息
-        conversation_manager.add_message(conversation_id, "assistant", message, "question")
+        popup_key = make_popup_key(message, scope=conversation_id)
+        
+        # 重试时弹窗仍在等待或回答尚未取回，问题已经记录过
+        if not popup_registry.has(popup_key):
+            # 添加助手消息
+            conversation_manager.add_message(conversation_id, "assistant", message, "question")
+        
+            # 命中自动回答规则时直接记录预设回答
+            auto_answer = auto_answer_engine.match(message)
+            if auto_answer:
+                conversation_manager.add_message(conversation_id, "system", auto_answer["answer"], "auto_answer")
+            
+                return {
+                    "status": "auto_answered",
+                    "conversation_id": conversation_id,
+                    "your_message": message,
+                    "user_reply": auto_answer["answer"],
+                    "rule": auto_answer["rule"],
+                    "message": "已根据自动回答规则回复，可以继续对话"
+                }
         
         # 使用弹窗获取用户回复
-        result = show_popup_dialog(message, f"对话ID: {conversation_id}")
+        suggestions = conversation_manager.find_similar_questions(message, limit=3)
+        result, popup, resumed = await popup_registry.ask(
+            popup_key,
+            message,
+            f"对话ID: {conversation_id}",
+            session_id=get_session_id(ctx),
+            on_heartbeat=progress_heartbeat(ctx) if ctx else None,
+            stream_draft=stream_draft,
+            on_draft=progress_draft(ctx) if ctx and stream_draft else None,
+            on_result=lambda r: conversation_manager.add_message(conversation_id, "user", r["answer"], "answer"),
+            suggestions=suggestions,
+            completer=answer_trie
+        )
         
         if result:
             user_reply = result["answer"]
-            
-            # 添加用户消息
-            conversation_manager.add_message(conversation_id, "user", user_reply, "answer")
+            answer_trie.flush()
             
             return {
                 "status": "replied",
                 "conversation_id": conversation_id,
                 "your_message": message,
                 "user_reply": user_reply,
+                "popup_id": popup.popup_id,
+                "resumed": resumed,
                 "message": "用户已回复，可以继续对话"
             }
         else:
@@ -214,30 +332,51 @@ def end_conversation(
 
 @mcp.tool()
 def get_conversation_history(
-    conversation_id: Annotated[str, Field(description="对话ID")]
-) -> Dict[str, str]:
-    """获取对话历史
+    conversation_id: Annotated[str, Field(description="对话ID")],
+    limit: Annotated[int, Field(description="每页最多返回的消息数", ge=1, le=500)] = 50,
+    before: Annotated[Optional[int], Field(description="只返回序号小于该值的消息（从新到旧翻页时传上一页的 next_cursor）")] = None,
+    after: Annotated[Optional[int], Field(description="只返回序号大于该值的消息（从旧到新翻页时传上一页的 next_cursor）")] = None,
+    order: Annotated[str, Field(description="排序：asc 从旧到新，desc 从新到旧")] = "asc",
+    fields: Annotated[Optional[List[str]], Field(description="只返回这些消息字段，例如 [\"sender\", \"content\"]")] = None,
+    since_seq: Annotated[Optional[int], Field(description="增量同步：只返回 seq 大于该值的消息（从旧到新）")] = None,
+    max_content_chars: Annotated[Optional[int], Field(description="内容超过该长度时只返回预览，默认使用配置的 preview_chars，0 表示返回完整内容", ge=0)] = None
+) -> Dict[str, Any]:
+    """分页获取对话历史
     
     Args:
         conversation_id: 对话ID
+        limit: 每页最多返回的消息数
+        before: 只返回序号小于该值的消息
+        after: 只返回序号大于该值的消息
+        order: asc 从旧到新，desc 从新到旧
+        fields: 只返回这些消息字段（每条消息总会带上位置 index）
+        since_seq: 增量同步，只返回 seq 大于该值的消息
+        max_content_chars: 内容超过该长度时只返回预览（content_truncated 为真），用 read_message_content 读取全文
         
     Returns:
-        对话历史
+        本页消息，has_more 为真时用 next_cursor 继续翻页
     """
     try:
-        history = conversation_manager.get_conversation_history(conversation_id)
-        conversation = conversation_manager.get_conversation(conversation_id)
+        max_chars = preview_chars if max_content_chars is None else max_content_chars
+        page = conversation_manager.get_history_page(
+            conversation_id, limit, before, after, order, fields, since_seq, max_chars
+        )
         
-        if conversation:
+        if page is not None:
+            context_fields: Dict[str, Any] = {}
+            put_text(context_fields, "context", page["context"], max_chars)
             return {
                 "status": "success",
                 "conversation_id": conversation_id,
-                "topic": conversation.topic,
-                "context": conversation.context,
-                "status": conversation.status,
-                "messages": history,
-                "total_messages": len(history),
-                "message": f"找到 {len(history)} 条对话消息"
+                "topic": page["topic"],
+                **context_fields,
+                "status": page["status"],
+                "messages": page["messages"],
+                "total_messages": page["total_messages"],
+                "latest_seq": page["latest_seq"],
+                "has_more": page["has_more"],
+                "next_cursor": page["next_cursor"],
+                "message": f"返回 {len(page['messages'])} 条对话消息，共 {page['total_messages']} 条"
             }
         else:
             return {
@@ -255,33 +394,45 @@ def get_conversation_history(
 
 
 @mcp.tool()
-def get_all_conversations() -> Dict[str, str]:
-    """获取所有对话列表
+def get_all_conversations(
+    status: Annotated[Optional[str], Field(description="只返回该状态的对话：active 或 ended")] = None,
+    topic_prefix: Annotated[str, Field(description="只返回主题以此开头的对话")] = "",
+    updated_since: Annotated[Optional[str], Field(description="只返回更新时间不早于该值的对话，例如 \"2025-01-12\" 或 \"2025-01-12 10:00:00\"")] = None,
+    sort: Annotated[str, Field(description="排序：updated_desc 最近更新在前，updated_asc 最早更新在前，topic 按主题")] = "updated_desc",
+    limit: Annotated[int, Field(description="每页最多返回的对话数", ge=1, le=500)] = 50,
+    cursor: Annotated[Optional[str], Field(description="上一页返回的 next_cursor")] = None,
+    fields: Annotated[Optional[List[str]], Field(description="只返回这些字段，例如 [\"id\", \"topic\", \"status\"]")] = None,
+    max_context_chars: Annotated[Optional[int], Field(description="上下文超过该长度时只返回预览，默认使用配置的 preview_chars，0 表示返回完整内容", ge=0)] = None
+) -> Dict[str, Any]:
+    """按条件分页获取对话列表
     
+    Args:
+        status: 只返回该状态的对话
+        topic_prefix: 主题前缀
+        updated_since: 只返回更新时间不早于该值的对话
+        sort: updated_desc、updated_asc 或 topic
+        limit: 每页最多返回的对话数
+        cursor: 上一页返回的 next_cursor
+        fields: 只返回这些字段
+        max_context_chars: 上下文超过该长度时只返回预览
+        
     Returns:
-        所有对话的信息
+        本页对话和总数，has_more 为真时用 next_cursor 继续翻页
     """
     try:
-        conversations = conversation_manager.get_all_conversations()
-        
-        conversation_list = []
-        for conv in conversations:
-            conversation_list.append({
-                "id": conv.id,
-                "topic": conv.topic,
-                "context": conv.context,
-                "status": conv.status,
-                "created_at": conv.created_at,
-                "updated_at": conv.updated_at,
-                "message_count": len(conv.messages)
-            })
+        page = conversation_manager.query_conversations(
+            status, topic_prefix, updated_since, sort, limit, cursor, fields,
+            preview_chars if max_context_chars is None else max_context_chars
+        )
         
         return {
             "status": "success",
-            "conversations": conversation_list,
-            "total_count": len(conversation_list),
-            "active_count": len([c for c in conversation_list if c["status"] == "active"]),
-            "message": f"找到 {len(conversation_list)} 个对话"
+            "conversations": page["conversations"],
+            "total_count": page["total_count"],
+            "active_count": page["active_count"],
+            "has_more": page["has_more"],
+            "next_cursor": page["next_cursor"],
+            "message": f"返回 {len(page['conversations'])} 个对话，共 {page['total_count']} 个"
         }
     
     except Exception as e:
@@ -344,6 +495,376 @@ def check_dependencies() -> Dict[str, str]:
         }
 
 
+@mcp.tool()
+def find_similar_questions(
+    question: Annotated[str, Field(description="要查找的问题")],
+    limit: Annotated[int, Field(description="最多返回数量")] = 5
+) -> Dict[str, Any]:
+    """在历史对话中查找相似问题及用户当时的回答
+    
+    Args:
+        question: 要查找的问题
+        limit: 最多返回数量
+        
+    Returns:
+        相似问答列表
+    """
+    try:
+        matches = conversation_manager.find_similar_questions(question, limit=limit)
+        return {
+            "status": "success",
+            "question": question,
+            "matches": matches,
+            "total_matches": len(matches),
+            "message": f"找到 {len(matches)} 个相似问题"
+        }
+    
+    except Exception as e:
+        return {
+            "status": "error",
+            "question": question,
+            "message": f"查找相似问题失败: {str(e)}"
+        }
+
+
+@mcp.tool()
+def get_auto_answer_stats() -> Dict[str, Any]:
+    """获取自动回答规则和命中统计
+    
+    Returns:
+        自动回答统计
+    """
+    try:
+        stats = auto_answer_engine.get_stats()
+        return {
+            "status": "success",
+            **stats,
+            "message": f"自动回答已处理 {stats['auto_answered_count']} 次提问"
+        }
+    
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"获取自动回答统计失败: {str(e)}"
+        }
+
+
+@mcp.tool()
+def list_pending_popups(ctx: Optional[Context] = None) -> Dict[str, Any]:
+    """列出当前会话正在等待用户回答的弹窗
+    
+    客户端超时后可以用相同参数重新调用 ask_user_popup / continue_conversation，
+    会挂到已打开的弹窗上继续等待，不会重复弹出。
+    
+    Returns:
+        等待中的弹窗列表
+    """
+    try:
+        popups = popup_registry.list_pending(get_session_id(ctx))
+        return {
+            "status": "success",
+            "popups": popups,
+            "total_pending": len(popups),
+            "message": f"有 {len(popups)} 个弹窗正在等待回答"
+        }
+    
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"获取等待中的弹窗失败: {str(e)}"
+        }
+
+
+@mcp.tool()
+def get_answer_draft(
+    popup_id: Annotated[str, Field(description="弹窗ID")],
+    since_version: Annotated[int, Field(description="已收到的草稿版本号，0 表示获取全文")] = 0
+) -> Dict[str, Any]:
+    """获取用户正在弹窗中输入的草稿
+    
+    只对开启了 stream_draft 的弹窗有效。传入上次收到的版本号时只返回之后的增量
+    （从 offset 处删除 delete 个字符后插入 insert），done 为 true 表示用户已提交或关闭弹窗。
+    
+    Args:
+        popup_id: 弹窗ID
+        since_version: 已收到的草稿版本号
+        
+    Returns:
+        草稿变化
+    """
+    try:
+        draft = popup_registry.get_draft(popup_id, since_version)
+        if draft is None:
+            return {
+                "status": "error",
+                "popup_id": popup_id,
+                "message": "弹窗不存在或未开启草稿推送"
+            }
+        return {
+            "status": "success",
+            **draft,
+            "message": f"草稿版本 {draft['version']}"
+        }
+    
+    except Exception as e:
+        return {
+            "status": "error",
+            "popup_id": popup_id,
+            "message": f"获取草稿失败: {str(e)}"
+        }
+
+
+@mcp.tool()
+def get_server_metrics(
+    write_prometheus: Annotated[bool, Field(description="是否同时写入 Prometheus 文本文件")] = False
+) -> Dict[str, Any]:
+    """获取每个工具的调用次数和分阶段耗时
+    
+    阶段包括 total、overhead（服务器自身开销）、dialog_construction、window_visible、
+    think_time（用户思考时间）、persistence 和 serialization，每个阶段给出次数、平均、最大和 p50/p95/p99。
+    
+    Args:
+        write_prometheus: 是否同时写入配置中的 Prometheus 文本文件
+        
+    Returns:
+        指标快照
+    """
+    try:
+        snapshot = server_metrics.snapshot()
+        written = server_metrics.write_prometheus() if write_prometheus else False
+        return {
+            "status": "success",
+            **snapshot,
+            "prometheus_file": server_metrics.prometheus_file if written else "",
+            "message": f"已统计 {len(snapshot['tools'])} 个工具"
+        }
+    
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"获取服务器指标失败: {str(e)}"
+        }
+
+
+@mcp.tool()
+def get_answer_record(
+    record_id: Annotated[int, Field(description="回答记录ID（ask_user_popup 返回的 record_id）")]
+) -> Dict[str, Any]:
+    """按记录ID查找过去的弹窗回答
+    
+    通过定长索引直接定位，不需要扫描日志。
+    
+    Args:
+        record_id: 回答记录ID
+        
+    Returns:
+        回答记录
+    """
+    try:
+        record = answer_journal.get(record_id)
+        if record is None:
+            return {
+                "status": "error",
+                "record_id": record_id,
+                "message": "回答记录不存在"
+            }
+        if record.get("expired"):
+            return {
+                "status": "error",
+                "record_id": record_id,
+                "expired": True,
+                "message": "回答记录已过期，所在的日志段已被清理"
+            }
+        return {
+            "status": "success",
+            "record": record,
+            "message": "已找到回答记录"
+        }
+    
+    except Exception as e:
+        return {
+            "status": "error",
+            "record_id": record_id,
+            "message": f"查找回答记录失败: {str(e)}"
+        }
+
+
+@mcp.tool()
+def get_conversation_version(
+    conversation_id: Annotated[str, Field(description="对话ID")]
+) -> Dict[str, Any]:
+    """获取对话的最新消息序号和更新时间
+    
+    开销固定，可用来轮询对话是否有新消息；latest_seq 变大后再用
+    get_conversation_history 的 since_seq 取增量。
+    
+    Args:
+        conversation_id: 对话ID
+        
+    Returns:
+        最新序号、更新时间和对话状态
+    """
+    try:
+        version = conversation_manager.get_conversation_version(conversation_id)
+        if version is None:
+            return {
+                "status": "error",
+                "conversation_id": conversation_id,
+                "message": "对话不存在"
+            }
+        return {
+            "status": "success",
+            "conversation_id": conversation_id,
+            "latest_seq": version["latest_seq"],
+            "updated_at": version["updated_at"],
+            "conversation_status": version["status"],
+            "message": f"最新消息序号 {version['latest_seq']}"
+        }
+    
+    except Exception as e:
+        return {
+            "status": "error",
+            "conversation_id": conversation_id,
+            "message": f"获取对话版本失败: {str(e)}"
+        }
+
+
+@mcp.tool()
+def read_message_content(
+    conversation_id: Annotated[str, Field(description="对话ID")],
+    seq: Annotated[int, Field(description="消息序号（消息的 seq 字段）", ge=1)],
+    offset: Annotated[int, Field(description="起始字符位置", ge=0)] = 0,
+    length: Annotated[int, Field(description="最多读取的字符数", ge=1, le=100000)] = 8000
+) -> Dict[str, Any]:
+    """分段读取一条消息的完整内容
+    
+    历史和列表中超过预览长度的内容会被截断（带 content_truncated 标记），
+    用这个工具按字符范围读取原文。
+    
+    Args:
+        conversation_id: 对话ID
+        seq: 消息序号
+        offset: 起始字符位置
+        length: 最多读取的字符数
+        
+    Returns:
+        内容片段，next_offset 不为空时从该位置继续读取
+    """
+    try:
+        chunk = conversation_manager.read_message_content(conversation_id, seq, offset, length)
+        if chunk is None:
+            return {
+                "status": "error",
+                "conversation_id": conversation_id,
+                "seq": seq,
+                "message": "对话或消息不存在"
+            }
+        return {
+            "status": "success",
+            "conversation_id": conversation_id,
+            "seq": seq,
+            **chunk,
+            "message": f"返回第 {chunk['offset']} 到 {chunk['offset'] + len(chunk['content'])} 个字符，共 {chunk['total_length']} 个"
+        }
+    
+    except Exception as e:
+        return {
+            "status": "error",
+            "conversation_id": conversation_id,
+            "seq": seq,
+            "message": f"读取消息内容失败: {str(e)}"
+        }
+
+
+@mcp.tool()
+def get_conversation_context(
+    conversation_id: Annotated[str, Field(description="对话ID")],
+    max_tokens: Annotated[Optional[int], Field(description="token 预算（估算值）", ge=1)] = 4000,
+    max_chars: Annotated[Optional[int], Field(description="字符预算（可选，与 token 预算同时满足）", ge=1)] = None
+) -> Dict[str, Any]:
+    """在预算内获取对话上下文
+    
+    最近的消息原样返回，更早的消息每段用一行摘要代替，预算仍不够时省略最早的部分。
+    长时间的 continue_conversation 循环用它代替完整历史，上下文大小保持稳定。
+    
+    Args:
+        conversation_id: 对话ID
+        max_tokens: token 预算
+        max_chars: 字符预算
+        
+    Returns:
+        分段摘要、最近的消息和预算使用情况
+    """
+    try:
+        view = conversation_manager.get_context_view(conversation_id, max_tokens, max_chars)
+        conversation = conversation_manager.get_conversation(conversation_id)
+        if view is None or conversation is None:
+            return {
+                "status": "error",
+                "conversation_id": conversation_id,
+                "message": "对话不存在"
+            }
+        return {
+            "status": "success",
+            "conversation_id": conversation_id,
+            "topic": conversation.topic,
+            "conversation_status": conversation.status,
+            **view,
+            "message": f"最近 {len(view['messages'])} 条消息原文，{len(view['summaries'])} 段摘要，约 {view['used_tokens']} tokens"
+        }
+    
+    except Exception as e:
+        return {
+            "status": "error",
+            "conversation_id": conversation_id,
+            "message": f"获取对话上下文失败: {str(e)}"
+        }
+
+
+@mcp.tool()
+def search_conversations(
+    query: Annotated[str, Field(description="检索内容，中文和英文均可")],
+    sender: Annotated[Optional[str], Field(description="只返回该发送者的消息：user 或 assistant")] = None,
+    message_type: Annotated[Optional[str], Field(description="只返回该类型的结果：question、answer，或 topic 表示对话主题")] = None,
+    since: Annotated[Optional[str], Field(description="只返回时间不早于该值的结果，例如 \"2025-01-12\" 或 \"2025-01-12 10:00:00\"")] = None,
+    until: Annotated[Optional[str], Field(description="只返回时间不晚于该值的结果，只给日期时包含当天")] = None,
+    limit: Annotated[int, Field(description="每页最多返回的结果数", ge=1, le=500)] = 20,
+    cursor: Annotated[Optional[int], Field(description="上一页返回的 next_cursor", ge=0)] = None
+) -> Dict[str, Any]:
+    """在所有对话中全文检索历史问题、回答和对话主题
+    
+    基于增量维护的倒排索引，中文按相邻两字切分，结果按 BM25 相关度排序。
+    索引保存在数据目录中，启动时直接加载，不需要遍历全部对话历史。
+    
+    Args:
+        query: 检索内容
+        sender: 只返回该发送者的消息
+        message_type: 只返回该类型的结果（"topic" 表示对话主题）
+        since: 只返回时间不早于该值的结果
+        until: 只返回时间不晚于该值的结果
+        limit: 每页最多返回的结果数
+        cursor: 上一页返回的 next_cursor
+        
+    Returns:
+        命中的消息（对话ID、主题、序号、发送者、类型、时间、分数、片段）和分页信息
+    """
+    try:
+        page = conversation_manager.search_messages(query, sender, message_type, since, until, limit, cursor)
+        return {
+            "status": "success",
+            "query": query,
+            **page,
+            "message": f"返回 {len(page['results'])} 条结果，共 {page['total']} 条"
+        }
+    
+    except Exception as e:
+        return {
+            "status": "error",
+            "query": query,
+            "message": f"检索对话失败: {str(e)}"
+        }
+
+
 @mcp.tool()
 def save_conversations() -> Dict[str, str]:
     """保存所有对话到文件
@@ -352,8 +873,7 @@ def save_conversations() -> Dict[str, str]:
         保存结果
     """
     try:
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False, encoding='utf-8') as f:
-            output_file = f.name
+        output_file = make_export_path()
         
         success = conversation_manager.save_to_file(output_file)
         
@@ -377,4 +897,4 @@ def save_conversations() -> Dict[str, str]:
 
 
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
+    run_server(mcp)
@@ -5,14 +5,12 @@ Interactive MCP Popup 主服务器 (修复版本)
 修复了输出验证错误，所有工具返回字符串。
 """
 
-import json
-import tempfile
 import os
 import sys
-from typing import Annotated, Dict, Optional
+from typing import Annotated, Any, Dict, List, Optional
 
 from pydantic import Field
-from fastmcp import FastMCP
+from fastmcp import FastMCP, Context
 
 # 添加当前目录到 Python 路径，支持相对导入
 if __name__ == "__main__":
@@ -20,36 +18,121 @@ if __name__ == "__main__":
     parent_dir = os.path.dirname(current_dir)
     sys.path.insert(0, parent_dir)
 
-from interactive_mcp_popup.popup import show_popup_dialog, save_result_to_file
-from interactive_mcp_popup.conversation import get_conversation_manager, ConversationManager
+from interactive_mcp_popup.popup import show_popup_dialog
+from interactive_mcp_popup.conversation import get_conversation_manager, ConversationManager, put_text
+from interactive_mcp_popup.auto_answer import get_auto_answer_engine
+from interactive_mcp_popup.journal import get_answer_journal
+from interactive_mcp_popup.janitor import create_storage_janitor, make_export_path
+from interactive_mcp_popup.resources import register_conversation_resources
+from interactive_mcp_popup.pending import PendingPopupRegistry, make_popup_key, progress_heartbeat, progress_draft
+from interactive_mcp_popup.transport import run_server, get_session_id
+from interactive_mcp_popup.metrics import MetricsMiddleware, server_metrics, timed_dumps
+from interactive_mcp_popup.tracing import TracingMiddleware, tracer
+from interactive_mcp_popup.utils import get_data_dir, config_manager
 
 # 创建 FastMCP 实例
 mcp = FastMCP("Interactive MCP Popup", log_level="ERROR")
 
+# 统计每个工具调用的次数和分阶段耗时
+mcp.add_middleware(MetricsMiddleware(server_metrics))
+
+# 按采样率记录调用链，导出到数据目录下的 traces.jsonl
+mcp.add_middleware(TracingMiddleware(tracer))
+
 # 获取对话管理器
 conversation_manager = get_conversation_manager()
 
+# 对话资源：客户端可订阅 conversation://list 和 conversation://{id}，对话变化时收到合并后的更新通知
+conversation_subscriptions = register_conversation_resources(mcp, conversation_manager)
+
+# 获取自动回答引擎
+auto_answer_engine = get_auto_answer_engine()
+
+# 加载回答自动补全前缀树，首次使用时从对话历史构建
+answer_trie = conversation_manager.answer_trie
+answer_trie.open(str(get_data_dir() / "answer_trie.json"), conversation_manager.iter_user_answers())
+
+# 全文检索索引：从文件加载，只补齐之后变化的对话
+conversation_manager.open_search_index(str(get_data_dir() / "search_index.json"))
+
+# 回答日志：所有弹窗回答追加写入同一组 JSONL 文件
+answer_journal = get_answer_journal()
+
+# 后台清理：按 cleanup_days 和总大小上限分批删除旧文件，不阻塞工具调用
+storage_janitor = create_storage_janitor(answer_journal)
+if config_manager.get_janitor_config().get("enabled", True):
+    storage_janitor.start()
+
+# 等待中的弹窗：等待期间发送进度心跳，客户端重试相同问题时挂到已打开的弹窗上
+# 历史和列表中超过该长度的消息内容、上下文只返回预览，完整内容用 read_message_content 读取
+preview_chars = config_manager.get_conversation_config().get("preview_chars", 2000)
+
+popup_registry = PendingPopupRegistry(
+    heartbeat_interval=config_manager.get_popup_config().get("heartbeat_seconds", 10)
+)
+
+
+def record_answer(result: Dict[str, Any]) -> None:
+    """记录弹窗回答：更新自动补全并追加到回答日志（调用方放弃后用户才回答时也会执行）"""
+    answer_trie.add(result["answer"])
+    try:
+        result["journal"] = answer_journal.append(result)
+    except Exception as e:
+        print(f"写入回答日志失败: {e}")
+
 
 @mcp.tool()
-def ask_user_popup(
+async def ask_user_popup(
     question: Annotated[str, Field(description="要问用户的问题")],
-    context: Annotated[str, Field(description="上下文信息，可选")] = ""
+    context: Annotated[str, Field(description="上下文信息，可选")] = "",
+    stream_draft: Annotated[bool, Field(description="是否通过进度通知推送用户正在输入的草稿")] = False,
+    ctx: Optional[Context] = None
 ) -> str:
     """使用 Qt 弹窗向用户提问并等待回答"""
     try:
-        result = show_popup_dialog(question, context)
+        auto_answer = auto_answer_engine.match(question, context)
+        if auto_answer:
+            response_data = {
+                "status": "auto_answered",
+                "question": question,
+                "context": context,
+                "answer": auto_answer["answer"],
+                "rule": auto_answer["rule"],
+                "message": "已根据自动回答规则回答，未打扰用户"
+            }
+            return timed_dumps(response_data, ensure_ascii=False)
+        
+        suggestions = conversation_manager.find_similar_questions(question, limit=3)
+        # HTTP 传输下多个客户端共享服务器，相同问题只在同一会话内合并
+        session_id = get_session_id(ctx)
+        result, popup, resumed = await popup_registry.ask(
+            make_popup_key(question, context, scope=session_id),
+            question,
+            context,
+            session_id=session_id,
+            on_heartbeat=progress_heartbeat(ctx) if ctx else None,
+            stream_draft=stream_draft,
+            on_draft=progress_draft(ctx) if ctx and stream_draft else None,
+            on_result=record_answer,
+            suggestions=suggestions,
+            completer=answer_trie
+        )
         
         if result:
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False, encoding='utf-8') as f:
-                output_file = f.name
+            answer_trie.flush()
             
-            if save_result_to_file(result, output_file):
+            record = result.get("journal")
+            if record:
                 response_data = {
                     "status": "answered",
                     "question": question,
                     "context": context,
                     "answer": result["answer"],
-                    "output_file": output_file,
+                    "record_id": record["record_id"],
+                    "journal_file": record["journal_file"],
+                    "offset": record["offset"],
+                    "popup_id": popup.popup_id,
+                    "resumed": resumed,
                     "message": "用户已通过弹窗回答问题"
                 }
             else:
@@ -58,7 +141,9 @@ def ask_user_popup(
                     "question": question,
                     "context": context,
                     "answer": result["answer"],
-                    "message": "用户已通过弹窗回答问题（保存文件失败）"
+                    "popup_id": popup.popup_id,
+                    "resumed": resumed,
+                    "message": "用户已通过弹窗回答问题（写入回答日志失败）"
                 }
         else:
             response_data = {
@@ -68,7 +153,7 @@ def ask_user_popup(
                 "message": "用户取消了回答"
             }
         
-        return json.dumps(response_data, ensure_ascii=False)
+        return timed_dumps(response_data, ensure_ascii=False)
     
     except Exception as e:
         error_data = {
@@ -77,7 +162,7 @@ def ask_user_popup(
             "context": context,
             "message": f"弹窗操作失败: {str(e)}"
         }
-        return json.dumps(error_data, ensure_ascii=False)
+        return timed_dumps(error_data, ensure_ascii=False)
 
 
 @mcp.tool()
@@ -98,36 +183,70 @@ def start_conversation(
             "instructions": "使用 continue_conversation 工具继续对话，使用 end_conversation 工具结束对话"
         }
         
-        return json.dumps(response_data, ensure_ascii=False)
+        return timed_dumps(response_data, ensure_ascii=False)
     
     except Exception as e:
         error_data = {
             "status": "error",
             "message": f"开始对话失败: {str(e)}"
         }
-        return json.dumps(error_data, ensure_ascii=False)
+        return timed_dumps(error_data, ensure_ascii=False)
 
 
 @mcp.tool()
-def continue_conversation(
+async def continue_conversation(
     conversation_id: Annotated[str, Field(description="对话ID")],
-    message: Annotated[str, Field(description="你的消息")]
+    message: Annotated[str, Field(description="你的消息")],
+    stream_draft: Annotated[bool, Field(description="是否通过进度通知推送用户正在输入的草稿")] = False,
+    ctx: Optional[Context] = None
 ) -> str:
     """继续对话"""
     try:
-        conversation_manager.add_message(conversation_id, "assistant", message, "question")
+        popup_key = make_popup_key(message, scope=conversation_id)
+        
+        # 重试时弹窗仍在等待或回答尚未取回，问题已经记录过
+        if not popup_registry.has(popup_key):
+            conversation_manager.add_message(conversation_id, "assistant", message, "question")
         
-        result = show_popup_dialog(message, f"对话ID: {conversation_id}")
+            auto_answer = auto_answer_engine.match(message)
+            if auto_answer:
+                conversation_manager.add_message(conversation_id, "system", auto_answer["answer"], "auto_answer")
+            
+                response_data = {
+                    "status": "auto_answered",
+                    "conversation_id": conversation_id,
+                    "your_message": message,
+                    "user_reply": auto_answer["answer"],
+                    "rule": auto_answer["rule"],
+                    "message": "已根据自动回答规则回复，可以继续对话"
+                }
+                return timed_dumps(response_data, ensure_ascii=False)
+        
+        suggestions = conversation_manager.find_similar_questions(message, limit=3)
+        result, popup, resumed = await popup_registry.ask(
+            popup_key,
+            message,
+            f"对话ID: {conversation_id}",
+            session_id=get_session_id(ctx),
+            on_heartbeat=progress_heartbeat(ctx) if ctx else None,
+            stream_draft=stream_draft,
+            on_draft=progress_draft(ctx) if ctx and stream_draft else None,
+            on_result=lambda r: conversation_manager.add_message(conversation_id, "user", r["answer"], "answer"),
+            suggestions=suggestions,
+            completer=answer_trie
+        )
         
         if result:
             user_reply = result["answer"]
-            conversation_manager.add_message(conversation_id, "user", user_reply, "answer")
+            answer_trie.flush()
             
             response_data = {
                 "status": "replied",
                 "conversation_id": conversation_id,
                 "your_message": message,
                 "user_reply": user_reply,
+                "popup_id": popup.popup_id,
+                "resumed": resumed,
                 "message": "用户已回复，可以继续对话"
             }
         else:
@@ -138,7 +257,7 @@ def continue_conversation(
                 "message": "用户取消了回复"
             }
         
-        return json.dumps(response_data, ensure_ascii=False)
+        return timed_dumps(response_data, ensure_ascii=False)
     
     except Exception as e:
         error_data = {
@@ -147,7 +266,7 @@ def continue_conversation(
             "your_message": message,
             "message": f"继续对话失败: {str(e)}"
         }
-        return json.dumps(error_data, ensure_ascii=False)
+        return timed_dumps(error_data, ensure_ascii=False)
 
 
 @mcp.tool()
@@ -173,7 +292,7 @@ def end_conversation(
                 "message": "对话不存在或已结束"
             }
         
-        return json.dumps(response_data, ensure_ascii=False)
+        return timed_dumps(response_data, ensure_ascii=False)
     
     except Exception as e:
         error_data = {
@@ -181,28 +300,42 @@ def end_conversation(
             "conversation_id": conversation_id,
             "message": f"结束对话失败: {str(e)}"
         }
-        return json.dumps(error_data, ensure_ascii=False)
+        return timed_dumps(error_data, ensure_ascii=False)
 
 
 @mcp.tool()
 def get_conversation_history(
-    conversation_id: Annotated[str, Field(description="对话ID")]
+    conversation_id: Annotated[str, Field(description="对话ID")],
+    limit: Annotated[int, Field(description="每页最多返回的消息数", ge=1, le=500)] = 50,
+    before: Annotated[Optional[int], Field(description="只返回序号小于该值的消息（从新到旧翻页时传上一页的 next_cursor）")] = None,
+    after: Annotated[Optional[int], Field(description="只返回序号大于该值的消息（从旧到新翻页时传上一页的 next_cursor）")] = None,
+    order: Annotated[str, Field(description="排序：asc 从旧到新，desc 从新到旧")] = "asc",
+    fields: Annotated[Optional[List[str]], Field(description="只返回这些消息字段，例如 [\"sender\", \"content\"]")] = None,
+    since_seq: Annotated[Optional[int], Field(description="增量同步：只返回 seq 大于该值的消息（从旧到新）")] = None,
+    max_content_chars: Annotated[Optional[int], Field(description="内容超过该长度时只返回预览，默认使用配置的 preview_chars，0 表示返回完整内容", ge=0)] = None
 ) -> str:
-    """获取对话历史"""
+    """分页获取对话历史"""
     try:
-        history = conversation_manager.get_conversation_history(conversation_id)
-        conversation = conversation_manager.get_conversation(conversation_id)
+        max_chars = preview_chars if max_content_chars is None else max_content_chars
+        page = conversation_manager.get_history_page(
+            conversation_id, limit, before, after, order, fields, since_seq, max_chars
+        )
         
-        if conversation:
+        if page is not None:
+            context_fields: Dict[str, Any] = {}
+            put_text(context_fields, "context", page["context"], max_chars)
             response_data = {
                 "status": "success",
                 "conversation_id": conversation_id,
-                "topic": conversation.topic,
-                "context": conversation.context,
-                "status": conversation.status,
-                "messages": history,
-                "total_messages": len(history),
-                "message": f"找到 {len(history)} 条对话消息"
+                "topic": page["topic"],
+                **context_fields,
+                "status": page["status"],
+                "messages": page["messages"],
+                "total_messages": page["total_messages"],
+                "latest_seq": page["latest_seq"],
+                "has_more": page["has_more"],
+                "next_cursor": page["next_cursor"],
+                "message": f"返回 {len(page['messages'])} 条对话消息，共 {page['total_messages']} 条"
             }
         else:
             response_data = {
@@ -211,7 +344,7 @@ def get_conversation_history(
                 "message": "对话不存在"
             }
         
-        return json.dumps(response_data, ensure_ascii=False)
+        return timed_dumps(response_data, ensure_ascii=False)
     
     except Exception as e:
         error_data = {
@@ -219,43 +352,45 @@ def get_conversation_history(
             "conversation_id": conversation_id,
             "message": f"获取对话历史失败: {str(e)}"
         }
-        return json.dumps(error_data, ensure_ascii=False)
+        return timed_dumps(error_data, ensure_ascii=False)
 
 
 @mcp.tool()
-def get_all_conversations() -> str:
-    """获取所有对话列表"""
+def get_all_conversations(
+    status: Annotated[Optional[str], Field(description="只返回该状态的对话：active 或 ended")] = None,
+    topic_prefix: Annotated[str, Field(description="只返回主题以此开头的对话")] = "",
+    updated_since: Annotated[Optional[str], Field(description="只返回更新时间不早于该值的对话，例如 \"2025-01-12\" 或 \"2025-01-12 10:00:00\"")] = None,
+    sort: Annotated[str, Field(description="排序：updated_desc 最近更新在前，updated_asc 最早更新在前，topic 按主题")] = "updated_desc",
+    limit: Annotated[int, Field(description="每页最多返回的对话数", ge=1, le=500)] = 50,
+    cursor: Annotated[Optional[str], Field(description="上一页返回的 next_cursor")] = None,
+    fields: Annotated[Optional[List[str]], Field(description="只返回这些字段，例如 [\"id\", \"topic\", \"status\"]")] = None,
+    max_context_chars: Annotated[Optional[int], Field(description="上下文超过该长度时只返回预览，默认使用配置的 preview_chars，0 表示返回完整内容", ge=0)] = None
+) -> str:
+    """按条件分页获取对话列表"""
     try:
-        conversations = conversation_manager.get_all_conversations()
-        
-        conversation_list = []
-        for conv in conversations:
-            conversation_list.append({
-                "id": conv.id,
-                "topic": conv.topic,
-                "context": conv.context,
-                "status": conv.status,
-                "created_at": conv.created_at,
-                "updated_at": conv.updated_at,
-                "message_count": len(conv.messages)
-            })
+        page = conversation_manager.query_conversations(
+            status, topic_prefix, updated_since, sort, limit, cursor, fields,
+            preview_chars if max_context_chars is None else max_context_chars
+        )
         
         response_data = {
             "status": "success",
-            "conversations": conversation_list,
-            "total_count": len(conversation_list),
-            "active_count": len([c for c in conversation_list if c["status"] == "active"]),
-            "message": f"找到 {len(conversation_list)} 个对话"
+            "conversations": page["conversations"],
+            "total_count": page["total_count"],
+            "active_count": page["active_count"],
+            "has_more": page["has_more"],
+            "next_cursor": page["next_cursor"],
+            "message": f"返回 {len(page['conversations'])} 个对话，共 {page['total_count']} 个"
         }
         
-        return json.dumps(response_data, ensure_ascii=False)
+        return timed_dumps(response_data, ensure_ascii=False)
     
     except Exception as e:
         error_data = {
             "status": "error",
             "message": f"获取对话列表失败: {str(e)}"
         }
-        return json.dumps(error_data, ensure_ascii=False)
+        return timed_dumps(error_data, ensure_ascii=False)
 
 
 @mcp.tool()
@@ -279,14 +414,14 @@ def test_popup() -> str:
                 "message": "用户取消了测试"
             }
         
-        return json.dumps(response_data, ensure_ascii=False)
+        return timed_dumps(response_data, ensure_ascii=False)
     
     except Exception as e:
         error_data = {
             "status": "error",
             "message": f"测试失败: {str(e)}"
         }
-        return json.dumps(error_data, ensure_ascii=False)
+        return timed_dumps(error_data, ensure_ascii=False)
 
 
 @mcp.tool()
@@ -305,15 +440,315 @@ def check_dependencies() -> str:
             "message": "PySide6 不可用，请安装: uv add pyside6"
         }
     
-    return json.dumps(response_data, ensure_ascii=False)
+    return timed_dumps(response_data, ensure_ascii=False)
+
+
+@mcp.tool()
+def find_similar_questions(
+    question: Annotated[str, Field(description="要查找的问题")],
+    limit: Annotated[int, Field(description="最多返回数量")] = 5
+) -> str:
+    """在历史对话中查找相似问题及用户当时的回答"""
+    try:
+        matches = conversation_manager.find_similar_questions(question, limit=limit)
+        response_data = {
+            "status": "success",
+            "question": question,
+            "matches": matches,
+            "total_matches": len(matches),
+            "message": f"找到 {len(matches)} 个相似问题"
+        }
+        return timed_dumps(response_data, ensure_ascii=False)
+    
+    except Exception as e:
+        error_data = {
+            "status": "error",
+            "question": question,
+            "message": f"查找相似问题失败: {str(e)}"
+        }
+        return timed_dumps(error_data, ensure_ascii=False)
+
+
+@mcp.tool()
+def get_auto_answer_stats() -> str:
+    """获取自动回答规则和命中统计"""
+    try:
+        stats = auto_answer_engine.get_stats()
+        response_data = {
+            "status": "success",
+            **stats,
+            "message": f"自动回答已处理 {stats['auto_answered_count']} 次提问"
+        }
+        return timed_dumps(response_data, ensure_ascii=False)
+    
+    except Exception as e:
+        error_data = {
+            "status": "error",
+            "message": f"获取自动回答统计失败: {str(e)}"
+        }
+        return timed_dumps(error_data, ensure_ascii=False)
+
+
+@mcp.tool()
+def list_pending_popups(ctx: Optional[Context] = None) -> str:
+    """列出当前会话正在等待用户回答的弹窗"""
+    try:
+        popups = popup_registry.list_pending(get_session_id(ctx))
+        response_data = {
+            "status": "success",
+            "popups": popups,
+            "total_pending": len(popups),
+            "message": f"有 {len(popups)} 个弹窗正在等待回答"
+        }
+        return timed_dumps(response_data, ensure_ascii=False)
+    
+    except Exception as e:
+        error_data = {
+            "status": "error",
+            "message": f"获取等待中的弹窗失败: {str(e)}"
+        }
+        return timed_dumps(error_data, ensure_ascii=False)
+
+
+@mcp.tool()
+def get_answer_draft(
+    popup_id: Annotated[str, Field(description="弹窗ID")],
+    since_version: Annotated[int, Field(description="已收到的草稿版本号，0 表示获取全文")] = 0
+) -> str:
+    """获取用户正在弹窗中输入的草稿"""
+    try:
+        draft = popup_registry.get_draft(popup_id, since_version)
+        if draft is None:
+            error_data = {
+                "status": "error",
+                "popup_id": popup_id,
+                "message": "弹窗不存在或未开启草稿推送"
+            }
+            return timed_dumps(error_data, ensure_ascii=False)
+        
+        response_data = {
+            "status": "success",
+            **draft,
+            "message": f"草稿版本 {draft['version']}"
+        }
+        return timed_dumps(response_data, ensure_ascii=False)
+    
+    except Exception as e:
+        error_data = {
+            "status": "error",
+            "popup_id": popup_id,
+            "message": f"获取草稿失败: {str(e)}"
+        }
+        return timed_dumps(error_data, ensure_ascii=False)
+
+
+@mcp.tool()
+def get_server_metrics(
+    write_prometheus: Annotated[bool, Field(description="是否同时写入 Prometheus 文本文件")] = False
+) -> str:
+    """获取每个工具的调用次数和分阶段耗时"""
+    try:
+        snapshot = server_metrics.snapshot()
+        written = server_metrics.write_prometheus() if write_prometheus else False
+        response_data = {
+            "status": "success",
+            **snapshot,
+            "prometheus_file": server_metrics.prometheus_file if written else "",
+            "message": f"已统计 {len(snapshot['tools'])} 个工具"
+        }
+        return timed_dumps(response_data, ensure_ascii=False)
+    
+    except Exception as e:
+        error_data = {
+            "status": "error",
+            "message": f"获取服务器指标失败: {str(e)}"
+        }
+        return timed_dumps(error_data, ensure_ascii=False)
+
+
+@mcp.tool()
+def get_answer_record(
+    record_id: Annotated[int, Field(description="回答记录ID（ask_user_popup 返回的 record_id）")]
+) -> str:
+    """按记录ID查找过去的弹窗回答"""
+    try:
+        record = answer_journal.get(record_id)
+        if record is None:
+            error_data = {
+                "status": "error",
+                "record_id": record_id,
+                "message": "回答记录不存在"
+            }
+            return timed_dumps(error_data, ensure_ascii=False)
+        if record.get("expired"):
+            error_data = {
+                "status": "error",
+                "record_id": record_id,
+                "expired": True,
+                "message": "回答记录已过期，所在的日志段已被清理"
+            }
+            return timed_dumps(error_data, ensure_ascii=False)
+        
+        response_data = {
+            "status": "success",
+            "record": record,
+            "message": "已找到回答记录"
+        }
+        return timed_dumps(response_data, ensure_ascii=False)
+    
+    except Exception as e:
+        error_data = {
+            "status": "error",
+            "record_id": record_id,
+            "message": f"查找回答记录失败: {str(e)}"
+        }
+        return timed_dumps(error_data, ensure_ascii=False)
+
+
+@mcp.tool()
+def get_conversation_version(
+    conversation_id: Annotated[str, Field(description="对话ID")]
+) -> str:
+    """获取对话的最新消息序号和更新时间"""
+    try:
+        version = conversation_manager.get_conversation_version(conversation_id)
+        if version is None:
+            error_data = {
+                "status": "error",
+                "conversation_id": conversation_id,
+                "message": "对话不存在"
+            }
+            return timed_dumps(error_data, ensure_ascii=False)
+        
+        response_data = {
+            "status": "success",
+            "conversation_id": conversation_id,
+            "latest_seq": version["latest_seq"],
+            "updated_at": version["updated_at"],
+            "conversation_status": version["status"],
+            "message": f"最新消息序号 {version['latest_seq']}"
+        }
+        return timed_dumps(response_data, ensure_ascii=False)
+    
+    except Exception as e:
+        error_data = {
+            "status": "error",
+            "conversation_id": conversation_id,
+            "message": f"获取对话版本失败: {str(e)}"
+        }
+        return timed_dumps(error_data, ensure_ascii=False)
+
+
+@mcp.tool()
+def read_message_content(
+    conversation_id: Annotated[str, Field(description="对话ID")],
+    seq: Annotated[int, Field(description="消息序号（消息的 seq 字段）", ge=1)],
+    offset: Annotated[int, Field(description="起始字符位置", ge=0)] = 0,
+    length: Annotated[int, Field(description="最多读取的字符数", ge=1, le=100000)] = 8000
+) -> str:
+    """分段读取一条消息的完整内容"""
+    try:
+        chunk = conversation_manager.read_message_content(conversation_id, seq, offset, length)
+        if chunk is None:
+            error_data = {
+                "status": "error",
+                "conversation_id": conversation_id,
+                "seq": seq,
+                "message": "对话或消息不存在"
+            }
+            return timed_dumps(error_data, ensure_ascii=False)
+        
+        response_data = {
+            "status": "success",
+            "conversation_id": conversation_id,
+            "seq": seq,
+            **chunk,
+            "message": f"返回第 {chunk['offset']} 到 {chunk['offset'] + len(chunk['content'])} 个字符，共 {chunk['total_length']} 个"
+        }
+        return timed_dumps(response_data, ensure_ascii=False)
+    
+    except Exception as e:
+        error_data = {
+            "status": "error",
+            "conversation_id": conversation_id,
+            "seq": seq,
+            "message": f"读取消息内容失败: {str(e)}"
+        }
+        return timed_dumps(error_data, ensure_ascii=False)
+
+
+@mcp.tool()
+def get_conversation_context(
+    conversation_id: Annotated[str, Field(description="对话ID")],
+    max_tokens: Annotated[Optional[int], Field(description="token 预算（估算值）", ge=1)] = 4000,
+    max_chars: Annotated[Optional[int], Field(description="字符预算（可选，与 token 预算同时满足）", ge=1)] = None
+) -> str:
+    """在预算内获取对话上下文：最近的消息原文加更早消息的分段摘要"""
+    try:
+        view = conversation_manager.get_context_view(conversation_id, max_tokens, max_chars)
+        conversation = conversation_manager.get_conversation(conversation_id)
+        if view is None or conversation is None:
+            error_data = {
+                "status": "error",
+                "conversation_id": conversation_id,
+                "message": "对话不存在"
+            }
+            return timed_dumps(error_data, ensure_ascii=False)
+        
+        response_data = {
+            "status": "success",
+            "conversation_id": conversation_id,
+            "topic": conversation.topic,
+            "conversation_status": conversation.status,
+            **view,
+            "message": f"最近 {len(view['messages'])} 条消息原文，{len(view['summaries'])} 段摘要，约 {view['used_tokens']} tokens"
+        }
+        return timed_dumps(response_data, ensure_ascii=False)
+    
+    except Exception as e:
+        error_data = {
+            "status": "error",
+            "conversation_id": conversation_id,
+            "message": f"获取对话上下文失败: {str(e)}"
+        }
+        return timed_dumps(error_data, ensure_ascii=False)
+
+
+@mcp.tool()
+def search_conversations(
+    query: Annotated[str, Field(description="检索内容，中文和英文均可")],
+    sender: Annotated[Optional[str], Field(description="只返回该发送者的消息：user 或 assistant")] = None,
+    message_type: Annotated[Optional[str], Field(description="只返回该类型的结果：question、answer，或 topic 表示对话主题")] = None,
+    since: Annotated[Optional[str], Field(description="只返回时间不早于该值的结果，例如 \"2025-01-12\" 或 \"2025-01-12 10:00:00\"")] = None,
+    until: Annotated[Optional[str], Field(description="只返回时间不晚于该值的结果，只给日期时包含当天")] = None,
+    limit: Annotated[int, Field(description="每页最多返回的结果数", ge=1, le=500)] = 20,
+    cursor: Annotated[Optional[int], Field(description="上一页返回的 next_cursor", ge=0)] = None
+) -> str:
+    """在所有对话的消息和主题中全文检索，按相关度排序并分页"""
+    try:
+        page = conversation_manager.search_messages(query, sender, message_type, since, until, limit, cursor)
+        response_data = {
+            "status": "success",
+            "query": query,
+            **page,
+            "message": f"返回 {len(page['results'])} 条结果，共 {page['total']} 条"
+        }
+        return timed_dumps(response_data, ensure_ascii=False)
+    
+    except Exception as e:
+        error_data = {
+            "status": "error",
+            "query": query,
+            "message": f"检索对话失败: {str(e)}"
+        }
+        return timed_dumps(error_data, ensure_ascii=False)
 
 
 @mcp.tool()
 def save_conversations() -> str:
     """保存所有对话到文件"""
     try:
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False, encoding='utf-8') as f:
-            output_file = f.name
+        output_file = make_export_path()
         
         success = conversation_manager.save_to_file(output_file)
         
@@ -329,15 +764,15 @@ def save_conversations() -> str:
                 "message": "保存对话失败"
             }
         
-        return json.dumps(response_data, ensure_ascii=False)
+        return timed_dumps(response_data, ensure_ascii=False)
     
     except Exception as e:
         error_data = {
             "status": "error",
             "message": f"保存对话失败: {str(e)}"
         }
-        return json.dumps(error_data, ensure_ascii=False)
+        return timed_dumps(error_data, ensure_ascii=False)
 
 
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
+    run_server(mcp)
@@ -0,0 +1,104 @@
+"""
+对话分片文件模块
+
+每个对话保存为目录中的一个分片文件（内容与 save_to_file 中单个对话的格式相同），
+只需重写发生变化的对话。分片先写同目录下唯一命名的临时文件再原子替换，
+读写都可以在线程池中并行进行，同一对话同时保存也不会互相覆盖临时文件。
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from typing import List
+
+from .conversation import Conversation, ConversationMessage, conversation_to_dict
+from .utils import validate_conversation_id
+
+SHARD_SUFFIX = ".json"
+
+
+def shard_path(directory: str, conversation_id: str) -> str:
+    """对话的分片文件路径
+
+    对话ID是 UUID 时直接作为文件名，否则使用其 SHA-1（导入的对话ID可能含有路径字符）。
+
+    Args:
+        directory: 分片目录
+        conversation_id: 对话ID
+
+    Returns:
+        分片文件路径
+    """
+    if validate_conversation_id(conversation_id):
+        name = conversation_id
+    else:
+        name = hashlib.sha1(conversation_id.encode("utf-8")).hexdigest()
+    return os.path.join(directory, name + SHARD_SUFFIX)
+
+
+def write_shard(directory: str, conversation: Conversation) -> str:
+    """原子写入一个对话的分片
+
+    Args:
+        directory: 分片目录
+        conversation: 对话
+
+    Returns:
+        分片文件路径
+    """
+    path = shard_path(directory, conversation.id)
+    data = json.dumps(conversation_to_dict(conversation), ensure_ascii=False)
+    fd, temp_path = tempfile.mkstemp(
+        prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return path
+
+
+def remove_shard(directory: str, conversation_id: str) -> bool:
+    """删除对话的分片
+
+    Returns:
+        分片是否存在
+    """
+    try:
+        os.remove(shard_path(directory, conversation_id))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def read_shard(path: str) -> Conversation:
+    """读取一个分片
+
+    Args:
+        path: 分片文件路径
+
+    Returns:
+        对话
+    """
+    with open(path, encoding="utf-8") as f:
+        conv_data = json.load(f)
+    messages = [
+        ConversationMessage(**msg_data) for msg_data in conv_data.pop("messages", [])
+    ]
+    for position, message in enumerate(messages, 1):
+        message.seq = position
+    return Conversation(**conv_data, messages=messages)
+
+
+def list_shards(directory: str) -> List[str]:
+    """列出目录中的分片文件（不包括未完成的临时文件）"""
+    with os.scandir(directory) as entries:
+        return [
+            entry.path
+            for entry in entries
+            if entry.is_file() and entry.name.endswith(SHARD_SUFFIX)
+        ]
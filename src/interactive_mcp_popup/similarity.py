@@ -0,0 +1,326 @@
+"""
+相似问题检索模块
+
+基于 n-gram 分片的 MinHash/LSH 近似索引，用于在历史问答中查找相似问题。
+分词对中文按字二元组切分，对英文和数字按单词切分。
+
+索引项只保存签名和问答消息的 (对话ID, 序号)，不保存文本；查询时只为返回的几条结果
+通过 resolve 回调取回消息。很长的问题只用前 max_shingles 个不同的分片计算签名。
+"""
+
+import re
+import threading
+import zlib
+from array import array
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+_CJK_RUN = re.compile(
+    r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]+"
+)
+_WORD_RUN = re.compile(r"[^\W_]+")
+
+# Mersenne 质数，用于 MinHash 的通用哈希族
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def iter_tokens(text: str) -> Iterator[str]:
+    """按顺序逐个生成词元，只取前几个时不必切分整段文本
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        词元迭代器
+    """
+    position = 0
+    lowered = text.lower()
+    for match in _CJK_RUN.finditer(lowered):
+        for word in _WORD_RUN.finditer(lowered, position, match.start()):
+            yield word.group(0)
+        run = match.group(0)
+        if len(run) == 1:
+            yield run
+        else:
+            for i in range(len(run) - 1):
+                yield run[i : i + 2]
+        position = match.end()
+    for word in _WORD_RUN.finditer(lowered, position):
+        yield word.group(0)
+
+
+def tokenize(text: str) -> List[str]:
+    """分词
+
+    中日韩文字按相邻两字切分（单字时保留单字），其他文字按单词切分并转为小写。
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        词元列表
+    """
+    return list(iter_tokens(text))
+
+
+def is_cjk(text: str) -> bool:
+    """文本是否全部由中日韩文字组成"""
+    return _CJK_RUN.fullmatch(text) is not None
+
+
+def shingles(text: str) -> Set[str]:
+    """生成文本的分片集合
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        分片集合
+    """
+    return set(tokenize(text))
+
+
+@dataclass
+class SimilarEntry:
+    """索引中的一条问答（消息内容在查询时按序号取回）"""
+
+    conversation_id: str
+    question_seq: int
+    signature: "array[int]"
+    answer_seq: int = 0  # 0 表示还没有回答
+
+
+class SimilarityIndex:
+    """相似问题索引
+
+    每个问题计算 MinHash 签名，签名按行分段后放入 LSH 桶。
+    查询只比较与问题落在同一个桶里的候选项，开销与索引规模基本无关。
+    """
+
+    def __init__(
+        self,
+        num_perm: int = 64,
+        bands: int = 16,
+        seed: int = 1,
+        max_shingles: int = 256,
+        resolve: Optional[Callable[[str, int], Any]] = None,
+    ):
+        """
+        Args:
+            num_perm: 签名长度
+            bands: LSH 分段数
+            seed: 哈希族种子
+            max_shingles: 计算签名时最多使用的不同分片数（从文本开头取）
+            resolve: 按 (对话ID, 序号) 取回消息的回调，消息不存在时返回 None
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm 必须能被 bands 整除")
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_shingles = max_shingles
+        self.resolve = resolve
+
+        # 固定种子生成哈希族参数，保证签名跨进程稳定
+        state = seed
+        self._permutations = []
+        for _ in range(num_perm):
+            state = (state * 6364136223846793005 + 1442695040888963407) % (1 << 64)
+            a = (state >> 3) % (_MERSENNE_PRIME - 1) + 1
+            state = (state * 6364136223846793005 + 1442695040888963407) % (1 << 64)
+            b = (state >> 3) % _MERSENNE_PRIME
+            self._permutations.append((a, b))
+
+        self._entries: Dict[int, SimilarEntry] = {}
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in range(bands)]
+        self._by_conversation: Dict[str, List[int]] = {}
+        self._last_question: Dict[str, int] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def signature(self, text: str) -> Optional["array[int]"]:
+        """计算文本的 MinHash 签名
+
+        Args:
+            text: 原始文本
+
+        Returns:
+            签名数组，文本没有可用词元时返回 None
+        """
+        unique: Set[str] = set()
+        for token in iter_tokens(text):
+            unique.add(token)
+            if len(unique) >= self.max_shingles:
+                break
+        hashes = [zlib.crc32(s.encode("utf-8")) for s in unique]
+        if not hashes:
+            return None
+        return array(
+            "I",
+            [
+                min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+                for a, b in self._permutations
+            ],
+        )
+
+    def _band_keys(self, signature: "array[int]") -> List[int]:
+        rows = self.rows
+        return [
+            hash(tuple(signature[band * rows : (band + 1) * rows]))
+            for band in range(self.bands)
+        ]
+
+    def add_question(
+        self, conversation_id: str, seq: int, question: str
+    ) -> Optional[int]:
+        """添加一个问题
+
+        Args:
+            conversation_id: 对话ID
+            seq: 问题消息的序号
+            question: 问题文本（只用于计算签名，不保存）
+
+        Returns:
+            索引项ID，问题没有可用词元时返回 None
+        """
+        signature = self.signature(question)
+        if signature is None:
+            return None
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = SimilarEntry(conversation_id, seq, signature)
+            for band, key in enumerate(self._band_keys(signature)):
+                self._buckets[band].setdefault(key, []).append(entry_id)
+            self._by_conversation.setdefault(conversation_id, []).append(entry_id)
+            self._last_question[conversation_id] = entry_id
+        return entry_id
+
+    def add_answer(self, conversation_id: str, seq: int) -> bool:
+        """把回答关联到该对话最近的一个问题
+
+        Args:
+            conversation_id: 对话ID
+            seq: 回答消息的序号
+
+        Returns:
+            是否关联成功
+        """
+        with self._lock:
+            entry_id = self._last_question.get(conversation_id)
+            entry = self._entries.get(entry_id) if entry_id is not None else None
+            if entry is None:
+                return False
+            entry.answer_seq = seq
+            return True
+
+    def add_message(self, message: Any) -> None:
+        """根据消息类型增量更新索引
+
+        Args:
+            message: 对话消息
+        """
+        if message.message_type == "question":
+            self.add_question(message.conversation_id, message.seq, message.content)
+        elif message.message_type == "answer" and message.sender == "user":
+            self.add_answer(message.conversation_id, message.seq)
+
+    def remove_conversation(self, conversation_id: str) -> int:
+        """移除一个对话的所有索引项
+
+        Args:
+            conversation_id: 对话ID
+
+        Returns:
+            移除的索引项数量
+        """
+        with self._lock:
+            entry_ids = self._by_conversation.pop(conversation_id, [])
+            self._last_question.pop(conversation_id, None)
+            for entry_id in entry_ids:
+                entry = self._entries.pop(entry_id)
+                for band, key in enumerate(self._band_keys(entry.signature)):
+                    bucket = self._buckets[band].get(key)
+                    if bucket is None:
+                        continue
+                    bucket.remove(entry_id)
+                    if not bucket:
+                        del self._buckets[band][key]
+            return len(entry_ids)
+
+    def query(
+        self,
+        text: str,
+        limit: int = 5,
+        min_score: float = 0.3,
+        answered_only: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """查找相似问题
+
+        Args:
+            text: 查询文本
+            limit: 最多返回数量
+            min_score: 最低相似度（估计的 Jaccard 系数）
+            answered_only: 是否只返回已有回答的问题
+
+        Returns:
+            按相似度降序排列的问答列表；没有 resolve 回调时只有对话ID、序号和分数
+        """
+        signature = self.signature(text)
+        if signature is None:
+            return []
+
+        with self._lock:
+            candidates: Set[int] = set()
+            for band, key in enumerate(self._band_keys(signature)):
+                candidates.update(self._buckets[band].get(key, ()))
+
+            scored = []
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if answered_only and not entry.answer_seq:
+                    continue
+                matches = sum(
+                    1 for x, y in zip(signature, entry.signature, strict=True) if x == y
+                )
+                score = matches / self.num_perm
+                if score >= min_score:
+                    scored.append((score, entry_id, entry))
+
+        # 分数相同时较新的问答优先
+        scored.sort(key=lambda item: (item[0], item[1]), reverse=True)
+        results: List[Dict[str, Any]] = []
+        for score, _, entry in scored:
+            if len(results) >= limit:
+                break
+            result = {
+                "conversation_id": entry.conversation_id,
+                "question_seq": entry.question_seq,
+                "answer_seq": entry.answer_seq,
+                "score": round(score, 3),
+            }
+            if self.resolve is not None:
+                # 在锁外取回消息，读存储时不阻塞索引更新；对话已被删除时跳过
+                question = self.resolve(entry.conversation_id, entry.question_seq)
+                answer = (
+                    self.resolve(entry.conversation_id, entry.answer_seq)
+                    if entry.answer_seq
+                    else None
+                )
+                if question is None or (entry.answer_seq and answer is None):
+                    continue
+                result.update(
+                    question_id=question.id,
+                    question=question.content,
+                    answer_id=answer.id if answer else "",
+                    answer=answer.content if answer else "",
+                    timestamp=question.timestamp,
+                )
+            results.append(result)
+        return results
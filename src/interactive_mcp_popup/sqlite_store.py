@@ -0,0 +1,233 @@
+"""
+SQLite 对话存储
+
+使用标准库 sqlite3，数据库以 WAL 模式打开：
+- conversations 表按 updated_at、(status, updated_at) 建索引；
+- messages 表以 (conversation_id, seq) 为主键，按对话读取消息是一次索引范围扫描；
+- add_message 只插入一行消息并更新对话的 updated_at，代价与已有消息数无关；
+- 启动时只读对话元数据和每个对话的消息数，消息在首次访问时读入，释放后可随时读回。
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .conversation import Conversation, ConversationMessage
+from .metrics import phase
+from .store import ConversationStore
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    topic TEXT NOT NULL,
+    context TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations (updated_at);
+CREATE INDEX IF NOT EXISTS idx_conversations_status ON conversations (status, updated_at);
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    content TEXT NOT NULL,
+    message_type TEXT NOT NULL,
+    PRIMARY KEY (conversation_id, seq)
+) WITHOUT ROWID;
+"""
+
+_MESSAGE_COLUMNS = "id, conversation_id, timestamp, sender, content, message_type, seq"
+
+
+class SQLiteConversationStore(ConversationStore):
+    """SQLite 存储后端"""
+
+    def __init__(self, path: str, synchronous: str = "NORMAL"):
+        """
+        Args:
+            path: 数据库文件路径（":memory:" 表示内存数据库）
+            synchronous: PRAGMA synchronous，WAL 模式下 NORMAL 只在检查点时 fsync
+        """
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}  # load 之后消息尚未读入的对话的消息数
+        # isolation_level=None：自动提交，每个写操作用显式事务
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"PRAGMA synchronous={synchronous}")
+        self._db.execute("PRAGMA foreign_keys=OFF")
+        self._db.executescript(_SCHEMA)
+
+    def _write(self, statements: Iterable[Tuple[str, Tuple[Any, ...]]]) -> None:
+        """在一个事务中执行多条写语句"""
+        with self._lock, phase("persistence"):
+            self._db.execute("BEGIN")
+            try:
+                for sql, params in statements:
+                    self._db.execute(sql, params)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _message_row(message: Any) -> Tuple[Any, ...]:
+        return (
+            message.conversation_id,
+            message.seq,
+            message.id,
+            message.timestamp,
+            message.sender,
+            message.content,
+            message.message_type,
+        )
+
+    def create_conversation(self, conversation: Conversation) -> None:
+        statements = [
+            (
+                "INSERT INTO conversations (id, topic, context, created_at, updated_at, status) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    conversation.id,
+                    conversation.topic,
+                    conversation.context,
+                    conversation.created_at,
+                    conversation.updated_at,
+                    conversation.status,
+                ),
+            )
+        ]
+        statements.extend(
+            (
+                "INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._message_row(message),
+            )
+            for message in conversation.messages
+        )
+        self._write(statements)
+
+    def add_message(self, conversation: Conversation, message: Any) -> None:
+        self._write(
+            [
+                (
+                    "INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    self._message_row(message),
+                ),
+                (
+                    "UPDATE conversations SET updated_at = ? WHERE id = ?",
+                    (conversation.updated_at, conversation.id),
+                ),
+            ]
+        )
+
+    def update_conversation(self, conversation: Conversation) -> None:
+        self._write(
+            [
+                (
+                    "UPDATE conversations SET status = ?, updated_at = ? WHERE id = ?",
+                    (conversation.status, conversation.updated_at, conversation.id),
+                )
+            ]
+        )
+
+    def delete_conversation(self, conversation_id: str) -> None:
+        self._write(
+            [
+                ("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,)),
+                ("DELETE FROM conversations WHERE id = ?", (conversation_id,)),
+            ]
+        )
+
+    def load_messages(
+        self, conversation_id: str, after_seq: int = 0, until_seq: Optional[int] = None
+    ) -> List[ConversationMessage]:
+        """按序号读取一个对话的消息（主键范围扫描）
+
+        Args:
+            conversation_id: 对话ID
+            after_seq: 只读取序号大于该值的消息
+            until_seq: 只读取序号不大于该值的消息，None 表示不限
+
+        Returns:
+            消息列表
+        """
+        with self._lock:
+            if until_seq is None:
+                rows = self._db.execute(
+                    f"SELECT {_MESSAGE_COLUMNS} FROM messages WHERE conversation_id = ? AND seq > ? ORDER BY seq",
+                    (conversation_id, after_seq),
+                ).fetchall()
+            else:
+                rows = self._db.execute(
+                    f"SELECT {_MESSAGE_COLUMNS} FROM messages "
+                    "WHERE conversation_id = ? AND seq > ? AND seq <= ? ORDER BY seq",
+                    (conversation_id, after_seq, until_seq),
+                ).fetchall()
+        return [ConversationMessage(*row) for row in rows]
+
+    def iter_conversation_ids(self, status: Optional[str] = None) -> List[str]:
+        """按更新时间从新到旧列出对话ID（使用 updated_at / status 索引）"""
+        with self._lock:
+            if status is None:
+                rows = self._db.execute(
+                    "SELECT id FROM conversations ORDER BY updated_at DESC"
+                ).fetchall()
+            else:
+                rows = self._db.execute(
+                    "SELECT id FROM conversations WHERE status = ? ORDER BY updated_at DESC",
+                    (status,),
+                ).fetchall()
+        return [row[0] for row in rows]
+
+    def load(self) -> Iterator[Conversation]:
+        """加载所有对话的元数据，消息在 load_body 时按对话读入"""
+        with self._lock:
+            conversations = [
+                Conversation(
+                    conversation_id,
+                    topic,
+                    context,
+                    created_at,
+                    updated_at,
+                    status,
+                    messages=[],
+                )
+                for conversation_id, topic, context, created_at, updated_at, status in self._db.execute(
+                    "SELECT id, topic, context, created_at, updated_at, status FROM conversations ORDER BY updated_at"
+                )
+            ]
+            self._counts = dict(
+                self._db.execute(
+                    "SELECT conversation_id, COUNT(*) FROM messages GROUP BY conversation_id"
+                )
+            )
+        return iter(conversations)
+
+    def deferred(self) -> Dict[str, int]:
+        counts, self._counts = self._counts, {}
+        return counts
+
+    def load_body(self, conversation: Conversation) -> None:
+        if not conversation.messages:
+            conversation.messages = self.load_messages(conversation.id)
+
+    def read_messages(
+        self, conversation: Conversation, start: int, stop: int
+    ) -> List[ConversationMessage]:
+        # 位置 i 的消息序号为 i + 1
+        return self.load_messages(conversation.id, start, stop)
+
+    def evict_body(self, conversation: Conversation) -> bool:
+        # 所有消息都已写入数据库，随时可以读回
+        conversation.messages = []
+        return True
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,111 @@
+"""
+对话存储模块
+
+ConversationManager 在每次修改对话时调用存储后端，启动时从后端加载对话。
+默认后端不持久化（只能通过 save_to_file 手动导出），可通过 storage.backend 配置切换：
+
+- "memory"：不持久化（默认）；
+- "sqlite"：SQLite 数据库（WAL 模式），每次修改只写一行；
+- "jsonl"：追加写入的操作日志，定期写快照并清空日志；
+- "shards"：对话全部在内存中，每个对话一个分片文件，由 ConversationManager 定期在后台保存变化的对话
+  （见 ConversationManager.start_shard_autosave），这里返回不持久化的后端。
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+
+from .utils import config_manager, get_data_dir
+
+
+class ConversationStore:
+    """对话存储后端基类，默认实现不做任何事"""
+
+    def load(self) -> Iterable[Any]:
+        """加载所有对话
+
+        Returns:
+            Conversation 迭代器
+        """
+        return []
+
+    def deferred(self) -> Dict[str, int]:
+        """load 之后消息尚未读入的对话
+
+        Returns:
+            {对话ID: 消息数}，这些对话的 messages 为空，需要调用 load_body 读入
+        """
+        return {}
+
+    def load_body(self, conversation: Any) -> None:
+        """读入延迟加载的对话消息，追加到 conversation.messages（已读入时不做任何事）"""
+
+    def read_messages(
+        self, conversation: Any, start: int, stop: int
+    ) -> Optional[List[Any]]:
+        """不读入整个对话，只读取位置在 [start, stop) 范围内的消息
+
+        Returns:
+            按顺序排列的消息；后端不支持按范围读取时返回 None
+        """
+        return None
+
+    def evict_body(self, conversation: Any) -> bool:
+        """释放对话的消息（conversation.messages 置为空列表），之后可用 load_body 读回
+
+        Returns:
+            是否已释放；无法读回（例如没有持久化）时不释放，返回 False
+        """
+        return False
+
+    def create_conversation(self, conversation: Any) -> None:
+        """新建对话（包含其中已有的消息）"""
+
+    def add_message(self, conversation: Any, message: Any) -> None:
+        """追加一条消息（对话的 updated_at 已更新）"""
+
+    def update_conversation(self, conversation: Any) -> None:
+        """对话的状态或更新时间变化"""
+
+    def delete_conversation(self, conversation_id: str) -> None:
+        """删除对话及其消息"""
+
+    def save_conversation(self, conversation: Any) -> None:
+        """整体写入对话（导入时使用，已存在时替换）"""
+        self.delete_conversation(conversation.id)
+        self.create_conversation(conversation)
+
+    def close(self) -> None:
+        """关闭存储"""
+
+
+def create_conversation_store() -> ConversationStore:
+    """按 storage 配置创建存储后端
+
+    Returns:
+        存储后端
+    """
+    storage_config = config_manager.get_storage_config()
+    backend = storage_config.get("backend", "memory")
+
+    if backend == "sqlite":
+        from .sqlite_store import SQLiteConversationStore
+
+        path = storage_config.get("sqlite_path") or str(
+            get_data_dir() / "conversations.db"
+        )
+        return SQLiteConversationStore(path)
+
+    if backend == "jsonl":
+        from .oplog import JsonlConversationStore
+
+        directory = storage_config.get("log_dir") or str(
+            get_data_dir() / "conversations"
+        )
+        return JsonlConversationStore(
+            directory,
+            snapshot_every=storage_config.get("snapshot_every", 1000),
+            fsync=storage_config.get("fsync", False),
+        )
+
+    if backend not in ("memory", "shards"):
+        print(f"未知的存储后端: {backend}，使用内存存储")
+    return ConversationStore()
@@ -0,0 +1,379 @@
+"""
+调用链追踪模块
+
+每次工具调用是一条 trace，内部的 add_message、弹窗创建、等待回答等是其中的 span，
+用于事后查看某一次调用慢在哪里（汇总耗时见 metrics 模块）。
+
+- 采样：按 sample_rate 在调用开始时决定；另外可设置 slow_threshold_seconds，
+  超过该耗时的调用即使没被采样也会导出，便于事后排查偶发的慢调用。
+  没被采样的调用只有根 span，内部的 span() 不创建 Span 对象，只按名称累计耗时，
+  慢调用导出时记在根 span 的 span_ms 属性中。两者都关闭时 span() 只做一次 contextvar 读取。
+- 导出：结束的 trace 通过 logging 的 QueueHandler 交给后台线程，
+  由 RotatingFileHandler 写入 JSONL 文件（字段参考 OpenTelemetry），不阻塞调用。
+"""
+
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    TypeVar,
+    cast,
+)
+
+from .utils import config_manager, get_data_dir
+
+
+class _Trace:
+    """一条调用链中已结束的 span"""
+
+    __slots__ = ("trace_id", "sampled", "exported", "spans", "timings")
+
+    def __init__(self, sampled: bool):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.sampled = sampled
+        self.exported = False
+        self.spans: List["Span"] = []
+        # 未采样时代替子 span：名称 -> 累计耗时（秒）
+        self.timings: Dict[str, float] = {}
+
+
+class Span:
+    """调用链中的一段操作"""
+
+    __slots__ = (
+        "trace",
+        "span_id",
+        "parent_id",
+        "name",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "status",
+    )
+
+    def __init__(
+        self,
+        trace: _Trace,
+        name: str,
+        parent_id: str = "",
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self.trace = trace
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes or {}
+        self.status = "ok"
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """设置属性"""
+        self.attributes[key] = value
+
+    def duration(self) -> float:
+        """耗时（秒）"""
+        end = self.end_ns or time.time_ns()
+        return (end - self.start_ns) / 1e9
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可序列化的字典"""
+        return {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": self.status,
+        }
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "interactive_mcp_popup_current_span", default=None
+)
+
+
+class _SpanQueueHandler(logging.handlers.QueueHandler):
+    """直接把 span 列表放入队列，格式化留给后台线程"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class _SpanFormatter(logging.Formatter):
+    """每个 span 一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return "\n".join(
+            json.dumps(span, ensure_ascii=False, default=str) for span in record.msg
+        )
+
+
+class Tracer:
+    """调用链追踪器"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        sample_rate: float = 0.0,
+        slow_threshold_seconds: float = 0.0,
+        filepath: str = "",
+        max_bytes: int = 10 * 1024 * 1024,
+        backup_count: int = 3,
+    ):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.slow_threshold_seconds = slow_threshold_seconds
+        self.filepath = filepath
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+        self._logger: Optional[logging.Logger] = None
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        self._file_handler: Optional[logging.Handler] = None
+        self._lock = threading.Lock()
+
+    def start_trace(self, name: str, **attributes: Any) -> Optional[Span]:
+        """开始一条调用链，不需要记录时返回 None
+
+        Args:
+            name: 根 span 名称（通常是工具名）
+            **attributes: 根 span 属性
+
+        Returns:
+            根 span
+        """
+        if not self.enabled:
+            return None
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled and self.slow_threshold_seconds <= 0:
+            return None
+        return Span(_Trace(sampled), name, attributes=attributes)
+
+    def finish(self, span: Span) -> None:
+        """结束 span；根 span 结束时决定是否导出整条调用链"""
+        span.end_ns = time.time_ns()
+        trace = span.trace
+        if span.parent_id:
+            if trace.exported:
+                # 根 span 结束后才完成的 span（例如调用方放弃后用户才回答）单独导出
+                self._export([span])
+            else:
+                trace.spans.append(span)
+            return
+
+        trace.spans.append(span)
+        slow = 0 < self.slow_threshold_seconds <= span.duration()
+        if trace.sampled or slow:
+            span.set_attribute("sampled_by", "rate" if trace.sampled else "slow")
+            if trace.timings:
+                span.set_attribute(
+                    "span_ms",
+                    {
+                        name: round(seconds * 1000, 3)
+                        for name, seconds in trace.timings.items()
+                    },
+                )
+            trace.exported = True
+            self._export(trace.spans)
+        trace.spans = []
+
+    def _export(self, spans: List[Span]) -> None:
+        logger = self._get_logger()
+        if logger is not None:
+            logger.info([span.to_dict() for span in spans])
+
+    def _get_logger(self) -> Optional[logging.Logger]:
+        if self._logger is not None:
+            return self._logger
+        with self._lock:
+            if self._logger is None:
+                try:
+                    filepath = self.filepath or str(get_data_dir() / "traces.jsonl")
+                    self._file_handler = logging.handlers.RotatingFileHandler(
+                        filepath,
+                        maxBytes=self.max_bytes,
+                        backupCount=self.backup_count,
+                        encoding="utf-8",
+                    )
+                    self._file_handler.setFormatter(_SpanFormatter())
+
+                    span_queue: queue.SimpleQueue[logging.LogRecord] = (
+                        queue.SimpleQueue()
+                    )
+                    self._listener = logging.handlers.QueueListener(
+                        span_queue, self._file_handler
+                    )
+                    self._listener.start()
+                    atexit.register(self.shutdown)
+
+                    logger = logging.getLogger(
+                        f"interactive_mcp_popup.tracing.{id(self)}"
+                    )
+                    logger.propagate = False
+                    logger.setLevel(logging.INFO)
+                    logger.addHandler(_SpanQueueHandler(span_queue))
+                    self._logger = logger
+                except Exception as e:
+                    print(f"初始化追踪导出失败: {e}")
+                    self.enabled = False
+        return self._logger
+
+    def shutdown(self) -> None:
+        """等待后台线程写完并关闭文件"""
+        with self._lock:
+            if self._listener is not None:
+                self._listener.stop()
+                self._listener = None
+            if self._file_handler is not None:
+                self._file_handler.close()
+                self._file_handler = None
+            if self._logger is not None:
+                for handler in list(self._logger.handlers):
+                    self._logger.removeHandler(handler)
+                self._logger = None
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """在当前调用链中记录一个 span；不在被记录的调用链中时什么都不做
+
+    Args:
+        name: span 名称
+        **attributes: span 属性
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    if not parent.trace.sampled:
+        # 只为慢调用保留的调用链：不创建子 span，只累计耗时
+        start = time.perf_counter()
+        try:
+            yield None
+        finally:
+            timings = parent.trace.timings
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+        return
+
+    current = Span(parent.trace, name, parent.span_id, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.set_attribute("error", repr(e))
+        raise
+    finally:
+        _current_span.reset(token)
+        tracer.finish(current)
+
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def traced(name: Optional[str] = None) -> Callable[[F], F]:
+    """把函数调用记录为 span 的装饰器（支持协程函数）
+
+    Args:
+        name: span 名称，默认使用函数的 __qualname__
+    """
+
+    def decorator(func: F) -> F:
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                if _current_span.get() is None:
+                    return await func(*args, **kwargs)
+                with span(span_name):
+                    return await func(*args, **kwargs)
+
+            return cast(F, async_wrapper)
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if _current_span.get() is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return cast(F, wrapper)
+
+    return decorator
+
+
+try:
+    from fastmcp.server.middleware import Middleware
+except ImportError:
+
+    class Middleware:  # type: ignore[no-redef]
+        """fastmcp 不可用时的空基类，保证 TracingMiddleware 总是可以导入"""
+
+
+class TracingMiddleware(Middleware):
+    """为每次工具调用开始一条调用链的 FastMCP 中间件"""
+
+    def __init__(self, tracer: "Tracer"):
+        self.tracer = tracer
+
+    async def on_call_tool(
+        self, context: Any, call_next: Callable[[Any], Awaitable[Any]]
+    ) -> Any:
+        root = self.tracer.start_trace(context.message.name, tool=context.message.name)
+        if root is None:
+            return await call_next(context)
+
+        token = _current_span.set(root)
+        try:
+            return await call_next(context)
+        except BaseException as e:
+            root.status = "error"
+            root.set_attribute("error", repr(e))
+            raise
+        finally:
+            _current_span.reset(token)
+            self.tracer.finish(root)
+
+
+def _create_tracer() -> Tracer:
+    tracing_config = config_manager.get_tracing_config()
+    return Tracer(
+        enabled=tracing_config.get("enabled", False),
+        sample_rate=tracing_config.get("sample_rate", 0.0),
+        slow_threshold_seconds=tracing_config.get("slow_threshold_seconds", 0.0),
+        filepath=os.path.expanduser(tracing_config.get("file", "")),
+        max_bytes=tracing_config.get("max_bytes", 10 * 1024 * 1024),
+        backup_count=tracing_config.get("backup_count", 3),
+    )
+
+
+# 全局追踪器
+tracer = _create_tracer()
+
+
+def get_tracer() -> Tracer:
+    """获取全局追踪器"""
+    return tracer
@@ -0,0 +1,86 @@
+"""
+服务器传输模块
+
+默认通过 stdio 运行，每个客户端各启动一个服务器进程。
+使用 HTTP（streamable-http）传输时，一个常驻服务器可以同时服务多个 MCP 客户端：
+Qt、对话存储和自动补全等只在本机加载一次，弹窗统一由这个进程显示。
+
+    python -m interactive_mcp_popup.server --transport http --port 8765
+
+客户端配置 "url": "http://127.0.0.1:8765/mcp" 即可连接。
+"""
+
+import argparse
+from typing import Any, List, Optional
+
+from .utils import config_manager
+
+TRANSPORTS = ("stdio", "http", "sse")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """创建命令行参数解析器，默认值来自配置文件的 server 部分
+
+    Returns:
+        参数解析器
+    """
+    server_config = config_manager.get_server_config()
+    parser = argparse.ArgumentParser(description="Interactive MCP Popup 服务器")
+    parser.add_argument(
+        "--transport",
+        choices=TRANSPORTS,
+        default=server_config.get("transport", "stdio"),
+        help="传输方式：stdio 每个客户端一个进程，http 多个客户端共享一个服务器",
+    )
+    parser.add_argument(
+        "--host", default=server_config.get("host", "127.0.0.1"), help="HTTP 监听地址"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=server_config.get("port", 8765),
+        help="HTTP 监听端口",
+    )
+    parser.add_argument(
+        "--path", default=server_config.get("path", "/mcp"), help="HTTP 端点路径"
+    )
+    return parser
+
+
+def run_server(mcp: Any, argv: Optional[List[str]] = None) -> None:
+    """按命令行参数启动服务器
+
+    Args:
+        mcp: FastMCP 实例
+        argv: 命令行参数（默认读取 sys.argv）
+    """
+    args = build_parser().parse_args(argv)
+    if args.transport == "stdio":
+        mcp.run(transport="stdio")
+    else:
+        print(
+            f"Interactive MCP Popup 监听 http://{args.host}:{args.port}{args.path} ({args.transport})"
+        )
+        mcp.run(
+            transport=args.transport, host=args.host, port=args.port, path=args.path
+        )
+
+
+def get_session_id(ctx: Any) -> str:
+    """获取调用方的 MCP 会话ID
+
+    HTTP 传输下多个客户端共享一个服务器，弹窗等按会话隔离；
+    没有请求上下文时返回空字符串。
+
+    Args:
+        ctx: FastMCP 的 Context（可以为 None）
+
+    Returns:
+        会话ID
+    """
+    if ctx is None:
+        return ""
+    try:
+        return ctx.session_id or ""
+    except Exception:
+        return ""
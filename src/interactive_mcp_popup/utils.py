@@ -8,9 +8,15 @@ import os
 import sys
 import json
 import tempfile
-from typing import Dict, Any, Optional, List
+import time
+from typing import IO, Dict, Any, Optional, List
 from pathlib import Path
 
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
 
 def get_temp_dir() -> Path:
     """获取临时目录
@@ -135,6 +141,17 @@ def get_project_root() -> Path:
     return current
 
 
+def get_data_dir() -> Path:
+    """获取持久化数据目录
+    
+    Returns:
+        数据目录路径
+    """
+    data_dir = Path.home() / ".interactive_mcp_popup" / "data"
+    data_dir.mkdir(parents=True, exist_ok=True)
+    return data_dir
+
+
 def get_config_path() -> Path:
     """获取配置文件路径
     
@@ -207,6 +224,45 @@ def cleanup_temp_files(max_age_hours: int = 24) -> int:
     return cleaned_count
 
 
+def lock_file(handle: IO[Any], blocking: bool = True) -> bool:
+    """对已打开的文件加进程间排他锁
+
+    Unix 使用 fcntl.flock，Windows 使用 msvcrt.locking 锁定第一个字节。
+    同一文件的锁只在进程之间互斥，进程内的线程仍需自己加锁。
+
+    Args:
+        handle: 已打开的文件
+        blocking: 是否等待其他进程释放锁
+
+    Returns:
+        是否获得锁（blocking 为 True 时总是 True）
+    """
+    if sys.platform == "win32":
+        while True:
+            handle.seek(0)
+            try:
+                msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(0.01)
+    try:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        return True
+    except BlockingIOError:
+        return False
+
+
+def unlock_file(handle: IO[Any]) -> None:
+    """释放 lock_file 加的锁"""
+    if sys.platform == "win32":
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
 class ConfigManager:
     """配置管理器"""
     
@@ -222,6 +278,11 @@ class ConfigManager:
         self.config[key] = value
         save_config(self.config)
     
+    def get_section(self, key: str, default: Dict[str, Any]) -> Dict[str, Any]:
+        """获取一个配置段（字典），不存在时返回默认值"""
+        section: Dict[str, Any] = self.get(key, default)
+        return section
+    
     def get_popup_config(self) -> Dict[str, Any]:
         """获取弹窗配置"""
         return self.get("popup", {
@@ -236,7 +297,68 @@ class ConfigManager:
         return self.get("conversation", {
             "max_messages": 100,
             "auto_save": True,
-            "cleanup_days": 7
+            "cleanup_days": 7,
+            "notify_debounce_ms": 200,
+            "preview_chars": 2000
+        })
+    
+    def get_server_config(self) -> Dict[str, Any]:
+        """获取服务器传输配置"""
+        return self.get_section("server", {
+            "transport": "stdio",
+            "host": "127.0.0.1",
+            "port": 8765,
+            "path": "/mcp"
+        })
+    
+    def get_metrics_config(self) -> Dict[str, Any]:
+        """获取指标配置"""
+        return self.get_section("metrics", {
+            "enabled": True,
+            "prometheus_file": "",
+            "prometheus_interval": 15
+        })
+    
+    def get_tracing_config(self) -> Dict[str, Any]:
+        """获取调用链追踪配置"""
+        return self.get_section("tracing", {
+            "enabled": False,
+            "sample_rate": 0.0,
+            "slow_threshold_seconds": 0.0,
+            "file": "",
+            "max_bytes": 10 * 1024 * 1024,
+            "backup_count": 3
+        })
+    
+    def get_journal_config(self) -> Dict[str, Any]:
+        """获取回答日志配置"""
+        return self.get_section("journal", {
+            "max_segment_mb": 16,
+            "fsync": False
+        })
+    
+    def get_janitor_config(self) -> Dict[str, Any]:
+        """获取存储清理配置（按时间清理使用对话配置中的 cleanup_days）"""
+        return self.get_section("janitor", {
+            "enabled": True,
+            "max_total_mb": 512,
+            "interval_hours": 6,
+            "batch_size": 500
+        })
+    
+    def get_storage_config(self) -> Dict[str, Any]:
+        """获取对话存储配置（路径为空时使用数据目录下的默认位置）"""
+        return self.get_section("storage", {
+            "backend": "memory",
+            "sqlite_path": "",
+            "log_dir": "",
+            "snapshot_every": 1000,
+            "fsync": False,
+            "hot_set_mb": 256,
+            "compact_messages": False,
+            "columnar_threshold": 0,
+            "shard_dir": "",
+            "autosave_seconds": 30
         })
 
 
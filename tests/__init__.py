@@ -6,8 +6,16 @@ Interactive MCP Popup 测试套件
 
 import sys
 import os
+import atexit
+import shutil
+import tempfile
 import unittest
 
+# 导入 interactive_mcp_popup 时服务器模块会在数据目录中打开回答日志和索引，并启动后台清理和保存线程；
+# 测试使用临时的用户目录，不写入开发者真实的 ~/.interactive_mcp_popup
+os.environ["HOME"] = os.environ["USERPROFILE"] = tempfile.mkdtemp(prefix="interactive_mcp_popup_home_")
+atexit.register(shutil.rmtree, os.environ["HOME"], ignore_errors=True)
+
 # 添加项目路径到 Python 路径
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
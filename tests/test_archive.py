@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+对话归档流式读取测试
+
+测试小块读取（包括多字节字符被块边界截断）与 json.load 结果一致、
+顶层其他字段、格式错误，以及 load_from_file 的过滤和进度回调。
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from interactive_mcp_popup.archive import ArchiveReader
+from interactive_mcp_popup.conversation import ConversationManager
+
+
+class TestArchiveReader(unittest.TestCase):
+    """测试流式读取"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "archive.json")
+
+    def tearDown(self):
+        """清理测试环境"""
+        self.temp_dir.cleanup()
+
+    def write(self, data, **kwargs):
+        """写入归档文件"""
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, **kwargs)
+
+    def test_matches_json_load(self):
+        """测试各种块大小下与 json.load 的结果一致"""
+        data = {
+            "last_op": 12345,
+            "conversations": {
+                f"id-{i}": {
+                    "topic": "部署" * i,
+                    "messages": [{"content": "是，继续" * i, "n": i * 1000}],
+                }
+                for i in range(20)
+            },
+            "version": 2,
+        }
+        for indent in (None, 2):
+            self.write(data, indent=indent)
+            for chunk_size in (1, 7, 64, 1 << 20):
+                reader = ArchiveReader(self.path, chunk_size=chunk_size)
+                self.assertEqual(
+                    dict(reader), data["conversations"], (indent, chunk_size)
+                )
+                self.assertEqual(reader.extra, {"last_op": 12345, "version": 2})
+                self.assertEqual(reader.bytes_read, reader.total_bytes)
+
+    def test_empty(self):
+        """测试没有对话的归档"""
+        for data in ({}, {"conversations": {}}):
+            self.write(data)
+            self.assertEqual(list(ArchiveReader(self.path, chunk_size=3)), [])
+
+    def test_malformed(self):
+        """测试格式错误和文件被截断"""
+        for text in (
+            "[]",
+            '{"conversations": {"a": {}} "b"',
+            '{"conversations": {"a": {"topic": "部',
+        ):
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.write(text)
+            with self.assertRaises(ValueError):
+                list(ArchiveReader(self.path, chunk_size=4))
+
+
+class TestStreamingLoad(unittest.TestCase):
+    """测试 load_from_file 的过滤和进度"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "export.json")
+
+        source = ConversationManager()
+        self.ids = []
+        for i in range(5):
+            conv_id = source.create_conversation(f"对话{i}")
+            source.add_message(conv_id, "user", f"回答{i}", "answer")
+            source.conversations[conv_id].updated_at = f"2026-01-0{i + 1} 12:00:00"
+            self.ids.append(conv_id)
+        source.end_conversation(self.ids[0])
+        source.conversations[self.ids[0]].updated_at = "2026-01-01 12:00:00"
+        self.source = source
+        self.assertTrue(source.save_to_file(self.path))
+
+    def tearDown(self):
+        """清理测试环境"""
+        self.temp_dir.cleanup()
+
+    def test_load_all(self):
+        """测试加载全部对话与原对话一致"""
+        manager = ConversationManager()
+        self.assertTrue(manager.load_from_file(self.path))
+        for conv_id in self.ids:
+            self.assertEqual(
+                manager.get_conversation_history(conv_id),
+                self.source.get_conversation_history(conv_id),
+            )
+
+    def test_filters(self):
+        """测试只加载活跃对话和指定时间之后更新的对话"""
+        manager = ConversationManager()
+        self.assertTrue(
+            manager.load_from_file(
+                self.path, status="active", updated_after="2026-01-02 12:00:00"
+            )
+        )
+        self.assertEqual(set(manager.conversations), set(self.ids[2:]))
+
+        manager = ConversationManager()
+        self.assertTrue(manager.load_from_file(self.path, status="ended"))
+        self.assertEqual(set(manager.conversations), {self.ids[0]})
+
+    def test_progress(self):
+        """测试进度回调"""
+        reports = []
+        manager = ConversationManager()
+        manager.load_from_file(
+            self.path, status="active", progress=reports.append, progress_every=2
+        )
+
+        self.assertEqual(len(reports), 3)
+        last = reports[-1]
+        self.assertEqual((last["loaded"], last["skipped"]), (4, 1))
+        self.assertEqual(last["bytes_read"], last["total_bytes"])
+
+    def test_malformed_file(self):
+        """测试格式错误时返回 False"""
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write('{"conversations": [')
+        self.assertFalse(ConversationManager().load_from_file(self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+自动回答规则测试
+
+测试规则编译、匹配和配置文件变化时的重新加载。
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from interactive_mcp_popup.auto_answer import AutoAnswerEngine, _build_keyword_pattern
+
+
+class TestKeywordPattern(unittest.TestCase):
+    """测试关键词前缀树正则"""
+
+    def test_shared_prefix(self):
+        """测试共享前缀只出现一次"""
+        pattern = _build_keyword_pattern(["continue", "confirm"])
+        self.assertEqual(pattern.count("con"), 1)
+
+    def test_longest_keyword_first(self):
+        """测试优先匹配更长的关键词"""
+        import re
+
+        pattern = re.compile(_build_keyword_pattern(["继续", "继续执行"]))
+        self.assertEqual(pattern.search("是否继续执行？").group(0), "继续执行")
+
+
+class TestAutoAnswerEngine(unittest.TestCase):
+    """测试自动回答引擎"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.temp_dir, "config.json")
+        self.write_config(
+            {
+                "auto_answer": {
+                    "enabled": True,
+                    "rules": [
+                        {
+                            "name": "continue",
+                            "keywords": ["continue?", "是否继续"],
+                            "answer": "继续",
+                        },
+                        {
+                            "name": "defaults",
+                            "regex": r"use default (settings|config)\?",
+                            "answer": "是",
+                        },
+                        {
+                            "name": "ci",
+                            "keywords": "CI 环境",
+                            "answer": "跳过",
+                            "match_context": True,
+                        },
+                    ],
+                }
+            }
+        )
+        self.engine = AutoAnswerEngine(self.config_path)
+
+    def tearDown(self):
+        """清理测试环境"""
+        import shutil
+
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def write_config(self, config):
+        """写入配置文件"""
+        with open(self.config_path, "w", encoding="utf-8") as f:
+            json.dump(config, f, ensure_ascii=False)
+
+    def test_keyword_match(self):
+        """测试关键词匹配（忽略大小写）"""
+        result = self.engine.match("Shall we CONTINUE?")
+        self.assertIsNotNone(result)
+        self.assertEqual(result["answer"], "继续")
+        self.assertEqual(result["rule"], "continue")
+        self.assertEqual(result["status"], "auto_answered")
+
+        result = self.engine.match("测试已经通过，是否继续发布？")
+        self.assertEqual(result["rule"], "continue")
+
+    def test_regex_match(self):
+        """测试正则匹配"""
+        result = self.engine.match("Use default config?")
+        self.assertIsNotNone(result)
+        self.assertEqual(result["rule"], "defaults")
+
+    def test_no_match(self):
+        """测试未命中规则"""
+        self.assertIsNone(self.engine.match("你希望使用哪个分支名？"))
+
+    def test_context_match(self):
+        """测试只在 match_context 规则中匹配上下文"""
+        result = self.engine.match("要运行全部测试吗？", "当前在 CI 环境中")
+        self.assertEqual(result["rule"], "ci")
+
+        # 上下文中的关键词不会触发只匹配问题的规则
+        self.assertIsNone(self.engine.match("要运行全部测试吗？", "是否继续"))
+
+    def test_hit_counting(self):
+        """测试命中计数"""
+        self.engine.match("continue?")
+        self.engine.match("continue?")
+        self.engine.match("use default settings?")
+        self.engine.match("没有命中")
+
+        stats = self.engine.get_stats()
+        self.assertEqual(stats["auto_answered_count"], 3)
+        self.assertEqual(stats["rule_hits"], {"continue": 2, "defaults": 1})
+
+    def test_reload_only_when_config_changes(self):
+        """测试只有配置文件变化时才重新加载"""
+        self.assertTrue(self.engine.reload_if_changed())
+        self.assertFalse(self.engine.reload_if_changed())
+
+        self.write_config(
+            {
+                "auto_answer": {
+                    "rules": [
+                        {
+                            "name": "proceed",
+                            "keywords": ["proceed?"],
+                            "answer": "yes, proceed",
+                        }
+                    ]
+                }
+            }
+        )
+
+        result = self.engine.match("Ready to proceed?")
+        self.assertEqual(result["answer"], "yes, proceed")
+        self.assertIsNone(self.engine.match("continue?"))
+
+    def test_disabled(self):
+        """测试禁用自动回答"""
+        self.write_config(
+            {
+                "auto_answer": {
+                    "enabled": False,
+                    "rules": [{"keywords": ["continue?"], "answer": "继续"}],
+                }
+            }
+        )
+        self.assertIsNone(self.engine.match("continue?"))
+
+    def test_invalid_rules_skipped(self):
+        """测试无效规则被忽略"""
+        self.engine.load_rules(
+            {
+                "rules": [
+                    {"name": "broken", "regex": "([", "answer": "x"},
+                    {"name": "named", "regex": "(?P<x>a)", "answer": "x"},
+                    {"name": "backreference", "regex": r"(yes|no) \1", "answer": "x"},
+                    {"name": "late_flags", "regex": "a(?i)b", "answer": "x"},
+                    {"name": "no_answer", "keywords": ["abc"]},
+                    {"name": "ok", "keywords": ["abc"], "answer": "好"},
+                ]
+            }
+        )
+        self.assertEqual([rule.name for rule in self.engine.rules], ["ok"])
+
+    def test_inline_flags_do_not_disable_other_rules(self):
+        """测试开头带全局标志的正则可以嵌入组合正则，其他规则照常匹配"""
+        self.write_config(
+            {
+                "auto_answer": {
+                    "rules": [
+                        {
+                            "name": "flags",
+                            "regex": "(?i)use default",
+                            "ignore_case": False,
+                            "answer": "是",
+                        },
+                        {"name": "escaped", "regex": r"path \\1", "answer": "路径"},
+                        {"name": "ok", "keywords": ["abc"], "answer": "好"},
+                    ]
+                }
+            }
+        )
+        self.assertEqual(self.engine.match("USE DEFAULT?")["rule"], "flags")
+        self.assertEqual(self.engine.match("path \\1")["rule"], "escaped")
+        self.assertEqual(self.engine.match("abc")["rule"], "ok")
+        self.assertEqual(
+            [rule.name for rule in self.engine.rules], ["flags", "escaped", "ok"]
+        )
+
+    def test_case_sensitive_keywords(self):
+        """测试 ignore_case 为 false 的关键词规则区分大小写"""
+        self.write_config(
+            {
+                "auto_answer": {
+                    "rules": [
+                        {
+                            "name": "exact",
+                            "keywords": ["PROD"],
+                            "ignore_case": False,
+                            "answer": "不要",
+                        },
+                        {"name": "any", "keywords": ["Staging"], "answer": "可以"},
+                    ]
+                }
+            }
+        )
+        self.assertEqual(self.engine.match("部署到 PROD 吗？")["rule"], "exact")
+        self.assertIsNone(self.engine.match("部署到 prod 吗？"))
+        self.assertEqual(self.engine.match("部署到 STAGING 吗？")["rule"], "any")
+
+    def test_missing_config_file(self):
+        """测试配置文件不存在"""
+        engine = AutoAnswerEngine(os.path.join(self.temp_dir, "missing.json"))
+        self.assertIsNone(engine.match("continue?"))
+        self.assertFalse(engine.get_stats()["enabled"])
+
+
+if __name__ == "__main__":
+    unittest.main()
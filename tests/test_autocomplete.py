@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+回答自动补全测试
+
+测试前缀树的插入、频率排序、持久化以及与对话管理器的集成。
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from interactive_mcp_popup.autocomplete import AnswerTrie
+from interactive_mcp_popup.conversation import ConversationManager
+
+
+class TestAnswerTrie(unittest.TestCase):
+    """测试回答前缀树"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.trie = AnswerTrie()
+        self.trie.add("yes, proceed", 5)
+        self.trie.add("yes", 3)
+        self.trie.add("yes, but later")
+        self.trie.add("release/2.0", 2)
+        self.trie.add("release/2.1", 4)
+        self.trie.add("继续执行", 2)
+        self.trie.add("继续")
+
+    def test_complete_ranked_by_frequency(self):
+        """测试按频率排序"""
+        self.assertEqual(
+            self.trie.complete("y"), ["yes, proceed", "yes", "yes, but later"]
+        )
+        self.assertEqual(self.trie.complete("rel"), ["release/2.1", "release/2.0"])
+
+    def test_complete_inside_edge(self):
+        """测试前缀落在压缩边中间"""
+        self.assertEqual(self.trie.complete("yes, p"), ["yes, proceed"])
+        self.assertEqual(
+            self.trie.complete("release/2."), ["release/2.1", "release/2.0"]
+        )
+
+    def test_complete_chinese(self):
+        """测试中文回答"""
+        self.assertEqual(self.trie.complete("继"), ["继续执行", "继续"])
+
+    def test_complete_no_match(self):
+        """测试没有匹配的前缀"""
+        self.assertEqual(self.trie.complete("no"), [])
+        self.assertEqual(self.trie.complete("yesx"), [])
+        self.assertEqual(self.trie.complete(""), [])
+
+    def test_frequency_updates_ranking(self):
+        """测试次数增加后排名更新"""
+        self.trie.add("yes, but later", 10)
+        self.assertEqual(self.trie.complete("yes")[0], "yes, but later")
+        self.assertEqual(self.trie.get_count("yes, but later"), 11)
+
+    def test_limit(self):
+        """测试返回数量限制"""
+        self.assertEqual(len(self.trie.complete("y", limit=2)), 2)
+
+    def test_ignore_empty_and_long_answers(self):
+        """测试忽略空回答和过长回答"""
+        trie = AnswerTrie(max_answer_length=10)
+        self.assertFalse(trie.add("   "))
+        self.assertFalse(trie.add("x" * 11))
+        self.assertEqual(len(trie), 0)
+
+    def test_save_and_load(self):
+        """测试持久化"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filepath = os.path.join(temp_dir, "trie.json")
+            self.assertTrue(self.trie.save(filepath))
+
+            loaded = AnswerTrie()
+            self.assertTrue(loaded.load(filepath))
+            self.assertEqual(loaded.complete("y"), self.trie.complete("y"))
+            self.assertEqual(loaded.get_count("release/2.1"), 4)
+
+    def test_open_builds_from_history_once(self):
+        """测试持久化文件不存在时才从历史构建"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filepath = os.path.join(temp_dir, "trie.json")
+
+            trie = AnswerTrie()
+            self.assertFalse(trie.open(filepath, ["main", "main", "master"]))
+            self.assertEqual(trie.complete("ma"), ["main", "master"])
+            self.assertTrue(trie.flush(force=True))
+            self.assertFalse(trie.flush(force=True))  # 没有改动时不写入
+
+            reopened = AnswerTrie()
+            self.assertTrue(reopened.open(filepath, ["should", "not", "be", "used"]))
+            self.assertEqual(reopened.complete("s"), [])
+            self.assertEqual(reopened.get_count("main"), 2)
+
+
+class TestConversationAutocomplete(unittest.TestCase):
+    """测试对话管理器增量更新前缀树"""
+
+    def test_user_answers_added(self):
+        """测试只记录用户回答"""
+        manager = ConversationManager()
+        conv_id = manager.create_conversation("分支选择")
+        manager.add_message(conv_id, "assistant", "使用哪个分支？", "question")
+        manager.add_message(conv_id, "user", "feature/login", "answer")
+
+        self.assertEqual(manager.answer_trie.complete("f"), ["feature/login"])
+        self.assertEqual(manager.answer_trie.complete("使用"), [])
+        self.assertEqual(list(manager.iter_user_answers()), ["feature/login"])
+
+
+if __name__ == "__main__":
+    unittest.main()
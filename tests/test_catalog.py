@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+对话目录索引测试
+
+测试按状态、主题前缀、更新时间过滤，排序、游标分页和计数。
+"""
+
+import os
+import sys
+import unittest
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from interactive_mcp_popup.catalog import ConversationCatalog
+from interactive_mcp_popup.conversation import ConversationManager
+
+
+class TestConversationCatalog(unittest.TestCase):
+    """测试对话目录索引"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.catalog = ConversationCatalog()
+        self.catalog.update("a", "active", "2025-01-01 10:00:00", "部署/生产")
+        self.catalog.update("b", "ended", "2025-01-02 10:00:00", "部署/测试")
+        self.catalog.update("c", "active", "2025-01-03 10:00:00", "代码审查")
+        self.catalog.update("d", "active", "2025-01-04 10:00:00", "部署/回滚")
+
+    def test_counts(self):
+        """测试计数"""
+        self.assertEqual(self.catalog.count(), 4)
+        self.assertEqual(self.catalog.count("active"), 3)
+        self.catalog.update("a", "ended", "2025-01-05 10:00:00", "部署/生产")
+        self.assertEqual(self.catalog.count("active"), 2)
+        self.catalog.remove("b")
+        self.assertEqual(self.catalog.count("ended"), 1)
+        self.assertEqual(len(self.catalog), 3)
+
+    def test_sort_by_updated(self):
+        """测试按更新时间排序"""
+        self.assertEqual(self.catalog.query()[0], ["d", "c", "b", "a"])
+        self.assertEqual(
+            self.catalog.query(sort="updated_asc")[0], ["a", "b", "c", "d"]
+        )
+
+        self.catalog.update("a", "active", "2025-01-05 10:00:00", "部署/生产")
+        self.assertEqual(self.catalog.query()[0], ["a", "d", "c", "b"])
+
+    def test_filters(self):
+        """测试状态、主题前缀和更新时间过滤"""
+        self.assertEqual(self.catalog.query(status="active")[0], ["d", "c", "a"])
+        self.assertEqual(self.catalog.query(topic_prefix="部署/")[0], ["d", "b", "a"])
+        self.assertEqual(self.catalog.query(updated_since="2025-01-03")[0], ["d", "c"])
+        self.assertEqual(
+            self.catalog.query(sort="topic", topic_prefix="部署/")[0], ["d", "b", "a"]
+        )
+        self.assertEqual(
+            self.catalog.query(
+                status="active",
+                topic_prefix="部署/",
+                updated_since="2025-01-02",
+                sort="topic",
+            )[0],
+            ["d"],
+        )
+        self.assertEqual(self.catalog.query(status="archived")[0], [])
+
+    def test_cursor_pagination(self):
+        """测试游标分页"""
+        for sort in ("updated_desc", "updated_asc", "topic"):
+            ids, cursor = self.catalog.query(sort=sort, limit=3)
+            self.assertIsNotNone(cursor)
+            rest, last_cursor = self.catalog.query(sort=sort, limit=3, cursor=cursor)
+            self.assertIsNone(last_cursor)
+            self.assertEqual(sorted(ids + rest), ["a", "b", "c", "d"])
+
+        ids, cursor = self.catalog.query(limit=4)
+        self.assertIsNone(cursor)
+
+    def test_invalid_arguments(self):
+        """测试无效参数"""
+        with self.assertRaises(ValueError):
+            self.catalog.query(sort="random")
+        with self.assertRaises(ValueError):
+            self.catalog.query(cursor="not-json")
+
+
+class TestQueryConversations(unittest.TestCase):
+    """测试对话管理器的列表查询"""
+
+    def test_manager_keeps_index_in_sync(self):
+        """测试创建、添加消息、结束和删除时更新索引"""
+        manager = ConversationManager()
+        first = manager.create_conversation("部署", "很长的上下文" * 100)
+        second = manager.create_conversation("审查")
+        manager.add_message(first, "assistant", "继续吗？", "question")
+        manager.end_conversation(second)
+
+        page = manager.query_conversations(
+            status="active", fields=["id", "message_count"]
+        )
+        self.assertEqual(page["conversations"], [{"id": first, "message_count": 2}])
+        self.assertEqual((page["total_count"], page["active_count"]), (2, 1))
+
+        manager.delete_conversation(first)
+        page = manager.query_conversations()
+        self.assertEqual([c["id"] for c in page["conversations"]], [second])
+        self.assertEqual(page["active_count"], 0)
+
+        with self.assertRaises(ValueError):
+            manager.query_conversations(fields=["messages"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+列式消息存储测试
+
+测试 MessageColumns 的列表操作、行视图与原消息一致、无法编码的值、
+按发送者/类型/时间筛选、内容视图，以及管理器在消息数达到阈值时改用列式存储。
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+import uuid
+from dataclasses import asdict
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from interactive_mcp_popup.columnar import MessageColumns
+from interactive_mcp_popup.conversation import (
+    ConversationManager,
+    ConversationMessage,
+    message_to_dict,
+)
+from interactive_mcp_popup.sqlite_store import SQLiteConversationStore
+
+CONV_ID = str(uuid.uuid4())
+
+
+def make_messages(count, overrides=None):
+    """生成一问一答交替的消息，时间每条递增一分钟"""
+    messages = []
+    for i in range(count):
+        values = {
+            "id": str(uuid.uuid4()),
+            "conversation_id": CONV_ID,
+            "timestamp": f"2026-01-01 10:{i:02d}:00",
+            "sender": "user" if i % 2 else "assistant",
+            "content": f"回答{i}" if i % 2 else f"question {i}",
+            "message_type": "answer" if i % 2 else "question",
+            "seq": i + 1,
+        }
+        values.update((overrides or {}).get(i, {}))
+        messages.append(ConversationMessage(**values))
+    return messages
+
+
+class TestMessageColumns(unittest.TestCase):
+    """测试列式存储"""
+
+    def test_sequence(self):
+        """测试长度、下标、负下标、切片和遍历与原列表一致"""
+        messages = make_messages(10)
+        columns = MessageColumns(CONV_ID, messages)
+        self.assertEqual(len(columns), 10)
+        self.assertEqual(message_to_dict(columns[3]), asdict(messages[3]))
+        self.assertEqual(columns[-1].seq, 10)
+        self.assertEqual([m.seq for m in columns[2:8:3]], [3, 6])
+        self.assertEqual(
+            [message_to_dict(m) for m in columns], [asdict(m) for m in messages]
+        )
+        with self.assertRaises(IndexError):
+            columns[10]
+        self.assertFalse(MessageColumns(CONV_ID))
+
+    def test_exceptions(self):
+        """测试无法编码的值原样保存"""
+        messages = make_messages(
+            4,
+            {
+                1: {"id": "msg-1", "timestamp": "2026-01-01T10:01:00Z"},
+                2: {"sender": "tool", "message_type": "note", "seq": 9},
+            },
+        )
+        columns = MessageColumns(CONV_ID, messages)
+        self.assertEqual(
+            [message_to_dict(m) for m in columns], [asdict(m) for m in messages]
+        )
+
+    def test_select(self):
+        """测试按发送者、类型和时间筛选"""
+        columns = MessageColumns(CONV_ID, make_messages(20))
+        self.assertEqual(columns.select("user", "answer"), list(range(1, 20, 2)))
+        self.assertEqual(
+            columns.select(message_type="question", after="2026-01-01 10:15:00"),
+            [16, 18],
+        )
+        self.assertEqual(
+            list(columns.iter_contents("user", "answer", "2026-01-01 10:15:00")),
+            ["回答17", "回答19"],
+        )
+        self.assertEqual(columns.select(after="2026-01-01 10:18:00"), [19])
+        self.assertEqual(columns.select("nobody"), [])
+        with self.assertRaises(ValueError):
+            columns.select(after="昨天")
+
+    def test_select_unsorted_and_unknown(self):
+        """测试时间不单调和发送者未知时的筛选"""
+        messages = make_messages(
+            6,
+            {
+                1: {"timestamp": "2026-01-01 11:00:00"},
+                3: {"sender": "tool", "message_type": "answer"},
+                4: {"timestamp": "yesterday"},
+            },
+        )
+        columns = MessageColumns(CONV_ID, messages)
+        expected = [
+            i
+            for i, m in enumerate(messages)
+            if m.timestamp > "2026-01-01 10:02:00" and m.message_type == "answer"
+        ]
+        self.assertEqual(
+            columns.select(message_type="answer", after="2026-01-01 10:02:00"), expected
+        )
+        self.assertEqual(columns.select("tool"), [3])
+
+    def test_content_buffer(self):
+        """测试内容视图不复制，以及视图存在时仍可追加"""
+        messages = make_messages(3)
+        columns = MessageColumns(CONV_ID, messages[:2])
+        view = columns.content_view(1)
+        self.assertEqual(bytes(view).decode("utf-8"), "回答1")
+        columns.append(messages[2])
+        self.assertEqual(bytes(view).decode("utf-8"), "回答1")
+        self.assertEqual(columns[2].content, "question 2")
+        self.assertEqual(
+            columns.content_bytes(),
+            sum(len(m.content.encode("utf-8")) for m in messages),
+        )
+
+
+class TestColumnarManager(unittest.TestCase):
+    """测试管理器按阈值改用列式存储"""
+
+    def fill(self, manager, answers):
+        """创建一个对话并追加若干问答"""
+        conv_id = manager.create_conversation("部署")
+        for i in range(answers):
+            manager.add_message(conv_id, "assistant", f"第{i}步继续吗", "question")
+            manager.add_message(conv_id, "user", f"继续{i}", "answer")
+        return conv_id
+
+    def test_threshold(self):
+        """测试达到阈值后改用列式存储，历史、分页和用户回答不变"""
+        plain = ConversationManager()
+        columnar = ConversationManager(columnar_threshold=6)
+        plain_id = self.fill(plain, 2)
+        conv_id = self.fill(columnar, 2)
+        self.assertIsInstance(columnar.get_conversation(conv_id).messages, list)
+
+        for manager, cid in ((plain, plain_id), (columnar, conv_id)):
+            manager.add_message(cid, "assistant", "还要继续吗", "question")
+            manager.add_message(cid, "user", "不用了", "answer")
+        self.assertIsInstance(
+            columnar.get_conversation(conv_id).messages, MessageColumns
+        )
+        self.assertEqual(columnar.get_memory_stats()["columnar"], 1)
+
+        def strip(history):
+            return [
+                (m["seq"], m["sender"], m["content"], m["message_type"])
+                for m in history
+            ]
+
+        self.assertEqual(
+            strip(columnar.get_conversation_history(conv_id)),
+            strip(plain.get_conversation_history(plain_id)),
+        )
+        page = columnar.get_history_page(conv_id, limit=2, order="desc")
+        self.assertEqual(
+            [m["content"] for m in page["messages"]], ["不用了", "还要继续吗"]
+        )
+        self.assertEqual(
+            list(columnar.iter_user_answers()), ["继续0", "继续1", "不用了"]
+        )
+        self.assertEqual(columnar.read_message_content(conv_id, 7)["content"], "不用了")
+
+    def test_iter_user_answers_after(self):
+        """测试只返回指定时间之后的用户回答"""
+        for manager in (
+            ConversationManager(),
+            ConversationManager(columnar_threshold=2),
+        ):
+            self.fill(manager, 2)
+            self.assertEqual(
+                list(manager.iter_user_answers(after="2000-01-01 00:00:00")),
+                ["继续0", "继续1"],
+            )
+            self.assertEqual(
+                list(manager.iter_user_answers(after="2999-01-01 00:00:00")), []
+            )
+            self.assertEqual(
+                manager.find_similar_questions("第1步继续吗", limit=1)[0]["answer"],
+                "继续1",
+            )
+
+    def test_reload_from_store(self):
+        """测试从存储读回的大对话直接使用列式存储"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "conversations.db")
+            store = SQLiteConversationStore(path)
+            manager = ConversationManager(store=store)
+            conv_id = self.fill(manager, 5)
+            expected = manager.get_conversation_history(conv_id)
+            store.close()
+
+            store = SQLiteConversationStore(path)
+            reopened = ConversationManager(
+                store=store, background_load=False, columnar_threshold=5
+            )
+            self.assertEqual(reopened.get_conversation_history(conv_id), expected)
+            self.assertIsInstance(
+                reopened.get_conversation(conv_id).messages, MessageColumns
+            )
+            reopened.add_message(conv_id, "user", "结束", "answer")
+            store.close()
+
+            store = SQLiteConversationStore(path)
+            history = ConversationManager(store=store).get_conversation_history(conv_id)
+            self.assertEqual(history[:-1], expected)
+            self.assertEqual((history[-1]["seq"], history[-1]["content"]), (12, "结束"))
+            store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+紧凑消息表示测试
+
+测试 CompactMessage 与 ConversationMessage 的属性和字典一致、无法编码的值原样保存，
+以及管理器启用紧凑表示后历史、导出文件和存储读回的结果不变。
+"""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+import uuid
+from dataclasses import asdict
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from interactive_mcp_popup.compact import CompactMessage
+from interactive_mcp_popup.conversation import (
+    ConversationManager,
+    ConversationMessage,
+    estimate_message_bytes,
+    message_to_dict,
+)
+from interactive_mcp_popup.oplog import JsonlConversationStore
+from interactive_mcp_popup.sqlite_store import SQLiteConversationStore
+
+
+class TestCompactMessage(unittest.TestCase):
+    """测试紧凑消息"""
+
+    def make(self, **kwargs):
+        """创建一条数据类消息"""
+        values = {
+            "id": str(uuid.uuid4()),
+            "conversation_id": str(uuid.uuid4()),
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "sender": "user",
+            "content": "是的，继续部署",
+            "message_type": "answer",
+            "seq": 3,
+        }
+        values.update(kwargs)
+        return ConversationMessage(**values)
+
+    def test_round_trip(self):
+        """测试各种发送者和类型组合的属性与字典一致"""
+        for sender in ("user", "assistant", "system"):
+            for message_type in ("question", "answer", "system"):
+                message = self.make(sender=sender, message_type=message_type)
+                compact = CompactMessage.from_message(message)
+                self.assertEqual(message_to_dict(compact), asdict(message))
+                self.assertEqual(
+                    (compact.sender, compact.message_type), (sender, message_type)
+                )
+
+    def test_encoded_fields(self):
+        """测试ID、时间戳和发送者/类型被编码"""
+        compact = CompactMessage.from_message(
+            self.make(timestamp="2026-03-01 08:05:09")
+        )
+        self.assertIsInstance(compact._id, bytes)
+        self.assertEqual(len(compact._id), 16)
+        self.assertIsInstance(compact.epoch, int)
+        self.assertIsInstance(compact._codes, int)
+        self.assertEqual(compact.timestamp, "2026-03-01 08:05:09")
+        self.assertFalse(hasattr(compact, "__dict__"))
+
+    def test_fallbacks(self):
+        """测试无法编码的值原样保存"""
+        message = self.make(
+            id="msg-1",
+            timestamp="2026-03-01T08:05:09Z",
+            sender="tool",
+            message_type="note",
+        )
+        compact = CompactMessage.from_message(message)
+        self.assertEqual(message_to_dict(compact), asdict(message))
+        # 大写的 UUID 和不补零的时间不能还原为同一字符串
+        for kwargs in (
+            {"id": str(uuid.uuid4()).upper()},
+            {"timestamp": "2026-3-1 8:05:09"},
+        ):
+            message = self.make(**kwargs)
+            self.assertEqual(
+                message_to_dict(CompactMessage.from_message(message)), asdict(message)
+            )
+
+    def test_shared_conversation_id(self):
+        """测试同一对话的消息共享对话ID字符串"""
+        conv_id = str(uuid.uuid4())
+        first = CompactMessage.from_message(self.make(conversation_id="".join(conv_id)))
+        second = CompactMessage.from_message(
+            self.make(conversation_id="".join(conv_id))
+        )
+        self.assertIs(first.conversation_id, second.conversation_id)
+
+    def test_estimate(self):
+        """测试紧凑消息的估算大小更小"""
+        message = self.make()
+        self.assertLess(
+            estimate_message_bytes(CompactMessage.from_message(message)),
+            estimate_message_bytes(message),
+        )
+
+
+class TestCompactManager(unittest.TestCase):
+    """测试管理器启用紧凑表示"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """清理测试环境"""
+        self.temp_dir.cleanup()
+
+    def fill(self, manager):
+        """创建两个对话，返回对话ID"""
+        ids = []
+        for i in range(2):
+            conv_id = manager.create_conversation(f"对话{i}")
+            manager.add_message(conv_id, "assistant", f"要继续第{i}步吗", "question")
+            manager.add_message(conv_id, "user", "继续", "answer")
+            ids.append(conv_id)
+        return ids
+
+    def test_messages_are_compact(self):
+        """测试新建和追加的消息使用紧凑表示，历史与普通管理器相同"""
+        manager = ConversationManager(compact_messages=True)
+        conv_id = self.fill(manager)[0]
+        messages = manager.get_conversation(conv_id).messages
+        self.assertTrue(
+            all(isinstance(message, CompactMessage) for message in messages)
+        )
+
+        history = manager.get_conversation_history(conv_id)
+        self.assertEqual([item["seq"] for item in history], [1, 2, 3])
+        self.assertEqual(
+            set(history[0]),
+            {
+                "id",
+                "conversation_id",
+                "timestamp",
+                "sender",
+                "content",
+                "message_type",
+                "seq",
+            },
+        )
+        self.assertEqual(
+            manager.find_similar_questions("要继续第0步吗", limit=1)[0]["answer"],
+            "继续",
+        )
+
+    def test_export_matches(self):
+        """测试导出文件可被普通管理器读入，读入紧凑管理器时转换为紧凑表示"""
+        manager = ConversationManager(compact_messages=True)
+        ids = self.fill(manager)
+        path = os.path.join(self.temp_dir.name, "export.json")
+        self.assertTrue(manager.save_to_file(path))
+
+        plain = ConversationManager()
+        self.assertTrue(plain.load_from_file(path))
+        compact = ConversationManager(compact_messages=True)
+        self.assertTrue(compact.load_from_file(path))
+        for conv_id in ids:
+            expected = manager.get_conversation_history(conv_id)
+            self.assertEqual(plain.get_conversation_history(conv_id), expected)
+            self.assertEqual(compact.get_conversation_history(conv_id), expected)
+            self.assertIsInstance(
+                compact.get_conversation(conv_id).messages[0], CompactMessage
+            )
+
+    def test_stores(self):
+        """测试写入存储后重新打开，读回的消息为紧凑表示且内容不变"""
+        stores = (
+            lambda: SQLiteConversationStore(
+                os.path.join(self.temp_dir.name, "conversations.db")
+            ),
+            lambda: JsonlConversationStore(os.path.join(self.temp_dir.name, "log")),
+        )
+        for open_store in stores:
+            store = open_store()
+            manager = ConversationManager(
+                store=store, background_load=False, compact_messages=True
+            )
+            ids = self.fill(manager)
+            expected = {
+                conv_id: manager.get_conversation_history(conv_id) for conv_id in ids
+            }
+            store.close()
+
+            store = open_store()
+            reopened = ConversationManager(
+                store=store, background_load=False, compact_messages=True
+            )
+            for conv_id in ids:
+                self.assertEqual(
+                    reopened.get_conversation_history(conv_id), expected[conv_id]
+                )
+                self.assertIsInstance(
+                    reopened.get_conversation(conv_id).messages[-1], CompactMessage
+                )
+            store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
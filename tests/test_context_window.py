@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+对话上下文窗口测试
+
+测试 token 估算、预算内的最近消息和分段摘要，以及缓存只处理新消息。
+"""
+
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from interactive_mcp_popup import context_window
+from interactive_mcp_popup.context_window import estimate_tokens
+from interactive_mcp_popup.conversation import ConversationManager
+
+
+class TestEstimateTokens(unittest.TestCase):
+    """测试 token 估算"""
+
+    def test_estimate(self):
+        """测试中英文估算"""
+        self.assertEqual(estimate_tokens("部署到生产"), 5)
+        self.assertEqual(estimate_tokens("deploy"), 2)
+        self.assertEqual(estimate_tokens(""), 1)
+
+
+class TestContextWindow(unittest.TestCase):
+    """测试预算内的对话视图"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.manager = ConversationManager()
+        self.conv_id = self.manager.create_conversation("长对话")
+        for index in range(1, 25):
+            self.manager.add_message(
+                self.conv_id,
+                "assistant",
+                f"第{index}轮问题：" + "细节" * 50,
+                "question",
+            )
+            self.manager.add_message(self.conv_id, "user", f"第{index}轮回答", "answer")
+
+    def test_unlimited_budget(self):
+        """测试预算足够时返回全部原文"""
+        view = self.manager.get_context_view(self.conv_id)
+        self.assertEqual(len(view["messages"]), 49)
+        self.assertEqual(view["summaries"], [])
+        self.assertIsNone(view["omitted"])
+
+    def test_recent_verbatim_and_summaries(self):
+        """测试最近的消息原文，更早的消息用摘要代替"""
+        view = self.manager.get_context_view(self.conv_id, max_tokens=1500)
+
+        seqs = [m["seq"] for m in view["messages"]]
+        self.assertEqual(seqs, list(range(seqs[0], 50)))
+        self.assertEqual(view["messages"][-1]["content"], "第24轮回答")
+        self.assertLessEqual(view["used_tokens"], 1500)
+
+        # 摘要与原文首尾相接，不重叠
+        self.assertTrue(view["summaries"])
+        self.assertEqual(view["summaries"][-1]["to_seq"] + 1, seqs[0])
+        for previous, current in zip(
+            view["summaries"], view["summaries"][1:], strict=False
+        ):
+            self.assertEqual(previous["to_seq"] + 1, current["from_seq"])
+        self.assertIn("问: 第", view["summaries"][-1]["summary"])
+
+    def test_tight_budget_omits_oldest(self):
+        """测试预算很小时省略最早的部分"""
+        view = self.manager.get_context_view(self.conv_id, max_chars=40)
+        self.assertLessEqual(view["used_chars"], 40)
+        self.assertEqual(view["omitted"]["from_seq"], 1)
+        self.assertGreater(view["omitted"]["to_seq"], 0)
+
+    def test_oversized_latest_message_is_truncated(self):
+        """测试最新一条消息超出预算时截断"""
+        self.manager.add_message(self.conv_id, "user", "日志" * 5000, "answer")
+        view = self.manager.get_context_view(self.conv_id, max_tokens=100)
+
+        self.assertEqual(len(view["messages"]), 1)
+        self.assertTrue(view["messages"][0]["content_truncated"])
+        self.assertLessEqual(view["used_tokens"], 100)
+
+    def test_cache_only_processes_new_messages(self):
+        """测试重复调用只估算新消息，已完成分段的摘要只生成一次"""
+        self.manager.get_context_view(self.conv_id, max_tokens=50)
+
+        with (
+            patch.object(
+                context_window, "estimate_tokens", wraps=estimate_tokens
+            ) as estimate,
+            patch.object(
+                context_window,
+                "summarize_messages",
+                wraps=context_window.summarize_messages,
+            ) as summarize,
+        ):
+            self.manager.get_context_view(self.conv_id, max_tokens=50)
+            self.assertEqual(estimate.call_count, summarize.call_count)
+
+            estimate.reset_mock()
+            summarize.reset_mock()
+            self.manager.add_message(self.conv_id, "assistant", "新问题", "question")
+            self.manager.get_context_view(self.conv_id)
+            # 只估算新消息，新消息补齐了第 5 段，生成一次摘要
+            self.assertEqual(estimate.call_count, 2)
+            self.assertEqual(summarize.call_count, 1)
+
+    def test_missing_conversation(self):
+        """测试对话不存在"""
+        self.assertIsNone(self.manager.get_context_view("non-existent"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -257,7 +257,143 @@ class TestConversationManager(unittest.TestCase):
         """测试获取不存在对话的历史"""
         history = self.manager.get_conversation_history("non-existent")
         self.assertEqual(history, [])
-    
+
+    def make_long_conversation(self, count=10):
+        """创建包含系统消息和 count 条问题的对话"""
+        conv_id = self.manager.create_conversation("分页主题")
+        for index in range(count):
+            self.manager.add_message(conv_id, "assistant", f"问题{index}", "question")
+        return conv_id
+
+    def test_history_page_ascending(self):
+        """测试从旧到新分页"""
+        conv_id = self.make_long_conversation()
+
+        first = self.manager.get_history_page(conv_id, limit=4)
+        self.assertEqual([m["index"] for m in first["messages"]], [0, 1, 2, 3])
+        self.assertEqual(first["total_messages"], 11)
+        self.assertTrue(first["has_more"])
+        self.assertEqual(first["next_cursor"], 3)
+
+        pages = [first]
+        while pages[-1]["has_more"]:
+            pages.append(self.manager.get_history_page(conv_id, limit=4, after=pages[-1]["next_cursor"]))
+        indexes = [m["index"] for page in pages for m in page["messages"]]
+        self.assertEqual(indexes, list(range(11)))
+        self.assertIsNone(pages[-1]["next_cursor"])
+
+    def test_history_page_descending(self):
+        """测试从新到旧分页"""
+        conv_id = self.make_long_conversation()
+
+        first = self.manager.get_history_page(conv_id, limit=3, order="desc")
+        self.assertEqual([m["content"] for m in first["messages"]], ["问题9", "问题8", "问题7"])
+
+        second = self.manager.get_history_page(conv_id, limit=3, order="desc", before=first["next_cursor"])
+        self.assertEqual([m["index"] for m in second["messages"]], [7, 6, 5])
+
+        window = self.manager.get_history_page(conv_id, limit=10, order="desc", before=5, after=2)
+        self.assertEqual([m["index"] for m in window["messages"]], [4, 3])
+        self.assertFalse(window["has_more"])
+
+    def test_history_page_fields(self):
+        """测试只返回所选字段"""
+        conv_id = self.make_long_conversation(2)
+
+        page = self.manager.get_history_page(conv_id, fields=["sender", "content"])
+        self.assertEqual(page["messages"][1], {"index": 1, "sender": "assistant", "content": "问题0", "content_length": 3})
+
+        full = self.manager.get_history_page(conv_id)
+        self.assertEqual(full["messages"][1]["conversation_id"], conv_id)
+
+    def test_since_seq_delta(self):
+        """测试按序号增量同步"""
+        conv_id = self.make_long_conversation(3)
+        version = self.manager.get_conversation_version(conv_id)
+        self.assertEqual(version["latest_seq"], 4)
+
+        empty = self.manager.get_history_page(conv_id, since_seq=version["latest_seq"])
+        self.assertEqual(empty["messages"], [])
+        self.assertFalse(empty["has_more"])
+
+        self.manager.add_message(conv_id, "user", "新回答", "answer")
+        delta = self.manager.get_history_page(conv_id, since_seq=version["latest_seq"], order="desc")
+        self.assertEqual([(m["seq"], m["content"]) for m in delta["messages"]], [(5, "新回答")])
+        self.assertEqual(delta["latest_seq"], 5)
+        self.assertIsNone(self.manager.get_conversation_version("non-existent"))
+
+    def test_seq_assigned_on_load(self):
+        """测试加载没有序号的旧文件时补齐序号"""
+        data = {"conversations": {"old": {
+            "id": "old", "topic": "旧对话", "context": "", "created_at": "2025-01-12 10:00:00",
+            "updated_at": "2025-01-12 10:00:00", "status": "active",
+            "messages": [
+                {"id": f"m{index}", "conversation_id": "old", "timestamp": "2025-01-12 10:00:00",
+                 "sender": "user", "content": f"消息{index}", "message_type": "answer"}
+                for index in range(3)
+            ]
+        }}}
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False, encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        try:
+            self.assertTrue(self.manager.load_from_file(f.name))
+        finally:
+            os.unlink(f.name)
+
+        self.assertEqual([m.seq for m in self.manager.conversations["old"].messages], [1, 2, 3])
+        self.manager.add_message("old", "assistant", "继续", "question")
+        self.assertEqual(self.manager.get_conversation_version("old")["latest_seq"], 4)
+
+    def test_large_content_preview(self):
+        """测试超过预览长度的内容只返回预览和长度"""
+        conv_id = self.manager.create_conversation("日志", "文件内容" * 1000)
+        log = "\n".join(f"第{index}行日志" for index in range(5000))
+        self.manager.add_message(conv_id, "user", log, "answer")
+        self.manager.add_message(conv_id, "user", "短回答", "answer")
+
+        page = self.manager.get_history_page(conv_id, max_content_chars=200)
+        large, small = page["messages"][1], page["messages"][2]
+        self.assertEqual(len(large["content"]), 200)
+        self.assertTrue(large["content_truncated"])
+        self.assertEqual(large["content_length"], len(log))
+        self.assertEqual(small["content"], "短回答")
+        self.assertNotIn("content_truncated", small)
+
+        history = self.manager.get_conversation_history(conv_id, max_content_chars=200)
+        self.assertTrue(history[1]["content_truncated"])
+        self.assertEqual(self.manager.get_conversation_history(conv_id)[1]["content"], log)
+
+        listing = self.manager.query_conversations(max_context_chars=100)["conversations"][0]
+        self.assertEqual((len(listing["context"]), listing["context_length"]), (100, 4000))
+
+    def test_read_message_content_chunks(self):
+        """测试按字符范围分段读取消息内容"""
+        conv_id = self.manager.create_conversation("日志")
+        log = "".join(f"日志{index};" for index in range(3000))
+        self.manager.add_message(conv_id, "user", log, "answer")
+
+        chunks = []
+        offset = 0
+        while offset is not None:
+            chunk = self.manager.read_message_content(conv_id, 2, offset, 5000)
+            chunks.append(chunk["content"])
+            offset = chunk["next_offset"]
+        self.assertEqual("".join(chunks), log)
+        self.assertEqual(chunk["total_length"], len(log))
+
+        self.assertIsNone(self.manager.read_message_content(conv_id, 3))
+        self.assertIsNone(self.manager.read_message_content("non-existent", 1))
+        self.assertEqual(self.manager.read_message_content(conv_id, 2, len(log) + 10)["content"], "")
+
+    def test_history_page_invalid(self):
+        """测试无效参数"""
+        conv_id = self.make_long_conversation(1)
+        self.assertIsNone(self.manager.get_history_page("non-existent"))
+        with self.assertRaises(ValueError):
+            self.manager.get_history_page(conv_id, order="random")
+        with self.assertRaises(ValueError):
+            self.manager.get_history_page(conv_id, fields=["password"])
+
     def test_delete_conversation(self):
         """测试删除对话"""
         conv_id = self.manager.create_conversation("测试主题")
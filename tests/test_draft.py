@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+回答草稿测试
+
+测试草稿增量的计算与回放、版本号，以及通过等待中弹窗推送草稿。
+"""
+
+import asyncio
+import os
+import sys
+import unittest
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from interactive_mcp_popup.draft import (
+    DraftBuffer,
+    apply_draft_diff,
+    compute_draft_diff,
+)
+from interactive_mcp_popup.pending import PendingPopupRegistry
+
+
+class TestDraftDiff(unittest.TestCase):
+    """测试草稿增量"""
+
+    def test_append(self):
+        """测试追加只传新增部分"""
+        diff = compute_draft_diff("使用 main", "使用 main 分支")
+        self.assertEqual(diff, {"offset": 7, "delete": 0, "insert": " 分支"})
+
+    def test_replace_middle(self):
+        """测试替换中间内容"""
+        diff = compute_draft_diff("deploy to staging now", "deploy to prod now")
+        self.assertEqual(diff["insert"], "prod")
+        self.assertEqual(
+            apply_draft_diff("deploy to staging now", diff), "deploy to prod now"
+        )
+
+    def test_repeated_characters(self):
+        """测试重复字符时前后缀不重叠"""
+        for old, new in [
+            ("aaa", "aaaa"),
+            ("aaaa", "aa"),
+            ("abab", "ab"),
+            ("", "x"),
+            ("x", ""),
+        ]:
+            self.assertEqual(apply_draft_diff(old, compute_draft_diff(old, new)), new)
+
+
+class TestDraftBuffer(unittest.TestCase):
+    """测试草稿缓冲"""
+
+    def test_since_returns_only_newer_diffs(self):
+        """测试只返回比已收到版本新的增量"""
+        draft = DraftBuffer()
+        draft.update("选")
+        draft.update("选 A")
+        draft.update("选 A，因为")
+
+        first = draft.since(0)
+        self.assertEqual(first["text"], "选 A，因为")
+        self.assertEqual(first["version"], 3)
+
+        update = draft.since(1)
+        text = "选"
+        for diff in update["diffs"]:
+            text = apply_draft_diff(text, diff)
+        self.assertEqual(text, "选 A，因为")
+        self.assertEqual(draft.since(3)["diffs"], [])
+
+    def test_unchanged_text_ignored(self):
+        """测试内容不变时不增加版本"""
+        draft = DraftBuffer()
+        draft.update("abc")
+        self.assertIsNone(draft.update("abc"))
+        self.assertEqual(draft.version, 1)
+
+    def test_history_trimmed_falls_back_to_text(self):
+        """测试增量被淘汰后返回全文"""
+        draft = DraftBuffer(max_history=2)
+        for text in ["a", "ab", "abc", "abcd"]:
+            draft.update(text)
+        self.assertEqual(draft.since(1)["text"], "abcd")
+        self.assertEqual(len(draft.since(2)["diffs"]), 2)
+
+    def test_finish(self):
+        """测试提交后标记完成"""
+        draft = DraftBuffer()
+        draft.update("好的 ")
+        draft.finish("好的")
+        self.assertTrue(draft.done)
+        self.assertEqual(draft.text, "好的")
+        self.assertIsNone(draft.update("再改"))
+
+
+class TestDraftStreaming(unittest.TestCase):
+    """测试通过等待中弹窗推送草稿"""
+
+    def test_stream_draft(self):
+        """测试输入过程中推送增量，提交时标记完成"""
+        typed = ["需要", "需要先备份", "需要先备份数据库"]
+
+        async def popup(question, context="", draft_callback=None, **kwargs):
+            for text in typed:
+                await asyncio.sleep(0.01)
+                draft_callback(text)
+            await asyncio.sleep(0.01)
+            return {
+                "question": question,
+                "context": context,
+                "answer": typed[-1],
+                "status": "answered",
+            }
+
+        registry = PendingPopupRegistry(popup_factory=popup, heartbeat_interval=1.0)
+        updates = []
+
+        async def on_draft(pending, update):
+            updates.append(update)
+
+        async def run():
+            result, popup_info, _ = await registry.ask(
+                "k", "问题", stream_draft=True, on_draft=on_draft
+            )
+            return result, popup_info
+
+        result, popup_info = asyncio.run(run())
+        self.assertEqual(result["answer"], "需要先备份数据库")
+        self.assertTrue(popup_info.draft.done)
+
+        # 首次推送全文，之后只推送增量
+        text = updates[0]["text"]
+        for update in updates[1:]:
+            for diff in update["diffs"]:
+                text = apply_draft_diff(text, diff)
+        self.assertEqual(text, "需要先备份数据库")
+        self.assertNotIn("text", updates[-1])
+
+    def test_get_draft(self):
+        """测试轮询草稿"""
+
+        async def popup(question, context="", draft_callback=None, **kwargs):
+            draft_callback("部分回答")
+            await asyncio.sleep(0.05)
+            return None
+
+        registry = PendingPopupRegistry(popup_factory=popup, heartbeat_interval=1.0)
+
+        async def run():
+            task = asyncio.ensure_future(registry.ask("k", "问题", stream_draft=True))
+            await asyncio.sleep(0.01)
+            popup_id = registry.list_pending()[0]["popup_id"]
+            draft = registry.get_draft(popup_id)
+            await task
+            return draft
+
+        draft = asyncio.run(run())
+        self.assertEqual(draft["text"], "部分回答")
+        self.assertFalse(draft["done"])
+        self.assertIsNone(registry.get_draft("missing"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+对话消息热集合测试
+
+测试超出内存预算时释放最久未访问的对话、释放后透明读回、
+元数据查询不读入消息、读回后相似问题索引不重复、追加消息期间对话不会被释放，以及逐个对话写出的导出文件格式不变。
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+from dataclasses import asdict
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from interactive_mcp_popup.conversation import (
+    ConversationManager,
+    estimate_message_bytes,
+)
+from interactive_mcp_popup.oplog import JsonlConversationStore
+from interactive_mcp_popup.sqlite_store import SQLiteConversationStore
+
+CONTENT = "部署日志" * 500
+
+
+class TestHotSet(unittest.TestCase):
+    """测试 SQLite 存储下的热集合"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = SQLiteConversationStore(
+            os.path.join(self.temp_dir.name, "conversations.db")
+        )
+        self.manager = ConversationManager(store=self.store)
+        self.ids = []
+        for i in range(6):
+            conv_id = self.manager.create_conversation(f"对话{i}")
+            self.manager.add_message(
+                conv_id, "assistant", f"第{i}个问题：要继续部署吗", "question"
+            )
+            self.manager.add_message(conv_id, "user", CONTENT, "answer")
+            self.ids.append(conv_id)
+        self.expected = {
+            conv_id: self.manager.get_conversation_history(conv_id)
+            for conv_id in self.ids
+        }
+        per_conversation = self.manager.get_memory_stats()["hot_bytes"] // 6
+        # 预算约能容纳两个对话
+        self.manager.memory_budget = per_conversation * 2 + per_conversation // 2
+
+    def tearDown(self):
+        """清理测试环境"""
+        self.store.close()
+        self.temp_dir.cleanup()
+
+    def test_evicts_least_recently_used(self):
+        """测试超出预算时释放最久未访问的对话"""
+        for conv_id in self.ids:
+            self.manager.get_conversation(conv_id)
+
+        stats = self.manager.get_memory_stats()
+        self.assertLessEqual(stats["hot_bytes"], self.manager.memory_budget)
+        self.assertEqual(stats["resident"], 2)
+        self.assertEqual(self.manager.conversations[self.ids[0]].messages, [])
+        self.assertTrue(self.manager.conversations[self.ids[-1]].messages)
+
+        # 访问第 5 个后再访问第 1 个，被释放的是第 6 个
+        self.manager.get_conversation(self.ids[4])
+        self.manager.get_conversation(self.ids[0])
+        self.assertEqual(self.manager.conversations[self.ids[5]].messages, [])
+        self.assertTrue(self.manager.conversations[self.ids[4]].messages)
+
+    def test_transparent_reload(self):
+        """测试释放后读回的历史与原来一致，追加的序号连续"""
+        for conv_id in self.ids:
+            self.manager.get_conversation(conv_id)
+        for conv_id in self.ids:
+            self.assertEqual(
+                self.manager.get_conversation_history(conv_id), self.expected[conv_id]
+            )
+
+        first = self.ids[0]
+        self.manager.get_conversation(self.ids[1])
+        self.manager.get_conversation(self.ids[2])
+        self.assertEqual(self.manager.conversations[first].messages, [])
+        self.manager.add_message(first, "assistant", "还有问题吗", "question")
+        self.assertEqual(self.manager.get_conversation_version(first)["latest_seq"], 4)
+        self.assertEqual(
+            [m.seq for m in self.manager.get_conversation(first).messages], [1, 2, 3, 4]
+        )
+
+    def test_add_message_holds_body(self):
+        """测试追加消息时从读入到写入存储一直持有锁，其他线程不能在期间释放这个对话"""
+        first = self.ids[0]
+        for conv_id in self.ids[1:]:
+            self.manager.get_conversation(conv_id)
+        self.assertEqual(self.manager.conversations[first].messages, [])
+
+        persisted = []
+        add_message = self.store.add_message
+
+        def record(conversation, message):
+            persisted.append(
+                (self.manager._body_lock.locked(), len(conversation.messages))
+            )
+            add_message(conversation, message)
+
+        self.store.add_message = record
+        self.manager.add_message(first, "assistant", "还有问题吗", "question")
+        self.assertEqual(persisted, [(True, 4)])
+        self.assertEqual(
+            [m.seq for m in self.manager.get_conversation(first).messages], [1, 2, 3, 4]
+        )
+
+    def test_metadata_queries_do_not_load(self):
+        """测试列表和版本查询使用记录的消息数，不读入消息"""
+        for conv_id in self.ids:
+            self.manager.get_conversation(conv_id)
+        resident = self.manager.get_memory_stats()["resident"]
+
+        page = self.manager.query_conversations(
+            fields=["id", "message_count"], limit=10
+        )
+        self.assertEqual({item["message_count"] for item in page["conversations"]}, {3})
+        self.assertEqual(
+            self.manager.get_conversation_version(self.ids[0])["latest_seq"], 3
+        )
+        self.assertEqual(self.manager.get_memory_stats()["resident"], resident)
+
+    def test_reload_does_not_duplicate_index(self):
+        """测试读回的对话不会重复加入相似问题索引"""
+        for _ in range(2):
+            for conv_id in self.ids:
+                self.manager.get_conversation(conv_id)
+        results = self.manager.find_similar_questions(
+            "第0个问题：要继续部署吗", limit=10, min_score=0.9
+        )
+        self.assertEqual(len(results), 1)
+
+    def test_save_to_file_streams(self):
+        """测试逐个对话写出的导出文件与 json.dump 的格式相同，且不超出预算"""
+        path = os.path.join(self.temp_dir.name, "export.json")
+        self.assertTrue(self.manager.save_to_file(path))
+        self.assertLessEqual(
+            self.manager.get_memory_stats()["hot_bytes"], self.manager.memory_budget
+        )
+
+        reference = ConversationManager()
+        reference.load_from_file(path)
+        expected = {
+            "conversations": {
+                c.id: asdict(c) for c in reference.get_all_conversations()
+            }
+        }
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual(
+                f.read(), json.dumps(expected, ensure_ascii=False, indent=2)
+            )
+
+    def test_save_empty(self):
+        """测试没有对话时的导出文件"""
+        path = os.path.join(self.temp_dir.name, "empty.json")
+        self.assertTrue(ConversationManager().save_to_file(path))
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual(f.read(), json.dumps({"conversations": {}}, indent=2))
+
+    def test_estimate(self):
+        """测试消息内存估算随内容增长"""
+        small, large = self.manager.get_conversation(self.ids[0]).messages[1:3]
+        self.assertLess(estimate_message_bytes(small), estimate_message_bytes(large))
+
+
+class TestJsonlHotSet(unittest.TestCase):
+    """测试操作日志存储下的热集合"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = JsonlConversationStore(self.temp_dir.name)
+        self.manager = ConversationManager(
+            store=self.store, background_load=False, memory_budget=1
+        )
+
+    def tearDown(self):
+        """清理测试环境"""
+        self.store.close()
+        self.temp_dir.cleanup()
+
+    def test_evict_after_snapshot(self):
+        """测试快照之后才能释放，读回时包含快照之后追加的消息"""
+        first = self.manager.create_conversation("第一个")
+        second = self.manager.create_conversation("第二个")
+        self.manager.add_message(first, "user", CONTENT, "answer")
+        # 还没有快照，无法释放
+        self.assertEqual(self.manager.get_memory_stats()["resident"], 2)
+
+        self.store.snapshot()
+        self.manager.add_message(first, "assistant", "继续吗", "question")
+        expected = self.manager.get_conversation_history(first)
+
+        self.manager.get_conversation(second)
+        self.assertEqual(self.manager.conversations[first].messages, [])
+        self.assertEqual(self.manager.get_conversation_history(first), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
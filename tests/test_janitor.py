@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+存储清理测试
+
+测试按时间清理、按总大小从最旧的开始清理、受保护文件和文件名匹配。
+"""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from interactive_mcp_popup.janitor import JanitorTarget, StorageJanitor
+from interactive_mcp_popup.journal import AnswerJournal
+
+
+class TestStorageJanitor(unittest.TestCase):
+    """测试存储清理器"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.temp_dir.name
+
+    def tearDown(self):
+        """清理测试环境"""
+        self.temp_dir.cleanup()
+
+    def make_file(self, name, size=100, age_days=0.0):
+        """创建指定大小和修改时间的文件"""
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        mtime = time.time() - age_days * 86400
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def make_janitor(self, targets=None, **kwargs):
+        """创建不暂停的清理器"""
+        kwargs.setdefault("batch_pause", 0)
+        return StorageJanitor(targets or [JanitorTarget(self.directory)], **kwargs)
+
+    def test_delete_old_files(self):
+        """测试删除超过天数的文件"""
+        old = self.make_file("old.json", age_days=10)
+        new = self.make_file("new.json", age_days=1)
+
+        stats = self.make_janitor(max_age_days=7).sweep()
+
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(new))
+        self.assertEqual(stats["deleted"], 1)
+        self.assertEqual(stats["freed_bytes"], 100)
+
+    def test_size_budget_deletes_oldest_first(self):
+        """测试超出总大小时从最旧的开始删除"""
+        paths = [
+            self.make_file(f"{index}.json", size=100, age_days=5 - index)
+            for index in range(5)
+        ]
+
+        stats = self.make_janitor(max_age_days=0, max_total_bytes=250).sweep()
+
+        self.assertEqual(
+            [os.path.exists(path) for path in paths], [False, False, False, True, True]
+        )
+        self.assertEqual(stats["kept_bytes"], 200)
+
+    def test_only_matching_files(self):
+        """测试只清理前缀和后缀匹配的文件"""
+        export = self.make_file("conversations-1.json", age_days=10)
+        other_json = self.make_file("settings.json", age_days=10)
+        other_suffix = self.make_file("conversations-2.txt", age_days=10)
+        os.mkdir(os.path.join(self.directory, "conversations-dir.json"))
+
+        target = JanitorTarget(self.directory, (".json",), prefix="conversations-")
+        self.make_janitor([target], max_age_days=7).sweep()
+
+        self.assertFalse(os.path.exists(export))
+        self.assertTrue(os.path.exists(other_json))
+        self.assertTrue(os.path.exists(other_suffix))
+        self.assertTrue(
+            os.path.isdir(os.path.join(self.directory, "conversations-dir.json"))
+        )
+
+    def age_all(self, days):
+        """把目录中所有文件的修改时间改到若干天前"""
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            os.utime(path, (time.time() - days * 86400,) * 2)
+
+    def test_protected_journal_segment(self):
+        """测试日志段通过日志删除，正在写入的段不会被清理，被清理的记录返回过期标记"""
+        journal = AnswerJournal(self.directory, max_segment_bytes=200)
+        for index in range(5):
+            journal.append({"answer": f"回答{index}"})
+        self.age_all(30)
+
+        target = JanitorTarget(
+            self.directory,
+            (".jsonl",),
+            prefix="answers-",
+            protect=journal.active_files,
+            remove=journal.remove_segment,
+        )
+        self.make_janitor([target], max_age_days=7).sweep()
+
+        remaining = sorted(os.listdir(self.directory))
+        self.assertEqual(
+            remaining,
+            [
+                os.path.basename(journal.segment_path(journal._segment)),
+                "answers.idx",
+                "answers.lock",
+            ],
+        )
+        self.assertEqual(journal.get(1), {"record_id": 1, "expired": True})
+        self.assertEqual(journal.get(5)["answer"], "回答4")
+        self.assertIsNone(journal.get(6))
+        self.assertEqual(journal.append({"answer": "继续"})["record_id"], 6)
+        self.assertEqual(journal.get(6)["answer"], "继续")
+        journal.close()
+
+    def test_journal_segment_rotated_by_other_writer(self):
+        """测试另一个写入者已轮转到的段也不会被清理"""
+        journal = AnswerJournal(self.directory, max_segment_bytes=200)
+        journal.append({"answer": "回答"})
+        other = AnswerJournal(self.directory, max_segment_bytes=200)
+        for index in range(5):
+            other.append({"answer": f"其他回答{index}"})
+        self.age_all(30)
+
+        # journal 记录的当前段已经过时，删除前按索引重新确定
+        target = JanitorTarget(
+            self.directory,
+            (".jsonl",),
+            prefix="answers-",
+            protect=journal.active_files,
+            remove=journal.remove_segment,
+        )
+        self.make_janitor([target], max_age_days=7).sweep()
+
+        self.assertTrue(os.path.exists(other.segment_path(other._segment)))
+        self.assertEqual(journal.get(6)["answer"], "其他回答4")
+        # 两个写入者都已写满的中间段被清理
+        self.assertTrue(journal.get(3)["expired"])
+        self.assertEqual(other.append({"answer": "继续"})["record_id"], 7)
+        journal.close()
+        other.close()
+
+    def test_missing_directory(self):
+        """测试目录不存在时跳过"""
+        target = JanitorTarget(os.path.join(self.directory, "missing"))
+        self.assertEqual(self.make_janitor([target]).sweep()["scanned"], 0)
+
+    def test_many_files_in_batches(self):
+        """测试分批处理大量文件"""
+        for index in range(120):
+            self.make_file(f"{index}.json", size=10, age_days=10)
+
+        stats = self.make_janitor(max_age_days=7, batch_size=25).sweep()
+
+        self.assertEqual(stats["scanned"], 120)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_start_and_stop(self):
+        """测试后台线程启动和停止"""
+        old = self.make_file("old.json", age_days=10)
+        janitor = self.make_janitor(max_age_days=7, initial_delay=0, interval=3600)
+        janitor.start()
+        deadline = time.time() + 5
+        while os.path.exists(old) and time.time() < deadline:
+            time.sleep(0.01)
+        janitor.stop()
+
+        self.assertFalse(os.path.exists(old))
+        self.assertEqual(janitor.last_sweep["deleted"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+回答日志测试
+
+测试追加、按ID查找、按大小轮转、崩溃后的索引恢复，以及多个进程同时追加。
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from interactive_mcp_popup.journal import AnswerJournal
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), "..", "src")
+
+
+def make_result(answer):
+    """构造弹窗结果"""
+    return {
+        "question": "使用哪个分支？",
+        "context": "",
+        "answer": answer,
+        "status": "answered",
+    }
+
+
+class TestAnswerJournal(unittest.TestCase):
+    """测试回答日志"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.temp_dir.name
+
+    def tearDown(self):
+        """清理测试环境"""
+        self.temp_dir.cleanup()
+
+    def test_append_and_get(self):
+        """测试追加和按ID查找"""
+        journal = AnswerJournal(self.directory)
+        first = journal.append(make_result("main"))
+        second = journal.append(make_result("release/2.0"))
+
+        self.assertEqual((first["record_id"], second["record_id"]), (1, 2))
+        self.assertEqual(first["offset"], 0)
+        self.assertGreater(second["offset"], 0)
+        self.assertEqual(journal.get(2)["answer"], "release/2.0")
+        self.assertEqual(journal.get(1)["record_id"], 1)
+        self.assertIsNone(journal.get(3))
+        self.assertIsNone(journal.get(0))
+        journal.close()
+
+    def test_single_file_for_many_answers(self):
+        """测试多个回答写入同一个文件"""
+        journal = AnswerJournal(self.directory)
+        for index in range(50):
+            journal.append(make_result(f"回答{index}"))
+        journal.close()
+
+        files = sorted(os.listdir(self.directory))
+        self.assertEqual(files, ["answers-000001.jsonl", "answers.idx", "answers.lock"])
+
+    def test_rotation(self):
+        """测试按大小轮转，轮转后旧记录仍可查找"""
+        journal = AnswerJournal(self.directory, max_segment_bytes=300)
+        records = [journal.append(make_result(f"回答{index}")) for index in range(10)]
+
+        self.assertGreater(records[-1]["segment"], 1)
+        for index, record in enumerate(records):
+            self.assertEqual(journal.get(record["record_id"])["answer"], f"回答{index}")
+        journal.close()
+
+    def test_reopen_continues_ids(self):
+        """测试重新打开后ID连续"""
+        journal = AnswerJournal(self.directory, max_segment_bytes=300)
+        for index in range(5):
+            journal.append(make_result(f"回答{index}"))
+        journal.close()
+
+        reopened = AnswerJournal(self.directory, max_segment_bytes=300)
+        self.assertEqual(len(reopened), 5)
+        self.assertEqual(reopened.append(make_result("新回答"))["record_id"], 6)
+        self.assertEqual(reopened.get(6)["answer"], "新回答")
+        self.assertEqual(reopened.get(3)["answer"], "回答2")
+        reopened.close()
+
+    def test_recover_missing_index_entries(self):
+        """测试日志已写入但索引未写入时恢复"""
+        journal = AnswerJournal(self.directory)
+        for index in range(3):
+            journal.append(make_result(f"回答{index}"))
+        journal.close()
+
+        # 模拟崩溃：最后一条索引只写了一半，日志末尾还有一行写了一半
+        index_path = os.path.join(self.directory, "answers.idx")
+        with open(index_path, "r+b") as f:
+            f.truncate(os.path.getsize(index_path) - 20)
+        with open(os.path.join(self.directory, "answers-000001.jsonl"), "ab") as f:
+            f.write(b'{"record_id":4,"answ')
+
+        recovered = AnswerJournal(self.directory)
+        self.assertEqual(len(recovered), 3)
+        self.assertEqual(recovered.get(2)["answer"], "回答1")
+        self.assertEqual(recovered.get(3)["answer"], "回答2")
+        self.assertEqual(recovered.append(make_result("继续"))["record_id"], 4)
+        self.assertEqual(recovered.get(4)["answer"], "继续")
+        recovered.close()
+
+    def test_two_processes(self):
+        """测试两个进程同时追加时ID不重复，轮转后都能按ID读回"""
+        script = (
+            "import json, sys\n"
+            f"sys.path.insert(0, {os.path.abspath(SRC_DIR)!r})\n"
+            "from interactive_mcp_popup.journal import AnswerJournal\n"
+            "journal = AnswerJournal(sys.argv[1], max_segment_bytes=2000)\n"
+            "print('ready', flush=True)\n"
+            "sys.stdin.readline()\n"
+            "ids = [journal.append({'answer': f'{sys.argv[2]}-{i}'})['record_id'] for i in range(100)]\n"
+            "print(json.dumps(ids))\n"
+        )
+        processes = [
+            subprocess.Popen(
+                [sys.executable, "-c", script, self.directory, name],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                text=True,
+            )
+            for name in ("a", "b")
+        ]
+        # 两个进程都打开日志之后再同时开始追加
+        for process in processes:
+            self.assertEqual(process.stdout.readline().strip(), "ready")
+        for process in processes:
+            process.stdin.write("go\n")
+            process.stdin.flush()
+        outputs = [process.communicate(timeout=60)[0] for process in processes]
+        self.assertEqual([process.returncode for process in processes], [0, 0])
+        ids = {
+            name: json.loads(output)
+            for name, output in zip(("a", "b"), outputs, strict=True)
+        }
+        self.assertEqual(sorted(ids["a"] + ids["b"]), list(range(1, 201)))
+
+        journal = AnswerJournal(self.directory, max_segment_bytes=2000)
+        self.assertEqual(len(journal), 200)
+        for name, record_ids in ids.items():
+            for index, record_id in enumerate(record_ids):
+                record = journal.get(record_id)
+                self.assertEqual(
+                    (record["record_id"], record["answer"]),
+                    (record_id, f"{name}-{index}"),
+                )
+        self.assertGreater(journal.append(make_result("继续"))["segment"], 1)
+        journal.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+服务器指标测试
+
+测试耗时直方图、阶段记录、Prometheus 导出，以及通过中间件统计工具调用。
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from interactive_mcp_popup.metrics import (
+    LatencyHistogram,
+    MetricsMiddleware,
+    ServerMetrics,
+    phase,
+    record_phase,
+    server_metrics,
+    timed_dumps,
+)
+
+try:
+    from fastmcp import Client
+
+    from interactive_mcp_popup import server_enhanced
+
+    FASTMCP_AVAILABLE = True
+except ImportError:
+    FASTMCP_AVAILABLE = False
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    """测试耗时直方图"""
+
+    def test_observe_and_quantile(self):
+        """测试记录和分位数估算"""
+        histogram = LatencyHistogram()
+        for _ in range(90):
+            histogram.observe(0.002)
+        for _ in range(10):
+            histogram.observe(42.0)
+
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.quantile(0.5), 0.0025)
+        self.assertEqual(histogram.quantile(0.99), 42.0)
+        self.assertEqual(histogram.to_dict()["max_seconds"], 42.0)
+
+    def test_empty(self):
+        """测试空直方图"""
+        self.assertEqual(LatencyHistogram().quantile(0.95), 0.0)
+
+
+class TestServerMetrics(unittest.TestCase):
+    """测试指标记录"""
+
+    def test_record_call_computes_overhead(self):
+        """测试总耗时减去各阶段即为服务器开销"""
+        metrics = ServerMetrics()
+        metrics.observe("ask_user_popup", "think_time", 3.0)
+        metrics.record_call("ask_user_popup", 3.004, 3.0)
+
+        phases = metrics.snapshot()["tools"]["ask_user_popup"]["phases"]
+        self.assertAlmostEqual(phases["overhead"]["sum_seconds"], 0.004, places=6)
+        self.assertEqual(phases["total"]["count"], 1)
+
+    def test_phase_outside_tool_call_ignored(self):
+        """测试不在工具调用中时不记录"""
+        before = server_metrics.snapshot()
+        with phase("persistence"):
+            pass
+        record_phase("think_time", 1.0)
+        self.assertEqual(server_metrics.snapshot()["tools"], before["tools"])
+
+    def test_prometheus_export(self):
+        """测试 Prometheus 文本导出"""
+        metrics = ServerMetrics()
+        metrics.record_call("test_popup", 0.2, 0.0)
+        text = metrics.to_prometheus()
+
+        self.assertIn(
+            'interactive_mcp_popup_tool_calls_total{tool="test_popup"} 1', text
+        )
+        self.assertIn(
+            'interactive_mcp_popup_phase_seconds_bucket{tool="test_popup",phase="total",le="+Inf"} 1',
+            text,
+        )
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filepath = os.path.join(temp_dir, "metrics.prom")
+            self.assertTrue(metrics.write_prometheus(filepath))
+            with open(filepath, encoding="utf-8") as f:
+                self.assertEqual(f.read(), text)
+
+    def test_middleware_called_directly(self):
+        """测试中间件可以脱离服务器直接调用，各阶段记到当前工具"""
+        server_metrics.reset()
+        self.addCleanup(server_metrics.reset)
+
+        async def call_next(context):
+            record_phase("think_time", 0.5)
+            return "好的"
+
+        context = SimpleNamespace(message=SimpleNamespace(name="ask_user_popup"))
+        result = asyncio.run(
+            MetricsMiddleware(server_metrics).on_call_tool(context, call_next)
+        )
+        self.assertEqual(result, "好的")
+        phases = server_metrics.snapshot()["tools"]["ask_user_popup"]["phases"]
+        self.assertAlmostEqual(phases["think_time"]["sum_seconds"], 0.5)
+        self.assertEqual(phases["total"]["count"], 1)
+
+    def test_timed_dumps(self):
+        """测试 JSON 编码结果不变"""
+        data = {"answer": "好的"}
+        self.assertEqual(
+            timed_dumps(data, ensure_ascii=False), json.dumps(data, ensure_ascii=False)
+        )
+
+
+class TestMetricsMiddleware(unittest.TestCase):
+    """测试通过中间件统计工具调用"""
+
+    def setUp(self):
+        """设置测试环境"""
+        if not FASTMCP_AVAILABLE:
+            self.skipTest("fastmcp 不可用")
+
+        async def fake_popup(question, context="", **kwargs):
+            record_phase("think_time", 0.05)
+            return {
+                "question": question,
+                "context": context,
+                "answer": "好的",
+                "status": "answered",
+            }
+
+        self.registry = server_enhanced.popup_registry
+        self.original_factory = self.registry.popup_factory
+        self.registry.popup_factory = fake_popup
+        server_metrics.reset()
+
+    def tearDown(self):
+        """恢复弹窗工厂"""
+        if FASTMCP_AVAILABLE:
+            self.registry.popup_factory = self.original_factory
+
+    def test_tool_phases_recorded(self):
+        """测试工具调用按阶段记录"""
+
+        async def run():
+            async with Client(server_enhanced.mcp) as client:
+                await client.call_tool("ask_user_popup", {"question": "指标测试问题"})
+                result = await client.call_tool("get_server_metrics", {})
+                return json.loads(result.content[0].text)
+
+        data = asyncio.run(run())
+        ask = data["tools"]["ask_user_popup"]
+        self.assertEqual(ask["calls"], 1)
+        for name in ("total", "overhead", "think_time", "serialization"):
+            self.assertIn(name, ask["phases"])
+        self.assertAlmostEqual(ask["phases"]["think_time"]["sum_seconds"], 0.05)
+
+
+if __name__ == "__main__":
+    unittest.main()
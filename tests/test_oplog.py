@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+对话操作日志存储测试
+
+测试每次修改追加一行、重放恢复对话、定期在后台写快照并换下日志、
+不完整的最后一行被截掉、快照与日志之间崩溃时不重复重放，以及多个进程同时写入同一目录。
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from interactive_mcp_popup.conversation import ConversationManager
+from interactive_mcp_popup.oplog import JsonlConversationStore
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), "..", "src")
+
+
+class OplogTestCase(unittest.TestCase):
+    """操作日志存储测试的公共部分"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.temp_dir.name
+        self.store = None
+
+    def tearDown(self):
+        """清理测试环境"""
+        if self.store is not None and self.store._log_file is not None:
+            self.store._log_file.close()
+        self.temp_dir.cleanup()
+
+    def open_manager(self, snapshot_every=1000):
+        """打开存储（不关闭上一个，模拟进程崩溃后重启）"""
+        if self.store is not None and self.store._log_file is not None:
+            self.store._log_file.close()
+        self.store = JsonlConversationStore(
+            self.directory, snapshot_every=snapshot_every
+        )
+        return ConversationManager(store=self.store, background_load=False)
+
+    def wait_compaction(self):
+        """等待后台写快照的线程结束"""
+        for thread in threading.enumerate():
+            if thread.name == "oplog-compact":
+                thread.join(5)
+
+    def read_log(self):
+        """读取操作日志中的所有操作"""
+        with open(self.store.log_path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+
+class TestJsonlConversationStore(OplogTestCase):
+    """测试操作日志存储后端"""
+
+    def test_one_append_per_mutation(self):
+        """测试每次修改只追加一行"""
+        manager = self.open_manager()
+        conv_id = manager.create_conversation("部署")
+        manager.add_message(conv_id, "assistant", "部署到生产？", "question")
+        manager.end_conversation(conv_id)
+        other = manager.create_conversation("删除")
+        manager.delete_conversation(other)
+
+        ops = self.read_log()
+        self.assertEqual(
+            [op["op"] for op in ops],
+            ["create", "message", "update", "create", "delete"],
+        )
+        self.assertEqual([op["n"] for op in ops], [1, 2, 3, 4, 5])
+        self.assertFalse(os.path.exists(self.store.snapshot_path))
+
+    def test_replay_after_crash(self):
+        """测试未写快照时重启，重放日志恢复对话"""
+        manager = self.open_manager()
+        conv_id = manager.create_conversation("部署", "上下文")
+        manager.add_message(conv_id, "assistant", "部署到生产？", "question")
+        manager.add_message(conv_id, "user", "是", "answer")
+        manager.end_conversation(conv_id)
+        deleted = manager.create_conversation("删除")
+        manager.delete_conversation(deleted)
+        original = manager.get_conversation_history(conv_id)
+
+        manager = self.open_manager()
+        self.assertIsNone(manager.get_conversation(deleted))
+        self.assertEqual(manager.get_conversation_history(conv_id), original)
+        self.assertEqual(manager.get_conversation(conv_id).status, "ended")
+
+        # 重启后继续编号
+        manager.add_message(conv_id, "user", "好", "answer")
+        self.assertEqual(self.read_log()[-1]["n"], 7)
+
+    def test_periodic_snapshot(self):
+        """测试累计到指定条数时在后台写快照并换下日志，快照与 load_from_file 兼容"""
+        manager = self.open_manager(snapshot_every=3)
+        conv_id = manager.create_conversation("部署")
+        manager.add_message(conv_id, "assistant", "问题一", "question")
+        manager.add_message(conv_id, "user", "回答一", "answer")
+        self.wait_compaction()
+
+        self.assertTrue(os.path.exists(self.store.snapshot_path))
+        self.assertFalse(os.path.exists(self.store.old_log_path))
+        self.assertEqual(os.path.getsize(self.store.log_path), 0)
+
+        manager.add_message(conv_id, "assistant", "问题二", "question")
+        self.assertEqual(len(self.read_log()), 1)
+
+        restored = self.open_manager(snapshot_every=3)
+        self.assertEqual(len(restored.get_conversation(conv_id).messages), 4)
+
+        imported = ConversationManager()
+        self.assertTrue(imported.load_from_file(self.store.snapshot_path))
+        self.assertEqual(len(imported.get_conversation(conv_id).messages), 3)
+
+    def test_truncated_last_line(self):
+        """测试崩溃时写了一半的最后一行被截掉"""
+        manager = self.open_manager()
+        conv_id = manager.create_conversation("部署")
+        manager.add_message(conv_id, "assistant", "问题", "question")
+        self.store._log_file.write(b'{"op": "message", "mess')
+        self.store._log_file.flush()
+
+        manager = self.open_manager()
+        self.assertEqual(len(manager.get_conversation(conv_id).messages), 2)
+        manager.add_message(conv_id, "user", "回答", "answer")
+        self.assertEqual([op["n"] for op in self.read_log()], [1, 2, 3])
+
+    def test_crash_between_snapshot_and_truncate(self):
+        """测试快照已写、日志未清空时，重放跳过快照已包含的操作"""
+        manager = self.open_manager()
+        conv_id = manager.create_conversation("部署")
+        manager.add_message(conv_id, "assistant", "问题", "question")
+        with open(self.store.log_path, "rb") as f:
+            log = f.read()
+        self.store.snapshot()
+        with open(self.store.log_path, "wb") as f:
+            f.write(log)
+
+        manager = self.open_manager()
+        self.assertEqual(len(manager.get_conversation(conv_id).messages), 2)
+
+    def test_appends_during_compaction(self):
+        """测试写快照期间的追加写入新日志，快照替换后仍能释放并读回消息"""
+        manager = self.open_manager(snapshot_every=3)
+        conv_id = manager.create_conversation("部署")
+        manager.add_message(conv_id, "assistant", "问题一", "question")
+        # 模拟其他线程正在写快照
+        self.assertTrue(self.store._acquire_compaction(blocking=False))
+        manager.add_message(conv_id, "user", "回答一", "answer")
+        self.assertFalse(os.path.exists(self.store.snapshot_path))
+        self.assertEqual(len(self.read_log()), 3)
+
+        with self.store._locked():
+            self.store._swap_log()
+        manager.add_message(conv_id, "assistant", "问题二", "question")
+        self.assertEqual([op["n"] for op in self.read_log()], [4])
+        self.store._compact()
+        self.store._release_compaction()
+
+        self.assertFalse(os.path.exists(self.store.old_log_path))
+        conversation = manager.conversations[conv_id]
+        self.assertTrue(self.store.evict_body(conversation))
+        self.store.load_body(conversation)
+        self.assertEqual(
+            [m.content for m in conversation.messages[1:]],
+            ["问题一", "回答一", "问题二"],
+        )
+
+    def test_crash_during_compaction(self):
+        """测试换下日志后、快照替换前崩溃时，重启重放换下的日志，下次写快照时合并"""
+        manager = self.open_manager()
+        conv_id = manager.create_conversation("部署")
+        manager.add_message(conv_id, "assistant", "问题", "question")
+        with self.store._locked():
+            self.store._swap_log()
+        manager.add_message(conv_id, "user", "回答", "answer")
+
+        manager = self.open_manager()
+        self.assertEqual(len(manager.get_conversation(conv_id).messages), 3)
+        self.store.snapshot()
+        self.assertFalse(os.path.exists(self.store.old_log_path))
+
+        manager = self.open_manager()
+        self.assertEqual(len(manager.get_conversation(conv_id).messages), 3)
+
+    def test_close_writes_snapshot(self):
+        """测试关闭时写快照"""
+        manager = self.open_manager()
+        conv_id = manager.create_conversation("部署")
+        self.store.close()
+
+        self.assertEqual(self.store.get_stats()["log_ops"], 0)
+        manager = self.open_manager()
+        self.assertIsNotNone(manager.get_conversation(conv_id))
+
+
+class TestFastStartup(OplogTestCase):
+    """测试从快照元数据和日志尾部快速启动"""
+
+    def make_archive(self):
+        """写快照后再追加一条消息，重启后对话的消息延迟读入"""
+        manager = self.open_manager()
+        conv_id = manager.create_conversation("部署", "上下文")
+        manager.add_message(conv_id, "assistant", "部署到生产环境吗", "question")
+        manager.add_message(conv_id, "user", "是", "answer")
+        self.store.snapshot()
+        manager.add_message(conv_id, "assistant", "现在开始吗", "question")
+        return conv_id, manager.get_conversation_history(conv_id)
+
+    def test_metadata_before_bodies(self):
+        """测试启动后先提供元数据，消息在首次访问时读入（包括日志尾部的消息）"""
+        conv_id, original = self.make_archive()
+
+        manager = self.open_manager()
+        self.assertEqual(self.store.get_stats()["deferred"], 1)
+        self.assertEqual(manager.conversations[conv_id].messages, [])
+        page = manager.query_conversations(fields=["id", "message_count"])
+        self.assertEqual(page["conversations"], [{"id": conv_id, "message_count": 4}])
+        self.assertEqual(manager.get_conversation_version(conv_id)["latest_seq"], 4)
+
+        self.assertEqual(manager.get_conversation_history(conv_id), original)
+        self.assertEqual(self.store.get_stats()["deferred"], 0)
+        manager.add_message(conv_id, "user", "开始", "answer")
+        self.assertEqual(manager.get_conversation_version(conv_id)["latest_seq"], 5)
+
+    def test_compaction_keeps_unread_bodies(self):
+        """测试写快照时直接复制未读入对话的消息，不读入内存"""
+        conv_id, original = self.make_archive()
+
+        manager = self.open_manager()
+        manager.create_conversation("其他")
+        self.store.snapshot()
+        self.assertEqual(self.store.get_stats()["deferred"], 1)
+
+        manager = self.open_manager()
+        self.assertEqual(manager.get_conversation_history(conv_id), original)
+        with open(self.store.snapshot_path, encoding="utf-8") as f:
+            self.assertEqual(len(json.load(f)["conversations"]), 2)
+
+    def test_stale_metadata_falls_back(self):
+        """测试元数据与快照不一致时完整解析快照"""
+        conv_id, original = self.make_archive()
+        self.open_manager().get_conversation(conv_id)
+        with open(self.store.snapshot_path, "a", encoding="utf-8") as f:
+            f.write(" ")
+
+        manager = self.open_manager()
+        self.assertEqual(self.store.get_stats()["deferred"], 0)
+        self.assertEqual(manager.get_conversation_history(conv_id), original)
+
+    def test_load_deferred(self):
+        """测试读入剩余对话后相似问题检索可用"""
+        conv_id, _ = self.make_archive()
+
+        manager = self.open_manager()
+        self.assertEqual(manager.find_similar_questions("部署到生产环境吗"), [])
+        self.assertEqual(manager.load_deferred(), 1)
+        self.assertTrue(manager.find_similar_questions("部署到生产环境吗"))
+        self.assertEqual(len(manager.conversations[conv_id].messages), 4)
+
+
+class TestMultipleProcesses(OplogTestCase):
+    """测试多个进程共用同一目录"""
+
+    def test_two_processes(self):
+        """测试两个进程同时写入并各自写快照时，操作编号不重复、对话不丢失"""
+        script = (
+            "import json, sys\n"
+            f"sys.path.insert(0, {os.path.abspath(SRC_DIR)!r})\n"
+            "from interactive_mcp_popup.conversation import ConversationManager\n"
+            "from interactive_mcp_popup.oplog import JsonlConversationStore\n"
+            "store = JsonlConversationStore(sys.argv[1], snapshot_every=7)\n"
+            "manager = ConversationManager(store=store, background_load=False)\n"
+            "print('ready', flush=True)\n"
+            "sys.stdin.readline()\n"
+            "ids = []\n"
+            "for i in range(15):\n"
+            "    conv_id = manager.create_conversation(f'{sys.argv[2]}-{i}')\n"
+            "    for j in range(3):\n"
+            "        manager.add_message(conv_id, 'user', f'{sys.argv[2]}-{i}-{j}', 'answer')\n"
+            "    ids.append(conv_id)\n"
+            "print(json.dumps(ids))\n"
+        )
+        processes = [
+            subprocess.Popen(
+                [sys.executable, "-c", script, self.directory, name],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                text=True,
+            )
+            for name in ("a", "b")
+        ]
+        # 两个进程都打开存储之后再同时开始写入
+        for process in processes:
+            self.assertEqual(process.stdout.readline().strip(), "ready")
+        for process in processes:
+            process.stdin.write("go\n")
+            process.stdin.flush()
+        outputs = [process.communicate(timeout=60)[0] for process in processes]
+        self.assertEqual([process.returncode for process in processes], [0, 0])
+
+        manager = self.open_manager()
+        numbers = [op["n"] for op in self.read_log()]
+        self.assertEqual(len(numbers), len(set(numbers)))
+        self.assertEqual(len(manager.conversations), 30)
+        for name, output in zip(("a", "b"), outputs, strict=True):
+            for i, conv_id in enumerate(json.loads(output)):
+                history = manager.get_conversation_history(conv_id)
+                self.assertEqual(manager.get_conversation(conv_id).topic, f"{name}-{i}")
+                self.assertEqual(
+                    [m["content"] for m in history[1:]],
+                    [f"{name}-{i}-{j}" for j in range(3)],
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
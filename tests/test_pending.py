@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+等待中弹窗测试
+
+测试进度心跳、重试时挂到已打开的弹窗，以及调用方放弃后回答的取回。
+"""
+
+import asyncio
+import os
+import sys
+import unittest
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from interactive_mcp_popup.pending import PendingPopupRegistry, make_popup_key
+
+
+class FakePopup:
+    """由测试控制何时回答的假弹窗"""
+
+    def __init__(self):
+        self.calls = 0
+        self.answer = None
+
+    async def __call__(self, question, context="", **kwargs):
+        self.calls += 1
+        self.answer = asyncio.get_running_loop().create_future()
+        reply = await self.answer
+        if reply is None:
+            return None
+        return {
+            "question": question,
+            "context": context,
+            "answer": reply,
+            "status": "answered",
+        }
+
+
+class TestPendingPopupRegistry(unittest.TestCase):
+    """测试等待中弹窗注册表"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.popup = FakePopup()
+        self.registry = PendingPopupRegistry(
+            popup_factory=self.popup, heartbeat_interval=0.01
+        )
+
+    def test_make_popup_key(self):
+        """测试去重键"""
+        self.assertEqual(
+            make_popup_key("问题", "上下文"), make_popup_key("问题", "上下文")
+        )
+        self.assertNotEqual(
+            make_popup_key("问题", scope="a"), make_popup_key("问题", scope="b")
+        )
+        self.assertNotEqual(make_popup_key("ab", "c"), make_popup_key("a", "bc"))
+
+    def test_heartbeat_while_waiting(self):
+        """测试等待期间发送心跳"""
+        beats = []
+
+        async def heartbeat(pending):
+            beats.append(pending.popup_id)
+
+        async def run():
+            task = asyncio.ensure_future(
+                self.registry.ask("k", "问题", on_heartbeat=heartbeat)
+            )
+            await asyncio.sleep(0.05)
+            self.popup.answer.set_result("好的")
+            return await task
+
+        result, popup, resumed = asyncio.run(run())
+        self.assertEqual(result["answer"], "好的")
+        self.assertFalse(resumed)
+        self.assertTrue(len(beats) >= 2)
+        self.assertEqual(set(beats), {popup.popup_id})
+        self.assertFalse(self.registry.has("k"))
+
+    def test_retry_attaches_to_open_popup(self):
+        """测试客户端超时重试时挂到已打开的弹窗"""
+
+        async def run():
+            first = asyncio.ensure_future(self.registry.ask("k", "问题"))
+            await asyncio.sleep(0.02)
+            first.cancel()
+            await asyncio.sleep(0.02)
+            self.assertTrue(self.registry.has("k"))
+            self.assertEqual(len(self.registry.list_pending()), 1)
+
+            second = asyncio.ensure_future(self.registry.ask("k", "问题"))
+            await asyncio.sleep(0.02)
+            self.popup.answer.set_result("继续")
+            return await second
+
+        result, popup, resumed = asyncio.run(run())
+        self.assertEqual(self.popup.calls, 1)
+        self.assertTrue(resumed)
+        self.assertEqual(popup.attach_count, 2)
+        self.assertEqual(result["answer"], "继续")
+
+    def test_answer_after_caller_gave_up(self):
+        """测试调用方放弃后用户才回答"""
+        recorded = []
+
+        async def run():
+            first = asyncio.ensure_future(
+                self.registry.ask(
+                    "k", "问题", on_result=lambda r: recorded.append(r["answer"])
+                )
+            )
+            await asyncio.sleep(0.02)
+            first.cancel()
+            self.popup.answer.set_result("已回答")
+            await asyncio.sleep(0.02)
+            self.assertTrue(self.registry.has("k"))
+            return await self.registry.ask("k", "问题")
+
+        result, popup, resumed = asyncio.run(run())
+        self.assertEqual(recorded, ["已回答"])
+        self.assertTrue(resumed)
+        self.assertEqual(result["answer"], "已回答")
+        self.assertEqual(self.popup.calls, 1)
+        self.assertFalse(self.registry.has("k"))
+
+    def test_cancelled_popup_not_kept(self):
+        """测试用户取消的弹窗不保留结果"""
+
+        async def run():
+            task = asyncio.ensure_future(self.registry.ask("k", "问题"))
+            await asyncio.sleep(0.02)
+            self.popup.answer.set_result(None)
+            return await task
+
+        result, popup, resumed = asyncio.run(run())
+        self.assertIsNone(result)
+        self.assertFalse(self.registry.has("k"))
+
+    def test_result_ttl(self):
+        """测试未取回的回答过期"""
+        self.registry.result_ttl = 0
+
+        async def run():
+            task = asyncio.ensure_future(self.registry.ask("k", "问题"))
+            await asyncio.sleep(0.02)
+            task.cancel()
+            self.popup.answer.set_result("过期")
+            await asyncio.sleep(0.02)
+
+        asyncio.run(run())
+        self.assertFalse(self.registry.has("k"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -101,6 +101,83 @@ class TestModernPopupDialog(unittest.TestCase):
         context_labels = [label for label in labels if "上下文" in label.text()]
         self.assertTrue(len(context_labels) > 0)
 
+    def test_dialog_with_suggestions(self):
+        """测试显示相似问题的历史回答"""
+        suggestions = [
+            {"question": "使用哪个分支？", "answer": "release/2.0"},
+            {"question": "部署到哪里？", "answer": "测试环境"}
+        ]
+        dialog = ModernPopupDialog("这次使用哪个分支？", suggestions=suggestions)
+
+        self.assertEqual(dialog.suggestion_list.count(), 2)
+
+        # 点击建议填入输入框
+        dialog.use_suggestion(dialog.suggestion_list.item(0))
+        self.assertEqual(dialog.input_field.toPlainText(), "release/2.0")
+
+    def test_dialog_autocomplete(self):
+        """测试输入框自动补全"""
+        from interactive_mcp_popup.autocomplete import AnswerTrie
+
+        trie = AnswerTrie()
+        trie.add("yes, proceed", 3)
+        trie.add("yes")
+        dialog = ModernPopupDialog("是否继续？", completer=trie)
+
+        dialog.input_field.setPlainText("ye")
+        self.assertEqual(dialog.completion_list.count(), 2)
+        self.assertEqual(dialog.completion_list.item(0).text(), "yes, proceed")
+
+        dialog.accept_completion()
+        self.assertEqual(dialog.input_field.toPlainText(), "yes, proceed")
+        self.assertFalse(dialog.completion_list.isVisible())
+
+    def test_dialog_draft_debounce(self):
+        """测试草稿在输入停顿后才回调"""
+        drafts = []
+        dialog = ModernPopupDialog("请描述问题", draft_callback=drafts.append, draft_debounce_ms=20)
+
+        dialog.input_field.setPlainText("第")
+        dialog.input_field.setPlainText("第一")
+        self.assertEqual(drafts, [])
+        self.assertTrue(dialog.draft_timer.isActive())
+
+        dialog.draft_timer.timeout.emit()
+        self.assertEqual(drafts, ["第一"])
+
+    def test_dialog_tracing_spans(self):
+        """测试弹窗创建和提交记录为调用链 span"""
+        import json
+        import tempfile
+
+        from interactive_mcp_popup import tracing
+
+        original_tracer = tracing.tracer
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filepath = os.path.join(temp_dir, "traces.jsonl")
+            tracing.tracer = tracing.Tracer(enabled=True, sample_rate=1.0, filepath=filepath)
+            try:
+                root = tracing.tracer.start_trace("ask_user_popup")
+                token = tracing._current_span.set(root)
+                try:
+                    dialog = ModernPopupDialog("测试问题")
+                    dialog.input_field.setPlainText("回答")
+                    dialog.submit_answer()
+                finally:
+                    tracing._current_span.reset(token)
+                    tracing.tracer.finish(root)
+                tracing.tracer.shutdown()
+
+                with open(filepath, encoding='utf-8') as f:
+                    spans = {json.loads(line)["name"]: json.loads(line) for line in f}
+            finally:
+                tracing.tracer = original_tracer
+
+        init_span = spans["ModernPopupDialog.__init__"]
+        self.assertEqual(spans["ModernPopupDialog.setup_style"]["parentSpanId"], init_span["spanId"])
+        self.assertEqual(spans["ModernPopupDialog.load_window_settings"]["parentSpanId"], init_span["spanId"])
+        self.assertIn("ModernPopupDialog.submit_answer", spans)
+
 
 class TestPopupFunctions(unittest.TestCase):
     """测试弹窗函数"""
@@ -150,7 +227,27 @@ class TestPopupFunctions(unittest.TestCase):
             result = show_popup_dialog("测试问题")
         
         self.assertIsNone(result)
-    
+
+    def test_show_popup_dialog_async(self):
+        """测试在事件循环中显示弹窗"""
+        import asyncio
+
+        from PySide6.QtCore import QTimer
+
+        from interactive_mcp_popup.popup import show_popup_dialog_async
+
+        def answer():
+            dialogs = [w for w in self.app.topLevelWidgets()
+                       if isinstance(w, ModernPopupDialog) and w.isVisible()]
+            dialogs[-1].input_field.setPlainText("异步回答")
+            dialogs[-1].submit_answer()
+
+        QTimer.singleShot(50, answer)
+        result = asyncio.run(show_popup_dialog_async("测试问题"))
+
+        self.assertIsNotNone(result)
+        self.assertEqual(result["answer"], "异步回答")
+
     def test_save_result_to_file(self):
         """测试保存结果到文件"""
         result = {
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+对话资源测试
+
+测试读取对话资源、订阅后收到更新通知、连续修改时合并通知、会话结束时丢弃订阅，
+以及依赖的 FastMCP 内部属性仍然存在。
+"""
+
+import asyncio
+import json
+import os
+import sys
+import unittest
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import mcp.types
+from fastmcp import Client, FastMCP
+from mcp.shared.session import BaseSession
+
+from interactive_mcp_popup.conversation import ConversationManager
+from interactive_mcp_popup.resources import (
+    LIST_URI,
+    conversation_uri,
+    register_conversation_resources,
+)
+
+
+class TestConversationResources(unittest.TestCase):
+    """测试对话资源和订阅"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.manager = ConversationManager()
+        self.mcp = FastMCP("resources-test")
+        self.subscriptions = register_conversation_resources(self.mcp, self.manager)
+        self.subscriptions.debounce = 0.05
+        self.conv_id = self.manager.create_conversation("资源测试", "上下文")
+
+    def run_client(self, scenario):
+        """用进程内客户端运行测试场景，返回收到的更新通知 URI"""
+        updates = []
+
+        async def handle_message(message):
+            if isinstance(message, mcp.types.ServerNotification):
+                if isinstance(message.root, mcp.types.ResourceUpdatedNotification):
+                    updates.append(str(message.root.params.uri))
+
+        async def main():
+            async with Client(self.mcp, message_handler=handle_message) as client:
+                await scenario(client)
+
+        asyncio.run(main())
+        return updates
+
+    def test_read_resources(self):
+        """测试读取对话列表和对话"""
+        self.manager.add_message(self.conv_id, "assistant", "继续吗？", "question")
+        contents = {}
+
+        async def scenario(client):
+            contents["list"] = await client.read_resource(LIST_URI)
+            contents["conversation"] = await client.read_resource(
+                conversation_uri(self.conv_id)
+            )
+            contents["capabilities"] = client.initialize_result.capabilities
+
+        self.run_client(scenario)
+
+        listing = json.loads(contents["list"][0].text)
+        self.assertEqual(listing["conversations"][0]["id"], self.conv_id)
+        self.assertNotIn("context", listing["conversations"][0])
+
+        conversation = json.loads(contents["conversation"][0].text)
+        self.assertEqual(conversation["latest_seq"], 2)
+        self.assertEqual(conversation["messages"][-1]["content"], "继续吗？")
+        self.assertTrue(contents["capabilities"].resources.subscribe)
+
+    def test_updates_are_coalesced(self):
+        """测试订阅后连续修改只发送一次通知"""
+
+        async def scenario(client):
+            await client.session.subscribe_resource(conversation_uri(self.conv_id))
+            for index in range(5):
+                self.manager.add_message(self.conv_id, "user", f"回答{index}", "answer")
+            self.manager.end_conversation(self.conv_id)
+            await asyncio.sleep(0.3)
+
+        updates = self.run_client(scenario)
+        self.assertEqual(updates, [conversation_uri(self.conv_id)])
+
+    def test_only_subscribed_resources(self):
+        """测试只通知订阅的资源，取消订阅后不再通知"""
+        other = self.manager.create_conversation("其他对话")
+
+        async def scenario(client):
+            await client.session.subscribe_resource(LIST_URI)
+            await client.session.subscribe_resource(conversation_uri(other))
+            self.manager.add_message(self.conv_id, "user", "回答", "answer")
+            await asyncio.sleep(0.2)
+
+            await client.session.unsubscribe_resource(LIST_URI)
+            self.manager.delete_conversation(self.conv_id)
+            await asyncio.sleep(0.2)
+
+        updates = self.run_client(scenario)
+        self.assertEqual(updates, [LIST_URI])
+        self.assertEqual(self.subscriptions.subscriber_count(LIST_URI), 0)
+
+    def test_subscriptions_dropped_when_session_closes(self):
+        """测试客户端断开后订阅被丢弃"""
+
+        async def scenario(client):
+            await client.session.subscribe_resource(LIST_URI)
+            await client.session.subscribe_resource(conversation_uri(self.conv_id))
+            self.assertEqual(self.subscriptions.subscriber_count(LIST_URI), 1)
+
+        self.run_client(scenario)
+        self.assertEqual(self.subscriptions.subscriber_count(LIST_URI), 0)
+        self.assertEqual(
+            self.subscriptions.subscriber_count(conversation_uri(self.conv_id)), 0
+        )
+
+
+class TestFastMCPInternals(unittest.TestCase):
+    """resources 模块使用的 FastMCP / MCP 内部属性，升级依赖后这里失败说明需要调整"""
+
+    def test_low_level_server(self):
+        """测试底层服务器及其订阅和能力接口"""
+        server = FastMCP("internals-test")._mcp_server
+        for name in (
+            "subscribe_resource",
+            "unsubscribe_resource",
+            "get_capabilities",
+            "request_context",
+        ):
+            self.assertTrue(hasattr(type(server), name), name)
+
+    def test_session_exit_stack(self):
+        """测试会话创建 _exit_stack，并在退出时关闭"""
+        self.assertIn("_exit_stack", BaseSession.__init__.__code__.co_names)
+        self.assertIn("_exit_stack", BaseSession.__aexit__.__code__.co_names)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+全文检索测试
+
+测试中文检索、BM25 排序、过滤和分页、删除后的压缩、索引文件的保存和加载，
+以及管理器启动时只补齐索引之后新增的消息。
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from interactive_mcp_popup.conversation import ConversationManager
+from interactive_mcp_popup.search import SearchIndex, make_snippet
+from interactive_mcp_popup.sqlite_store import SQLiteConversationStore
+
+
+class SearchTestCase(unittest.TestCase):
+    """创建几个对话的基类"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.manager = ConversationManager()
+        self.deploy = self.fill(
+            self.manager,
+            "发布 v2",
+            [
+                ("要先跑数据库迁移吗", "先跑数据库迁移，再切流量"),
+                ("回滚方案准备好了吗", "准备好了"),
+            ],
+        )
+        self.review = self.fill(
+            self.manager,
+            "代码审查",
+            [
+                ("这个函数需要拆分吗", "需要，函数太长"),
+                ("Should we add a migration test?", "Yes, add the migration test"),
+            ],
+        )
+
+    def tearDown(self):
+        """清理测试环境"""
+        self.temp_dir.cleanup()
+
+    @staticmethod
+    def fill(manager, topic, pairs):
+        """创建对话并追加问答"""
+        conv_id = manager.create_conversation(topic)
+        for question, answer in pairs:
+            manager.add_message(conv_id, "assistant", question, "question")
+            manager.add_message(conv_id, "user", answer, "answer")
+        return conv_id
+
+
+class TestSearch(SearchTestCase):
+    """测试检索"""
+
+    def test_chinese_query(self):
+        """测试中文检索和排序"""
+        page = self.manager.search_messages("数据库迁移")
+        self.assertEqual(page["total"], 2)
+        # 两条都包含全部词元，较短的问题排在前面
+        first, second = page["results"]
+        self.assertEqual(
+            (first["conversation_id"], first["seq"], second["seq"]), (self.deploy, 2, 3)
+        )
+        self.assertGreater(first["score"], second["score"])
+        self.assertEqual(second["topic"], "发布 v2")
+        self.assertEqual(second["snippet"], "先跑数据库迁移，再切流量")
+
+        # 命中更多词元的排在前面
+        page = self.manager.search_messages("迁移 流量")
+        self.assertEqual(page["results"][0]["seq"], 3)
+
+    def test_english_and_topic(self):
+        """测试英文不区分大小写，以及主题命中"""
+        page = self.manager.search_messages("MIGRATION test")
+        self.assertEqual({r["seq"] for r in page["results"]}, {4, 5})
+        topic = self.manager.search_messages("代码审查", message_type="topic")
+        self.assertEqual(
+            [(r["conversation_id"], r["seq"]) for r in topic["results"]],
+            [(self.review, 0)],
+        )
+
+    def test_single_cjk_character(self):
+        """测试单个中文字可以命中包含它的词"""
+        plan = self.fill(self.manager, "数据库迁移方案", [])
+        topic = self.manager.search_messages("库", message_type="topic")
+        self.assertEqual([r["conversation_id"] for r in topic["results"]], [plan])
+        self.assertEqual(
+            {
+                r["seq"]
+                for r in self.manager.search_messages("库", sender="user")["results"]
+            },
+            {3},
+        )
+        # 单个字母不展开
+        self.assertEqual(self.manager.search_messages("m")["total"], 0)
+
+        path = os.path.join(self.temp_dir.name, "search_index.json")
+        self.manager.search_index.save(path)
+        index = SearchIndex()
+        index.load(path)
+        self.assertEqual(index.search("库", message_type="topic")[1], 1)
+
+    def test_filters(self):
+        """测试按发送者、类型和时间过滤"""
+        answers = self.manager.search_messages("数据库迁移", sender="user")
+        self.assertEqual([r["seq"] for r in answers["results"]], [3])
+        questions = self.manager.search_messages("函数", message_type="question")
+        self.assertEqual([r["seq"] for r in questions["results"]], [2])
+        timestamp = answers["results"][0]["timestamp"]
+        self.assertEqual(
+            self.manager.search_messages("数据库迁移", until=timestamp[:10])["total"], 2
+        )
+        self.assertEqual(
+            self.manager.search_messages("数据库迁移", since="2999-01-01")["total"], 0
+        )
+        self.assertEqual(
+            self.manager.search_messages("数据库迁移", until="2000-01-01")["total"], 0
+        )
+
+    def test_pagination(self):
+        """测试分页"""
+        for i in range(5):
+            self.fill(self.manager, f"部署{i}", [("要继续部署吗", f"继续部署第{i}台")])
+        seen = []
+        cursor = None
+        while True:
+            page = self.manager.search_messages("部署", limit=4, cursor=cursor)
+            seen.extend((r["conversation_id"], r["seq"]) for r in page["results"])
+            if not page["has_more"]:
+                break
+            cursor = page["next_cursor"]
+        self.assertEqual(len(seen), page["total"])
+        self.assertEqual(len(set(seen)), len(seen))
+
+    def test_delete_and_import(self):
+        """测试删除对话后不再命中，导入时替换旧的索引"""
+        self.assertTrue(self.manager.delete_conversation(self.deploy))
+        self.assertEqual(self.manager.search_messages("数据库迁移")["total"], 0)
+
+        path = os.path.join(self.temp_dir.name, "export.json")
+        self.assertTrue(self.manager.save_to_file(path))
+        self.assertTrue(self.manager.load_from_file(path))
+        self.assertEqual(self.manager.search_messages("太长")["total"], 1)
+
+    def test_snippet(self):
+        """测试长文本片段截取命中位置附近"""
+        text = "无关内容" * 50 + "数据库迁移" + "其他内容" * 50
+        snippet = make_snippet(text, "数据库迁移", 40)
+        self.assertIn("数据库迁移", snippet)
+        self.assertTrue(snippet.startswith("...") and snippet.endswith("..."))
+        self.assertEqual(make_snippet("短文本", "文本", 40), "短文本")
+
+
+class TestPersistence(SearchTestCase):
+    """测试索引持久化"""
+
+    def test_save_and_load(self):
+        """测试删除后保存会压缩，加载后结果不变"""
+        self.fill(self.manager, "临时", [("数据库迁移要多久", "十分钟")])
+        self.manager.delete_conversation(self.review)
+        expected = self.manager.search_messages("数据库迁移")
+
+        path = os.path.join(self.temp_dir.name, "search_index.json")
+        self.assertTrue(self.manager.search_index.save(path))
+        index = SearchIndex()
+        self.assertTrue(index.load(path))
+        self.assertEqual(len(index), len(self.manager.search_index))
+        hits, total = index.search("数据库迁移")
+        self.assertEqual(total, expected["total"])
+        self.assertEqual(
+            [(h["conversation_id"], h["seq"], h["score"]) for h in hits],
+            [(r["conversation_id"], r["seq"], r["score"]) for r in expected["results"]],
+        )
+
+    def test_startup_catches_up(self):
+        """测试启动时加载索引文件，只补齐之后新增的消息"""
+        db_path = os.path.join(self.temp_dir.name, "conversations.db")
+        index_path = os.path.join(self.temp_dir.name, "search_index.json")
+
+        store = SQLiteConversationStore(db_path)
+        manager = ConversationManager(store=store)
+        manager.open_search_index(index_path, background=False)
+        first = self.fill(manager, "发布", [("要先跑数据库迁移吗", "先跑")])
+        second = self.fill(manager, "审查", [("需要拆分吗", "需要")])
+        # 模拟索引没有记录之后追加的消息（例如进程在写入索引日志之前退出）
+        manager.search_index.close()
+        manager.add_message(second, "user", "数据库迁移也要审查", "answer")
+        store.close()
+
+        store = SQLiteConversationStore(db_path)
+        reopened = ConversationManager(store=store, background_load=False)
+        reopened.open_search_index(index_path, background=False)
+        # 打开索引时不读入任何消息
+        self.assertEqual(reopened.get_memory_stats()["resident"], 0)
+        # 补齐时只读入索引落后的对话
+        self.assertEqual(reopened.sync_search_index(), 1)
+        self.assertEqual(reopened.get_memory_stats()["resident"], 1)
+        # 补齐之后追加的消息直接进入索引
+        reopened.add_message(first, "user", "已经完成", "answer")
+        self.assertEqual(reopened.sync_search_index(), 0)
+        results = reopened.search_messages("数据库迁移")["results"]
+        self.assertEqual(
+            {(r["conversation_id"], r["seq"]) for r in results},
+            {(first, 2), (second, 4)},
+        )
+        self.assertEqual(reopened.search_messages("已经完成")["results"][0]["seq"], 4)
+        reopened.search_index.close()
+        store.close()
+
+    def test_snippets_do_not_load(self):
+        """测试生成片段只读取命中的那条消息，不读入整个对话"""
+        db_path = os.path.join(self.temp_dir.name, "conversations.db")
+        index_path = os.path.join(self.temp_dir.name, "search_index.json")
+
+        store = SQLiteConversationStore(db_path)
+        manager = ConversationManager(store=store)
+        manager.open_search_index(index_path, background=False)
+        conv_id = self.fill(manager, "数据库迁移", [("要先跑数据库迁移吗", "先跑")])
+        manager.search_index.close()
+        store.close()
+
+        store = SQLiteConversationStore(db_path)
+        reopened = ConversationManager(store=store, background_load=False)
+        reopened.open_search_index(index_path, background=False)
+        results = reopened.search_messages("数据库迁移")["results"]
+        self.assertEqual(
+            {(r["conversation_id"], r["seq"], r["snippet"]) for r in results},
+            {(conv_id, 0, "数据库迁移"), (conv_id, 2, "要先跑数据库迁移吗")},
+        )
+        self.assertEqual({r["topic"] for r in results}, {"数据库迁移"})
+        self.assertEqual(reopened.get_memory_stats()["resident"], 0)
+        reopened.search_index.close()
+        store.close()
+
+    def test_background_catch_up(self):
+        """测试在后台线程中补齐索引"""
+        index_path = os.path.join(self.temp_dir.name, "search_index.json")
+        self.manager.search_index.save(index_path)
+        conv_id = self.fill(self.manager, "新对话", [("要发布吗", "发布")])
+
+        manager = ConversationManager()
+        for conversation in self.manager.conversations.values():
+            manager._adopt(conversation)
+        manager.open_search_index(index_path)
+        for thread in threading.enumerate():
+            if thread.name == "search-index-sync":
+                thread.join(5)
+        self.assertFalse(manager._search_pending)
+        self.assertEqual(
+            manager.search_messages("发布")["results"][0]["conversation_id"], conv_id
+        )
+        manager.search_index.close()
+
+    def reopen(self, path):
+        """重新打开索引文件"""
+        index = SearchIndex()
+        self.assertTrue(index.open(path))
+        self.addCleanup(index.close)
+        return index
+
+    def hits(self, index, query):
+        """检索结果的 (对话ID, 序号) 列表"""
+        return [(h["conversation_id"], h["seq"]) for h in index.search(query)[0]]
+
+    def test_log_replay(self):
+        """测试每次变化只追加日志，重新打开时重放日志，跳过写了一半的最后一行"""
+        path = os.path.join(self.temp_dir.name, "search_index.json")
+        manager = ConversationManager()
+        manager.open_search_index(path, background=False)
+        deploy = self.fill(manager, "发布", [("要先跑数据库迁移吗", "先跑数据库迁移")])
+        review = self.fill(manager, "审查", [("数据库迁移要审查吗", "要")])
+        manager.delete_conversation(review)
+        manager.search_index.close()
+        self.assertFalse(os.path.exists(path))
+        with open(f"{path}.log", "ab") as f:
+            f.write(b'{"op":"remove","id":')
+
+        index = self.reopen(path)
+        self.assertEqual(
+            self.hits(index, "数据库迁移"),
+            self.hits(manager.search_index, "数据库迁移"),
+        )
+        self.assertEqual(index.indexed_seq(deploy), 3)
+        self.assertIsNone(index.indexed_seq(review))
+        # 截掉的半行之后可以继续追加
+        index.remove_conversation(deploy)
+        index.close()
+        self.assertEqual(self.reopen(path).search("数据库迁移")[1], 0)
+
+    def test_background_compaction(self):
+        """测试日志累计到阈值后在后台写快照，换下的日志被删除"""
+        path = os.path.join(self.temp_dir.name, "search_index.json")
+        manager = ConversationManager()
+        manager.search_index.compact_every = 3
+        manager.open_search_index(path, background=False)
+        conv_id = self.fill(manager, "发布", [("要先跑数据库迁移吗", "先跑数据库迁移")])
+        for thread in threading.enumerate():
+            if thread.name == "search-index-compact":
+                thread.join(5)
+        self.assertTrue(os.path.exists(path))
+        self.assertFalse(os.path.exists(f"{path}.log.old"))
+        manager.add_message(conv_id, "user", "迁移完成", "answer")
+        manager.search_index.close()
+
+        index = self.reopen(path)
+        self.assertEqual(
+            self.hits(index, "迁移"), self.hits(manager.search_index, "迁移")
+        )
+        self.assertEqual(index.indexed_seq(conv_id), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+对话分片持久化测试
+
+测试只写入变化过的对话、删除对话时删除分片、换目录时全量写入、
+从分片加载后视为已保存、写入失败的对话下次重试、同一对话并发写入，以及后台定期保存。
+"""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from interactive_mcp_popup import shards
+from interactive_mcp_popup.conversation import ConversationManager
+from interactive_mcp_popup.shards import list_shards, shard_path
+
+
+class TestShardPersistence(unittest.TestCase):
+    """测试分片持久化"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.temp_dir.name, "shards")
+        self.manager = ConversationManager()
+        self.first = self.manager.create_conversation("第一个")
+        self.second = self.manager.create_conversation("第二个")
+
+    def tearDown(self):
+        """清理测试环境"""
+        self.temp_dir.cleanup()
+
+    def test_only_dirty_conversations_written(self):
+        """测试第一次全量写入，之后只写入变化的对话"""
+        result = self.manager.save_shards(self.directory, max_workers=2)
+        self.assertEqual(result, {"written": 2, "removed": 0, "failed": 0})
+
+        self.assertEqual(self.manager.save_shards(self.directory)["written"], 0)
+
+        self.manager.add_message(self.first, "assistant", "问题", "question")
+        with patch.object(shards, "write_shard", wraps=shards.write_shard) as write:
+            result = self.manager.save_shards(self.directory)
+        self.assertEqual(result["written"], 1)
+        self.assertEqual(write.call_args[0][1].id, self.first)
+
+    def test_delete_removes_shard(self):
+        """测试删除对话后保存时删除其分片"""
+        self.manager.save_shards(self.directory)
+        self.manager.delete_conversation(self.second)
+
+        result = self.manager.save_shards(self.directory)
+        self.assertEqual(result["removed"], 1)
+        self.assertFalse(os.path.exists(shard_path(self.directory, self.second)))
+        self.assertEqual(len(list_shards(self.directory)), 1)
+
+    def test_new_directory_writes_everything(self):
+        """测试换目录时写入全部对话"""
+        self.manager.save_shards(self.directory)
+        other = os.path.join(self.temp_dir.name, "other")
+        self.assertEqual(self.manager.save_shards(other)["written"], 2)
+
+    def test_load_shards(self):
+        """测试从分片加载对话，加载后视为已保存"""
+        self.manager.add_message(self.first, "user", "回答", "answer")
+        self.manager.save_shards(self.directory)
+
+        manager = ConversationManager()
+        self.assertEqual(manager.load_shards(self.directory), 2)
+        self.assertEqual(
+            manager.get_conversation_history(self.first),
+            self.manager.get_conversation_history(self.first),
+        )
+        self.assertEqual(manager.save_shards(self.directory)["written"], 0)
+
+        manager.end_conversation(self.second)
+        self.assertEqual(manager.save_shards(self.directory)["written"], 1)
+
+    def test_failed_write_retried(self):
+        """测试写入失败的对话下次保存时重试，旧分片保持完整"""
+        self.manager.save_shards(self.directory)
+        self.manager.add_message(self.first, "assistant", "问题", "question")
+
+        with patch.object(shards, "write_shard", side_effect=OSError("磁盘已满")):
+            self.assertEqual(self.manager.save_shards(self.directory)["failed"], 1)
+        self.assertEqual(
+            len(shards.read_shard(shard_path(self.directory, self.first)).messages), 1
+        )
+
+        self.assertEqual(self.manager.save_shards(self.directory)["written"], 1)
+        self.assertEqual(
+            len(shards.read_shard(shard_path(self.directory, self.first)).messages), 2
+        )
+
+    def test_concurrent_writes_of_one_conversation(self):
+        """测试同时写入同一对话的分片时各自使用临时文件，不留下临时文件"""
+        os.makedirs(self.directory)
+        conversation = self.manager.get_conversation(self.first)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            paths = list(
+                pool.map(
+                    lambda _: shards.write_shard(self.directory, conversation),
+                    range(32),
+                )
+            )
+        self.assertEqual(set(paths), {shard_path(self.directory, self.first)})
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(paths[0])])
+        self.assertEqual(shards.read_shard(paths[0]).topic, "第一个")
+
+    def test_autosave(self):
+        """测试后台定期保存，停止时保存最后一次变化，重新启动时加载"""
+        self.assertEqual(
+            self.manager.start_shard_autosave(self.directory, interval=0.05), 0
+        )
+        deadline = time.monotonic() + 5
+        while len(list_shards(self.directory)) < 2 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(len(list_shards(self.directory)), 2)
+
+        self.manager.add_message(self.first, "user", "最后的回答", "answer")
+        self.manager.stop_shard_autosave()
+        manager = ConversationManager()
+        self.assertEqual(manager.start_shard_autosave(self.directory, interval=60), 2)
+        self.assertEqual(
+            manager.get_conversation_history(self.first)[-1]["content"], "最后的回答"
+        )
+        manager.stop_shard_autosave()
+
+    def test_non_uuid_id(self):
+        """测试非 UUID 的对话ID不会作为路径使用"""
+        path = shard_path(self.directory, "../外部")
+        self.assertEqual(os.path.dirname(path), self.directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
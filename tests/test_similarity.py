@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+相似问题检索测试
+
+测试分词、MinHash/LSH 索引、长文本只取开头的分片、查询时按序号取回消息，
+以及与对话管理器的集成。
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from interactive_mcp_popup.conversation import ConversationManager
+from interactive_mcp_popup.similarity import SimilarityIndex, iter_tokens, tokenize
+from interactive_mcp_popup.sqlite_store import SQLiteConversationStore
+
+
+class TestTokenize(unittest.TestCase):
+    """测试分词"""
+
+    def test_chinese_bigrams(self):
+        """测试中文按二元组切分"""
+        self.assertEqual(tokenize("是否继续"), ["是否", "否继", "继续"])
+
+    def test_single_chinese_char(self):
+        """测试单个汉字保留为词元"""
+        self.assertEqual(tokenize("好"), ["好"])
+
+    def test_mixed_text(self):
+        """测试中英文混合"""
+        tokens = tokenize("部署到 Main 分支, v2?")
+        self.assertEqual(tokens, ["部署", "署到", "main", "分支", "v2"])
+
+    def test_empty_text(self):
+        """测试空文本"""
+        self.assertEqual(tokenize("  ?! "), [])
+
+    def test_iter_tokens_matches_tokenize(self):
+        """测试逐个生成的词元与一次切分的结果相同"""
+        text = "Deploy 到 prod-2 吗？是否继续 OK"
+        self.assertEqual(list(iter_tokens(text)), tokenize(text))
+
+
+class TestSimilarityIndex(unittest.TestCase):
+    """测试相似问题索引"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.messages = {}
+        self.index = SimilarityIndex(
+            resolve=lambda cid, seq: self.messages.get((cid, seq))
+        )
+        self.add("conv-1", 1, "q1", "是否将代码部署到测试环境？")
+        self.add("conv-1", 2, "a1", "是，部署到测试环境")
+        self.add("conv-2", 1, "q2", "你希望使用哪个数据库？")
+        self.add("conv-2", 2, "a2", "PostgreSQL")
+
+    def add(self, conversation_id, seq, message_id, content):
+        """记录消息，奇数序号为问题，偶数序号为回答"""
+        self.messages[(conversation_id, seq)] = SimpleNamespace(
+            id=message_id, content=content, timestamp=""
+        )
+        if seq % 2:
+            self.index.add_question(conversation_id, seq, content)
+        else:
+            self.index.add_answer(conversation_id, seq)
+
+    def test_query_similar(self):
+        """测试查找相似问题"""
+        results = self.index.query("是否将代码部署到生产环境？")
+        self.assertTrue(len(results) > 0)
+        self.assertEqual(results[0]["question_id"], "q1")
+        self.assertEqual(results[0]["answer"], "是，部署到测试环境")
+        self.assertGreaterEqual(results[0]["score"], 0.3)
+
+    def test_query_exact(self):
+        """测试完全相同的问题得分为 1"""
+        results = self.index.query("你希望使用哪个数据库？")
+        self.assertEqual(results[0]["answer"], "PostgreSQL")
+        self.assertEqual(results[0]["score"], 1.0)
+
+    def test_query_unrelated(self):
+        """测试不相关的问题"""
+        self.assertEqual(self.index.query("今天天气怎么样"), [])
+
+    def test_unanswered_questions_skipped(self):
+        """测试默认跳过没有回答的问题"""
+        self.add("conv-3", 1, "q3", "要不要重启缓存服务？")
+        self.assertEqual(self.index.query("要不要重启缓存服务？"), [])
+        results = self.index.query("要不要重启缓存服务？", answered_only=False)
+        self.assertEqual(results[0]["question_id"], "q3")
+
+    def test_signature_is_stable(self):
+        """测试签名在不同实例间一致"""
+        other = SimilarityIndex()
+        self.assertEqual(
+            self.index.signature("是否继续执行"), other.signature("是否继续执行")
+        )
+
+    def test_entries_hold_no_text(self):
+        """测试索引项只保存序号，没有 resolve 时结果只有序号和分数"""
+        entry = self.index._entries[0]
+        self.assertEqual(
+            (entry.conversation_id, entry.question_seq, entry.answer_seq),
+            ("conv-1", 1, 2),
+        )
+        self.assertFalse(hasattr(entry, "question"))
+
+        self.index.resolve = None
+        result = self.index.query("你希望使用哪个数据库？")[0]
+        self.assertEqual(
+            result,
+            {
+                "conversation_id": "conv-2",
+                "question_seq": 1,
+                "answer_seq": 2,
+                "score": 1.0,
+            },
+        )
+
+    def test_deleted_message_skipped(self):
+        """测试查询时取不回的消息被跳过"""
+        del self.messages[("conv-2", 2)]
+        self.assertEqual(self.index.query("你希望使用哪个数据库？"), [])
+
+    def test_long_question_uses_leading_shingles(self):
+        """测试很长的问题只用开头的分片计算签名"""
+        index = SimilarityIndex(max_shingles=8)
+        head = "是否将代码部署到测试环境"
+        self.assertEqual(
+            index.signature(head + "，另外" * 1000 + "末尾不同"),
+            index.signature(head + "其他"),
+        )
+
+    def test_remove_conversation(self):
+        """测试移除对话的索引项"""
+        removed = self.index.remove_conversation("conv-1")
+        self.assertEqual(removed, 1)
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual(self.index.query("是否将代码部署到测试环境？"), [])
+
+    def test_invalid_band_config(self):
+        """测试签名长度必须能被分段数整除"""
+        with self.assertRaises(ValueError):
+            SimilarityIndex(num_perm=10, bands=3)
+
+
+class TestConversationSimilarity(unittest.TestCase):
+    """测试对话管理器的增量索引"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.manager = ConversationManager()
+
+    def test_index_updates_on_add_message(self):
+        """测试 add_message 增量更新索引"""
+        conv_id = self.manager.create_conversation("部署讨论")
+        self.manager.add_message(
+            conv_id, "assistant", "使用哪个分支进行发布？", "question"
+        )
+        self.manager.add_message(conv_id, "user", "release/2.0", "answer")
+
+        matches = self.manager.find_similar_questions("这次使用哪个分支发布？")
+        self.assertEqual(len(matches), 1)
+        self.assertEqual(matches[0]["answer"], "release/2.0")
+        self.assertEqual(matches[0]["conversation_id"], conv_id)
+
+    def test_delete_conversation_removes_index(self):
+        """测试删除对话时同步移除索引"""
+        conv_id = self.manager.create_conversation("部署讨论")
+        self.manager.add_message(
+            conv_id, "assistant", "使用哪个分支进行发布？", "question"
+        )
+        self.manager.add_message(conv_id, "user", "release/2.0", "answer")
+        self.manager.delete_conversation(conv_id)
+
+        self.assertEqual(
+            self.manager.find_similar_questions("使用哪个分支进行发布？"), []
+        )
+
+    def test_resolve_from_store(self):
+        """测试消息不在内存中时只从数据库读回命中的问答"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "conversations.db")
+            store = SQLiteConversationStore(path)
+            manager = ConversationManager(store=store, memory_budget=1)
+            conv_id = manager.create_conversation("部署讨论")
+            manager.add_message(
+                conv_id, "assistant", "使用哪个分支进行发布？", "question"
+            )
+            manager.add_message(conv_id, "user", "release/2.0", "answer")
+
+            # 访问另一个对话后超出内存预算，第一个对话的消息被释放，索引仍在
+            other = manager.create_conversation("其他")
+            manager.add_message(other, "assistant", "今天做什么？", "question")
+            self.assertEqual(manager.get_memory_stats()["resident"], 1)
+            match = manager.find_similar_questions("这次使用哪个分支发布？")[0]
+            self.assertEqual(
+                (match["conversation_id"], match["question"], match["answer"]),
+                (conv_id, "使用哪个分支进行发布？", "release/2.0"),
+            )
+            self.assertEqual((match["question_seq"], match["answer_seq"]), (2, 3))
+            self.assertEqual(manager.get_memory_stats()["resident"], 1)
+            store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+SQLite 对话存储测试
+
+测试重新打开后对话完整恢复、WAL 模式和索引、结束和删除对话、文件导入，
+以及分页读取历史时只从数据库读取本页消息。
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from interactive_mcp_popup.conversation import ConversationManager
+from interactive_mcp_popup.sqlite_store import SQLiteConversationStore
+
+
+class TestSQLiteConversationStore(unittest.TestCase):
+    """测试 SQLite 存储后端"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "conversations.db")
+        self.store = SQLiteConversationStore(self.path)
+        self.manager = ConversationManager(store=self.store)
+
+    def tearDown(self):
+        """清理测试环境"""
+        self.store.close()
+        self.temp_dir.cleanup()
+
+    def reopen(self):
+        """关闭后重新打开数据库"""
+        self.store.close()
+        self.store = SQLiteConversationStore(self.path)
+        self.manager = ConversationManager(store=self.store)
+        return self.manager
+
+    def test_round_trip(self):
+        """测试重新打开后对话、消息和序号完整恢复"""
+        conv_id = self.manager.create_conversation("部署", "上下文")
+        self.manager.add_message(conv_id, "assistant", "部署到生产？", "question")
+        self.manager.add_message(conv_id, "user", "是", "answer")
+        original = self.manager.get_conversation_history(conv_id)
+
+        manager = self.reopen()
+        self.assertEqual(manager.get_conversation_history(conv_id), original)
+        conversation = manager.get_conversation(conv_id)
+        self.assertEqual(conversation.context, "上下文")
+        self.assertEqual([m.seq for m in conversation.messages], [1, 2, 3])
+
+        # 恢复后的对话可以继续追加，并进入目录索引
+        manager.add_message(conv_id, "assistant", "确认？", "question")
+        self.assertEqual(manager.get_conversation_version(conv_id)["latest_seq"], 4)
+        self.assertEqual(manager.query_conversations()["total_count"], 1)
+        self.assertEqual(len(self.store.load_messages(conv_id, after_seq=2)), 2)
+
+    def test_history_page_reads_range(self):
+        """测试消息不在内存中时历史分页只读取本页，结果与读入整个对话时相同"""
+        conv_id = self.manager.create_conversation("部署", "上下文")
+        for i in range(10):
+            self.manager.add_message(conv_id, "user", f"回答{i}", "answer")
+        pages = [
+            self.manager.get_history_page(
+                conv_id, limit=3, order=order, before=before, after=after
+            )
+            for order, before, after in (
+                ("asc", None, 4),
+                ("desc", None, None),
+                ("desc", 5, 1),
+                ("asc", 2, None),
+            )
+        ]
+
+        self.store.close()
+        self.store = SQLiteConversationStore(self.path)
+        manager = ConversationManager(store=self.store, background_load=False)
+        lazy = [
+            manager.get_history_page(
+                conv_id, limit=3, order=order, before=before, after=after
+            )
+            for order, before, after in (
+                ("asc", None, 4),
+                ("desc", None, None),
+                ("desc", 5, 1),
+                ("asc", 2, None),
+            )
+        ]
+        self.assertEqual(lazy, pages)
+        self.assertEqual(manager.get_memory_stats()["resident"], 0)
+        self.assertEqual(
+            (lazy[0]["topic"], lazy[0]["status"], lazy[0]["context"]),
+            ("部署", "active", "上下文"),
+        )
+        self.assertEqual([m["seq"] for m in lazy[1]["messages"]], [11, 10, 9])
+        self.assertEqual(
+            manager.get_history_page(conv_id, since_seq=11)["messages"], []
+        )
+
+    def test_wal_and_indexes(self):
+        """测试数据库使用 WAL 模式并建立了索引"""
+        mode = self.store._db.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+        indexes = {
+            row[0]
+            for row in self.store._db.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index'"
+            )
+        }
+        self.assertIn("idx_conversations_updated", indexes)
+        self.assertIn("idx_conversations_status", indexes)
+
+    def test_end_and_delete(self):
+        """测试结束对话的状态被保存，删除的对话不再恢复"""
+        ended = self.manager.create_conversation("已结束")
+        deleted = self.manager.create_conversation("已删除")
+        self.manager.add_message(deleted, "assistant", "问题", "question")
+        self.manager.end_conversation(ended, "完成")
+        self.manager.delete_conversation(deleted)
+
+        manager = self.reopen()
+        self.assertIsNone(manager.get_conversation(deleted))
+        self.assertEqual(manager.get_conversation(ended).status, "ended")
+        self.assertEqual(len(manager.get_conversation(ended).messages), 2)
+        self.assertEqual(self.store.iter_conversation_ids("ended"), [ended])
+        self.assertEqual(self.store.load_messages(deleted), [])
+
+    def test_load_from_file_is_persisted(self):
+        """测试从文件导入的对话写入数据库，重复导入时替换"""
+        source = ConversationManager()
+        conv_id = source.create_conversation("导入")
+        source.add_message(conv_id, "user", "回答", "answer")
+        export_path = os.path.join(self.temp_dir.name, "export.json")
+        self.assertTrue(source.save_to_file(export_path))
+
+        self.assertTrue(self.manager.load_from_file(export_path))
+        self.assertTrue(self.manager.load_from_file(export_path))
+
+        manager = self.reopen()
+        self.assertEqual(len(manager.get_conversation(conv_id).messages), 2)
+        with open(export_path, encoding="utf-8") as f:
+            self.assertIn(conv_id, json.load(f)["conversations"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+调用链追踪测试
+
+测试 span 的父子关系、采样、慢调用导出、后台写入文件，以及对话流程中的 span。
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from interactive_mcp_popup import tracing
+from interactive_mcp_popup.conversation import ConversationManager
+from interactive_mcp_popup.tracing import Tracer, TracingMiddleware, span, traced
+
+
+class TracingTestCase(unittest.TestCase):
+    """替换全局追踪器，写入临时文件"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.temp_dir.name, "traces.jsonl")
+        self.original_tracer = tracing.tracer
+        tracing.tracer = Tracer(enabled=True, sample_rate=1.0, filepath=self.filepath)
+
+    def tearDown(self):
+        """恢复全局追踪器"""
+        tracing.tracer.shutdown()
+        tracing.tracer = self.original_tracer
+        self.temp_dir.cleanup()
+
+    def run_trace(self, name, func):
+        """在一条调用链中运行函数"""
+        root = tracing.tracer.start_trace(name)
+        if root is None:
+            func()
+            return
+        token = tracing._current_span.set(root)
+        try:
+            func()
+        finally:
+            tracing._current_span.reset(token)
+            tracing.tracer.finish(root)
+
+    def read_spans(self):
+        """等待后台线程写完并读取 span"""
+        tracing.tracer.shutdown()
+        if not os.path.exists(self.filepath):
+            return []
+        with open(self.filepath, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+class TestTracer(TracingTestCase):
+    """测试追踪器"""
+
+    def test_nested_spans(self):
+        """测试嵌套 span 的父子关系"""
+
+        def work():
+            with span("outer", step=1):
+                with span("inner"):
+                    pass
+
+        self.run_trace("tool", work)
+        spans = {s["name"]: s for s in self.read_spans()}
+
+        self.assertEqual(set(spans), {"tool", "outer", "inner"})
+        self.assertEqual(spans["inner"]["parentSpanId"], spans["outer"]["spanId"])
+        self.assertEqual(spans["outer"]["parentSpanId"], spans["tool"]["spanId"])
+        self.assertEqual(spans["outer"]["attributes"], {"step": 1})
+        self.assertEqual(len({s["traceId"] for s in spans.values()}), 1)
+
+    def test_not_sampled(self):
+        """测试未采样时不记录"""
+        tracing.tracer.sample_rate = 0.0
+        self.run_trace("tool", lambda: None)
+        self.assertEqual(self.read_spans(), [])
+
+    def test_slow_call_exported(self):
+        """测试未采样但超过慢调用阈值时导出"""
+        tracing.tracer.sample_rate = 0.0
+        tracing.tracer.slow_threshold_seconds = 0.001
+
+        def slow():
+            with span("sleep"):
+                import time
+
+                time.sleep(0.01)
+
+        self.run_trace("slow_tool", slow)
+        self.run_trace("fast_tool", lambda: None)
+        spans = self.read_spans()
+
+        # 未采样的调用只导出根 span，内部 span 的耗时按名称记在根 span 上
+        self.assertEqual([s["name"] for s in spans], ["slow_tool"])
+        self.assertEqual(spans[0]["attributes"]["sampled_by"], "slow")
+        self.assertGreaterEqual(spans[0]["attributes"]["span_ms"]["sleep"], 10)
+
+    def test_unsampled_trace_creates_no_spans(self):
+        """测试只设置慢调用阈值时，未采样的调用不创建子 span"""
+        tracing.tracer.sample_rate = 0.0
+        tracing.tracer.slow_threshold_seconds = 60
+        created = []
+
+        def work():
+            for _ in range(3):
+                with span("step") as current:
+                    created.append(current)
+
+        self.run_trace("fast_tool", work)
+        self.assertEqual(created, [None, None, None])
+        self.assertEqual(self.read_spans(), [])
+
+    def test_error_status(self):
+        """测试异常时标记错误"""
+
+        def fail():
+            with span("broken"):
+                raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            self.run_trace("tool", fail)
+        broken = [s for s in self.read_spans() if s["name"] == "broken"][0]
+        self.assertEqual(broken["status"], "error")
+
+    def test_middleware_called_directly(self):
+        """测试中间件可以脱离服务器直接调用，异常时根 span 标记错误"""
+
+        async def call_next(context):
+            with span("handler"):
+                raise ValueError("bad input")
+
+        context = SimpleNamespace(message=SimpleNamespace(name="ask_user_popup"))
+        with self.assertRaises(ValueError):
+            asyncio.run(
+                TracingMiddleware(tracing.tracer).on_call_tool(context, call_next)
+            )
+        spans = {s["name"]: s for s in self.read_spans()}
+        self.assertEqual(
+            spans["handler"]["parentSpanId"], spans["ask_user_popup"]["spanId"]
+        )
+        self.assertEqual(spans["ask_user_popup"]["status"], "error")
+
+    def test_traced_async(self):
+        """测试协程函数装饰器"""
+
+        @traced("async_step")
+        async def step():
+            await asyncio.sleep(0)
+            return 42
+
+        results = []
+        self.run_trace("tool", lambda: results.append(asyncio.run(step())))
+        self.assertEqual(results, [42])
+        self.assertIn("async_step", {s["name"] for s in self.read_spans()})
+
+    def test_outside_trace_is_noop(self):
+        """测试不在调用链中时不记录"""
+        with span("orphan") as current:
+            self.assertIsNone(current)
+        self.assertEqual(self.read_spans(), [])
+
+
+class TestConversationSpans(TracingTestCase):
+    """测试对话流程中的 span"""
+
+    def test_add_message_span(self):
+        """测试 add_message 记录为 span"""
+        manager = ConversationManager()
+        conv_id = manager.create_conversation("追踪测试")
+
+        def work():
+            manager.add_message(conv_id, "assistant", "继续吗？", "question")
+            manager.add_message(conv_id, "user", "继续", "answer")
+
+        self.run_trace("continue_conversation", work)
+        names = [s["name"] for s in self.read_spans()]
+        self.assertEqual(names.count("add_message"), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+传输测试
+
+测试命令行参数，以及多个客户端通过 HTTP 共享一个服务器时的会话隔离和共享对话存储。
+"""
+
+import asyncio
+import json
+import os
+import socket
+import sys
+import unittest
+
+# 添加项目路径到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from interactive_mcp_popup.transport import build_parser, get_session_id
+
+try:
+    from fastmcp import Client
+
+    from interactive_mcp_popup import server_enhanced
+
+    FASTMCP_AVAILABLE = True
+except ImportError:
+    FASTMCP_AVAILABLE = False
+
+
+def get_free_port() -> int:
+    """获取一个空闲端口"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestTransportArgs(unittest.TestCase):
+    """测试命令行参数"""
+
+    def test_default_stdio(self):
+        """测试默认使用 stdio"""
+        args = build_parser().parse_args([])
+        self.assertIn(args.transport, ("stdio", "http", "sse"))
+
+    def test_http_args(self):
+        """测试 HTTP 参数"""
+        args = build_parser().parse_args(
+            ["--transport", "http", "--host", "0.0.0.0", "--port", "9000"]
+        )
+        self.assertEqual(args.transport, "http")
+        self.assertEqual(args.host, "0.0.0.0")
+        self.assertEqual(args.port, 9000)
+
+    def test_session_id_without_context(self):
+        """测试没有请求上下文时的会话ID"""
+        self.assertEqual(get_session_id(None), "")
+
+
+class TestSharedHttpServer(unittest.TestCase):
+    """测试多个客户端共享 HTTP 服务器"""
+
+    def setUp(self):
+        """设置测试环境"""
+        if not FASTMCP_AVAILABLE:
+            self.skipTest("fastmcp 不可用")
+
+        self.calls = []
+
+        async def fake_popup(question, context="", **kwargs):
+            self.calls.append(question)
+            await asyncio.sleep(0.2)
+            return {
+                "question": question,
+                "context": context,
+                "answer": f"回答{len(self.calls)}",
+                "status": "answered",
+            }
+
+        self.registry = server_enhanced.popup_registry
+        self.original_factory = self.registry.popup_factory
+        self.registry.popup_factory = fake_popup
+
+    def tearDown(self):
+        """恢复弹窗工厂"""
+        if FASTMCP_AVAILABLE:
+            self.registry.popup_factory = self.original_factory
+
+    def test_clients_isolated_with_shared_store(self):
+        """测试两个客户端的弹窗互相隔离，对话存储共享"""
+        port = get_free_port()
+        url = f"http://127.0.0.1:{port}/mcp"
+
+        async def call(client, tool, arguments):
+            result = await client.call_tool(tool, arguments)
+            return json.loads(result.content[0].text)
+
+        async def run():
+            server = asyncio.ensure_future(
+                server_enhanced.mcp.run_http_async(
+                    show_banner=False,
+                    host="127.0.0.1",
+                    port=port,
+                    path="/mcp",
+                    log_level="error",
+                )
+            )
+            try:
+                for _ in range(100):
+                    try:
+                        with socket.create_connection(("127.0.0.1", port), timeout=0.1):
+                            break
+                    except OSError:
+                        await asyncio.sleep(0.05)
+
+                async with Client(url) as first, Client(url) as second:
+                    # 相同问题来自不同客户端时各自弹窗
+                    answers = await asyncio.gather(
+                        call(first, "ask_user_popup", {"question": "共享服务器问题"}),
+                        call(second, "ask_user_popup", {"question": "共享服务器问题"}),
+                    )
+
+                    # 一个客户端创建的对话对另一个客户端可见
+                    started = await call(
+                        first, "start_conversation", {"topic": "共享对话"}
+                    )
+                    history = await call(
+                        second,
+                        "get_conversation_history",
+                        {"conversation_id": started["conversation_id"]},
+                    )
+                    return answers, history
+            finally:
+                server.cancel()
+                try:
+                    await server
+                except asyncio.CancelledError:
+                    pass
+
+        answers, history = asyncio.run(run())
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual([a["status"] for a in answers], ["answered", "answered"])
+        self.assertNotEqual(answers[0]["popup_id"], answers[1]["popup_id"])
+        self.assertEqual(history["topic"], "共享对话")
+
+
+if __name__ == "__main__":
+    unittest.main()